@@ -1,27 +1,76 @@
 import os
 import zmq
-import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 from common.actors.base import Actor
+from common.actors.cache import NO_EXISTE
+from common.actors.lotes import Coalescedor
+
+MAX_RENOVACIONES = 2  # mismo límite que aplica el GA
+
+# Las renovaciones que llegan con un lote en vuelo se envían juntas al GA (MAX <= 1 = sin lotes).
+# La ventana es una espera extra antes de enviar cada lote (0 = ninguna)
+RENOVACION_LOTE_VENTANA_MS = float(os.getenv("RENOVACION_LOTE_VENTANA_MS", "0"))
+RENOVACION_LOTE_MAX = int(os.getenv("RENOVACION_LOTE_MAX", "100"))
 
 
 class ActorRenovacion(Actor):
     topic = "renovacion"
+    nombre = "ActorRenovacion"
+    puerto = 5561
+    puerto_resultados = 5564
 
-    def __init__(self):
-        super().__init__()
-        # Crear socket REQ para comunicarse con gestor_almacenamiento
-        self.context = zmq.Context()
-        self.storage_socket = self.context.socket(zmq.REQ)
-        self.storage_socket.RCVTIMEO = 5000
-        self.storage_socket.SNDTIMEO = 5000
-        
-        storage_host = os.getenv("GESTOR_ALMACENAMIENTO_HOST", "gestor_almacenamiento")
-        storage_port = os.getenv("GESTOR_ALMACENAMIENTO_PORT", "5570")
-        storage_addr = f"tcp://{storage_host}:{storage_port}"
-        
-        print(f"[ActorRenovacion] Conectando a gestor_almacenamiento en {storage_addr}")
-        self.storage_socket.connect(storage_addr)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lotes = None
+        if RENOVACION_LOTE_MAX > 1:
+            self.lotes = Coalescedor(self._enviar_lote, RENOVACION_LOTE_VENTANA_MS, RENOVACION_LOTE_MAX)
+
+    def _enviar_lote(self, items: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Envía un lote de renovaciones al GA; cada elemento recibe su propia respuesta."""
+        response = self.solicitar_ga({
+            "action": "actualizar_renovacion_lote",
+            "items": [{"isbn": isbn, "usuario": usuario} for isbn, usuario in items]
+        })
+        resultados = (response.get("datos") or {}).get("resultados")
+        if response.get("status") != "ok" or not isinstance(resultados, list):
+            # Error del lote completo (parámetros, conexión...): vale para todos
+            return [response] * len(items)
+        print(f"[ActorRenovacion] Lote de {len(items)} renovación(es) enviado al gestor")
+        return resultados
+
+    def _renovar(self, isbn, usuario) -> Dict[str, Any]:
+        if self.lotes is not None:
+            return self.lotes.enviar((isbn, usuario))
+        return self.solicitar_ga({
+            "action": "actualizar_renovacion",
+            "isbn": isbn,
+            "usuario": usuario
+        })
+
+    def _rechazo_local(self, isbn, usuario):
+        """Código de error si la caché ya sabe que el GA rechazaría la renovación."""
+        prestamo = self.cache.obtener(usuario, isbn)
+        if prestamo is None:
+            return None
+        if prestamo["estado"] == NO_EXISTE:
+            return "PrestamoNoEncontrado"
+        if prestamo["estado"] != "ACTIVO":
+            return "PrestamoNoActivo"
+        if prestamo["renovaciones"] is not None and prestamo["renovaciones"] >= MAX_RENOVACIONES:
+            return "LimiteRenovaciones"
+        return None
+
+    def _recordar(self, isbn, usuario, response: Dict[str, Any]) -> None:
+        """Guarda en la caché lo que la respuesta del GA dice del préstamo."""
+        error = response.get("error")
+        if response.get("status") == "ok":
+            self.cache.guardar(usuario, isbn, "ACTIVO", (response.get("datos") or {}).get("renovaciones"))
+        elif error == "PrestamoNoEncontrado":
+            self.cache.guardar(usuario, isbn, NO_EXISTE)
+        elif error == "PrestamoNoActivo":
+            self.cache.guardar(usuario, isbn, "NO_ACTIVO")
+        elif error == "LimiteRenovaciones":
+            self.cache.guardar(usuario, isbn, "ACTIVO", MAX_RENOVACIONES)
 
     def handle(self, msg: Dict[str, Any]) -> Dict[str, Any]:
         print(f"[ActorRenovacion] Procesando mensaje: {msg}")
@@ -34,19 +83,17 @@ class ActorRenovacion(Actor):
             print(f"[ActorRenovacion] Datos inválidos: isbn={isbn}, usuario={usuario}")
             return {"ok": False, "accion": "datos_invalidos"}
 
+        rechazo = self._rechazo_local(isbn, usuario)
+        if rechazo:
+            print(f"[ActorRenovacion] Rechazada sin consultar al gestor: {rechazo}")
+            return {"ok": False, "accion": "renovacionRechazada", "error": rechazo, "cache": True}
+
         try:
             # Enviar solicitud de renovación al gestor de almacenamiento
             print(f"[ActorRenovacion] Solicitando renovación para isbn={isbn}, usuario={usuario}")
-            request = {
-                "action": "actualizar_renovacion",
-                "isbn": isbn,
-                "usuario": usuario
-            }
-            self.storage_socket.send_json(request)
-            
-            # Esperar respuesta
-            response = self.storage_socket.recv_json()
+            response = self._renovar(isbn, usuario)
             print(f"[ActorRenovacion] Respuesta del gestor: {response}")
+            self._recordar(isbn, usuario, response)
             
             if response.get("status") == "ok":
                 return {
@@ -69,62 +116,17 @@ class ActorRenovacion(Actor):
             print(f"[ActorRenovacion] Error: {e}")
             return {"ok": False, "accion": "error", "error": str(e)}
 
+    def respuesta_sincrona(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        # Normalizar respuesta para gestor_carga
+        return {
+            "exito": result.get("ok", False),
+            "renovacion": result.get("datos", {}),
+            "error": result.get("error")
+        }
 
-def main():
-    context = zmq.Context()
-
-    # SUB socket para eventos pub/sub
-    socket_sub = context.socket(zmq.SUB)
-    gc_pub_addr = os.getenv("GESTOR_CARGA_PUB_ADDR", "tcp://gestor_carga:5556")
-    socket_sub.connect(gc_pub_addr)
-    socket_sub.setsockopt_string(zmq.SUBSCRIBE, ActorRenovacion.topic)
-
-    # REP socket para peticiones síncronas del gestor
-    socket_rep = context.socket(zmq.REP)
-    socket_rep.bind("tcp://*:5561")
-
-    poller = zmq.Poller()
-    poller.register(socket_sub, zmq.POLLIN)
-    poller.register(socket_rep, zmq.POLLIN)
-
-    print(f"[ActorRenovacion] PUB/SUB conectado a {gc_pub_addr}, REP escuchando en 5561")
 
-    actor = ActorRenovacion()
-
-    try:
-        while True:
-            events = dict(poller.poll())
-            
-            if socket_sub in events:
-                try:
-                    raw = socket_sub.recv_string()
-                    topic, data = raw.split(" ", 1)
-                    msg = json.loads(data)
-                    result = actor.handle(msg)
-                    print(f"[ActorRenovacion] Evento resultado: {result}")
-                except Exception as e:
-                    print(f"[ActorRenovacion] Error en PUB/SUB: {e}")
-            
-            if socket_rep in events:
-                try:
-                    req = socket_rep.recv_json()
-                    result = actor.handle(req)
-                    # Normalizar respuesta para gestor_carga
-                    response = {
-                        "exito": result.get("ok", False),
-                        "renovacion": result.get("datos", {}),
-                        "error": result.get("error")
-                    }
-                    socket_rep.send_json(response)
-                    print(f"[ActorRenovacion] Req/Rep resultado: {response}")
-                except Exception as e:
-                    socket_rep.send_json({"exito": False, "error": str(e)})
-    except KeyboardInterrupt:
-        print("[ActorRenovacion] Interrumpido")
-    finally:
-        socket_sub.close()
-        socket_rep.close()
-        context.term()
+def main():
+    ActorRenovacion().run()
 
 
 if __name__ == "__main__":
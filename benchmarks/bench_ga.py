@@ -0,0 +1,129 @@
+"""
+Salto actor -> GA sin red: Despachador.despachar() de cada acción contra los
+backends embebidos (memoria y SQLite en un fichero temporal). Incluye la
+validación de la petición y el registro de la latencia en el histograma del
+despachador, igual que en el bucle del GA.
+
+Las escrituras necesitan estado nuevo en cada llamada: los préstamos usan
+un usuario distinto cada vez (con ejemplares de sobra) y las renovaciones y
+devoluciones consumen préstamos activos creados por `preparar` fuera del
+tiempo medido.
+"""
+import itertools
+import os
+import shutil
+import tempfile
+from collections import deque
+from datetime import datetime
+
+from acciones import Despachador
+from almacenamiento import MemoriaAlmacenamiento, SQLiteAlmacenamiento
+
+from medicion import caso
+
+ISBN = "978-0134685991"
+EJEMPLARES = 10 ** 9
+TAMANO_LOTE = 16
+
+
+def _memoria():
+    yield MemoriaAlmacenamiento({ISBN: EJEMPLARES})
+
+
+def _sqlite():
+    directorio = tempfile.mkdtemp(prefix="bench-ga-")
+    almacenamiento = SQLiteAlmacenamiento(os.path.join(directorio, "ga.sqlite3"), {ISBN: EJEMPLARES})
+    try:
+        yield almacenamiento
+    finally:
+        almacenamiento.cerrar()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+BACKENDS = {"memoria": _memoria, "sqlite": _sqlite}
+
+
+class _Prestamos:
+    """Usuarios nuevos y cola de préstamos activos para consumir."""
+
+    def __init__(self, despachador: Despachador, prefijo: str):
+        self.despachador = despachador
+        self.contador = itertools.count()
+        self.prefijo = prefijo
+        self.activos = deque()
+
+    def usuario_nuevo(self) -> str:
+        return f"{self.prefijo}{next(self.contador)}"
+
+    def crear(self, n: int) -> None:
+        for _ in range(n):
+            usuario = self.usuario_nuevo()
+            self.despachador.despachar({"action": "procesar_prestamo", "isbn": ISBN, "usuario": usuario})
+            self.activos.append(usuario)
+
+
+def _registrar(backend: str, fabrica):
+    def con_despachador(fn):
+        def envoltura():
+            gen = fabrica()
+            almacenamiento = next(gen)
+            try:
+                yield from fn(Despachador(almacenamiento))
+            finally:
+                gen.close()
+        return envoltura
+
+    @caso("ga", f"consultar_libro_{backend}")
+    @con_despachador
+    def _consultar(despachador):
+        req = {"action": "consultar_libro", "isbn": ISBN}
+        yield lambda: despachador.despachar(req)
+
+    @caso("ga", f"validar_renovacion_{backend}")
+    @con_despachador
+    def _validar(despachador):
+        prestamos = _Prestamos(despachador, "validar")
+        prestamos.crear(1)
+        req = {"action": "validar_renovacion", "isbn": ISBN, "usuario": prestamos.activos[0]}
+        yield lambda: despachador.despachar(req)
+
+    @caso("ga", f"procesar_prestamo_{backend}")
+    @con_despachador
+    def _prestamo(despachador):
+        prestamos = _Prestamos(despachador, "prestamo")
+        yield lambda: despachador.despachar(
+            {"action": "procesar_prestamo", "isbn": ISBN, "usuario": prestamos.usuario_nuevo()})
+
+    @caso("ga", f"actualizar_renovacion_{backend}")
+    @con_despachador
+    def _renovacion(despachador):
+        prestamos = _Prestamos(despachador, "renovacion")
+        nueva_fecha = datetime.now().isoformat()
+        yield (lambda: despachador.despachar({"action": "actualizar_renovacion", "isbn": ISBN,
+                                              "usuario": prestamos.activos.popleft(),
+                                              "nueva_fecha": nueva_fecha}),
+               prestamos.crear)
+
+    @caso("ga", f"aplicar_devolucion_{backend}")
+    @con_despachador
+    def _devolucion(despachador):
+        prestamos = _Prestamos(despachador, "devolucion")
+        yield (lambda: despachador.despachar({"action": "aplicar_devolucion", "isbn": ISBN,
+                                              "usuario": prestamos.activos.popleft()}),
+               prestamos.crear)
+
+    @caso("ga", f"actualizar_renovacion_lote{TAMANO_LOTE}_{backend}")
+    @con_despachador
+    def _lote(despachador):
+        prestamos = _Prestamos(despachador, "lote")
+        nueva_fecha = datetime.now().isoformat()
+
+        def renovar_lote():
+            items = [{"isbn": ISBN, "usuario": prestamos.activos.popleft()} for _ in range(TAMANO_LOTE)]
+            return despachador.despachar({"action": "actualizar_renovacion_lote", "items": items,
+                                          "nueva_fecha": nueva_fecha})
+        yield renovar_lote, lambda n: prestamos.crear(n * TAMANO_LOTE)
+
+
+for _backend, _fabrica in BACKENDS.items():
+    _registrar(_backend, _fabrica)
@@ -0,0 +1,62 @@
+"""
+Salto GC -> actor: GestorCarga.atender() con actores simulados (un REP que
+contesta siempre lo mismo), por inproc y por TCP local. Incluye todo lo que
+el GC hace por petición síncrona: socket REQ nuevo hacia la réplica, ida y
+vuelta JSON, construir la Respuesta y publicar "invalidar". La consulta no
+sale del GC y sirve de referencia del coste propio del gestor.
+"""
+import contextlib
+import os
+from types import SimpleNamespace
+
+import zmq
+
+from gestor import GestorCarga
+
+from bench_mensajes import RESPUESTA_ACTOR
+from bench_zmq import Servidor
+from medicion import caso
+
+RESPUESTAS_ACTORES = {
+    "prestamo": RESPUESTA_ACTOR,
+    "renovacion": {"exito": True, "renovacion": {"isbn": "978-0134685991", "usuario": "usuario42",
+                                                 "renovaciones": 1, "fecha_devolucion": "2025-12-12T13:58:57"}},
+    "devolucion": {"exito": True},
+}
+
+
+def _peticion(operacion: str) -> SimpleNamespace:
+    payload = {"operacion": operacion, "isbn": "978-0134685991", "usuario": "usuario42"}
+    return SimpleNamespace(id="bench", payload=payload, raw=dict(payload, id="bench"))
+
+
+def _registrar(operacion: str, transporte: str):
+    @caso("gc", f"atender_{operacion}_{transporte}")
+    def _atender():
+        context = zmq.Context()
+        actores = {}
+        for op, respuesta in RESPUESTAS_ACTORES.items():
+            endpoint = f"inproc://bench-actor-{op}" if transporte == "inproc" else "tcp://127.0.0.1:*"
+            actores[op] = Servidor(context, zmq.REP, endpoint, respuesta=zmq.utils.jsonapi.dumps(respuesta))
+        gestor = GestorCarga(context, rep_endpoint=f"inproc://bench-gc-rep-{transporte}",
+                             pub_endpoint=f"inproc://bench-gc-pub-{transporte}",
+                             replicas_actores={op: [s.endpoint] for op, s in actores.items()},
+                             ga_endpoint="inproc://bench-ga")
+        peticion = _peticion(operacion)
+        # El GC escribe cada paso por stdout; no se mide la consola
+        with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+            try:
+                yield lambda: gestor.atender(peticion)
+            finally:
+                gestor.publisher.socket.close(0)
+                gestor.replier.socket.close(0)
+                for servidor in actores.values():
+                    servidor.cerrar()
+                context.term()
+
+
+for _transporte in ("inproc", "tcp"):
+    for _operacion in ("prestamo", "renovacion", "devolucion", "consulta"):
+        if _operacion == "consulta" and _transporte == "tcp":
+            continue
+        _registrar(_operacion, _transporte)
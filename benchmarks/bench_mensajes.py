@@ -0,0 +1,66 @@
+"""Codificación de los mensajes que cruzan cada salto (cliente -> GC -> actor -> GA)."""
+import json
+
+from common.messaging.respuesta import Respuesta
+
+from medicion import caso
+
+PETICION_GC = {"operacion": "prestamo", "isbn": "978-0134685991", "usuario": "usuario42",
+               "id": "978-0134685991_usuario42_1732200000.123"}
+PETICION_GA = {"action": "procesar_prestamo", "isbn": "978-0134685991", "usuario": "usuario42"}
+RESPUESTA_GA = {
+    "status": "ok",
+    "detalle": "Préstamo registrado exitosamente",
+    "datos": {"isbn": "978-0134685991", "usuario": "usuario42", "fecha_prestamo": "2025-11-21T13:58:57.123456",
+              "fecha_devolucion": "2025-12-05T13:58:57.123456", "dias_prestamo": 14},
+}
+RESPUESTA_ACTOR = {"exito": True, "prestamo": RESPUESTA_GA["datos"]}
+
+
+def _respuesta():
+    return Respuesta(topico="prestamo", contenido="respuesta", exito=True,
+                     mensaje="Préstamo registrado exitosamente", datos=RESPUESTA_ACTOR["prestamo"])
+
+
+RESPUESTA_GC = _respuesta().to_dict()
+
+MENSAJES = {
+    "peticion_gc": PETICION_GC,
+    "peticion_ga": PETICION_GA,
+    "respuesta_ga": RESPUESTA_GA,
+    "respuesta_gc": RESPUESTA_GC,
+}
+
+
+def _registrar(nombre, mensaje):
+    # send_json/recv_json de pyzmq: json.dumps + encode y decode + json.loads
+    crudo = json.dumps(mensaje).encode("utf-8")
+
+    @caso("mensajes", f"codificar_{nombre}")
+    def _codificar():
+        yield lambda: json.dumps(mensaje).encode("utf-8")
+
+    @caso("mensajes", f"decodificar_{nombre}")
+    def _decodificar():
+        yield lambda: json.loads(crudo.decode("utf-8"))
+
+
+for _nombre, _mensaje in MENSAJES.items():
+    _registrar(_nombre, _mensaje)
+
+
+@caso("mensajes", "respuesta_construir")
+def _respuesta_construir():
+    yield _respuesta
+
+
+@caso("mensajes", "respuesta_to_dict")
+def _respuesta_to_dict():
+    respuesta = _respuesta()
+    yield respuesta.to_dict
+
+
+@caso("mensajes", "respuesta_construir_to_dict_codificar")
+def _respuesta_completa():
+    # Lo que hace el GC por cada petición al responder al cliente
+    yield lambda: json.dumps(_respuesta().to_dict()).encode("utf-8")
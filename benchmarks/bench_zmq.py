@@ -0,0 +1,145 @@
+"""
+Ida y vuelta ZMQ: REQ/REP frente a DEALER/ROUTER, por inproc y por TCP
+local, con el mismo mensaje que el GC manda a un actor. El caso
+"socket_nuevo" reproduce lo que hace hoy el GC por petición (crear, conectar
+y cerrar un REQ); "pipeline" manda una ventana de mensajes antes de leer las
+respuestas y da el coste amortizado por mensaje.
+"""
+import json
+import threading
+from typing import Optional
+
+import zmq
+
+from medicion import caso
+
+MENSAJE = json.dumps({"isbn": "978-0134685991", "usuario": "usuario42"}).encode("utf-8")
+VENTANA_PIPELINE = 64
+
+
+class Servidor:
+    """REP o ROUTER en un hilo que contesta siempre lo mismo (o lo recibido)."""
+
+    def __init__(self, context: zmq.Context, tipo: int, endpoint: str, respuesta: Optional[bytes] = None):
+        self.socket = context.socket(tipo)
+        self.socket.linger = 0
+        self.socket.bind(endpoint)
+        # Con tcp://...:* el puerto lo elige el sistema
+        self.endpoint = self.socket.getsockopt_string(zmq.LAST_ENDPOINT)
+        self.respuesta = respuesta
+        self._stop = threading.Event()
+        self._hilo = threading.Thread(target=self._servir, daemon=True)
+        self._hilo.start()
+
+    def _servir(self):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        while not self._stop.is_set():
+            if not poller.poll(100):
+                continue
+            while True:
+                try:
+                    partes = self.socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                cuerpo = self.respuesta if self.respuesta is not None else partes[-1]
+                self.socket.send_multipart(partes[:-1] + [cuerpo])
+
+    def cerrar(self):
+        self._stop.set()
+        self._hilo.join(timeout=1.0)
+        self.socket.close(0)
+
+
+def _endpoint(transporte: str, nombre: str) -> str:
+    return f"inproc://bench-{nombre}" if transporte == "inproc" else "tcp://127.0.0.1:*"
+
+
+def _registrar(transporte: str):
+    @caso("zmq", f"req_rep_{transporte}")
+    def _req_rep():
+        context = zmq.Context()
+        servidor = Servidor(context, zmq.REP, _endpoint(transporte, "rep"))
+        req = context.socket(zmq.REQ)
+        req.linger = 0
+        req.connect(servidor.endpoint)
+
+        def ida_y_vuelta():
+            req.send(MENSAJE)
+            req.recv()
+        try:
+            yield ida_y_vuelta
+        finally:
+            req.close(0)
+            servidor.cerrar()
+            context.term()
+
+    @caso("zmq", f"req_rep_socket_nuevo_{transporte}")
+    def _req_rep_nuevo():
+        context = zmq.Context()
+        servidor = Servidor(context, zmq.REP, _endpoint(transporte, "rep-nuevo"))
+
+        def ida_y_vuelta():
+            req = context.socket(zmq.REQ)
+            req.linger = 0
+            req.connect(servidor.endpoint)
+            req.send(MENSAJE)
+            req.recv()
+            req.close(0)
+        try:
+            yield ida_y_vuelta
+        finally:
+            servidor.cerrar()
+            context.term()
+
+    @caso("zmq", f"dealer_router_{transporte}")
+    def _dealer_router():
+        context = zmq.Context()
+        servidor = Servidor(context, zmq.ROUTER, _endpoint(transporte, "router"))
+        dealer = context.socket(zmq.DEALER)
+        dealer.linger = 0
+        dealer.connect(servidor.endpoint)
+
+        def ida_y_vuelta():
+            dealer.send_multipart([b"", MENSAJE])
+            dealer.recv_multipart()
+        try:
+            yield ida_y_vuelta
+        finally:
+            dealer.close(0)
+            servidor.cerrar()
+            context.term()
+
+    @caso("zmq", f"dealer_router_pipeline_{transporte}")
+    def _dealer_router_pipeline():
+        context = zmq.Context()
+        servidor = Servidor(context, zmq.ROUTER, _endpoint(transporte, "router-pipeline"))
+        dealer = context.socket(zmq.DEALER)
+        dealer.linger = 0
+        dealer.connect(servidor.endpoint)
+        pendientes = [0]
+
+        def enviar() -> None:
+            # Una llamada = un mensaje; cada VENTANA_PIPELINE se recogen las respuestas
+            dealer.send_multipart([b"", MENSAJE])
+            pendientes[0] += 1
+            if pendientes[0] == VENTANA_PIPELINE:
+                for _ in range(VENTANA_PIPELINE):
+                    dealer.recv_multipart()
+                pendientes[0] = 0
+
+        def vaciar(_: int) -> None:
+            while pendientes[0]:
+                dealer.recv_multipart()
+                pendientes[0] -= 1
+        try:
+            yield enviar, vaciar
+        finally:
+            vaciar(0)
+            dealer.close(0)
+            servidor.cerrar()
+            context.term()
+
+
+for _transporte in ("inproc", "tcp"):
+    _registrar(_transporte)
@@ -0,0 +1,129 @@
+"""
+Microbenchmarks por salto del camino de una petición:
+
+- mensajes: codificar/decodificar cada mensaje y construir la Respuesta.
+- zmq: ida y vuelta REQ/REP y DEALER/ROUTER por inproc y TCP local.
+- gc: GestorCarga.atender() contra actores simulados.
+- ga: Despachador.despachar() de cada acción (memoria y SQLite).
+
+Cada caso se mide por separado (mediana de varias muestras, GC de Python
+apagado mientras se mide). Con --salida se guarda el resultado junto con los
+datos de la máquina y el commit; con --comparar se compara contra un JSON
+anterior y se sale con código 1 si algún caso empeora más de --umbral %.
+
+Uso (desde la raíz del repo):
+    python benchmarks/correr.py --salida base.json
+    python benchmarks/correr.py --grupos ga,gc --comparar base.json
+    python benchmarks/correr.py --filtro sqlite --explain
+
+Para resultados estables: fijar la CPU (taskset -c 2 python ...), el
+governor en "performance", PYTHONHASHSEED=0 y la máquina sin otra carga.
+"""
+import argparse
+import json
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Los servicios importan sus módulos hermanos sin paquete, como en todo_en_uno.py
+for carpeta in ("", "gestor_almacenamiento", "gestor_carga", "benchmarks"):
+    sys.path.insert(0, os.path.join(RAIZ, carpeta))
+
+# Registran sus casos al importarse, en el orden de la petición
+import bench_mensajes  # noqa: E402,F401
+import bench_zmq  # noqa: E402,F401
+import bench_gc  # noqa: E402,F401
+import bench_ga  # noqa: E402,F401
+import explain  # noqa: E402
+from medicion import CASOS, comparar, entorno, medir  # noqa: E402
+
+
+def _formato_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} µs"
+    return f"{ns:.0f} ns"
+
+
+def imprimir_resultados(resultados) -> None:
+    print(f"\n{'caso':<52} {'mediana':>11} {'mín':>11} {'±MAD':>7} {'ops/s':>12} {'vueltas':>8}")
+    grupo_actual = None
+    for r in resultados:
+        if r.grupo != grupo_actual:
+            grupo_actual = r.grupo
+            print(f"[{grupo_actual}]")
+        print(f"  {r.nombre:<50} {_formato_ns(r.mediana_ns):>11} {_formato_ns(r.min_ns):>11} "
+              f"{r.mad_rel * 100:>6.1f}% {r.ops_s:>12,.0f} {r.vueltas:>8}")
+
+
+def imprimir_comparacion(cambios) -> None:
+    print(f"\n{'caso':<60} {'antes':>11} {'ahora':>11} {'cambio':>8}")
+    for c in cambios:
+        marca = {"peor": "  <-- PEOR", "mejor": "  (mejor)"}.get(c["veredicto"], "")
+        print(f"  {c['grupo'] + '/' + c['nombre']:<58} {_formato_ns(c['antes_ns']):>11} "
+              f"{_formato_ns(c['ahora_ns']):>11} {c['cambio_pct']:>+7.1f}%{marca}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks por salto (mensajes, zmq, gc, ga)")
+    parser.add_argument("--grupos", default=",".join(CASOS), help=f"separados por comas ({', '.join(CASOS)})")
+    parser.add_argument("--filtro", default="", help="solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--muestras", type=int, default=15)
+    parser.add_argument("--calentamiento", type=int, default=3)
+    parser.add_argument("--objetivo-ms", type=float, default=20.0, help="duración mínima de cada muestra")
+    parser.add_argument("--salida", help="guarda resultados y entorno en este JSON")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior (--salida)")
+    parser.add_argument("--umbral", type=float, default=5.0, help="%% de empeoramiento que cuenta como regresión")
+    parser.add_argument("--explain", action="store_true", help="muestra también los planes de las consultas del GA")
+    args = parser.parse_args()
+
+    grupos = [g.strip() for g in args.grupos.split(",") if g.strip()]
+    desconocidos = [g for g in grupos if g not in CASOS]
+    if desconocidos:
+        parser.error(f"grupos desconocidos: {', '.join(desconocidos)}")
+
+    datos_entorno = entorno()
+    print(f"[Benchmarks] Python {datos_entorno['python']} en {datos_entorno['plataforma']}, "
+          f"commit {datos_entorno.get('commit') or '?'}")
+    if datos_entorno.get("governor") not in (None, "performance"):
+        print(f"[Benchmarks] Aviso: governor de CPU '{datos_entorno['governor']}', los tiempos variarán más")
+
+    resultados = []
+    for grupo in grupos:
+        for nombre, fabrica in CASOS[grupo].items():
+            if args.filtro and args.filtro not in nombre:
+                continue
+            print(f"[Benchmarks] {grupo}/{nombre}...", file=sys.stderr)
+            resultados.append(medir(grupo, nombre, fabrica, muestras=args.muestras,
+                                    calentamiento=args.calentamiento, objetivo_ms=args.objetivo_ms))
+    imprimir_resultados(resultados)
+
+    planes = None
+    if args.explain:
+        planes = explain.explicar()
+        explain.imprimir(planes)
+
+    actuales = [r.a_dict() for r in resultados]
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"entorno": datos_entorno, "resultados": actuales, "planes": planes}, f, indent=2)
+        print(f"\n[Benchmarks] Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        previo = anterior.get("entorno", {})
+        for clave in ("python", "plataforma", "cpus"):
+            if previo.get(clave) != datos_entorno.get(clave):
+                print(f"[Benchmarks] Aviso: {clave} distinto ({previo.get(clave)} -> {datos_entorno.get(clave)})")
+        cambios = comparar(actuales, anterior.get("resultados", []), args.umbral)
+        imprimir_comparacion(cambios)
+        peores = [c for c in cambios if c["veredicto"] == "peor"]
+        if peores:
+            print(f"\n[Benchmarks] {len(peores)} caso(s) empeoran más de un {args.umbral:g}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
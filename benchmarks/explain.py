@@ -0,0 +1,150 @@
+"""
+Planes de las consultas del camino caliente del GA.
+
+Con PostgreSQL accesible (DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS, como
+el GA) ejecuta cada consulta con EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+dentro de una transacción que se deshace al final, así que las escrituras no
+cambian nada. Sin PostgreSQL muestra EXPLAIN QUERY PLAN de las mismas
+consultas en el backend SQLite (sin tiempos ni buffers).
+
+Uso (desde la raíz del repo):
+    python benchmarks/correr.py --explain
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Dict, List, Optional
+
+from almacenamiento import SQLiteAlmacenamiento
+
+ISBN = "978-0134685991"
+USUARIO = "usuario_explain"
+
+# (nombre, SQL con %s, parámetros) en el orden en que se ejecutan en gestor_a.py
+CONSULTAS = [
+    ("consultar_libro", "SELECT * FROM libros WHERE isbn=%s;", (ISBN,)),
+    ("validar_renovacion", "SELECT renovaciones FROM prestamos WHERE isbn=%s AND usuario=%s;", (ISBN, USUARIO)),
+    ("prestamo_bloquear_libro", "SELECT ejemplares FROM libros WHERE isbn=%s FOR UPDATE;", (ISBN,)),
+    ("prestamo_bloquear_prestamo",
+     "SELECT estado FROM prestamos WHERE isbn=%s AND usuario=%s FOR UPDATE;", (ISBN, USUARIO)),
+    ("prestamo_upsert", """
+        INSERT INTO prestamos (isbn, usuario, estado, fecha_devolucion, renovaciones)
+        VALUES (%s, %s, 'ACTIVO', NOW() + INTERVAL '14 days', 0)
+        ON CONFLICT (isbn, usuario)
+        DO UPDATE SET estado='ACTIVO', fecha_devolucion=excluded.fecha_devolucion, renovaciones=0;
+    """, (ISBN, USUARIO)),
+    ("prestamo_descontar", "UPDATE libros SET ejemplares = ejemplares - 1 WHERE isbn=%s;", (ISBN,)),
+    ("renovacion_bloquear",
+     "SELECT renovaciones, estado, fecha_devolucion FROM prestamos WHERE isbn=%s AND usuario=%s FOR UPDATE;",
+     (ISBN, USUARIO)),
+    ("renovacion_actualizar", """
+        UPDATE prestamos SET fecha_devolucion = NOW() + INTERVAL '7 days', renovaciones = renovaciones + 1
+        WHERE isbn=%s AND usuario=%s;
+    """, (ISBN, USUARIO)),
+    ("devolucion_stock", """
+        INSERT INTO libros(isbn, ejemplares) VALUES (%s, 1)
+        ON CONFLICT (isbn) DO UPDATE SET ejemplares = libros.ejemplares + 1;
+    """, (ISBN,)),
+    ("devolucion_marcar", """
+        UPDATE prestamos SET estado='DEVUELTO', fecha_devolucion=NOW()
+        WHERE isbn=%s AND usuario=%s;
+    """, (ISBN, USUARIO)),
+]
+
+TAMANO_LOTE = 16
+
+
+def _nodos(plan: Dict, profundidad: int = 0) -> List[str]:
+    partes = [plan["Node Type"]]
+    if plan.get("Relation Name"):
+        partes.append(f"on {plan['Relation Name']}")
+    if plan.get("Index Name"):
+        partes.append(f"using {plan['Index Name']}")
+    if "Actual Total Time" in plan:
+        partes.append(f"({plan['Actual Total Time']:.3f} ms, filas={plan.get('Actual Rows')}, "
+                      f"hit={plan.get('Shared Hit Blocks', 0)} read={plan.get('Shared Read Blocks', 0)})")
+    lineas = ["  " * profundidad + " ".join(partes)]
+    for hijo in plan.get("Plans", []):
+        lineas.extend(_nodos(hijo, profundidad + 1))
+    return lineas
+
+
+def explicar_postgres(conn) -> List[Dict]:
+    from psycopg2.extras import execute_values
+    from gestor_a import SQL_RENOVACION_LOTE
+
+    prefijo = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+    resultados = []
+    try:
+        with conn.cursor() as cur:
+            for nombre, sql, params in CONSULTAS:
+                cur.execute(prefijo + sql, params)
+                resultados.append({"nombre": nombre, "plan": cur.fetchone()[0][0]})
+            lote = [(pos, ISBN, f"{USUARIO}{pos}", None) for pos in range(TAMANO_LOTE)]
+            filas = execute_values(cur, prefijo + SQL_RENOVACION_LOTE, lote,
+                                   template="(%s, %s, %s, %s::timestamp)", page_size=len(lote), fetch=True)
+            resultados.append({"nombre": f"renovacion_lote{TAMANO_LOTE}", "plan": filas[0][0][0]})
+    finally:
+        conn.rollback()
+    return resultados
+
+
+def explicar_sqlite(path: Optional[str] = None) -> List[Dict]:
+    directorio = None
+    if path is None:
+        directorio = tempfile.mkdtemp(prefix="bench-explain-")
+        path = os.path.join(directorio, "ga.sqlite3")
+    SQLiteAlmacenamiento(path).cerrar()   # crea el esquema igual que el GA
+    conn = sqlite3.connect(path)
+    resultados = []
+    try:
+        for nombre, sql, params in CONSULTAS:
+            sql = (sql.replace("%s", "?").replace(" FOR UPDATE", "")
+                   .replace("NOW() + INTERVAL '14 days'", "datetime('now', '+14 days')")
+                   .replace("NOW() + INTERVAL '7 days'", "datetime('now', '+7 days')")
+                   .replace("NOW()", "datetime('now')"))
+            filas = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            resultados.append({"nombre": nombre, "plan": [fila[-1] for fila in filas]})
+    finally:
+        conn.close()
+        if directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+    return resultados
+
+
+def conectar_postgres():
+    """Conexión con los mismos parámetros que el GA, o None si no hay servidor."""
+    try:
+        import psycopg2
+        from gestor_a import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+        return psycopg2.connect(host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER,
+                                password=DB_PASS, connect_timeout=3)
+    except Exception as e:
+        print(f"[Explain] PostgreSQL no disponible ({str(e).strip()}); se usa SQLite")
+        return None
+
+
+def explicar() -> Dict:
+    conn = conectar_postgres()
+    if conn is None:
+        return {"motor": "sqlite", "consultas": explicar_sqlite()}
+    try:
+        return {"motor": "postgres", "consultas": explicar_postgres(conn)}
+    finally:
+        conn.close()
+
+
+def imprimir(resultado: Dict) -> None:
+    print(f"\n=== Planes de consulta ({resultado['motor']}) ===")
+    for consulta in resultado["consultas"]:
+        plan = consulta["plan"]
+        if resultado["motor"] == "postgres":
+            print(f"\n{consulta['nombre']}: planificación {plan.get('Planning Time', 0):.3f} ms, "
+                  f"ejecución {plan.get('Execution Time', 0):.3f} ms")
+            for linea in _nodos(plan["Plan"]):
+                print(f"  {linea}")
+        else:
+            print(f"\n{consulta['nombre']}:")
+            for paso in plan:
+                print(f"  {paso}")
@@ -0,0 +1,147 @@
+"""
+Arnés de microbenchmarks.
+
+Cada caso es un generador registrado con @caso: prepara lo que necesite,
+hace `yield` de la función a medir (sin argumentos) y libera recursos
+después del yield. Si necesita estado nuevo por muestra (usuarios sin
+préstamo, préstamos renovables...), hace `yield (fn, preparar)`:
+`preparar(n)` se llama fuera del tiempo medido antes de cada muestra de n
+llamadas.
+
+La medición sigue el esquema de timeit: se calibra el número de vueltas para
+que cada muestra dure al menos `objetivo_ms`, se descartan muestras de
+calentamiento y el GC de Python se apaga mientras se mide. Se informa la
+mediana por llamada, que es lo que se compara entre ejecuciones; la MAD
+relativa indica el ruido de la medición.
+"""
+import gc
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+CASOS: Dict[str, Dict[str, Callable[[], Iterator]]] = {}
+
+
+def caso(grupo: str, nombre: str):
+    """Decorador que registra un caso de benchmark en `grupo`."""
+    def registrar(fn):
+        CASOS.setdefault(grupo, {})[nombre] = fn
+        return fn
+    return registrar
+
+
+@dataclass
+class Resultado:
+    grupo: str
+    nombre: str
+    mediana_ns: float
+    min_ns: float
+    max_ns: float
+    mad_rel: float        # desviación absoluta mediana / mediana
+    vueltas: int          # llamadas por muestra
+    muestras: int
+
+    @property
+    def ops_s(self) -> float:
+        return 1e9 / self.mediana_ns if self.mediana_ns else 0.0
+
+    def a_dict(self) -> Dict:
+        return {**asdict(self), "ops_s": round(self.ops_s, 1)}
+
+
+def _muestra(fn: Callable[[], object], vueltas: int, preparar: Optional[Callable[[int], None]]) -> float:
+    if preparar is not None:
+        preparar(vueltas)
+    rango = range(vueltas)
+    gc_activo = gc.isenabled()
+    gc.disable()
+    try:
+        inicio = time.perf_counter_ns()
+        for _ in rango:
+            fn()
+        return (time.perf_counter_ns() - inicio) / vueltas
+    finally:
+        if gc_activo:
+            gc.enable()
+
+
+def medir(grupo: str, nombre: str, fabrica: Callable[[], Iterator], muestras: int = 15,
+          calentamiento: int = 3, objetivo_ms: float = 20.0, max_vueltas: int = 1_000_000) -> Resultado:
+    gen = fabrica()
+    try:
+        objetivo = next(gen)
+        fn, preparar = objetivo if isinstance(objetivo, tuple) else (objetivo, None)
+
+        # Calibración: duplicar vueltas hasta que una muestra dure objetivo_ms
+        vueltas = 1
+        while vueltas < max_vueltas:
+            if _muestra(fn, vueltas, preparar) * vueltas >= objetivo_ms * 1e6:
+                break
+            vueltas *= 2
+
+        for _ in range(calentamiento):
+            _muestra(fn, vueltas, preparar)
+        tiempos = [_muestra(fn, vueltas, preparar) for _ in range(muestras)]
+    finally:
+        gen.close()
+
+    mediana = statistics.median(tiempos)
+    mad = statistics.median(abs(t - mediana) for t in tiempos)
+    return Resultado(grupo, nombre, round(mediana, 1), round(min(tiempos), 1), round(max(tiempos), 1),
+                     round(mad / mediana, 4) if mediana else 0.0, vueltas, muestras)
+
+
+def entorno() -> Dict:
+    """Datos de la máquina y del código para saber si dos resultados son comparables."""
+    datos = {
+        "python": sys.version.split()[0],
+        "implementacion": platform.python_implementation(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        datos["afinidad_cpus"] = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        pass
+    try:
+        with open("/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor") as f:
+            datos["governor"] = f.read().strip()
+    except OSError:
+        pass
+    try:
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        datos["commit"] = subprocess.run(["git", "-C", raiz, "rev-parse", "--short", "HEAD"],
+                                         capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return datos
+
+
+def comparar(actuales: List[Dict], anteriores: List[Dict], umbral: float) -> List[Dict]:
+    """
+    Cambio de la mediana de cada caso respecto a una ejecución anterior. Un
+    cambio cuenta si supera `umbral` % y además tres veces el ruido (MAD
+    relativa) de las dos mediciones.
+    """
+    previos = {(r["grupo"], r["nombre"]): r for r in anteriores}
+    cambios = []
+    for r in actuales:
+        p = previos.get((r["grupo"], r["nombre"]))
+        if not p or not p["mediana_ns"]:
+            continue
+        cambio = (r["mediana_ns"] - p["mediana_ns"]) / p["mediana_ns"] * 100
+        ruido = 3 * (r["mad_rel"] + p["mad_rel"]) * 100
+        significativo = abs(cambio) > max(umbral, ruido)
+        cambios.append({
+            "grupo": r["grupo"], "nombre": r["nombre"],
+            "antes_ns": p["mediana_ns"], "ahora_ns": r["mediana_ns"],
+            "cambio_pct": round(cambio, 2),
+            "veredicto": ("peor" if cambio > 0 else "mejor") if significativo else "igual",
+        })
+    return cambios
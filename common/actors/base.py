@@ -1,8 +1,449 @@
+"""
+Runtime común de los actores (préstamo, renovación, devolución).
+
+Cada actor solo implementa `handle(msg) -> dict`; el runtime se encarga de:
+
+- Un ROUTER en `puerto` (peticiones síncronas del GC) que reparte por un
+  ROUTER inproc entre N workers, cada uno con su propio socket REQ: el worker
+  avisa (LISTO) cuando queda libre y cada petición va al que lleva más tiempo
+  esperando (LRU), así una petición nunca espera detrás de otra lenta.
+- Un SUB al PUB del GC (`topic`) que se vacía a una cola acotada consumida
+  por otros workers; el resultado de cada evento se publica en el tópico
+  "resultado.<topic>" (PUB en `puerto_resultados`) con un número de
+  secuencia, y los huecos en el seq que pone el GC se detectan y cuentan.
+- Una caché del estado de préstamos por usuario (`self.cache`, ver cache.py)
+  que se mantiene con los eventos "invalidar" del GC.
+- Un cliente del gestor de almacenamiento por worker (`solicitar_ga`, ver
+  cliente_ga.py), así que los workers no se bloquean entre sí esperando al GA.
+
+Número de workers: ACTOR_WORKERS (por defecto 4) y ACTOR_WORKERS_EVENTOS (2).
+Al parar, los eventos ya encolados se procesan durante como mucho
+ACTOR_DRENAJE_S segundos; los que queden se cuentan como descartados.
+
+Modo supervisado (lo activa supervisor_actores con variables de entorno): los
+workers se conectan a ACTOR_BACKEND_ADDR (el broker LRU es el del
+supervisor), los eventos llegan por un DEALER de
+ACTOR_EVENTOS_ADDR, los resultados salen por ACTOR_RESULTADOS_CONNECT y la
+carga se informa por un HealthResponder en ACTOR_SALUD_ADDR. Las identidades
+de esos sockets llevan ACTOR_HIJO_ID, y el primer mensaje por el DEALER de
+eventos da al supervisor el endpoint real del HealthResponder.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
 from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import zmq
+
+from common.actors.cache import CacheUsuarios
+from common.actors.cliente_ga import ClienteGA, SaludEndpoints
+from common.health.responder import HealthResponder
+from common.metrics.carga import CargaReciente
+from common.tracing import traza
+
+ACTOR_WORKERS = int(os.getenv("ACTOR_WORKERS", "4"))
+ACTOR_WORKERS_EVENTOS = int(os.getenv("ACTOR_WORKERS_EVENTOS", "2"))
+ACTOR_COLA_EVENTOS = int(os.getenv("ACTOR_COLA_EVENTOS", "10000"))
+ACTOR_SUB_HWM = int(os.getenv("ACTOR_SUB_HWM", "100000"))
+ACTOR_DRENAJE_S = float(os.getenv("ACTOR_DRENAJE_S", "5"))
+LISTO = b"LISTO"  # worker libre, para el broker LRU (propio o del supervisor)
+TOPICO_INVALIDAR = "invalidar"  # eventos del GC para la caché de usuarios (cache.py)
+
+
+def endpoints_ga() -> List[str]:
+    """
+    Endpoints del gestor de almacenamiento. Admite una lista separada por
+    comas, con o sin "tcp://" (GESTOR_ALMACENAMIENTO_ADDR o
+    GESTOR_ALMACENAMIENTO), o GESTOR_ALMACENAMIENTO_HOST/PORT.
+    """
+    valor = os.getenv("GESTOR_ALMACENAMIENTO_ADDR") or os.getenv("GESTOR_ALMACENAMIENTO")
+    if not valor:
+        host = os.getenv("GESTOR_ALMACENAMIENTO_HOST", "gestor_almacenamiento")
+        port = os.getenv("GESTOR_ALMACENAMIENTO_PORT", "5570")
+        valor = f"{host}:{port}"
+    return [e if "://" in e else f"tcp://{e}" for e in (x.strip() for x in valor.split(",")) if e]
+
+
+def endpoint_pub_gc() -> str:
+    """Dirección del PUB del gestor de carga (misma prioridad que el resto de servicios)."""
+    if os.getenv("GESTOR_CARGA_PUB_ADDR"):
+        return os.getenv("GESTOR_CARGA_PUB_ADDR")
+    host = os.getenv("GESTOR_CARGA_HOST", "gestor_carga")
+    port = os.getenv("GESTOR_CARGA_PUB_PORT", "5556")
+    return f"tcp://{host}:{port}"
+
 
 class Actor(ABC):
     topic: str
+    nombre: str = "Actor"        # prefijo de los logs
+    puerto: Optional[int] = None  # puerto del ROUTER para peticiones síncronas del GC
+    puerto_resultados: Optional[int] = None  # puerto del PUB con el resultado de cada evento
+
+    def __init__(self, workers: Optional[int] = None, context: Optional[zmq.Context] = None,
+                 bind_endpoint: Optional[str] = None, pub_endpoint: Optional[str] = None,
+                 ga_endpoints: Optional[List[str]] = None, workers_eventos: Optional[int] = None,
+                 pub_resultados_endpoint: Optional[str] = None):
+        self.workers = workers or ACTOR_WORKERS
+        self.context = context or zmq.Context.instance()
+        self.bind_endpoint = bind_endpoint or (f"tcp://*:{self.puerto}" if self.puerto else None)
+        self.pub_endpoint = pub_endpoint or endpoint_pub_gc()
+        self.ga_endpoints = ga_endpoints or endpoints_ga()
+        self.salud_ga = SaludEndpoints(self.ga_endpoints)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._fin_eventos = threading.Event()  # deja de drenar la cola de eventos
+        self._id = uuid.uuid4().hex[:8]
+        self._threads: List[threading.Thread] = []
+        self._hilos_eventos: List[threading.Thread] = []
+        # Canal PUB/SUB: cola acotada entre recepción y handle(), huecos de seq y resultados
+        self.workers_eventos = workers_eventos or ACTOR_WORKERS_EVENTOS
+        self._cola_eventos: "queue.Queue[dict]" = queue.Queue(maxsize=ACTOR_COLA_EVENTOS)
+        self.topic_resultados = f"resultado.{self.topic}"
+        self.pub_resultados_endpoint = pub_resultados_endpoint or os.getenv("ACTOR_RESULTADOS_ADDR") or (
+            f"tcp://*:{self.puerto_resultados}" if self.puerto_resultados else None)
+        self.contadores_eventos = {"recibidos": 0, "procesados": 0, "descartados": 0, "perdidos": 0}
+        self._ultimo_seq: Dict[str, int] = {}
+        self._seq_resultados = 0
+        # Estado de préstamos de los usuarios que enruta el GC a esta réplica
+        self.cache = CacheUsuarios()
+        self.carga = CargaReciente()
+        # Modo supervisado (supervisor_actores): el supervisor hace de broker
+        self.supervisado = bool(os.getenv("ACTOR_BACKEND_ADDR"))
+        self.hijo_id = os.getenv("ACTOR_HIJO_ID") or self._id
+        if self.supervisado:
+            self.bind_endpoint = None
+            self.pub_resultados_endpoint = None
+        self.salud_endpoint = os.getenv("ACTOR_SALUD_ADDR")
 
     @abstractmethod
     def handle(self, msg: dict) -> dict:
-        ...
\ No newline at end of file
+        ...
+
+    def respuesta_sincrona(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Adapta el resultado de handle() a lo que espera el GC por REQ/REP."""
+        return result
+
+    # Gestor de almacenamiento (un ClienteGA por hilo, salud compartida)
+    def _cliente_ga(self) -> ClienteGA:
+        cliente = getattr(self._local, "ga", None)
+        if cliente is None:
+            cliente = ClienteGA(self.salud_ga, self.context)
+            self._local.ga = cliente
+        return cliente
+
+    def _cerrar_cliente_ga(self) -> None:
+        cliente = getattr(self._local, "ga", None)
+        if cliente is not None:
+            cliente.cerrar()
+            self._local.ga = None
+
+    def solicitar_ga(self, peticion: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Petición síncrona al GA desde el hilo actual, por el endpoint sano que
+        toque (ver cliente_ga.py). Lanza zmq.Again si ninguno respondió.
+        """
+        accion = peticion.get("action") or peticion.get("accion")
+        with traza.subspan("actor.ga", accion=accion) as span:
+            return self._cliente_ga().solicitar(traza.con_cabeceras(peticion, span))
+
+    # Runtime
+    def _worker(self, n: int, backend: str) -> None:
+        """
+        Atiende peticiones síncronas del GC con un REQ que avisa al broker
+        cuando queda libre; recibe y devuelve el sobre del cliente junto con
+        el mensaje.
+        """
+        rep = self.context.socket(zmq.REQ)
+        rep.linger = 0
+        rep.identity = f"{self.hijo_id}/{n}".encode()
+        rep.connect(backend)
+        rep.send(LISTO)
+        try:
+            while not self._stop.is_set():
+                if not rep.poll(500):
+                    continue
+                *sobre, cuerpo = rep.recv_multipart()
+                req = json.loads(cuerpo)
+                inicio = self.carga.empezar()
+                span = traza.iniciar(self.nombre, f"actor.{self.topic}", traza.de_mensaje(req), worker=n)
+                try:
+                    with span:
+                        response = self.respuesta_sincrona(self.handle(req))
+                        span.anotar(exito=bool(response.get("exito")))
+                except Exception as e:
+                    response = {"exito": False, "error": str(e)}
+                finally:
+                    self.carga.terminar(inicio)
+                rep.send_multipart([*sobre, json.dumps(response).encode("utf-8")])
+                print(f"[{self.nombre}] Req/Rep resultado (worker {n}): {response}")
+        finally:
+            rep.close(0)
+            self._cerrar_cliente_ga()
+
+    def _worker_eventos(self, n: int, resultados: str) -> None:
+        """
+        Consume la cola de eventos del SUB y envía cada resultado al hilo
+        principal. Al parar sigue hasta vaciar la cola (o hasta _fin_eventos).
+        """
+        push = self.context.socket(zmq.PUSH)
+        push.linger = 0
+        push.connect(resultados)
+        try:
+            while not self._fin_eventos.is_set():
+                try:
+                    msg = self._cola_eventos.get(timeout=0.1 if self._stop.is_set() else 0.5)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                inicio = self.carga.empezar()
+                span = traza.iniciar(self.nombre, f"actor.{self.topic}.evento", traza.de_mensaje(msg),
+                                     worker=n, seq=msg.get("seq"))
+                try:
+                    with span:
+                        result = self.handle(msg)
+                    estado = "procesado"
+                except Exception as e:
+                    print(f"[{self.nombre}] Error en PUB/SUB (worker eventos {n}): {e}")
+                    result = {"ok": False, "error": str(e)}
+                    estado = "error"
+                finally:
+                    self.carga.terminar(inicio)
+                print(f"[{self.nombre}] Evento resultado (worker eventos {n}): {result}")
+                push.send_json({"estado": estado, "evento": msg, "resultado": result})
+        finally:
+            push.close(0)
+            self._cerrar_cliente_ga()
+
+    def _revisar_secuencia(self, msg: Dict[str, Any]) -> int:
+        """Detecta huecos en el seq que el GC pone a cada evento (por origen)."""
+        origen, seq = msg.get("origen"), msg.get("seq")
+        if origen is None or not isinstance(seq, int):
+            return 0
+        ultimo = self._ultimo_seq.get(origen)
+        perdidos = 0
+        if ultimo is not None and seq > ultimo + 1:
+            perdidos = seq - ultimo - 1
+            self.contadores_eventos["perdidos"] += perdidos
+            print(f"[{self.nombre}] Hueco en eventos de {origen}: {perdidos} perdido(s) "
+                  f"entre seq {ultimo} y {seq}")
+        if ultimo is None or seq > ultimo:
+            self._ultimo_seq[origen] = seq
+        return perdidos
+
+    def _aplicar_invalidacion(self, msg: Dict[str, Any]) -> None:
+        """Evento "invalidar" del GC para la caché."""
+        # Si se perdió alguna invalidación no se sabe qué quedó desfasado
+        if self._revisar_secuencia(msg):
+            self.cache.limpiar()
+        self.cache.aplicar_evento(msg)
+
+    def _publicar_resultado(self, pub: zmq.Socket, datos: Dict[str, Any]) -> None:
+        """Publica en "resultado.<topic>" con un seq propio del actor (solo hilo principal)."""
+        self._seq_resultados += 1
+        evento = datos.get("evento") or {}
+        mensaje = {
+            "origen": self._id,
+            "seq": self._seq_resultados,
+            "actor": self.nombre,
+            "estado": datos["estado"],
+            "evento": {"origen": evento.get("origen"), "seq": evento.get("seq"),
+                       "isbn": evento.get("isbn"), "usuario": evento.get("usuario")},
+            "resultado": datos.get("resultado"),
+        }
+        pub.send_string(f"{self.topic_resultados} {json.dumps(mensaje)}")
+
+    def estado_salud(self) -> Dict[str, Any]:
+        """Carga del actor para el health-check (la usa el supervisor para escalar)."""
+        return {
+            "actor": self.nombre,
+            "workers": self.workers,
+            **self.carga.a_dict(),
+            "cola_eventos": self._cola_eventos.qsize(),
+            "eventos": dict(self.contadores_eventos),
+            "cache": self.cache.estadisticas(),
+        }
+
+    def run(self) -> None:
+        """Arranca los workers y reparte peticiones/eventos hasta KeyboardInterrupt o stop()."""
+        resultados_ep = f"inproc://actor-{self.topic}-{self._id}-resultados"
+        resultados = self.context.socket(zmq.PULL)
+        resultados.linger = 0
+        resultados.bind(resultados_ep)
+
+        poller = zmq.Poller()
+        poller.register(resultados, zmq.POLLIN)
+
+        # Peticiones síncronas: ROUTER propio -> ROUTER inproc (LRU) -> workers REQ, o
+        # en modo supervisado los workers se conectan directamente al broker del supervisor
+        frontend = backend = None
+        libres: deque = deque()  # workers libres, el más antiguo primero
+        backend_ep = os.getenv("ACTOR_BACKEND_ADDR")
+        if not backend_ep:
+            backend_ep = f"inproc://actor-{self.topic}-{self._id}-rep"
+            backend = self.context.socket(zmq.ROUTER)
+            backend.linger = 0
+            backend.bind(backend_ep)
+            poller.register(backend, zmq.POLLIN)
+            if self.bind_endpoint:
+                frontend = self.context.socket(zmq.ROUTER)
+                frontend.linger = 0
+                frontend.bind(self.bind_endpoint)
+        leyendo_frontend = False
+
+        pub = None
+        if self.pub_resultados_endpoint:
+            pub = self.context.socket(zmq.PUB)
+            pub.linger = 0
+            pub.bind(self.pub_resultados_endpoint)
+        elif os.getenv("ACTOR_RESULTADOS_CONNECT"):
+            # Modo supervisado: el supervisor reúne los resultados de todos los procesos
+            pub = self.context.socket(zmq.PUB)
+            pub.linger = 0
+            pub.connect(os.getenv("ACTOR_RESULTADOS_CONNECT"))
+
+        # Eventos: SUB al GC, o en modo supervisado un DEALER hacia el supervisor
+        # (que reparte cada evento a un solo proceso). Las invalidaciones de la
+        # caché llegan siempre por SUB, porque cada proceso necesita todas.
+        eventos = None
+        if os.getenv("ACTOR_EVENTOS_ADDR"):
+            eventos = self.context.socket(zmq.DEALER)
+            eventos.linger = 0
+            eventos.identity = self.hijo_id.encode()
+            eventos.connect(os.getenv("ACTOR_EVENTOS_ADDR"))
+            poller.register(eventos, zmq.POLLIN)
+
+        sub = self.context.socket(zmq.SUB)
+        sub.linger = 0
+        # El SUB se vacía continuamente hacia la cola acotada: así el HWM de ZMQ
+        # no descarta en silencio cuando el GA va lento (lo hace la cola, contándolo)
+        sub.rcvhwm = ACTOR_SUB_HWM
+        sub.connect(self.pub_endpoint)
+        if eventos is None:
+            sub.setsockopt_string(zmq.SUBSCRIBE, self.topic)
+        if self.cache.activa:
+            sub.setsockopt_string(zmq.SUBSCRIBE, TOPICO_INVALIDAR)
+        poller.register(sub, zmq.POLLIN)
+
+        salud = None
+        if self.salud_endpoint:
+            salud = HealthResponder(self.salud_endpoint, estado=self.estado_salud, context=self.context)
+            salud.start()
+        if eventos is not None:
+            # Alta en el supervisor: desde aquí le puede mandar eventos y preguntarle la carga
+            eventos.send_json({"hijo": self.hijo_id, "salud": salud.endpoint if salud else None})
+
+        for n in range(self.workers):
+            t = threading.Thread(target=self._worker, args=(n, backend_ep),
+                                 name=f"{self.nombre}-worker-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        for n in range(self.workers_eventos):
+            t = threading.Thread(target=self._worker_eventos, args=(n, resultados_ep),
+                                 name=f"{self.nombre}-eventos-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+            self._hilos_eventos.append(t)
+
+        print(f"[{self.nombre}] PUB/SUB conectado a {self.pub_endpoint}, "
+              f"REP en {self.bind_endpoint or backend_ep}, {self.workers} workers + {self.workers_eventos} de eventos, "
+              f"resultados en {self.pub_resultados_endpoint}, GA en {', '.join(self.ga_endpoints)}")
+
+        try:
+            while not self._stop.is_set():
+                # El frontend solo se lee mientras haya un worker libre
+                if frontend is not None and bool(libres) != leyendo_frontend:
+                    if libres:
+                        poller.register(frontend, zmq.POLLIN)
+                    else:
+                        poller.unregister(frontend)
+                    leyendo_frontend = bool(libres)
+                events = dict(poller.poll(500))
+                if backend is not None and backend in events:
+                    worker, _, *frames = backend.recv_multipart()
+                    if frames != [LISTO] and frontend is not None:
+                        frontend.send_multipart(frames)
+                    libres.append(worker)
+                if frontend is not None and frontend in events and libres:
+                    backend.send_multipart([libres.popleft(), b"", *frontend.recv_multipart()])
+                if resultados in events:
+                    self._resultado(resultados, pub)
+                if eventos is not None and eventos in events:
+                    # El supervisor ya revisó el seq: aquí cada proceso ve solo una parte
+                    self._encolar_evento(eventos.recv_json(), pub)
+                if sub in events:
+                    raw = sub.recv_string()
+                    parts = raw.split(" ", 1)
+                    if len(parts) != 2:
+                        continue
+                    try:
+                        msg = json.loads(parts[1])
+                    except ValueError:
+                        print(f"[{self.nombre}] Evento no es JSON: {parts[1][:100]}")
+                        continue
+                    if parts[0] == TOPICO_INVALIDAR:
+                        self._aplicar_invalidacion(msg)
+                        continue
+                    self._revisar_secuencia(msg)
+                    self._encolar_evento(msg, pub)
+        except KeyboardInterrupt:
+            print(f"[{self.nombre}] Interrumpido")
+        finally:
+            self._stop.set()
+            self._drenar_eventos(resultados, pub)
+            self.stop()
+            if salud is not None:
+                salud.stop()
+            for s in (frontend, backend, resultados, pub, eventos, sub):
+                if s is not None:
+                    s.close(0)
+
+    def _encolar_evento(self, msg: Dict[str, Any], pub: Optional[zmq.Socket]) -> None:
+        self.contadores_eventos["recibidos"] += 1
+        try:
+            self._cola_eventos.put_nowait(msg)
+        except queue.Full:
+            # Cola llena: se descarta, pero se cuenta y se publica el resultado
+            self.contadores_eventos["descartados"] += 1
+            print(f"[{self.nombre}] Cola de eventos llena ({self._cola_eventos.maxsize}), "
+                  f"evento descartado: {msg}")
+            if pub is not None:
+                self._publicar_resultado(pub, {"estado": "descartado", "evento": msg,
+                                               "resultado": {"ok": False, "error": "ColaLlena"}})
+
+    def _resultado(self, resultados: zmq.Socket, pub: Optional[zmq.Socket]) -> None:
+        datos = resultados.recv_json()
+        self.contadores_eventos["procesados"] += 1
+        if pub is not None:
+            self._publicar_resultado(pub, datos)
+
+    def _drenar_eventos(self, resultados: zmq.Socket, pub: Optional[zmq.Socket],
+                        timeout: float = ACTOR_DRENAJE_S) -> int:
+        """
+        Ya no entra trabajo: publica los resultados mientras los workers de
+        eventos vacían la cola, hasta `timeout` segundos. Devuelve cuántos
+        eventos quedaron sin procesar (se cuentan como descartados).
+        """
+        limite = time.monotonic() + timeout
+        while any(t.is_alive() for t in self._hilos_eventos) and time.monotonic() < limite:
+            if resultados.poll(100):
+                self._resultado(resultados, pub)
+        self._fin_eventos.set()
+        while resultados.poll(0):
+            self._resultado(resultados, pub)
+        restantes = self._cola_eventos.qsize()
+        if restantes:
+            self.contadores_eventos["descartados"] += restantes
+            print(f"[{self.nombre}] {restantes} evento(s) sin procesar al parar (tras {timeout}s)")
+        return restantes
+
+    def stop(self) -> None:
+        self._stop.set()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout=1.0)
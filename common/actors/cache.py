@@ -0,0 +1,131 @@
+"""
+Caché por actor del estado de los préstamos de cada usuario.
+
+Gracias al enrutado por hash de usuario del GC, cada réplica de un actor ve
+siempre a los mismos usuarios, así que puede recordar lo que el GA respondió
+(préstamo activo, renovaciones usadas, préstamo inexistente...) y rechazar
+sin ir al GA las peticiones que sabe que fallarían.
+
+Las entradas se invalidan:
+- con los eventos "invalidar" que publica el GC tras un préstamo/devolución,
+- por TTL (ACTOR_CACHE_TTL), que acota lo que pueda quedar desfasado,
+- completas si se detecta un hueco en el seq de "invalidar".
+
+En modo asíncrono el GC publica "invalidar" con "pendiente" antes de que otro
+actor aplique la operación, así que lo que el GA responda mientras tanto ya
+no valdrá. Ese (usuario, isbn) queda marcado un TTL y no se guarda nada de
+él; tras un hueco, como no se sabe qué quedó pendiente, no se guarda nada de
+nadie durante un TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+ACTOR_CACHE_TTL = float(os.getenv("ACTOR_CACHE_TTL", "30"))
+ACTOR_CACHE_USUARIOS = int(os.getenv("ACTOR_CACHE_USUARIOS", "10000"))
+
+NO_EXISTE = "NO_EXISTE"  # estado para "el GA dijo que no hay préstamo"
+
+
+class CacheUsuarios:
+    """LRU por usuario -> {isbn: (expira, prestamo)}; thread-safe."""
+
+    def __init__(self, ttl: float = ACTOR_CACHE_TTL, max_usuarios: int = ACTOR_CACHE_USUARIOS):
+        self.ttl = ttl
+        self.max_usuarios = max_usuarios
+        self._lock = threading.Lock()
+        self._usuarios: "OrderedDict[str, Dict[str, tuple]]" = OrderedDict()
+        # (usuario, isbn) con una operación asíncrona sin aplicar -> hasta cuándo no guardar
+        self._pendientes: "OrderedDict[tuple, float]" = OrderedDict()
+        self._sin_guardar_hasta = 0.0
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.omitidas = 0
+
+    @property
+    def activa(self) -> bool:
+        return self.ttl > 0 and self.max_usuarios > 0
+
+    def obtener(self, usuario, isbn) -> Optional[Dict[str, Any]]:
+        """{"estado": ..., "renovaciones": ...} si hay una entrada vigente."""
+        if not self.activa:
+            return None
+        with self._lock:
+            entradas = self._usuarios.get(usuario)
+            entrada = entradas.get(isbn) if entradas else None
+            if entrada is None or entrada[0] < time.monotonic():
+                self.fallos += 1
+                return None
+            self._usuarios.move_to_end(usuario)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, usuario, isbn, estado: str, renovaciones: Optional[int] = None) -> None:
+        if not self.activa or not usuario or not isbn:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora < self._sin_guardar_hasta or self._pendientes.get((usuario, isbn), 0) > ahora:
+                self.omitidas += 1
+                return
+            entradas = self._usuarios.setdefault(usuario, {})
+            entradas[isbn] = (ahora + self.ttl, {"estado": estado, "renovaciones": renovaciones})
+            self._usuarios.move_to_end(usuario)
+            while len(self._usuarios) > self.max_usuarios:
+                self._usuarios.popitem(last=False)
+
+    def invalidar(self, usuario, isbn=None) -> None:
+        with self._lock:
+            self.invalidaciones += 1
+            if isbn is None:
+                self._usuarios.pop(usuario, None)
+                return
+            entradas = self._usuarios.get(usuario)
+            if entradas:
+                entradas.pop(isbn, None)
+
+    def marcar_pendiente(self, usuario, isbn) -> None:
+        """Olvida la entrada y no guarda nada de ella durante un TTL (operación aún sin aplicar)."""
+        with self._lock:
+            self.invalidaciones += 1
+            entradas = self._usuarios.get(usuario)
+            if entradas:
+                entradas.pop(isbn, None)
+            ahora = time.monotonic()
+            # Las marcas se añaden en orden de caducidad: las vencidas están al principio
+            while self._pendientes and next(iter(self._pendientes.values())) <= ahora:
+                self._pendientes.popitem(last=False)
+            self._pendientes.pop((usuario, isbn), None)
+            self._pendientes[(usuario, isbn)] = ahora + self.ttl
+
+    def limpiar(self) -> None:
+        """Vacía la caché y no guarda nada durante un TTL (se perdieron invalidaciones)."""
+        with self._lock:
+            self._usuarios.clear()
+            self._pendientes.clear()
+            self._sin_guardar_hasta = time.monotonic() + self.ttl
+
+    def aplicar_evento(self, msg: Dict[str, Any]) -> None:
+        """
+        Evento "invalidar" del GC: guarda el estado nuevo si viene, marca el
+        préstamo si la operación aún está pendiente y si no olvida la entrada.
+        """
+        usuario, isbn = msg.get("usuario"), msg.get("isbn")
+        if not usuario:
+            return
+        prestamo = msg.get("prestamo")
+        if prestamo and isbn:
+            self.guardar(usuario, isbn, prestamo.get("estado"), prestamo.get("renovaciones"))
+        elif msg.get("pendiente") and isbn:
+            self.marcar_pendiente(usuario, isbn)
+        else:
+            self.invalidar(usuario, isbn)
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {"usuarios": len(self._usuarios), "aciertos": self.aciertos,
+                    "fallos": self.fallos, "invalidaciones": self.invalidaciones,
+                    "pendientes": len(self._pendientes), "omitidas": self.omitidas}
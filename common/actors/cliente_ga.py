@@ -0,0 +1,139 @@
+"""
+Cliente del gestor de almacenamiento con varios endpoints (lazy pirate).
+
+- Cada ClienteGA usa un socket REQ por endpoint y lo reconstruye en cuanto
+  vence un timeout (un REQ sin respuesta queda inutilizable).
+- La salud de cada endpoint (SaludEndpoints) se comparte entre todos los
+  clientes de un proceso: tras un fallo el endpoint queda "en enfriamiento"
+  con backoff exponencial y las peticiones van a los demás; cuando vence el
+  enfriamiento se le vuelve a probar con una petición real.
+- Solo se reintenta en otro endpoint una petición que pudo no llegar al GA
+  si la acción es idempotente (lecturas); una escritura que agota el timeout
+  se devuelve como error para no aplicarla dos veces.
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import zmq
+
+GA_TIMEOUT_MS = int(os.getenv("GA_TIMEOUT_MS", "5000"))
+GA_REINTENTOS = int(os.getenv("GA_REINTENTOS", "3"))
+GA_ENFRIAMIENTO_MS = int(os.getenv("GA_ENFRIAMIENTO_MS", "1000"))
+GA_ENFRIAMIENTO_MAX_MS = int(os.getenv("GA_ENFRIAMIENTO_MAX_MS", "30000"))
+
+ACCIONES_IDEMPOTENTES = {"validar_renovacion", "consultar_libro", "metricas", "estadisticas"}
+
+
+class SaludEndpoints:
+    """Estado UP/DOWN de cada endpoint del GA, compartido entre hilos."""
+
+    def __init__(self, endpoints: Iterable[str], enfriamiento_ms: int = GA_ENFRIAMIENTO_MS,
+                 enfriamiento_max_ms: int = GA_ENFRIAMIENTO_MAX_MS):
+        self.endpoints = list(endpoints)
+        self.enfriamiento = enfriamiento_ms / 1000.0
+        self.enfriamiento_max = enfriamiento_max_ms / 1000.0
+        self._lock = threading.Lock()
+        self._fallos: Dict[str, int] = {ep: 0 for ep in self.endpoints}
+        self._hasta: Dict[str, float] = {ep: 0.0 for ep in self.endpoints}
+        self._turno = itertools.count()
+
+    def orden(self) -> List[str]:
+        """
+        Endpoints a intentar: primero los sanos (en turno rotatorio para
+        repartir carga), después los que están en enfriamiento, el que antes
+        vence primero.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            sanos = [ep for ep in self.endpoints if self._hasta[ep] <= ahora]
+            caidos = sorted((ep for ep in self.endpoints if self._hasta[ep] > ahora), key=self._hasta.get)
+            if sanos:
+                k = next(self._turno) % len(sanos)
+                sanos = sanos[k:] + sanos[:k]
+        return sanos + caidos
+
+    def exito(self, endpoint: str) -> None:
+        with self._lock:
+            if self._fallos[endpoint]:
+                print(f"[ClienteGA] {endpoint} vuelve a responder")
+            self._fallos[endpoint] = 0
+            self._hasta[endpoint] = 0.0
+
+    def fallo(self, endpoint: str) -> None:
+        with self._lock:
+            self._fallos[endpoint] += 1
+            espera = min(self.enfriamiento_max, self.enfriamiento * (2 ** (self._fallos[endpoint] - 1)))
+            self._hasta[endpoint] = time.monotonic() + espera
+            print(f"[ClienteGA] {endpoint} sin respuesta ({self._fallos[endpoint]} fallo(s)); "
+                  f"se evita durante {espera:.1f}s")
+
+    def estado(self) -> Dict[str, str]:
+        ahora = time.monotonic()
+        with self._lock:
+            return {ep: ("DOWN" if self._hasta[ep] > ahora else "UP") for ep in self.endpoints}
+
+
+class ClienteGA:
+    """
+    Cliente REQ del GA para un único hilo (los sockets ZMQ no son thread-safe).
+    Lanza zmq.Again si ningún endpoint respondió.
+    """
+
+    def __init__(self, salud: SaludEndpoints, context: Optional[zmq.Context] = None,
+                 timeout_ms: int = GA_TIMEOUT_MS, reintentos: int = GA_REINTENTOS):
+        self.salud = salud
+        self.context = context or zmq.Context.instance()
+        self.timeout_ms = timeout_ms
+        self.reintentos = max(1, reintentos)
+        self._sockets: Dict[str, zmq.Socket] = {}
+
+    def _socket(self, endpoint: str) -> zmq.Socket:
+        sock = self._sockets.get(endpoint)
+        if sock is None:
+            sock = self.context.socket(zmq.REQ)
+            sock.linger = 0
+            sock.connect(endpoint)
+            self._sockets[endpoint] = sock
+        return sock
+
+    def _descartar(self, endpoint: str) -> None:
+        sock = self._sockets.pop(endpoint, None)
+        if sock is not None:
+            sock.close(0)
+
+    def solicitar(self, peticion: Dict, idempotente: Optional[bool] = None) -> Dict:
+        if idempotente is None:
+            accion = peticion.get("action") or peticion.get("accion")
+            idempotente = accion in ACCIONES_IDEMPOTENTES
+
+        ultimo = None
+        for endpoint in self.salud.orden()[:self.reintentos]:
+            sock = self._socket(endpoint)
+            try:
+                sock.send_json(peticion, flags=zmq.NOBLOCK)
+            except zmq.ZMQError as e:
+                # No salió del proceso: se puede probar otro endpoint sin riesgo
+                self._descartar(endpoint)
+                self.salud.fallo(endpoint)
+                ultimo = e
+                continue
+
+            if sock.poll(self.timeout_ms, zmq.POLLIN):
+                respuesta = sock.recv_json()
+                self.salud.exito(endpoint)
+                return respuesta
+
+            self._descartar(endpoint)
+            self.salud.fallo(endpoint)
+            ultimo = zmq.Again(f"Sin respuesta de {endpoint} en {self.timeout_ms} ms")
+            if not idempotente:
+                break
+
+        raise ultimo or zmq.Again("No hay endpoints del gestor de almacenamiento")
+
+    def cerrar(self) -> None:
+        for endpoint in list(self._sockets):
+            self._descartar(endpoint)
@@ -0,0 +1,105 @@
+"""
+Agrupación de peticiones concurrentes en lotes (coalescing).
+
+Los workers de un actor llaman a `Coalescedor.enviar(item)` y se quedan
+esperando su resultado. Si no hay ningún lote en vuelo, el hilo que llega
+envía enseguida lo que haya pendiente (su propio item, normalmente) con
+`enviar_lote(items) -> resultados` desde su propio hilo (con su propio socket
+al GA). Mientras un lote está en vuelo los que llegan se acumulan, y al
+volver ese lote el primero de ellos se lleva hasta `maximo` y los envía de
+una vez; el resto recibe su resultado sin haber hecho ninguna petición. Así
+con poca carga no se añade espera y con mucha los lotes crecen solos.
+
+`ventana_ms` > 0 hace además que quien envía espere hasta ese tiempo (o hasta
+reunir `maximo` elementos) antes de salir, para lotes más grandes a costa de
+latencia. El tamaño real de los lotes está acotado por el número de workers
+que pueden estar esperando a la vez (ACTOR_WORKERS + ACTOR_WORKERS_EVENTOS).
+"""
+import threading
+import time
+from typing import Any, Callable, List
+
+from common.tracing import traza
+
+
+class _Pendiente:
+    __slots__ = ("item", "resultado", "error", "enviado", "listo")
+
+    def __init__(self, item):
+        self.item = item
+        self.enviado = False
+        self.resultado = None
+        self.error = None
+        self.listo = threading.Event()
+
+
+class Coalescedor:
+    def __init__(self, enviar_lote: Callable[[List[Any]], List[Any]], ventana_ms: float, maximo: int):
+        self.enviar_lote = enviar_lote
+        self.ventana = ventana_ms / 1000.0
+        self.maximo = max(1, maximo)
+        self._cond = threading.Condition()
+        self._pendientes: List[_Pendiente] = []
+        self._en_vuelo = False
+        self.lotes = 0
+        self.elementos = 0
+
+    def enviar(self, item) -> Any:
+        """Añade el item al lote en curso y devuelve su resultado (o relanza el error del envío)."""
+        # Con trazas, lo que tarda en salir y volver el lote queda como span "actor.lote"
+        with traza.subspan("actor.lote"):
+            return self._enviar(item)
+
+    def _enviar(self, item) -> Any:
+        p = _Pendiente(item)
+        with self._cond:
+            self._pendientes.append(p)
+            if len(self._pendientes) >= self.maximo:
+                self._cond.notify_all()
+
+        while True:
+            with self._cond:
+                # Con un lote en vuelo se espera a que vuelva; entonces envía el
+                # primero que despierte y su item sale en ese lote o en uno siguiente
+                while self._en_vuelo and not p.enviado:
+                    self._cond.wait()
+                if p.enviado:
+                    break
+                self._en_vuelo = True
+                limite = time.monotonic() + self.ventana
+                while len(self._pendientes) < self.maximo:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                lote, self._pendientes = self._pendientes[:self.maximo], self._pendientes[self.maximo:]
+                for q in lote:
+                    q.enviado = True
+            try:
+                self._despachar(lote)
+            finally:
+                with self._cond:
+                    self._en_vuelo = False
+                    self._cond.notify_all()
+
+        p.listo.wait()
+        if p.error is not None:
+            raise p.error
+        return p.resultado
+
+    def _despachar(self, lote: List[_Pendiente]) -> None:
+        traza.actual().anotar(lider=True, tamano=len(lote))
+        try:
+            resultados = self.enviar_lote([p.item for p in lote])
+            if len(resultados) != len(lote):
+                raise ValueError(f"Se esperaban {len(lote)} resultados y llegaron {len(resultados)}")
+            for p, r in zip(lote, resultados):
+                p.resultado = r
+        except Exception as e:
+            for p in lote:
+                p.error = e
+        finally:
+            self.lotes += 1
+            self.elementos += len(lote)
+            for p in lote:
+                p.listo.set()
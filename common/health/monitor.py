@@ -1,24 +1,102 @@
-import time
+"""
+Monitor de salud con sockets persistentes y detección phi-accrual.
+
+Un solo hilo sondea todos los objetivos a la vez: cada uno tiene un DEALER
+persistente hacia su HealthResponder (REP) y recibe un ping cada
+`intervalo_ms`, sin esperar a los demás. El transporte usa el heartbeat
+nativo de ZMQ (ZMQ_HEARTBEAT_IVL/TIMEOUT) para detectar conexiones TCP
+muertas y reconectar, y como mucho hay un ping en vuelo por objetivo: si no
+contesta en `timeout_ms` se rehace el socket (lazy pirate).
+
+En lugar de UP/DOWN binario, cada objetivo tiene un nivel de sospecha phi
+(Hayashibara et al.): con la media y la desviación de los intervalos entre
+respuestas, phi = -log10(P(la siguiente respuesta llegue aún más tarde)).
+phi = 1 es ~10% de probabilidad de equivocarse al darlo por caído, phi = 3
+~0.1%, etc. El objetivo pasa a DOWN cuando phi >= `umbral_phi` y vuelve a UP
+con la siguiente respuesta.
+"""
+import json
+import math
+import os
 import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
 import zmq
-from typing import Callable, Dict
+
+HEALTH_INTERVALO_MS = int(os.getenv("HEALTH_INTERVALO_MS", "100"))
+HEALTH_TIMEOUT_MS = int(os.getenv("HEALTH_TIMEOUT_MS", "700"))
+HEALTH_UMBRAL_PHI = float(os.getenv("HEALTH_UMBRAL_PHI", "8"))
+HEALTH_VENTANA = int(os.getenv("HEALTH_VENTANA", "100"))
+HEALTH_DESVIACION_MIN_MS = float(os.getenv("HEALTH_DESVIACION_MIN_MS", "20"))
+
+
+class DetectorPhi:
+    """Phi-accrual sobre una ventana de intervalos entre respuestas (en segundos)."""
+
+    def __init__(self, ventana: int = HEALTH_VENTANA, desviacion_min_ms: float = HEALTH_DESVIACION_MIN_MS,
+                 intervalo_esperado_ms: float = HEALTH_INTERVALO_MS):
+        self.intervalos: deque = deque(maxlen=ventana)
+        self.desviacion_min = desviacion_min_ms / 1000.0
+        # Hasta tener historia se supone el intervalo configurado
+        self.intervalos.append(intervalo_esperado_ms / 1000.0)
+        self.ultimo: Optional[float] = None
+
+    def latido(self, ahora: float) -> None:
+        if self.ultimo is not None:
+            self.intervalos.append(ahora - self.ultimo)
+        self.ultimo = ahora
+
+    def phi(self, ahora: float) -> float:
+        if self.ultimo is None:
+            return 0.0
+        n = len(self.intervalos)
+        media = sum(self.intervalos) / n
+        varianza = sum((x - media) ** 2 for x in self.intervalos) / n
+        desviacion = max(math.sqrt(varianza), self.desviacion_min)
+        y = (ahora - self.ultimo - media) / desviacion
+        # Aproximación logística de la cola de la normal (la misma que usa Akka)
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        p_despues = e / (1.0 + e) if y > 0 else 1.0 - 1.0 / (1.0 + e)
+        return -math.log10(max(p_despues, 1e-300))
+
+
+class _Objetivo:
+    def __init__(self, nombre: str, endpoint: str):
+        self.nombre = nombre
+        self.endpoint = endpoint
+        self.socket: Optional[zmq.Socket] = None
+        self.enviado: Optional[float] = None   # ping en vuelo desde este instante
+        self.alta: Optional[float] = None      # primer intento de conexión
+        self.detector = DetectorPhi()
+        self.estado: Dict[str, Any] = {}        # última respuesta del HealthResponder
+
 
 class HealthMonitor:
     """
-    Hace ping (REQ) a endpoints REP de health. Notifica cambios (UP/DOWN) por callback.
+    Hace ping a endpoints REP de health y notifica cambios (UP/DOWN) por callback.
+    `phi(nombre)` da el nivel de sospecha actual y `disponible(nombre)` si está UP.
     """
-    def __init__(self, poll_interval: float = 2.0, timeout_ms: int = 700):
-        self.poll_interval = poll_interval
+    def __init__(self, intervalo_ms: int = HEALTH_INTERVALO_MS, timeout_ms: int = HEALTH_TIMEOUT_MS,
+                 umbral_phi: float = HEALTH_UMBRAL_PHI, context: Optional[zmq.Context] = None):
+        self.intervalo = intervalo_ms / 1000.0
         self.timeout_ms = timeout_ms
+        self.umbral_phi = umbral_phi
+        self.context = context or zmq.Context.instance()
         self.targets: Dict[str, str] = {}         # name -> endpoint
         self.status: Dict[str, str] = {}          # name -> "UP"/"DOWN"
+        self._objetivos: Dict[str, _Objetivo] = {}
+        self._lock = threading.Lock()
         self._on_change: Callable[[str, str], None] = lambda n, s: None
         self._stop = threading.Event()
-        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
 
     def add_target(self, name: str, endpoint: str):
-        self.targets[name] = endpoint
-        self.status.setdefault(name, "UNKNOWN")
+        with self._lock:
+            self.targets[name] = endpoint
+            self.status.setdefault(name, "UNKNOWN")
+            self._objetivos[name] = _Objetivo(name, endpoint)
 
     def on_change(self, cb: Callable[[str, str], None]):
         self._on_change = cb
@@ -30,28 +108,105 @@ class HealthMonitor:
         self._stop.set()
         self._thread.join(timeout=1.0)
 
-    def _probe(self, ctx: zmq.Context, endpoint: str) -> bool:
-        s = ctx.socket(zmq.REQ)
-        s.rcvtimeo = self.timeout_ms
-        s.sndtimeo = self.timeout_ms
+    def phi(self, name: str) -> float:
+        objetivo = self._objetivos.get(name)
+        return objetivo.detector.phi(time.monotonic()) if objetivo else 0.0
+
+    def disponible(self, name: str) -> bool:
+        """UP o aún sin datos; solo False si la sospecha supera el umbral."""
+        return self.status.get(name) != "DOWN"
+
+    def sospecha(self) -> Dict[str, float]:
+        ahora = time.monotonic()
+        with self._lock:
+            return {n: round(o.detector.phi(ahora), 2) for n, o in self._objetivos.items()}
+
+    def estado(self, name: str) -> Dict[str, Any]:
+        objetivo = self._objetivos.get(name)
+        return dict(objetivo.estado) if objetivo else {}
+
+    def _abrir(self, objetivo: _Objetivo) -> None:
+        s = self.context.socket(zmq.DEALER)
         s.linger = 0
-        s.connect(endpoint)
+        # Sin conexión establecida el ping no se encola (send da zmq.Again)
+        s.setsockopt(zmq.IMMEDIATE, 1)
+        s.sndhwm = 1
+        hb = max(1, int(self.intervalo * 1000))
+        s.setsockopt(zmq.HEARTBEAT_IVL, hb)
+        s.setsockopt(zmq.HEARTBEAT_TIMEOUT, self.timeout_ms)
+        s.setsockopt(zmq.HEARTBEAT_TTL, max(self.timeout_ms, 100))
+        s.connect(objetivo.endpoint)
+        objetivo.socket = s
+        if objetivo.alta is None:
+            objetivo.alta = time.monotonic()
+        objetivo.enviado = None
+
+    def _cerrar(self, objetivo: _Objetivo) -> None:
+        if objetivo.socket is not None:
+            objetivo.socket.close(0)
+            objetivo.socket = None
+
+    def _cambiar(self, objetivo: _Objetivo, nuevo: str) -> None:
+        if self.status.get(objetivo.nombre) != nuevo:
+            self.status[objetivo.nombre] = nuevo
+            self._on_change(objetivo.nombre, nuevo)
+
+    def _respuesta(self, objetivo: _Objetivo, cuerpo: bytes, ahora: float) -> None:
+        objetivo.enviado = None
+        objetivo.detector.latido(ahora)
         try:
-            s.send_json({"ping": True})
-            _ = s.recv_json()
-            return True
-        except Exception:
-            return False
-        finally:
-            s.close()
+            objetivo.estado = json.loads(cuerpo)
+        except ValueError:
+            objetivo.estado = {}
+        self._cambiar(objetivo, "UP")
+
+    def _revisar(self, objetivo: _Objetivo, ahora: float) -> None:
+        """Sin respuesta en esta vuelta: DOWN si phi supera el umbral."""
+        if objetivo.detector.phi(ahora) >= self.umbral_phi:
+            self._cambiar(objetivo, "DOWN")
+        elif objetivo.detector.ultimo is None and objetivo.alta is not None \
+                and (ahora - objetivo.alta) * 1000 >= self.timeout_ms:
+            # Nunca respondió: sin historia no hay phi, cuenta el timeout
+            self._cambiar(objetivo, "DOWN")
 
     def _loop(self):
-        ctx = zmq.Context.instance()
-        while not self._stop.is_set():
-            for name, ep in self.targets.items():
-                ok = self._probe(ctx, ep)
-                new_state = "UP" if ok else "DOWN"
-                if self.status.get(name) != new_state:
-                    self.status[name] = new_state
-                    self._on_change(name, new_state)
-            time.sleep(self.poll_interval)
+        proximo_ping = 0.0
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    objetivos = list(self._objetivos.values())
+                ahora = time.monotonic()
+
+                if ahora >= proximo_ping:
+                    proximo_ping = ahora + self.intervalo
+                    for o in objetivos:
+                        if o.socket is None:
+                            self._abrir(o)
+                        if o.enviado is not None:
+                            if (ahora - o.enviado) * 1000 < self.timeout_ms:
+                                continue
+                            # La respuesta no llegará por este socket: rehacerlo
+                            self._cerrar(o)
+                            self._abrir(o)
+                        try:
+                            o.socket.send_multipart([b"", b'{"ping": true}'], zmq.NOBLOCK)
+                            o.enviado = ahora
+                        except zmq.Again:
+                            pass
+
+                poller = zmq.Poller()
+                for o in objetivos:
+                    if o.socket is not None:
+                        poller.register(o.socket, zmq.POLLIN)
+                espera = max(0.0, proximo_ping - time.monotonic())
+                eventos = dict(poller.poll(espera * 1000))
+
+                ahora = time.monotonic()
+                for o in objetivos:
+                    if o.socket is not None and o.socket in eventos:
+                        self._respuesta(o, o.socket.recv_multipart()[-1], ahora)
+                    else:
+                        self._revisar(o, ahora)
+        finally:
+            for o in self._objetivos.values():
+                self._cerrar(o)
@@ -1,32 +1,63 @@
 import threading
 import zmq
+from typing import Any, Callable, Dict, Optional
 
 class HealthResponder:
     """
-    REP simple para health-check. Responde {"status":"ok"} a cualquier petición.
-    Ejecutar en un thread del proceso (GC, Actor, GA).
+    REP simple para health-check. Responde {"status":"ok"} a cualquier petición,
+    más la carga que haya registrado el componente que lo arranca: lo que
+    devuelva `estado()` y cada métrica añadida con `registrar(nombre, fn)`
+    (peticiones en curso, colas, latencias, uso del pool de la BD...).
+    Ejecutar en un thread del proceso (GC, Actor, GA); espera con un poller,
+    así que parado no consume CPU. El socket se enlaza en start(), así que
+    con un puerto comodín (p.ej. "tcp://127.0.0.1:*") `endpoint` tiene después
+    el puerto real.
     """
-    def __init__(self, bind_endpoint: str):
+    def __init__(self, bind_endpoint: str, estado: Optional[Callable[[], Dict[str, Any]]] = None,
+                 context: Optional[zmq.Context] = None):
         self.bind_endpoint = bind_endpoint
+        self.endpoint = bind_endpoint
+        self.estado = estado
+        self.context = context or zmq.Context.instance()
+        self.metricas: Dict[str, Callable[[], Any]] = {}
         self._stop = threading.Event()
+        self._sock = None
         self._thread = threading.Thread(target=self._serve, daemon=True)
 
+    def registrar(self, nombre: str, fn: Callable[[], Any]) -> None:
+        """Añade una métrica a la respuesta; `fn` se llama en cada health-check."""
+        self.metricas[nombre] = fn
+
     def start(self):
+        self._sock = self.context.socket(zmq.REP)
+        self._sock.linger = 0
+        self._sock.bind(self.bind_endpoint)
+        self.endpoint = self._sock.getsockopt_string(zmq.LAST_ENDPOINT)
         self._thread.start()
 
     def stop(self):
         self._stop.set()
         self._thread.join(timeout=1.0)
 
+    def respuesta(self) -> Dict[str, Any]:
+        respuesta: Dict[str, Any] = {"status": "ok"}
+        try:
+            if self.estado is not None:
+                respuesta.update(self.estado())
+            for nombre, fn in list(self.metricas.items()):
+                respuesta[nombre] = fn()
+        except Exception as e:
+            # Sigue vivo aunque una métrica falle: el health-check no debe mentir sobre eso
+            respuesta["error_metricas"] = str(e)
+        return respuesta
+
     def _serve(self):
-        ctx = zmq.Context.instance()
-        sock = ctx.socket(zmq.REP)
-        sock.linger = 0
-        sock.bind(self.bind_endpoint)
-        while not self._stop.is_set():
-            try:
-                msg = sock.recv_json(flags=zmq.NOBLOCK)
-                # Podrías incluir métricas aquí: carga, colas, etc.
-                sock.send_json({"status": "ok"})
-            except zmq.Again:
-                pass
+        sock = self._sock
+        try:
+            while not self._stop.is_set():
+                if not sock.poll(500):
+                    continue
+                sock.recv()
+                sock.send_json(self.respuesta())
+        finally:
+            sock.close(0)
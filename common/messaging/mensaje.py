@@ -7,4 +7,4 @@ class Mensaje:
     topico: str
     contenido: str
     date: datetime = field(default_factory=datetime.now)
-    headers: dict[str, str] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)  # p.ej. contexto de traza (common/tracing)
@@ -14,9 +14,13 @@ class Respuesta(Mensaje):
 
     def to_dict(self) -> Dict[str, Any]:
         # Serializar campos principales de la respuesta
-        return {
+        resultado = {
             "exito": self.exito,
             "mensaje": self.mensaje,
             "fechaOperacion": self.fechaOperacion,
             "datos": self.datos,
         }
+        if self.headers:
+            # Solo si hay algo (p.ej. el id de la traza, ver common/tracing)
+            resultado["headers"] = self.headers
+        return resultado
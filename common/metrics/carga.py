@@ -0,0 +1,66 @@
+"""
+Carga reciente de un componente: peticiones en curso y latencia de los
+últimos segundos, para publicarla por el HealthResponder.
+
+La latencia se guarda en dos histogramas que rotan cada `ventana_s`: el
+resumen combina el actual y el anterior, así refleja siempre entre una y dos
+ventanas de historia sin que una sola petición lenta de hace horas cuente.
+"""
+import os
+import threading
+import time
+from typing import Dict
+
+from common.metrics.histograma import Histograma
+
+CARGA_VENTANA_S = float(os.getenv("CARGA_VENTANA_S", "10"))
+
+
+class CargaReciente:
+    def __init__(self, ventana_s: float = CARGA_VENTANA_S):
+        self.ventana = ventana_s
+        self._lock = threading.Lock()
+        self.en_curso = 0
+        self.completadas = 0
+        self._actual = Histograma()
+        self._anterior = Histograma()
+        self._rotacion = time.monotonic() + ventana_s
+
+    def empezar(self) -> float:
+        with self._lock:
+            self.en_curso += 1
+        return time.perf_counter()
+
+    def terminar(self, inicio: float) -> None:
+        duracion_us = (time.perf_counter() - inicio) * 1_000_000
+        with self._lock:
+            self.en_curso -= 1
+            self.completadas += 1
+            self._rotar()
+            actual = self._actual
+        actual.registrar(duracion_us)
+
+    def _rotar(self) -> None:
+        ahora = time.monotonic()
+        if ahora < self._rotacion:
+            return
+        if ahora - self._rotacion >= self.ventana:
+            # Más de una ventana sin actividad: no queda nada reciente
+            self._anterior = Histograma()
+        else:
+            self._anterior = self._actual
+        self._actual = Histograma()
+        self._rotacion = ahora + self.ventana
+
+    def a_dict(self) -> Dict:
+        with self._lock:
+            self._rotar()
+            en_curso, completadas = self.en_curso, self.completadas
+            reciente = Histograma()
+            reciente.fusionar(self._anterior)
+            reciente.fusionar(self._actual)
+        return {
+            "en_curso": en_curso,
+            "completadas": completadas,
+            "latencia_us": reciente.resumen((50, 99)),
+        }
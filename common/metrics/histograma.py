@@ -0,0 +1,126 @@
+"""
+Histograma de latencias log-lineal (estilo HdrHistogram) en memoria.
+
+Los valores son enteros (p.ej. microsegundos). Por debajo de 128 cada valor
+tiene su propio bucket; por encima, cada potencia de 2 se divide en 64
+buckets, así que el error relativo de cualquier percentil es < 1/64 (~1.6%)
+sin importar el rango, y el histograma ocupa lo mismo con 10 muestras o con
+10 millones. Dos histogramas se pueden fusionar sumando sus buckets.
+"""
+import math
+import threading
+from typing import Dict, Iterable, Optional
+
+_SUB_BITS = 7
+_SUB = 1 << _SUB_BITS      # 128 buckets lineales
+_MITAD = _SUB >> 1         # 64 buckets por potencia de 2 a partir de ahí
+
+PERCENTILES_RESUMEN = (50, 90, 99, 99.9)
+
+
+def _indice(valor: int) -> int:
+    if valor < _SUB:
+        return valor
+    desplazamiento = valor.bit_length() - _SUB_BITS
+    return _SUB + (desplazamiento - 1) * _MITAD + ((valor >> desplazamiento) - _MITAD)
+
+
+def _limite_superior(indice: int) -> int:
+    """Mayor valor que cae en el bucket `indice`."""
+    if indice < _SUB:
+        return indice
+    desplazamiento = (indice - _SUB) // _MITAD + 1
+    mantisa = (indice - _SUB) % _MITAD + _MITAD
+    return ((mantisa + 1) << desplazamiento) - 1
+
+
+class Histograma:
+    """Histograma thread-safe; `registrar` es O(1)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[int, int] = {}
+        self.total = 0
+        self.suma = 0
+        self.minimo: Optional[int] = None
+        self.maximo: Optional[int] = None
+
+    def registrar(self, valor, veces: int = 1) -> None:
+        valor = max(0, int(valor))
+        i = _indice(valor)
+        with self._lock:
+            self._buckets[i] = self._buckets.get(i, 0) + veces
+            self.total += veces
+            self.suma += valor * veces
+            self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+            self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+
+    def fusionar(self, otro: "Histograma") -> None:
+        with otro._lock:
+            buckets = dict(otro._buckets)
+            total, suma, minimo, maximo = otro.total, otro.suma, otro.minimo, otro.maximo
+        if not total:
+            return
+        with self._lock:
+            for i, n in buckets.items():
+                self._buckets[i] = self._buckets.get(i, 0) + n
+            self.total += total
+            self.suma += suma
+            self.minimo = minimo if self.minimo is None else min(self.minimo, minimo)
+            self.maximo = maximo if self.maximo is None else max(self.maximo, maximo)
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self.total = 0
+            self.suma = 0
+            self.minimo = None
+            self.maximo = None
+
+    def percentil(self, p: float) -> Optional[int]:
+        """Valor por debajo del cual está el p% de las muestras (None si está vacío)."""
+        with self._lock:
+            if not self.total:
+                return None
+            objetivo = max(1, math.ceil(self.total * p / 100.0))
+            acumulado = 0
+            for i in sorted(self._buckets):
+                acumulado += self._buckets[i]
+                if acumulado >= objetivo:
+                    return min(_limite_superior(i), self.maximo)
+            return self.maximo
+
+    def percentiles(self, ps: Iterable[float]) -> Dict[str, Optional[int]]:
+        return {f"p{p:g}": self.percentil(p) for p in ps}
+
+    def resumen(self, ps: Iterable[float] = PERCENTILES_RESUMEN) -> Dict:
+        """Conteo, mínimo, media, máximo y percentiles (serializable a JSON)."""
+        datos = {
+            "n": self.total,
+            "min": self.minimo,
+            "media": round(self.suma / self.total, 1) if self.total else None,
+            "max": self.maximo,
+        }
+        datos.update(self.percentiles(ps))
+        return datos
+
+    def a_dict(self) -> Dict:
+        """Forma completa (buckets incluidos) para enviar por la red o guardar a disco."""
+        with self._lock:
+            return {
+                "buckets": {str(i): n for i, n in self._buckets.items()},
+                "total": self.total,
+                "suma": self.suma,
+                "min": self.minimo,
+                "max": self.maximo,
+            }
+
+    @classmethod
+    def desde_dict(cls, datos: Dict) -> "Histograma":
+        h = cls()
+        h._buckets = {int(i): int(n) for i, n in datos.get("buckets", {}).items()}
+        h.total = int(datos.get("total", 0))
+        h.suma = int(datos.get("suma", 0))
+        h.minimo = datos.get("min")
+        h.maximo = datos.get("max")
+        return h
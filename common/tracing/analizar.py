@@ -0,0 +1,221 @@
+"""
+Junta los spans de todos los componentes (ficheros trazas-*.jsonl de
+TRAZA_DIR, ver traza.py) y muestra:
+
+- El desglose agregado del camino crítico por operación: en qué se fue el
+  tiempo de las peticiones (GC, espera hasta el actor, actor, espera hasta el
+  GA, GA, conexión y transacción en la base de datos...), con media, p50,
+  p99 y porcentaje del total.
+- La línea temporal de una traza (--traza ID, el id llega al cliente en
+  "headers" de la respuesta) o de las N más lentas (--lentas N).
+
+Las duraciones de cada span las mide su propio proceso; el desglose solo usa
+duraciones, así que no le afecta el desfase de relojes entre máquinas. Un
+salto a otro componente (p.ej. "gc.actor" -> "actor.prestamo") se reparte en
+el tiempo del receptor y "red+cola -> receptor", que es lo que esperó el
+mensaje en la red y en las colas de ZMQ antes de que lo atendieran. El
+trabajo con un evento publicado (span con "asincrono") sale en la línea
+temporal pero no en el camino crítico de la respuesta. En la línea temporal
+los desplazamientos sí dependen de los relojes de cada máquina.
+
+Uso (desde la raíz del repo):
+    python -m common.tracing.analizar trazas/
+    python -m common.tracing.analizar trazas_gc/ trazas_ga/ --operacion prestamo --lentas 3
+    python -m common.tracing.analizar trazas/ --traza 3f2a9c0d1e4b5a67 --json desglose.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.metrics.histograma import Histograma
+
+
+def ficheros(rutas: Iterable[str]) -> List[str]:
+    """Ficheros de trazas (también los rotados, .jsonl.N) de cada directorio o fichero."""
+    encontrados = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            encontrados.extend(sorted(glob.glob(os.path.join(ruta, "trazas-*.jsonl*"))))
+        else:
+            encontrados.append(ruta)
+    return encontrados
+
+
+def leer_spans(rutas: Iterable[str]) -> Iterator[Dict]:
+    for path in ficheros(rutas):
+        with open(path, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    span = json.loads(linea)
+                except ValueError:
+                    continue   # línea a medias (proceso cortado mientras escribía)
+                if isinstance(span, dict) and span.get("traza") and span.get("span"):
+                    yield span
+
+
+def agrupar(spans: Iterable[Dict], operacion: Optional[str] = None) -> Dict[str, List[Dict]]:
+    trazas: Dict[str, List[Dict]] = defaultdict(list)
+    for span in spans:
+        trazas[span["traza"]].append(span)
+    if operacion:
+        trazas = {t: s for t, s in trazas.items()
+                  if any(x["atributos"].get("operacion") == operacion for x in s)}
+    return trazas
+
+
+class Traza:
+    """Árbol de spans de una traza."""
+
+    def __init__(self, spans: List[Dict]):
+        self.id = spans[0]["traza"]
+        ids = {s["span"] for s in spans}
+        self.hijos: Dict[str, List[Dict]] = defaultdict(list)
+        self.raices = []
+        for s in spans:
+            if s.get("padre") in ids:
+                self.hijos[s["padre"]].append(s)
+            else:
+                self.raices.append(s)
+        self.raices.sort(key=lambda s: s["inicio"])
+        # Varias raíces = faltan spans (fichero de algún componente sin leer o descartados)
+        self.completa = len(self.raices) == 1
+        self.raiz = max(self.raices, key=lambda s: s["dur_us"])
+
+    @property
+    def operacion(self) -> str:
+        return self.raiz["atributos"].get("operacion") or self.raiz["nombre"]
+
+    def camino_critico(self) -> Dict[str, int]:
+        """Microsegundos del camino crítico de la raíz, por tramo."""
+        tramos: Dict[str, int] = defaultdict(int)
+        self._critico(self.raiz, tramos)
+        return dict(tramos)
+
+    def _critico(self, span: Dict, tramos: Dict[str, int]) -> None:
+        hijos = self.hijos.get(span["span"], [])
+        if span["atributos"].get("asincrono"):
+            # Lo que hacen otros componentes con un evento publicado no lo espera nadie
+            hijos = [h for h in hijos if h["servicio"] == span["servicio"]]
+        remotos = [h for h in hijos if h["servicio"] != span["servicio"]]
+        if remotos:
+            # Petición a otro componente: espera síncrona por el más largo
+            camino = [max(remotos, key=lambda h: h["dur_us"])]
+            propio = f"red+cola -> {camino[0]['nombre']}"
+        else:
+            # Hijos del mismo proceso: hacia atrás desde el que termina último,
+            # cada uno terminado antes de que empiece el siguiente
+            camino, limite = [], span["inicio"] + span["dur_us"]
+            for h in sorted(hijos, key=lambda h: h["inicio"] + h["dur_us"], reverse=True):
+                if h["inicio"] + h["dur_us"] <= limite:
+                    camino.append(h)
+                    limite = h["inicio"]
+            propio = span["nombre"]
+        tramos[propio] += max(0, span["dur_us"] - sum(h["dur_us"] for h in camino))
+        for h in camino:
+            self._critico(h, tramos)
+
+    def linea_temporal(self, ancho: int = 40) -> List[str]:
+        inicio = self.raices[0]["inicio"]
+        total = max(1, max(s["inicio"] + s["dur_us"] for s in self.raices) - inicio,
+                    max(s["dur_us"] for s in self.raices))
+        lineas = [f"Traza {self.id} ({self.operacion}, {self.raiz['dur_us'] / 1000:.3f} ms"
+                  f"{'' if self.completa else ', INCOMPLETA'})"]
+
+        def pintar(span: Dict, nivel: int) -> None:
+            desde = span["inicio"] - inicio
+            a = min(ancho - 1, max(0, int(desde / total * ancho)))
+            b = min(ancho, max(a + 1, int((desde + span["dur_us"]) / total * ancho)))
+            barra = " " * a + "#" * (b - a) + " " * (ancho - b)
+            atributos = " ".join(f"{k}={v}" for k, v in span["atributos"].items())
+            lineas.append(f"  {desde / 1000:>9.3f} {span['dur_us'] / 1000:>9.3f}  |{barra}|  "
+                          f"{'  ' * nivel}{span['nombre']} [{span['servicio']}] {atributos}".rstrip())
+            for h in sorted(self.hijos.get(span["span"], []), key=lambda h: h["inicio"]):
+                pintar(h, nivel + 1)
+
+        lineas.append(f"  {'desde ms':>9} {'dura ms':>9}")
+        for raiz in self.raices:
+            pintar(raiz, 0)
+        return lineas
+
+
+def desglosar(trazas: Iterable[Traza]) -> Dict[str, Dict]:
+    """Por operación: latencia total y cada tramo del camino crítico (histogramas en µs)."""
+    resultado: Dict[str, Dict] = {}
+    for t in trazas:
+        op = resultado.setdefault(t.operacion, {"trazas": 0, "incompletas": 0, "total": Histograma(),
+                                                "tramos": defaultdict(Histograma), "suma": defaultdict(int)})
+        op["trazas"] += 1
+        op["incompletas"] += 0 if t.completa else 1
+        op["total"].registrar(t.raiz["dur_us"])
+        for tramo, us in t.camino_critico().items():
+            op["tramos"][tramo].registrar(us)
+            op["suma"][tramo] += us
+    return resultado
+
+
+def _resumen_tramos(op: Dict) -> List[Tuple[str, Dict]]:
+    total = sum(op["suma"].values()) or 1
+    filas = []
+    for tramo, suma in sorted(op["suma"].items(), key=lambda x: -x[1]):
+        r = op["tramos"][tramo].resumen()
+        filas.append((tramo, {"media_us": round(suma / op["trazas"], 1), "p50_us": r["p50"], "p99_us": r["p99"],
+                              "pct": round(suma / total * 100, 1), "n": r["n"]}))
+    return filas
+
+
+def imprimir_desglose(desglose: Dict[str, Dict]) -> None:
+    for operacion, op in sorted(desglose.items()):
+        r = op["total"].resumen()
+        print(f"\n=== {operacion}: {op['trazas']} trazas ({op['incompletas']} incompletas), "
+              f"total p50 {r['p50'] / 1000:.3f} ms, p99 {r['p99'] / 1000:.3f} ms ===")
+        print(f"  {'tramo del camino crítico':<44} {'media ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'% total':>8}")
+        for tramo, fila in _resumen_tramos(op):
+            print(f"  {tramo:<44} {fila['media_us'] / 1000:>9.3f} {fila['p50_us'] / 1000:>9.3f} "
+                  f"{fila['p99_us'] / 1000:>9.3f} {fila['pct']:>7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Línea temporal y camino crítico de las trazas del sistema")
+    parser.add_argument("rutas", nargs="+", help="directorios TRAZA_DIR de cada componente o ficheros trazas-*.jsonl")
+    parser.add_argument("--operacion", help="solo trazas de esta operación (prestamo, renovacion, ...)")
+    parser.add_argument("--traza", help="muestra la línea temporal de esta traza")
+    parser.add_argument("--lentas", type=int, default=0, help="muestra la línea temporal de las N más lentas")
+    parser.add_argument("--json", help="guarda el desglose en este JSON")
+    args = parser.parse_args()
+
+    grupos = agrupar(leer_spans(args.rutas), args.operacion)
+    if not grupos:
+        print(f"[Trazas] No hay spans en {', '.join(args.rutas)}")
+        sys.exit(1)
+    trazas = [Traza(spans) for spans in grupos.values()]
+    print(f"[Trazas] {len(trazas)} trazas, {sum(len(s) for s in grupos.values())} spans")
+
+    if args.traza:
+        elegidas = [t for t in trazas if t.id == args.traza]
+        if not elegidas:
+            print(f"[Trazas] No se encontró la traza {args.traza}")
+            sys.exit(1)
+        print("\n" + "\n".join(elegidas[0].linea_temporal()))
+        return
+
+    desglose = desglosar(trazas)
+    imprimir_desglose(desglose)
+    for t in sorted(trazas, key=lambda t: -t.raiz["dur_us"])[:args.lentas]:
+        print("\n" + "\n".join(t.linea_temporal()))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                operacion: {"trazas": op["trazas"], "incompletas": op["incompletas"],
+                            "total_us": op["total"].resumen(), "tramos": dict(_resumen_tramos(op))}
+                for operacion, op in desglose.items()
+            }, f, indent=2)
+        print(f"\n[Trazas] Desglose guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
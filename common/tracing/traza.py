@@ -0,0 +1,255 @@
+"""
+Trazas distribuidas de una petición (GC -> actor -> GA -> base de datos).
+
+El contexto viaja en la clave "headers" de cada mensaje JSON (el mismo campo
+que `Mensaje.headers`): {"traza": <id de la traza>, "padre": <id del span que
+envía>}. Quien recibe un mensaje con cabeceras abre un span hijo; sin
+cabeceras solo el GC abre una traza nueva (raíz), según TRAZA_MUESTREO. Un
+cliente puede mandar sus propias cabeceras para forzar la traza de una
+petición concreta.
+
+Cada span se guarda al terminar como una línea JSON:
+    {"traza", "span", "padre", "servicio", "nombre", "inicio" (epoch en µs),
+     "dur_us", "atributos"}
+en TRAZA_DIR/trazas-<host>-<pid>.jsonl (en Docker cada contenedor tiene
+su hostname y todos suelen ser PID 1). La escritura es de un hilo en segundo
+plano: el hilo que atiende la petición solo añade el span a una cola acotada
+(si se llena se descartan y se cuentan). El fichero rota al pasar de
+TRAZA_MAX_MB y se conservan TRAZA_ARCHIVOS anteriores. Con TRAZA_DIR vacío
+(por defecto) no se registra nada y las cabeceras no se añaden.
+
+El span activo de cada hilo se guarda en un thread-local, así que el código
+de más abajo (p.ej. el backend PostgreSQL) abre sub-spans con `subspan()`
+sin recibir el span por parámetro. Para juntar los ficheros de todos los
+componentes: python -m common.tracing.analizar <dirs>.
+"""
+import atexit
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Optional
+
+TRAZA_DIR = os.getenv("TRAZA_DIR", "")
+TRAZA_MUESTREO = float(os.getenv("TRAZA_MUESTREO", "1.0"))  # fracción de peticiones raíz trazadas
+TRAZA_MAX_MB = float(os.getenv("TRAZA_MAX_MB", "50"))
+TRAZA_ARCHIVOS = int(os.getenv("TRAZA_ARCHIVOS", "3"))
+TRAZA_COLA = int(os.getenv("TRAZA_COLA", "100000"))         # spans pendientes de escribir
+TRAZA_VOLCADO_MS = int(os.getenv("TRAZA_VOLCADO_MS", "200"))
+
+CABECERAS = "headers"
+
+_local = threading.local()
+
+
+class EscritorTrazas:
+    """Vuelca los spans terminados a un JSONL rotativo desde un hilo propio."""
+
+    def __init__(self, directorio: str, max_mb: float = TRAZA_MAX_MB, archivos: int = TRAZA_ARCHIVOS,
+                 cola: int = TRAZA_COLA, volcado_ms: int = TRAZA_VOLCADO_MS):
+        os.makedirs(directorio, exist_ok=True)
+        host = socket.gethostname().replace(os.sep, "_") or "host"
+        self.path = os.path.join(directorio, f"trazas-{host}-{os.getpid()}.jsonl")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.archivos = max(0, archivos)
+        self.max_cola = cola
+        self.volcado = volcado_ms / 1000.0
+        self.escritos = 0
+        self.descartados = 0
+        self._cola: deque = deque()
+        self._lock = threading.Lock()     # serializa volcados (hilo propio y atexit)
+        self._stop = threading.Event()
+        self._fichero = open(self.path, "a", encoding="utf-8")
+        self._hilo = threading.Thread(target=self._loop, name="escritor-trazas", daemon=True)
+        self._hilo.start()
+
+    def registrar(self, registro: Dict[str, Any]) -> None:
+        # deque.append es atómico: no hace falta lock en el camino de la petición
+        if len(self._cola) >= self.max_cola:
+            self.descartados += 1
+            return
+        self._cola.append(registro)
+
+    def _rotar(self) -> None:
+        self._fichero.close()
+        if self.archivos:
+            for n in range(self.archivos - 1, 0, -1):
+                origen = f"{self.path}.{n}"
+                if os.path.exists(origen):
+                    os.replace(origen, f"{self.path}.{n + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._fichero = open(self.path, "a", encoding="utf-8")
+
+    def volcar(self) -> None:
+        with self._lock:
+            if self._fichero.closed:
+                return
+            lineas = []
+            while self._cola:
+                lineas.append(json.dumps(self._cola.popleft(), separators=(",", ":")))
+            if not lineas:
+                return
+            self._fichero.write("\n".join(lineas) + "\n")
+            self._fichero.flush()
+            self.escritos += len(lineas)
+            if self._fichero.tell() >= self.max_bytes:
+                self._rotar()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.volcado):
+            try:
+                self.volcar()
+            except OSError as e:
+                print(f"[Trazas] Error al escribir {self.path}: {e}")
+
+    def cerrar(self) -> None:
+        self._stop.set()
+        self.volcar()
+        with self._lock:
+            self._fichero.close()
+
+
+_escritor: Optional[EscritorTrazas] = None
+_escritor_lock = threading.Lock()
+
+
+def escritor() -> Optional[EscritorTrazas]:
+    """Escritor del proceso (se crea con el primer span); None si TRAZA_DIR está vacío."""
+    global _escritor
+    if not TRAZA_DIR:
+        return None
+    if _escritor is None:
+        with _escritor_lock:
+            if _escritor is None:
+                _escritor = EscritorTrazas(TRAZA_DIR)
+                atexit.register(_escritor.cerrar)
+                print(f"[Trazas] Registrando spans en {_escritor.path}")
+    return _escritor
+
+
+def _nuevo_id(longitud: int) -> str:
+    return uuid.uuid4().hex[:longitud]
+
+
+class Span:
+    """Tramo de trabajo de un componente. Se usa como context manager."""
+    __slots__ = ("traza", "id", "padre", "servicio", "nombre", "inicio", "atributos", "_t0", "_anterior")
+
+    def __init__(self, traza: str, padre: Optional[str], servicio: str, nombre: str, **atributos):
+        self.traza = traza
+        self.id = _nuevo_id(8)
+        self.padre = padre
+        self.servicio = servicio
+        self.nombre = nombre
+        self.atributos = atributos
+        self.inicio = time.time_ns() // 1000
+        self._t0 = time.perf_counter_ns()
+        self._anterior = None
+
+    def cabeceras(self) -> Dict[str, str]:
+        """Cabeceras para los mensajes que envía este span (sus receptores serán hijos suyos)."""
+        return {"traza": self.traza, "padre": self.id}
+
+    def hijo(self, nombre: str, **atributos) -> "Span":
+        return Span(self.traza, self.id, self.servicio, nombre, **atributos)
+
+    def anotar(self, **atributos) -> None:
+        self.atributos.update(atributos)
+
+    def terminar(self) -> None:
+        dur_us = (time.perf_counter_ns() - self._t0) // 1000
+        destino = escritor()
+        if destino is not None:
+            destino.registrar({
+                "traza": self.traza, "span": self.id, "padre": self.padre, "servicio": self.servicio,
+                "nombre": self.nombre, "inicio": self.inicio, "dur_us": dur_us, "atributos": self.atributos,
+            })
+
+    def __enter__(self) -> "Span":
+        self._anterior = getattr(_local, "actual", None)
+        _local.actual = self
+        return self
+
+    def __exit__(self, tipo, valor, tb) -> None:
+        _local.actual = self._anterior
+        if tipo is not None:
+            self.atributos["error"] = tipo.__name__
+        self.terminar()
+
+
+class _SpanNulo:
+    """Lo que se devuelve sin trazas (desactivadas o petición no muestreada): no hace nada."""
+    traza = None
+    id = None
+
+    def cabeceras(self) -> Dict[str, str]:
+        return {}
+
+    def hijo(self, nombre: str, **atributos) -> "_SpanNulo":
+        return self
+
+    def anotar(self, **atributos) -> None:
+        pass
+
+    def terminar(self) -> None:
+        pass
+
+    def __enter__(self) -> "_SpanNulo":
+        return self
+
+    def __exit__(self, tipo, valor, tb) -> None:
+        pass
+
+
+SPAN_NULO = _SpanNulo()
+
+
+def de_mensaje(msg: Any) -> Optional[Dict[str, str]]:
+    """Cabeceras de traza de un mensaje recibido, o None."""
+    if isinstance(msg, dict):
+        cabeceras = msg.get(CABECERAS)
+        if isinstance(cabeceras, dict) and cabeceras.get("traza"):
+            return cabeceras
+    return None
+
+
+def iniciar(servicio: str, nombre: str, cabeceras: Optional[Dict[str, str]] = None,
+            raiz: bool = False, **atributos):
+    """
+    Span de la petición que acaba de llegar a `servicio`. Continúa la traza de
+    `cabeceras` si las hay; si no, con `raiz=True` abre una traza nueva según
+    TRAZA_MUESTREO y, sin `raiz`, no traza nada.
+    """
+    if not TRAZA_DIR:
+        return SPAN_NULO
+    if cabeceras:
+        return Span(str(cabeceras["traza"]), cabeceras.get("padre"), servicio, nombre, **atributos)
+    if raiz and (TRAZA_MUESTREO >= 1.0 or random.random() < TRAZA_MUESTREO):
+        return Span(_nuevo_id(16), None, servicio, nombre, **atributos)
+    return SPAN_NULO
+
+
+def actual():
+    """Span activo en este hilo (SPAN_NULO si no hay)."""
+    return getattr(_local, "actual", None) or SPAN_NULO
+
+
+def subspan(nombre: str, **atributos):
+    """Span hijo del activo en este hilo; úsese con `with`."""
+    if not TRAZA_DIR:
+        return SPAN_NULO
+    return actual().hijo(nombre, **atributos)
+
+
+def con_cabeceras(msg: Dict[str, Any], span) -> Dict[str, Any]:
+    """Copia de `msg` con las cabeceras de `span`; el mismo `msg` si no se traza."""
+    cabeceras = span.cabeceras()
+    if not cabeceras:
+        return msg
+    return dict(msg, **{CABECERAS: cabeceras})
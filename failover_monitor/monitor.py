@@ -1,9 +1,15 @@
 import os
-import os
+import json
 import time
+import socket
 import psycopg2
 import subprocess
 import logging
+import threading
+import zmq
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime
 
 # Configuration
@@ -14,9 +20,44 @@ REPLICA_PORT = int(os.getenv("REPLICA_PORT", "5432"))
 DB_NAME = os.getenv("DB_NAME", "library")
 DB_USER = os.getenv("DB_USER", "app")
 DB_PASS = os.getenv("DB_PASS", "app")
-CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "10"))
 FAILOVER_COOLDOWN = int(os.getenv("FAILOVER_COOLDOWN", "300"))
 
+# Fast detection: probes over a persistent connection every PROBE_INTERVAL_MS;
+# a probe that does not answer within PROBE_TIMEOUT_MS counts as a failure
+PROBE_INTERVAL_MS = int(os.getenv("PROBE_INTERVAL_MS", "200"))
+PROBE_TIMEOUT_MS = int(os.getenv("PROBE_TIMEOUT_MS", "300"))
+FAILURE_THRESHOLD = int(os.getenv("FAILURE_THRESHOLD", "3"))
+
+# Quorum: with several monitors (MONITOR_PEERS = their PUB endpoints), the
+# primary is only promoted away when FAILOVER_QUORUM of them see it down
+MONITOR_ID = os.getenv("MONITOR_ID", socket.gethostname())
+MONITOR_PEERS = [p.strip() for p in os.getenv("MONITOR_PEERS", "").split(",") if p.strip()]
+FAILOVER_QUORUM = int(os.getenv("FAILOVER_QUORUM", "1"))
+VIEW_TTL_MS = int(os.getenv("VIEW_TTL_MS", str(PROBE_INTERVAL_MS * 5)))
+
+# Push channel: "primaria" announces the current primary (repeated every
+# ANNOUNCE_INTERVAL_MS so late subscribers learn it), "vista" carries votes
+FAILOVER_PUB_ADDR = os.getenv("FAILOVER_PUB_ADDR", "tcp://*:5580")
+ANNOUNCE_INTERVAL_MS = int(os.getenv("ANNOUNCE_INTERVAL_MS", "1000"))
+TOPIC_PRIMARY = "primaria"
+TOPIC_VIEW = "vista"
+
+# Replication telemetry: sampled every LAG_SAMPLE_INTERVAL_MS, last LAG_HISTORY
+# samples served over HTTP on METRICS_ADDR (/metrics Prometheus text, /lag JSON)
+LAG_SAMPLE_INTERVAL_MS = int(os.getenv("LAG_SAMPLE_INTERVAL_MS", "1000"))
+LAG_HISTORY = int(os.getenv("LAG_HISTORY", "600"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "0.0.0.0:9180")
+REPLICA_APPLICATION_NAME = os.getenv("REPLICA_APPLICATION_NAME", "postgres_replica")
+
+# Promotion guard: with more unreplicated WAL than MAX_LAG_BYTES (or replay
+# lag above MAX_LAG_SECONDS) at the last sample, promotion waits up to
+# LAG_PROMOTION_WAIT_S for the primary to come back; after that it is refused
+# unless LAG_PROMOTE_AFTER_WAIT=1. 0 disables each bound.
+MAX_LAG_BYTES = int(os.getenv("MAX_LAG_BYTES", "0"))
+MAX_LAG_SECONDS = float(os.getenv("MAX_LAG_SECONDS", "0"))
+LAG_PROMOTION_WAIT_S = float(os.getenv("LAG_PROMOTION_WAIT_S", "30"))
+LAG_PROMOTE_AFTER_WAIT = os.getenv("LAG_PROMOTE_AFTER_WAIT", "0") == "1"
+
 # Logging setup
 logging.basicConfig(
     level=logging.INFO,
@@ -24,158 +65,444 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-# Global state
-last_failover_time = None
-primary_is_down = False
-failover_executed = False
 
-def check_primary_health():
-    """Check if primary is reachable and writable."""
-    try:
-        conn = psycopg2.connect(
-            host=PRIMARY_HOST,
-            port=PRIMARY_PORT,
+class Probe:
+    """
+    Persistent connection to one PostgreSQL server, probed from its own thread.
+    probe() returns pg_is_in_recovery() or None if it failed or did not answer in time.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"probe-{host}")
+        self.pending = None
+
+    def _connect(self):
+        return psycopg2.connect(
+            host=self.host,
+            port=self.port,
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASS,
-            connect_timeout=5
+            connect_timeout=2,
+            # A dead peer must break the connection quickly, not after minutes of TCP retries
+            keepalives=1,
+            keepalives_idle=1,
+            keepalives_interval=1,
+            keepalives_count=2,
+            tcp_user_timeout=PROBE_TIMEOUT_MS,
+            options=f"-c statement_timeout={PROBE_TIMEOUT_MS}",
         )
-        with conn.cursor() as cur:
-            cur.execute("SELECT pg_is_in_recovery();")
-            is_recovery = cur.fetchone()[0]
-        conn.close()
-        if is_recovery:
-            logging.warning(f"{PRIMARY_HOST} is in recovery (not primary)")
-            return False
-        logging.debug(f"{PRIMARY_HOST} is healthy")
-        return True
-    except Exception as e:
-        logging.error(f"Error connecting to {PRIMARY_HOST}:{PRIMARY_PORT}: {e}")
-        return False
 
-def check_replica_health():
-    """Check if replica is reachable."""
+    def _run(self):
+        try:
+            if self.conn is None or self.conn.closed:
+                self.conn = self._connect()
+                self.conn.autocommit = True
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_is_in_recovery();")
+                return cur.fetchone()[0]
+        except Exception:
+            self.close()
+            raise
+
+    def probe(self, timeout_ms=PROBE_TIMEOUT_MS):
+        if self.pending is not None and not self.pending.done():
+            # The previous probe is still hanging: that is a failure too
+            return None
+        self.pending = self.executor.submit(self._run)
+        try:
+            return self.pending.result(timeout_ms / 1000.0)
+        except FutureTimeout:
+            return None
+        except Exception as e:
+            logging.debug(f"Probe to {self.host}:{self.port} failed: {e}")
+            return None
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+
+def promote_with_pg_promote(host, port):
+    """Promote with pg_promote() (PostgreSQL 12+), waiting until the server accepts writes."""
+    conn = psycopg2.connect(host=host, port=port, dbname=DB_NAME, user=DB_USER,
+                            password=DB_PASS, connect_timeout=2)
     try:
-        conn = psycopg2.connect(
-            host=REPLICA_HOST,
-            port=REPLICA_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            connect_timeout=5
-        )
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_promote(true, 10);")
+            return bool(cur.fetchone()[0])
+    finally:
         conn.close()
-        logging.debug(f"{REPLICA_HOST} is available")
-        return True
-    except Exception as e:
-        logging.error(f"Replica not available: {e}")
-        return False
 
-def execute_failover():
-    """Promote replica to primary."""
-    global last_failover_time, failover_executed
-    logging.warning("Starting failover process...")
-    try:
-        # Connect to replica
-        conn = psycopg2.connect(
-            host=REPLICA_HOST,
-            port=REPLICA_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            connect_timeout=5
-        )
-        promote_command = f"docker exec {REPLICA_HOST} su - postgres -c '/usr/lib/postgresql/16/bin/pg_ctl promote -D /var/lib/postgresql/data'"
-        logging.info("Executing promotion command...")
-        result = subprocess.run(
-            promote_command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        if result.returncode == 0:
-            logging.info("Promotion command succeeded")
-            time.sleep(5)
-            # Verify promotion
-            conn_check = psycopg2.connect(
-                host=REPLICA_HOST,
-                port=REPLICA_PORT,
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASS,
-                connect_timeout=5
-            )
-            with conn_check.cursor() as cur:
-                cur.execute("SELECT pg_is_in_recovery();")
-                still_recovery = cur.fetchone()[0]
-            conn_check.close()
-            if not still_recovery:
-                logging.info("FAILOVER SUCCESSFUL: Replica promoted to primary")
-                last_failover_time = datetime.now()
-                failover_executed = True
-                return True
+
+def promote_with_docker(host):
+    """Fallback when pg_promote() is not allowed: pg_ctl promote through docker exec."""
+    promote_command = f"docker exec {host} su - postgres -c '/usr/lib/postgresql/16/bin/pg_ctl promote -D /var/lib/postgresql/data'"
+    result = subprocess.run(promote_command, shell=True, capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        logging.error(f"Promotion error: {result.stderr}")
+    return result.returncode == 0
+
+
+PRIMARY_LAG_SQL = """
+    SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')::bigint,
+           r.state,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), r.sent_lsn)::bigint,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), r.flush_lsn)::bigint,
+           pg_wal_lsn_diff(pg_current_wal_lsn(), r.replay_lsn)::bigint,
+           EXTRACT(EPOCH FROM r.write_lag),
+           EXTRACT(EPOCH FROM r.flush_lag),
+           EXTRACT(EPOCH FROM r.replay_lag)
+    FROM (SELECT 1) AS uno
+    LEFT JOIN pg_stat_replication r ON r.application_name = %s;
+"""
+
+REPLICA_LAG_SQL = """
+    SELECT pg_wal_lsn_diff(pg_last_wal_receive_lsn(), '0/0')::bigint,
+           pg_wal_lsn_diff(pg_last_wal_receive_lsn(), pg_last_wal_replay_lsn())::bigint,
+           EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp());
+"""
+
+
+class LagSampler:
+    """
+    Samples replication lag and WAL throughput on the current primary
+    (pg_stat_replication) and standby (pg_last_wal_*_lsn) into a bounded
+    time series. Uses its own connections, never the failure-detection probes.
+    """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.samples = deque(maxlen=LAG_HISTORY)
+        self.lock = threading.Lock()
+        self.conns = {}
+        self.previous_wal = None       # (monotonic, primary WAL position) of the last sample
+        self.thread = threading.Thread(target=self._loop, name="lag-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _query(self, server, sql, params=()):
+        conn = self.conns.get(server)
+        try:
+            if conn is None or conn.closed:
+                conn = psycopg2.connect(host=server[0], port=server[1], dbname=DB_NAME, user=DB_USER,
+                                        password=DB_PASS, connect_timeout=2,
+                                        options=f"-c statement_timeout={LAG_SAMPLE_INTERVAL_MS}")
+                conn.autocommit = True
+                self.conns[server] = conn
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchone()
+        except Exception as e:
+            logging.debug(f"Lag sample from {server[0]}:{server[1]} failed: {e}")
+            if conn is not None:
+                conn.close()
+            self.conns.pop(server, None)
+            return None
+
+    def sample(self):
+        now = time.monotonic()
+        sample = {"ts": time.time(), "primary": f"{self.monitor.primary[0]}:{self.monitor.primary[1]}"}
+        row = self._query(self.monitor.primary, PRIMARY_LAG_SQL, (REPLICA_APPLICATION_NAME,))
+        if row is not None:
+            wal, state, sent, flush, replay, write_lag, flush_lag, replay_lag = row
+            sample.update({
+                "replica_state": state,
+                "lag_sent_bytes": sent,
+                "lag_flush_bytes": flush,
+                "lag_replay_bytes": replay,
+                "write_lag_s": float(write_lag) if write_lag is not None else None,
+                "flush_lag_s": float(flush_lag) if flush_lag is not None else None,
+                "replay_lag_s": float(replay_lag) if replay_lag is not None else None,
+            })
+            if self.previous_wal is not None and now > self.previous_wal[0]:
+                sample["wal_bytes_per_s"] = round((wal - self.previous_wal[1]) / (now - self.previous_wal[0]), 1)
+            self.previous_wal = (now, wal)
+        if self.monitor.previous is None:
+            row = self._query(self.monitor.standby, REPLICA_LAG_SQL)
+            if row is not None:
+                received, pending_replay, replay_delay = row
+                sample.update({
+                    "replica_pending_replay_bytes": pending_replay,
+                    "replica_replay_delay_s": float(replay_delay) if replay_delay is not None else None,
+                })
+        with self.lock:
+            self.samples.append(sample)
+        return sample
+
+    def _loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error(f"Lag sampler error: {e}")
+            time.sleep(max(0.0, LAG_SAMPLE_INTERVAL_MS / 1000.0 - (time.monotonic() - started)))
+
+    def series(self):
+        with self.lock:
+            return list(self.samples)
+
+    def last_known(self):
+        """Latest sample that reached the primary (the one that says how much WAL is at risk)."""
+        with self.lock:
+            for sample in reversed(self.samples):
+                if "lag_flush_bytes" in sample:
+                    return sample
+        return None
+
+    def promotion_risk(self):
+        """Reason not to promote now, or None if the last known lag is within bounds."""
+        if not MAX_LAG_BYTES and not MAX_LAG_SECONDS:
+            return None
+        sample = self.last_known()
+        if sample is None:
+            return "no replication lag sample from the primary"
+        if sample.get("replica_state") is None:
+            return "replica was not streaming from the primary"
+        lag_bytes = sample.get("lag_flush_bytes") or 0
+        if MAX_LAG_BYTES and lag_bytes > MAX_LAG_BYTES:
+            return f"replica was {lag_bytes} bytes behind (bound {MAX_LAG_BYTES})"
+        replay_lag = sample.get("replay_lag_s") or 0.0
+        if MAX_LAG_SECONDS and replay_lag > MAX_LAG_SECONDS:
+            return f"replica replay lag was {replay_lag:.1f}s (bound {MAX_LAG_SECONDS}s)"
+        return None
+
+
+def prometheus_text(sampler, monitor):
+    lines = [
+        f'failover_monitor_epoch {monitor.epoch}',
+        f'failover_monitor_primary_failures {monitor.failures}',
+    ]
+    series = sampler.series()
+    if series:
+        last = series[-1]
+        for key in ("lag_sent_bytes", "lag_flush_bytes", "lag_replay_bytes", "write_lag_s", "flush_lag_s",
+                    "replay_lag_s", "wal_bytes_per_s", "replica_pending_replay_bytes", "replica_replay_delay_s"):
+            if last.get(key) is not None:
+                lines.append(f'pg_replication_{key}{{primary="{last["primary"]}"}} {last[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(sampler, monitor):
+    host, _, port = METRICS_ADDR.rpartition(":")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/lag"):
+                body = json.dumps({"primary": f"{monitor.primary[0]}:{monitor.primary[1]}",
+                                   "epoch": monitor.epoch, "samples": sampler.series()}).encode()
+                content_type = "application/json"
+            elif self.path.startswith("/metrics"):
+                body = prometheus_text(sampler, monitor).encode()
+                content_type = "text/plain; version=0.0.4"
             else:
-                logging.error("Failover failed: replica still in recovery")
-                return False
-        else:
-            logging.error(f"Promotion error: {result.stderr}")
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Replication metrics on http://{METRICS_ADDR}/metrics and /lag")
+    return server
+
+
+class FailoverMonitor:
+    def __init__(self, context=None):
+        self.context = context or zmq.Context.instance()
+        self.primary = (PRIMARY_HOST, PRIMARY_PORT)
+        self.standby = (REPLICA_HOST, REPLICA_PORT)
+        self.probes = {self.primary: Probe(*self.primary), self.standby: Probe(*self.standby)}
+        self.previous = None           # primary before the last failover
+        self.epoch = 0
+        self.failures = 0
+        self.last_failover_time = None
+        self.peer_views = {}           # monitor id -> (down, monotonic time received)
+        self.next_announce = 0.0
+        self.last_problem = None       # avoid logging the same problem every probe
+        self.lag = LagSampler(self)
+        self.lag_blocked_since = None  # promotion delayed because of replication lag
+
+        self.pub = self.context.socket(zmq.PUB)
+        self.pub.linger = 0
+        self.pub.bind(FAILOVER_PUB_ADDR)
+        self.sub = None
+        if MONITOR_PEERS:
+            self.sub = self.context.socket(zmq.SUB)
+            self.sub.linger = 0
+            for peer in MONITOR_PEERS:
+                self.sub.connect(peer)
+            self.sub.setsockopt_string(zmq.SUBSCRIBE, TOPIC_VIEW)
+            self.sub.setsockopt_string(zmq.SUBSCRIBE, TOPIC_PRIMARY)
+
+    def _publish(self, topic, message):
+        self.pub.send_string(f"{topic} {json.dumps(message)}")
+
+    def announce(self):
+        host, port = self.primary
+        message = {"origen": MONITOR_ID, "epoca": self.epoch, "primaria": {"host": host, "port": port}}
+        if self.previous is not None:
+            message["anterior"] = {"host": self.previous[0], "port": self.previous[1]}
+        self._publish(TOPIC_PRIMARY, message)
+        self.next_announce = time.monotonic() + ANNOUNCE_INTERVAL_MS / 1000.0
+
+    def discover_primary(self):
+        """On start, the standby may already have been promoted (e.g. the monitor restarted)."""
+        if self.probes[self.standby].probe(2000) is False and self.probes[self.primary].probe(2000) is not False:
+            logging.warning(f"{self.standby[0]} is already primary")
+            self._switch(self.standby)
+
+    def _switch(self, new_primary):
+        self.previous, self.primary = self.primary, new_primary
+        self.standby = self.previous
+        self.epoch += 1
+        self.failures = 0
+
+    def _read_peers(self):
+        if self.sub is None:
+            return
+        while self.sub.poll(0):
+            topic, _, body = self.sub.recv_string().partition(" ")
+            try:
+                message = json.loads(body)
+            except ValueError:
+                continue
+            if topic == TOPIC_VIEW and message.get("origen") != MONITOR_ID:
+                self.peer_views[message.get("origen")] = (message.get("caida"), time.monotonic())
+            elif topic == TOPIC_PRIMARY and message.get("epoca", 0) > self.epoch:
+                # Another monitor already promoted: follow it instead of promoting again
+                new_primary = (message["primaria"]["host"], int(message["primaria"]["port"]))
+                if new_primary != self.primary:
+                    logging.warning(f"Monitor {message.get('origen')} promoted {new_primary[0]}")
+                    self._switch(new_primary)
+                    self.epoch = message["epoca"]
+                    self.last_failover_time = datetime.now()
+
+    def _problem(self, message):
+        if message != self.last_problem:
+            logging.warning(message)
+            self.last_problem = message
+
+    def votes_down(self, locally_down):
+        now = time.monotonic()
+        ttl = VIEW_TTL_MS / 1000.0
+        peers = sum(1 for down, received in self.peer_views.values() if down and now - received <= ttl)
+        return peers + (1 if locally_down else 0)
+
+    def lag_allows_promotion(self):
+        risk = self.lag.promotion_risk()
+        if risk is None:
+            self.lag_blocked_since = None
+            return True
+        if self.lag_blocked_since is None:
+            self.lag_blocked_since = time.monotonic()
+        waited = time.monotonic() - self.lag_blocked_since
+        if waited < LAG_PROMOTION_WAIT_S:
+            self._problem(f"Delaying promotion up to {LAG_PROMOTION_WAIT_S:.0f}s, waiting for the primary: {risk}")
             return False
-    except subprocess.TimeoutExpired:
-        logging.error("Promotion command timeout")
-        return False
-    except Exception as e:
-        logging.error(f"Failover error: {e}")
+        if LAG_PROMOTE_AFTER_WAIT:
+            logging.error(f"Promoting despite replication lag, data may be lost: {risk}")
+            return True
+        self._problem(f"Promotion refused: {risk}")
         return False
 
-def main():
-    global primary_is_down, failover_executed
-    logging.info("Starting PostgreSQL Failover Monitor")
-    consecutive_failures = 0
-    FAILURE_THRESHOLD = 3
-    while True:
+    def failover(self):
+        host, port = self.standby
+        logging.warning(f"Promoting {host}:{port}...")
         try:
-            if failover_executed:
-                if check_replica_health():
-                    logging.info(f"New primary ({REPLICA_HOST}) operational")
-                else:
-                    logging.error("Critical: New primary not responding!")
-                time.sleep(CHECK_INTERVAL * 2)
-                continue
-            primary_healthy = check_primary_health()
-            if primary_healthy:
-                if primary_is_down:
-                    logging.info("Primary recovered")
-                    primary_is_down = False
-                    consecutive_failures = 0
-            else:
-                consecutive_failures += 1
-                logging.warning(f"Primary not responding (attempt {consecutive_failures}/{FAILURE_THRESHOLD})")
-                if consecutive_failures >= FAILURE_THRESHOLD:
-                    if not primary_is_down:
-                        logging.error("PRIMARY DECLARED DOWN")
-                        primary_is_down = True
-                    if last_failover_time:
-                        elapsed = (datetime.now() - last_failover_time).total_seconds()
-                        if elapsed < FAILOVER_COOLDOWN:
-                            logging.warning("Failover in cooldown")
-                            time.sleep(CHECK_INTERVAL)
-                            continue
-                    if check_replica_health():
-                        logging.warning("Initiating automatic failover...")
-                        if execute_failover():
-                            logging.info("FAILOVER COMPLETED SUCCESSFULLY")
-                        else:
-                            logging.error("Failover failed, will retry next cycle")
-                    else:
-                        logging.error("Replica unavailable, cannot failover")
-            time.sleep(CHECK_INTERVAL)
-        except KeyboardInterrupt:
-            logging.info("Monitor stopped by user")
-            break
+            promoted = promote_with_pg_promote(host, port)
         except Exception as e:
-            logging.error(f"Main loop error: {e}")
-            time.sleep(CHECK_INTERVAL)
+            logging.warning(f"pg_promote() failed ({e}), trying docker exec")
+            promoted = promote_with_docker(host)
+        if not promoted or self.probes[self.standby].probe(2000) is not False:
+            logging.error("Failover failed: replica still in recovery")
+            return False
+        logging.info("FAILOVER SUCCESSFUL: Replica promoted to primary")
+        self._switch(self.standby)
+        self.last_failover_time = datetime.now()
+        self.announce()
+        return True
+
+    def step(self):
+        in_recovery = self.probes[self.primary].probe()
+        if in_recovery is False:
+            if self.failures >= FAILURE_THRESHOLD:
+                logging.info("Primary recovered")
+            self.failures = 0
+            self.lag_blocked_since = None
+        else:
+            self.failures += 1
+            if in_recovery:
+                self._problem(f"{self.primary[0]} is in recovery (not primary)")
+            if self.failures == FAILURE_THRESHOLD:
+                logging.error("PRIMARY DECLARED DOWN")
+        locally_down = self.failures >= FAILURE_THRESHOLD
+        if not locally_down:
+            self.last_problem = None
+        self._publish(TOPIC_VIEW, {"origen": MONITOR_ID, "caida": locally_down, "epoca": self.epoch})
+        self._read_peers()
+
+        if locally_down and self.previous is None:
+            votes = self.votes_down(locally_down)
+            if votes < FAILOVER_QUORUM:
+                self._problem(f"Primary down for {votes}/{FAILOVER_QUORUM} monitors, waiting for quorum")
+            elif self.last_failover_time and \
+                    (datetime.now() - self.last_failover_time).total_seconds() < FAILOVER_COOLDOWN:
+                self._problem("Failover in cooldown")
+            elif self.probes[self.standby].probe() is None:
+                self._problem("Replica unavailable, cannot failover")
+            elif not self.lag_allows_promotion():
+                pass
+            else:
+                logging.warning("Initiating automatic failover...")
+                if not self.failover():
+                    logging.error("Failover failed, will retry next cycle")
+        elif locally_down and self.failures == FAILURE_THRESHOLD:
+            logging.error("Critical: New primary not responding and there is no standby left!")
+
+        if time.monotonic() >= self.next_announce:
+            self.announce()
+
+    def run(self):
+        logging.info(f"Starting PostgreSQL Failover Monitor {MONITOR_ID}: probes every {PROBE_INTERVAL_MS} ms, "
+                     f"quorum {FAILOVER_QUORUM}, announcing on {FAILOVER_PUB_ADDR}")
+        self.discover_primary()
+        self.lag.start()
+        if METRICS_ADDR:
+            start_metrics_server(self.lag, self)
+        while True:
+            started = time.monotonic()
+            try:
+                self.step()
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                logging.error(f"Main loop error: {e}")
+            time.sleep(max(0.0, PROBE_INTERVAL_MS / 1000.0 - (time.monotonic() - started)))
+
+
+def main():
+    try:
+        FailoverMonitor().run()
+    except KeyboardInterrupt:
+        logging.info("Monitor stopped by user")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,182 @@
+"""
+Registro de acciones del gestor de almacenamiento.
+
+Cada acción declara su nombre, los parámetros obligatorios y si es de
+lectura o escritura; el Despachador valida la petición, la ejecuta sobre el
+backend (Almacenamiento) y lleva por acción un histograma de latencia y el
+conteo de errores. Ambos se leen con la petición de control
+{"action": "metricas"} (con "reiniciar": true se ponen a cero).
+{"action": "version_mapa"} devuelve la versión del mapa de shards en uso:
+rebalancear_shards.py la consulta para saber que cada GA ya lo cargó.
+"""
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Tuple
+
+from common.metrics.carga import CargaReciente
+from common.metrics.histograma import Histograma
+from common.tracing import traza
+
+GA_LOTE_MAX = int(os.getenv("GA_LOTE_MAX", "500"))
+
+LECTURA = "lectura"
+ESCRITURA = "escritura"
+
+
+@dataclass(frozen=True)
+class Accion:
+    nombre: str
+    tipo: str                       # LECTURA / ESCRITURA
+    requeridos: Tuple[str, ...]     # campos obligatorios de la petición
+    ejecutar: Callable              # (almacenamiento, req) -> respuesta
+
+    @property
+    def escritura(self) -> bool:
+        return self.tipo == ESCRITURA
+
+    def validar(self, req):
+        """None si la petición es válida; si no, la respuesta de error."""
+        faltan = [c for c in self.requeridos if not req.get(c)]
+        if not faltan:
+            return None
+        if faltan == ["isbn"]:
+            detalle = "ISBN es requerido"
+        else:
+            detalle = " y ".join("ISBN" if c == "isbn" else c for c in self.requeridos) + " son requeridos"
+        return {"error": "ParametrosInvalidos", "detalle": detalle}
+
+
+REGISTRO: Dict[str, Accion] = {}
+
+
+def accion(nombre: str, tipo: str, requeridos: Tuple[str, ...] = ("isbn",)):
+    """Decorador que registra el handler de una acción del GA."""
+    def registrar(fn):
+        REGISTRO[nombre] = Accion(nombre, tipo, tuple(requeridos), fn)
+        return fn
+    return registrar
+
+
+def acciones_de_escritura():
+    return {a.nombre for a in REGISTRO.values() if a.escritura}
+
+
+# Las acciones individuales están indexadas por ISBN (shard dueño), así que siempre es obligatorio
+
+@accion("validar_renovacion", LECTURA)
+def _validar_renovacion(almacenamiento, req):
+    return almacenamiento.validar_renovacion(req["isbn"], req.get("usuario"))
+
+
+@accion("actualizar_renovacion", ESCRITURA)
+def _actualizar_renovacion(almacenamiento, req):
+    nueva_fecha = req.get("nueva_fecha") or datetime.now().isoformat()
+    return almacenamiento.actualizar_renovacion(req["isbn"], req.get("usuario"), nueva_fecha)
+
+
+@accion("consultar_libro", LECTURA)
+def _consultar_libro(almacenamiento, req):
+    return almacenamiento.consultar_libro(req["isbn"])
+
+
+@accion("aplicar_devolucion", ESCRITURA, ("isbn", "usuario"))
+def _aplicar_devolucion(almacenamiento, req):
+    return almacenamiento.aplicar_devolucion(req["isbn"], req["usuario"])
+
+
+@accion("procesar_prestamo", ESCRITURA, ("isbn", "usuario"))
+def _procesar_prestamo(almacenamiento, req):
+    return almacenamiento.procesar_prestamo(req["isbn"], req["usuario"])
+
+
+@accion("actualizar_renovacion_lote", ESCRITURA, ("items",))
+def _actualizar_renovacion_lote(almacenamiento, req):
+    items = req["items"]
+    if not isinstance(items, list) or len(items) > GA_LOTE_MAX or not all(
+            isinstance(i, dict) and i.get("isbn") and i.get("usuario") for i in items):
+        return {"error": "ParametrosInvalidos",
+                "detalle": f"items debe ser una lista de hasta {GA_LOTE_MAX} elementos con ISBN y usuario"}
+    nueva_fecha = req.get("nueva_fecha") or datetime.now().isoformat()
+    return almacenamiento.actualizar_renovacion_lote([(i["isbn"], i["usuario"]) for i in items], nueva_fecha)
+
+
+class Despachador:
+    """Ejecuta peticiones del GA contra el registro y mide cada acción."""
+
+    def __init__(self, almacenamiento, registro: Dict[str, Accion] = None):
+        self.almacenamiento = almacenamiento
+        self.registro = REGISTRO if registro is None else registro
+        self.latencias = {nombre: Histograma() for nombre in self.registro}  # microsegundos
+        self.peticiones = defaultdict(int)
+        self.errores = defaultdict(lambda: defaultdict(int))  # acción -> código de error -> n
+        self.desde = datetime.now()
+        self.carga = CargaReciente()  # para el health-check: en curso y latencia reciente
+        self.control = {
+            "metricas": self._metricas,
+            "estadisticas": lambda req: {"status": "ok", "datos": self.almacenamiento.estadisticas()},
+            "version_mapa": lambda req: {"status": "ok", "datos": {"version": self.almacenamiento.version_mapa()}},
+        }
+
+    def despachar(self, req) -> Dict:
+        # Acepta "action" o "accion"
+        nombre = req.get("action") or req.get("accion")
+        if nombre in self.control:
+            return self.control[nombre](req)
+
+        accion = self.registro.get(nombre)
+        if accion is None:
+            self.errores["desconocida"]["accion_desconocida"] += 1
+            return {"error": "accion_desconocida"}
+
+        self.peticiones[nombre] += 1
+        resp = accion.validar(req)
+        if resp is not None:
+            self.errores[nombre][resp["error"]] += 1
+            return resp
+
+        inicio = self.carga.empezar()
+        try:
+            # Con PostgreSQL, los tiempos de base de datos van como spans db.* dentro de este
+            with traza.subspan("ga.ejecutar", backend=self.almacenamiento.nombre):
+                resp = accion.ejecutar(self.almacenamiento, req)
+        except Exception:
+            self.errores[nombre]["ErrorInterno"] += 1
+            raise
+        finally:
+            self.latencias[nombre].registrar((time.perf_counter() - inicio) * 1_000_000)
+            self.carga.terminar(inicio)
+
+        if resp.get("error"):
+            self.errores[nombre][resp["error"]] += 1
+        return resp
+
+    def metricas(self) -> Dict:
+        return {
+            "desde": self.desde.isoformat(),
+            "acciones": {
+                nombre: {
+                    "tipo": accion.tipo,
+                    "peticiones": self.peticiones[nombre],
+                    "errores": dict(self.errores[nombre]),
+                    "latencia_us": self.latencias[nombre].resumen(),
+                }
+                for nombre, accion in self.registro.items()
+            },
+            "desconocidas": sum(self.errores["desconocida"].values()),
+        }
+
+    def reiniciar(self) -> None:
+        for h in self.latencias.values():
+            h.reiniciar()
+        self.peticiones.clear()
+        self.errores.clear()
+        self.desde = datetime.now()
+
+    def _metricas(self, req) -> Dict:
+        datos = self.metricas()
+        if req.get("reiniciar"):
+            self.reiniciar()
+        return {"status": "ok", "datos": datos}
@@ -0,0 +1,410 @@
+"""
+Interfaz de almacenamiento del GA y backends embebidos.
+
+El bucle del GA solo habla con un Almacenamiento; el backend PostgreSQL
+(primario/réplica, shards, journal) vive en gestor_a.py y aquí están los
+backends sin servidor, pensados para pruebas locales y benchmarks del camino
+GC -> actor -> GA sin la latencia de la base de datos:
+
+- SQLiteAlmacenamiento: archivo SQLite en modo WAL.
+- MemoriaAlmacenamiento: diccionarios en memoria protegidos por un lock.
+
+Los tres devuelven las mismas respuestas y códigos de error
+(LibroNoEncontrado, SinEjemplaresDisponibles, PrestamoActivo,
+PrestamoNoEncontrado, PrestamoNoActivo, LimiteRenovaciones, ...).
+"""
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+GA_SQLITE_PATH = os.getenv("GA_SQLITE_PATH", "ga.sqlite3")
+
+MAX_RENOVACIONES = 2
+DIAS_PRESTAMO = 14
+DIAS_RENOVACION = 7
+
+# Mismos libros de prueba que init.sql, para que un backend embebido arranque con datos
+LIBROS_INICIALES = {
+    "978-0134685991": 5,  # Clean Code
+    "978-0135957059": 3,  # Refactoring
+    "978-0596007126": 7,  # Head First Design Patterns
+    "978-1491950296": 4,  # Designing Data-Intensive Applications
+}
+
+
+class Almacenamiento(ABC):
+    """Las cinco acciones del GA. Cada método devuelve el dict que se envía al actor."""
+    nombre: str
+
+    @abstractmethod
+    def validar_renovacion(self, isbn, usuario) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def actualizar_renovacion(self, isbn, usuario, nueva_fecha=None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def consultar_libro(self, isbn) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def aplicar_devolucion(self, isbn, usuario) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def procesar_prestamo(self, isbn, usuario) -> Dict[str, Any]:
+        ...
+
+    def actualizar_renovacion_lote(self, items: List[Tuple[str, str]], nueva_fecha=None) -> Dict[str, Any]:
+        """
+        Renueva varios préstamos (pares isbn, usuario). Devuelve una respuesta
+        por elemento, en el mismo orden, en datos.resultados. Los backends que
+        pueden hacerlo en una sola transacción lo sobrescriben.
+        """
+        return _resp_lote([self.actualizar_renovacion(isbn, usuario, nueva_fecha) for isbn, usuario in items])
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores internos del backend (p.ej. reintentos por acción)."""
+        return {}
+
+    def version_mapa(self) -> Optional[int]:
+        """Versión del mapa de shards en uso (None si el backend no usa shards)."""
+        return None
+
+    def cambiar_primaria(self, anuncio: Dict[str, Any]) -> None:
+        """Anuncio del failover_monitor de que otro servidor pasó a ser el primario (si aplica)."""
+
+    def uso_pool(self) -> Dict[str, Any]:
+        """Uso de las conexiones a la base de datos, para el health-check (vacío si no aplica)."""
+        return {}
+
+    def hay_mantenimiento(self) -> bool:
+        """True si el backend tiene trabajo de fondo pendiente (p.ej. un journal por reproducir)."""
+        return False
+
+    def mantenimiento(self) -> None:
+        pass
+
+    def cerrar(self) -> None:
+        pass
+
+
+# Respuestas compartidas por los backends embebidos (mismo texto que gestor_a.py)
+
+def _fecha_iso(fecha) -> str:
+    return fecha.isoformat() if hasattr(fecha, "isoformat") else str(fecha)
+
+
+def _resp_renovacion_ok(isbn, usuario, nueva_fecha, renovaciones) -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "detalle": "Renovación completada exitosamente",
+        "datos": {
+            "isbn": isbn,
+            "usuario": usuario,
+            "nueva_fecha_devolucion": _fecha_iso(nueva_fecha),
+            "renovaciones": renovaciones
+        }
+    }
+
+
+def _resp_lote(resultados: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "detalle": f"Lote de {len(resultados)} renovación(es) procesado",
+        "datos": {"resultados": resultados}
+    }
+
+
+def _resp_prestamo_ok(isbn, usuario, fecha_prestamo, fecha_devolucion) -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "detalle": "Préstamo registrado exitosamente",
+        "datos": {
+            "isbn": isbn,
+            "usuario": usuario,
+            "fecha_prestamo": fecha_prestamo.isoformat(),
+            "fecha_devolucion": fecha_devolucion.isoformat(),
+            "dias_prestamo": DIAS_PRESTAMO
+        }
+    }
+
+
+def _error_renovacion(prestamo: Optional[Dict[str, Any]], isbn, usuario) -> Optional[Dict[str, Any]]:
+    """Valida un préstamo antes de renovarlo; None si se puede renovar."""
+    if not prestamo:
+        return {
+            "error": "PrestamoNoEncontrado",
+            "detalle": f"No existe un préstamo para el usuario {usuario} del libro {isbn}"
+        }
+    if prestamo["estado"] != "ACTIVO":
+        return {
+            "error": "PrestamoNoActivo",
+            "detalle": f"El préstamo no está activo (estado: {prestamo['estado']})"
+        }
+    if prestamo["renovaciones"] >= MAX_RENOVACIONES:
+        return {
+            "error": "LimiteRenovaciones",
+            "detalle": f"Se alcanzó el límite de 2 renovaciones (actual: {prestamo['renovaciones']})"
+        }
+    return None
+
+
+def _error_libro_no_encontrado(isbn) -> Dict[str, Any]:
+    return {
+        "error": "LibroNoEncontrado",
+        "detalle": f"El libro con ISBN {isbn} no existe en el sistema"
+    }
+
+
+def _error_sin_ejemplares(isbn) -> Dict[str, Any]:
+    return {
+        "error": "SinEjemplaresDisponibles",
+        "detalle": f"No hay ejemplares disponibles del libro {isbn}"
+    }
+
+
+def _error_prestamo_activo(isbn, usuario) -> Dict[str, Any]:
+    return {
+        "error": "PrestamoActivo",
+        "detalle": f"El usuario {usuario} ya tiene un préstamo activo del libro {isbn}"
+    }
+
+
+class MemoriaAlmacenamiento(Almacenamiento):
+    """Estado en diccionarios; cada acción es atómica bajo un único lock."""
+    nombre = "memoria"
+
+    def __init__(self, libros: Optional[Dict[str, int]] = None):
+        self._lock = threading.Lock()
+        self.libros: Dict[str, int] = dict(LIBROS_INICIALES if libros is None else libros)
+        self.prestamos: Dict[tuple, Dict[str, Any]] = {}
+
+    def validar_renovacion(self, isbn, usuario):
+        with self._lock:
+            prestamo = self.prestamos.get((isbn, usuario))
+            return {"renovaciones": (prestamo["renovaciones"] if prestamo else 0)}
+
+    def actualizar_renovacion(self, isbn, usuario, nueva_fecha=None):
+        with self._lock:
+            prestamo = self.prestamos.get((isbn, usuario))
+            error = _error_renovacion(prestamo, isbn, usuario)
+            if error:
+                return error
+            if nueva_fecha is None:
+                actual = prestamo["fecha_devolucion"]
+                if isinstance(actual, str):
+                    actual = datetime.fromisoformat(actual)
+                nueva_fecha = actual + timedelta(days=DIAS_RENOVACION)
+            prestamo["fecha_devolucion"] = nueva_fecha
+            prestamo["renovaciones"] += 1
+            return _resp_renovacion_ok(isbn, usuario, nueva_fecha, prestamo["renovaciones"])
+
+    def consultar_libro(self, isbn):
+        with self._lock:
+            if isbn not in self.libros:
+                return {"error": "LibroNoEncontrado", "detalle": f"El libro {isbn} no existe"}
+            return {"status": "ok", "datos": {"isbn": isbn, "ejemplares": self.libros[isbn]}}
+
+    def aplicar_devolucion(self, isbn, usuario):
+        with self._lock:
+            prestamo = self.prestamos.get((isbn, usuario))
+            if prestamo:
+                prestamo["estado"] = "DEVUELTO"
+                prestamo["fecha_devolucion"] = datetime.now()
+            else:
+                self.prestamos[(isbn, usuario)] = {
+                    "estado": "DEVUELTO", "fecha_devolucion": datetime.now(), "renovaciones": 0
+                }
+            self.libros[isbn] = self.libros.get(isbn, 0) + 1
+            return {"status": "ok", "detalle": "devolucion completada"}
+
+    def procesar_prestamo(self, isbn, usuario):
+        with self._lock:
+            if isbn not in self.libros:
+                return _error_libro_no_encontrado(isbn)
+            if self.libros[isbn] <= 0:
+                return _error_sin_ejemplares(isbn)
+            prestamo = self.prestamos.get((isbn, usuario))
+            if prestamo and prestamo["estado"] == "ACTIVO":
+                return _error_prestamo_activo(isbn, usuario)
+            fecha_prestamo = datetime.now()
+            fecha_devolucion = fecha_prestamo + timedelta(days=DIAS_PRESTAMO)
+            self.prestamos[(isbn, usuario)] = {
+                "estado": "ACTIVO", "fecha_devolucion": fecha_devolucion, "renovaciones": 0
+            }
+            self.libros[isbn] -= 1
+            return _resp_prestamo_ok(isbn, usuario, fecha_prestamo, fecha_devolucion)
+
+
+class SQLiteAlmacenamiento(Almacenamiento):
+    """
+    SQLite embebido. Una conexión por hilo (sqlite3 no comparte conexiones
+    entre hilos) y transacciones de escritura con BEGIN IMMEDIATE para que dos
+    escritores no se interbloqueen al promover un lock de lectura.
+    """
+    nombre = "sqlite"
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL;",
+        "PRAGMA synchronous=NORMAL;",      # con WAL: durable salvo corte de luz
+        "PRAGMA temp_store=MEMORY;",
+        "PRAGMA cache_size=-65536;",       # 64 MiB
+        "PRAGMA mmap_size=268435456;",     # 256 MiB
+        "PRAGMA busy_timeout=5000;",
+    )
+
+    def __init__(self, path: str = GA_SQLITE_PATH, libros: Optional[Dict[str, int]] = None):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS libros (
+          isbn TEXT PRIMARY KEY,
+          ejemplares INTEGER NOT NULL DEFAULT 0
+        );
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS prestamos (
+          isbn TEXT NOT NULL,
+          usuario TEXT NOT NULL,
+          estado TEXT NOT NULL DEFAULT 'ACTIVO',
+          fecha_devolucion TEXT,
+          renovaciones INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (isbn, usuario)
+        ) WITHOUT ROWID;
+        """)
+        conn.executemany(
+            "INSERT OR IGNORE INTO libros (isbn, ejemplares) VALUES (?, ?);",
+            list((LIBROS_INICIALES if libros is None else libros).items())
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: las transacciones se abren a mano
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        return conn
+
+    def _escritura(self, fn, error: str, detalle: str):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            resp = fn(conn)
+            conn.execute("COMMIT;" if resp.get("status") == "ok" else "ROLLBACK;")
+            return resp
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+            return {"error": error, "detalle": f"{detalle}: {str(e)}"}
+
+    def validar_renovacion(self, isbn, usuario):
+        row = self._conn().execute(
+            "SELECT renovaciones FROM prestamos WHERE isbn=? AND usuario=?;", (isbn, usuario)
+        ).fetchone()
+        return {"renovaciones": (row["renovaciones"] if row else 0)}
+
+    @staticmethod
+    def _renovar(conn, isbn, usuario, nueva_fecha):
+        row = conn.execute(
+            "SELECT renovaciones, estado, fecha_devolucion FROM prestamos WHERE isbn=? AND usuario=?;",
+            (isbn, usuario)
+        ).fetchone()
+        prestamo = dict(row) if row else None
+        error = _error_renovacion(prestamo, isbn, usuario)
+        if error:
+            return error
+        fecha = nueva_fecha
+        if fecha is None:
+            fecha = datetime.fromisoformat(prestamo["fecha_devolucion"]) + timedelta(days=DIAS_RENOVACION)
+        conn.execute("""
+            UPDATE prestamos
+            SET fecha_devolucion = ?,
+                renovaciones = renovaciones + 1
+            WHERE isbn=? AND usuario=?;
+        """, (_fecha_iso(fecha), isbn, usuario))
+        return _resp_renovacion_ok(isbn, usuario, fecha, prestamo["renovaciones"] + 1)
+
+    def actualizar_renovacion(self, isbn, usuario, nueva_fecha=None):
+        return self._escritura(lambda conn: self._renovar(conn, isbn, usuario, nueva_fecha),
+                               "ErrorProcesamiento", "Error al procesar renovación")
+
+    def actualizar_renovacion_lote(self, items, nueva_fecha=None):
+        # Un único BEGIN IMMEDIATE/COMMIT para todo el lote; los rechazos no escriben nada
+        def tx(conn):
+            return _resp_lote([self._renovar(conn, isbn, usuario, nueva_fecha) for isbn, usuario in items])
+        return self._escritura(tx, "ErrorProcesamiento", "Error al procesar lote de renovaciones")
+
+    def consultar_libro(self, isbn):
+        try:
+            row = self._conn().execute("SELECT * FROM libros WHERE isbn=?;", (isbn,)).fetchone()
+            if row:
+                return {"status": "ok", "datos": dict(row)}
+            return {"error": "LibroNoEncontrado", "detalle": f"El libro {isbn} no existe"}
+        except Exception as e:
+            return {"error": "ErrorConsulta", "detalle": str(e)}
+
+    def aplicar_devolucion(self, isbn, usuario):
+        def tx(conn):
+            ahora = datetime.now().isoformat()
+            cur = conn.execute("""
+                UPDATE prestamos
+                   SET estado='DEVUELTO', fecha_devolucion=?
+                 WHERE isbn=? AND usuario=?;
+            """, (ahora, isbn, usuario))
+            if cur.rowcount == 0:
+                conn.execute("""
+                    INSERT INTO prestamos (isbn, usuario, estado, fecha_devolucion, renovaciones)
+                    VALUES (?, ?, 'DEVUELTO', ?, 0)
+                    ON CONFLICT (isbn, usuario) DO NOTHING;
+                """, (isbn, usuario, ahora))
+            conn.execute("""
+                INSERT INTO libros(isbn, ejemplares)
+                VALUES (?, 1)
+                ON CONFLICT (isbn)
+                DO UPDATE SET ejemplares = libros.ejemplares + 1;
+            """, (isbn,))
+            return {"status": "ok", "detalle": "devolucion completada"}
+        resp = self._escritura(tx, "ErrorProcesamiento", "Error al procesar devolución")
+        # gestor_a.aplicar_devolucion responde solo {"error": str(e)} ante una excepción
+        return resp if resp.get("status") == "ok" else {"error": resp.get("detalle")}
+
+    def procesar_prestamo(self, isbn, usuario):
+        def tx(conn):
+            libro = conn.execute("SELECT ejemplares FROM libros WHERE isbn=?;", (isbn,)).fetchone()
+            if not libro:
+                return _error_libro_no_encontrado(isbn)
+            if libro["ejemplares"] <= 0:
+                return _error_sin_ejemplares(isbn)
+            existente = conn.execute(
+                "SELECT estado FROM prestamos WHERE isbn=? AND usuario=?;", (isbn, usuario)
+            ).fetchone()
+            if existente and existente["estado"] == "ACTIVO":
+                return _error_prestamo_activo(isbn, usuario)
+            fecha_prestamo = datetime.now()
+            fecha_devolucion = fecha_prestamo + timedelta(days=DIAS_PRESTAMO)
+            conn.execute("""
+                INSERT INTO prestamos (isbn, usuario, estado, fecha_devolucion, renovaciones)
+                VALUES (?, ?, 'ACTIVO', ?, 0)
+                ON CONFLICT (isbn, usuario)
+                DO UPDATE SET estado='ACTIVO',
+                              fecha_devolucion=excluded.fecha_devolucion,
+                              renovaciones=0;
+            """, (isbn, usuario, fecha_devolucion.isoformat()))
+            conn.execute("UPDATE libros SET ejemplares = ejemplares - 1 WHERE isbn=?;", (isbn,))
+            return _resp_prestamo_ok(isbn, usuario, fecha_prestamo, fecha_devolucion)
+        return self._escritura(tx, "ErrorProcesamiento", "Error al procesar préstamo")
+
+    def cerrar(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
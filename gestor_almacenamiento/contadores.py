@@ -0,0 +1,200 @@
+"""
+Contadores fragmentados de ejemplares para libros muy solicitados.
+
+Con CONTADORES_SLOTS=N (> 0) el stock de cada ISBN deja de vivir en la fila
+libros.ejemplares y se reparte en N filas de libros_ejemplares(isbn, slot).
+Un préstamo descuenta de un slot no vacío elegido al azar saltándose los que
+están bloqueados (FOR UPDATE SKIP LOCKED), así que préstamos concurrentes del
+mismo libro ya no hacen cola sobre un único row lock. Una devolución suma a un
+slot cualquiera.
+
+El total disponible es siempre libros.ejemplares + SUM(libros_ejemplares),
+por lo que las consultas siguen devolviendo el valor exacto. La primera vez
+que se toca un ISBN su stock se mueve de libros a los slots ("siembra"); el
+que llegue después a libros.ejemplares (carga de datos, devoluciones con los
+contadores desactivados) se mueve cuando un préstamo no encuentra stock en
+los slots.
+
+Un hilo de fondo (RebalanceadorContadores) vuelve a repartir el stock cuando
+algún slot queda vacío mientras otros tienen de sobra.
+"""
+import os
+import random
+import threading
+import time
+
+CONTADORES_SLOTS = int(os.getenv("CONTADORES_SLOTS", "0"))  # 0 = desactivado
+CONTADORES_REBALANCEO = float(os.getenv("CONTADORES_REBALANCEO", "5"))
+
+
+def activos() -> bool:
+    return CONTADORES_SLOTS > 0
+
+
+def ensure_schema_contadores(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS libros_ejemplares (
+          isbn TEXT NOT NULL,
+          slot INTEGER NOT NULL,
+          ejemplares INTEGER NOT NULL DEFAULT 0 CHECK (ejemplares >= 0),
+          PRIMARY KEY (isbn, slot)
+        );
+        """)
+    conn.commit()
+
+
+def _repartir(total: int, slots: int):
+    base, resto = divmod(total, slots)
+    return [base + (1 if i < resto else 0) for i in range(slots)]
+
+
+def sembrar(conn, isbn) -> bool:
+    """
+    Crea los slots del ISBN si aún no tiene y les reparte lo que haya en
+    libros.ejemplares, que queda a 0. Devuelve False si el libro no existe.
+    Bloquea la fila de libros, así que solo se llama cuando los slots no bastan.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT ejemplares FROM libros WHERE isbn=%s FOR UPDATE;", (isbn,))
+        row = cur.fetchone()
+        if not row:
+            return False
+        cur.execute("SELECT slot FROM libros_ejemplares WHERE isbn=%s ORDER BY slot;", (isbn,))
+        slots = [r[0] for r in cur.fetchall()]
+        if slots and row[0] == 0:
+            return True  # otra transacción sembró primero y no llegó stock nuevo
+        slots = slots or list(range(CONTADORES_SLOTS))
+        for slot, n in zip(slots, _repartir(row[0], len(slots))):
+            cur.execute("""
+                INSERT INTO libros_ejemplares (isbn, slot, ejemplares)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (isbn, slot)
+                DO UPDATE SET ejemplares = libros_ejemplares.ejemplares + EXCLUDED.ejemplares;
+            """, (isbn, slot, n))
+        if row[0]:
+            cur.execute("UPDATE libros SET ejemplares = 0 WHERE isbn=%s;", (isbn,))
+    return True
+
+
+def _ajustar_slot(conn, isbn, delta: int, solo_no_vacios: bool):
+    """Suma delta a un slot aleatorio del ISBN. Devuelve el slot o None."""
+    filtro = "AND ejemplares > 0" if solo_no_vacios else ""
+    # Primero sin esperar a slots bloqueados; si todos lo están, esperar a uno
+    for bloqueo in ("FOR UPDATE SKIP LOCKED", "FOR UPDATE"):
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE libros_ejemplares SET ejemplares = ejemplares + %s
+                 WHERE (isbn, slot) = (
+                    SELECT isbn, slot FROM libros_ejemplares
+                     WHERE isbn=%s {filtro}
+                     ORDER BY random() LIMIT 1
+                     {bloqueo})
+                RETURNING slot;
+            """, (delta, isbn))
+            row = cur.fetchone()
+            if row:
+                return row[0]
+    return None
+
+
+def tomar_ejemplar(conn, isbn) -> bool:
+    """Descuenta un ejemplar de un slot no vacío. False si no hay stock."""
+    if _ajustar_slot(conn, isbn, -1, solo_no_vacios=True) is not None:
+        return True
+    if not sembrar(conn, isbn):
+        return False
+    return _ajustar_slot(conn, isbn, -1, solo_no_vacios=True) is not None
+
+
+def devolver_ejemplar(conn, isbn) -> None:
+    """Suma un ejemplar a un slot cualquiera (el libro debe existir en libros)."""
+    if _ajustar_slot(conn, isbn, 1, solo_no_vacios=False) is not None:
+        return
+    sembrar(conn, isbn)
+    if _ajustar_slot(conn, isbn, 1, solo_no_vacios=False) is None:
+        raise RuntimeError(f"No hay slots de ejemplares para {isbn}")
+
+
+def total_ejemplares(conn, isbn):
+    """Total exacto disponible (None si el libro no existe)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT l.ejemplares + COALESCE(
+                     (SELECT SUM(e.ejemplares) FROM libros_ejemplares e WHERE e.isbn = l.isbn), 0)
+              FROM libros l WHERE l.isbn=%s;
+        """, (isbn,))
+        row = cur.fetchone()
+        return int(row[0]) if row else None
+
+
+def rebalancear(conn, limite: int = 100) -> int:
+    """
+    Reparte de nuevo el stock de los ISBN con algún slot vacío y stock suficiente
+    para llenar todos. Devuelve cuántos ISBN se rebalancearon.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT isbn FROM libros_ejemplares
+             GROUP BY isbn
+            HAVING MIN(ejemplares) = 0 AND SUM(ejemplares) >= COUNT(*)
+             LIMIT %s;
+        """, (limite,))
+        isbns = [r[0] for r in cur.fetchall()]
+    conn.commit()
+
+    for isbn in isbns:
+        with conn.cursor() as cur:
+            # Orden fijo por slot para no interbloquearse con otro rebalanceador
+            cur.execute("""
+                SELECT slot, ejemplares FROM libros_ejemplares
+                 WHERE isbn=%s ORDER BY slot FOR UPDATE;
+            """, (isbn,))
+            filas = cur.fetchall()
+            total = sum(n for _, n in filas)
+            for (slot, _), n in zip(filas, _repartir(total, len(filas))):
+                cur.execute("UPDATE libros_ejemplares SET ejemplares=%s WHERE isbn=%s AND slot=%s;",
+                            (n, isbn, slot))
+        conn.commit()
+    return len(isbns)
+
+
+class RebalanceadorContadores:
+    """
+    Hilo de fondo que rebalancea los slots de cada shard con su propia conexión
+    (no comparte transacciones con el bucle principal del GA).
+    """
+    def __init__(self, obtener_nodos, conectar, intervalo: float = CONTADORES_REBALANCEO):
+        self.obtener_nodos = obtener_nodos  # () -> iterable de NodoShard
+        self.conectar = conectar            # (nodo) -> conexión
+        self.intervalo = intervalo
+        self._conexiones = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def _loop(self):
+        while not self._stop.wait(self.intervalo * random.uniform(0.8, 1.2)):
+            for nodo in list(self.obtener_nodos()):
+                conn = self._conexiones.get(nodo.nombre)
+                try:
+                    if conn is None or conn.closed:
+                        conn = self.conectar(nodo)
+                        self._conexiones[nodo.nombre] = conn
+                    inicio = time.monotonic()
+                    n = rebalancear(conn)
+                    if n:
+                        print(f"[Contadores] Shard {nodo.nombre}: {n} ISBN rebalanceados en "
+                              f"{(time.monotonic() - inicio) * 1000:.1f} ms")
+                except Exception as e:
+                    print(f"[Contadores] Error rebalanceando shard {nodo.nombre}: {e}")
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        self._conexiones.pop(nodo.nombre, None)
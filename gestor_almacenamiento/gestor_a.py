@@ -1,8 +1,26 @@
 import os
+import json
+import random
+import time
+import threading
 import zmq
 import psycopg2                      
-from psycopg2.extras import RealDictCursor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from psycopg2.extras import RealDictCursor, execute_values
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import Optional
+
+from shards import ShardMap, ShardMapRecargable, ESTADO_MIGRANDO
+import contadores
+from journal import JournalLocal, ensure_schema_journal, nuevo_id, purgar_aplicados
+from acciones import Despachador, acciones_de_escritura
+from common.health.responder import HealthResponder
+from common.tracing import traza
+from almacenamiento import (
+    Almacenamiento, SQLiteAlmacenamiento, MemoriaAlmacenamiento, GA_SQLITE_PATH,
+    _error_renovacion, _resp_lote, _resp_renovacion_ok
+)
 
 # Config DB desde variables de entorno
 DB_HOST = os.getenv("DB_HOST", "postgres_primary")     
@@ -12,12 +30,58 @@ DB_NAME = os.getenv("DB_NAME", "library")
 DB_USER = os.getenv("DB_USER", "app")          
 DB_PASS = os.getenv("DB_PASS", "app")
 
+# Backend de almacenamiento: postgres (por defecto), sqlite o memoria
+GA_BACKEND = os.getenv("GA_BACKEND", "postgres")
+
+# Anuncios de failover_monitor (PUB, tópico "primaria"), separados por comas.
+# Con ellos el GA cambia de primario al instante y deja de sondear la conexión
+# antes de cada petición; vacío = comportamiento anterior.
+GA_FAILOVER_SUB = [e.strip() for e in os.getenv("GA_FAILOVER_SUB", "").split(",") if e.strip()]
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+# Modo degradado: sin primario, las lecturas se sirven desde la réplica y las
+# escrituras fallan al instante; el primario se reintenta en segundo plano cada
+# GA_DEGRADADO_REINTENTO_MS. GA_MODO_DEGRADADO=0 vuelve al comportamiento anterior.
+GA_MODO_DEGRADADO = os.getenv("GA_MODO_DEGRADADO", "1") == "1"
+GA_DEGRADADO_REINTENTO_MS = int(os.getenv("GA_DEGRADADO_REINTENTO_MS", "1000"))
+
+# HealthResponder con la carga del GA (p.ej. tcp://*:5571); vacío = sin health-check
+GA_SALUD_ADDR = os.getenv("GA_SALUD_ADDR", "")
+
+# Mapa de shards (opcional). Sin SHARD_MAP_FILE hay un único shard con DB_HOST.
+SHARD_MAP_FILE = os.getenv("SHARD_MAP_FILE")
+SHARD_MAP_RECARGA = float(os.getenv("SHARD_MAP_RECARGA", "1.0"))
+
+# Acciones que modifican datos (se rechazan sobre rangos en migración)
+ACCIONES_ESCRITURA = acciones_de_escritura()
+
+# Acciones conmutativas que se aceptan en el journal local si la BD no está disponible
+ACCIONES_JOURNAL = {"aplicar_devolucion"}
+# Cada cuánto (ms) intentar vaciar el journal cuando no llegan peticiones
+GA_JOURNAL_REINTENTO_MS = int(os.getenv("GA_JOURNAL_REINTENTO_MS", "2000"))
+
+# Mapa usado cuando no hay SHARD_MAP_FILE: un único shard con DB_HOST
+MAPA_POR_DEFECTO = ShardMap.por_defecto(DB_HOST, DB_PORT, DB_STANDBY_HOST)
+NODO_POR_DEFECTO = MAPA_POR_DEFECTO.nodos["default"]
+
 # Estado de conexión global
 current_db_host = DB_HOST
 current_db_port = DB_PORT
 last_failover_time = None
 
 
+# Reintentos de conflictos de concurrencia (serialización / deadlock)
+SQLSTATE_REINTENTABLES = {"40001", "40P01"}  # serialization_failure, deadlock_detected
+GA_PLAZO_REINTENTOS_MS = int(os.getenv("GA_PLAZO_REINTENTOS_MS", "4000"))  # < RCVTIMEO de los actores
+GA_REINTENTO_BASE_MS = float(os.getenv("GA_REINTENTO_BASE_MS", "5"))
+GA_REINTENTO_MAX_MS = float(os.getenv("GA_REINTENTO_MAX_MS", "200"))
+
+
+def es_conflicto_reintentable(e):
+    """True si PostgreSQL abortó la transacción por serialización o deadlock."""
+    return getattr(e, "pgcode", None) in SQLSTATE_REINTENTABLES
+
+
 # Helpers de base de datos
 def is_connection_read_only(conn):
     # Verifica si la conexión actual es de solo lectura
@@ -31,73 +95,168 @@ def is_connection_read_only(conn):
         return True  # Asumir read-only si hay error
 
 
-def connect_db_with_failover(preferred_host=None):
+# Topología conocida por shard: (host, puerto) -> "primario" | "solo_lectura" | "caido".
+# El último primario se prueba primero y el resto arranca DB_CARRERA_ESCALONADO_MS
+# después, así en el caso normal no se abren conexiones de más.
+_topologia = {}
+_topologia_lock = threading.Lock()
+DB_CARRERA_ESCALONADO_MS = int(os.getenv("DB_CARRERA_ESCALONADO_MS", "100"))
+
+
+def _anotar_topologia(nodo, host, port, estado):
+    with _topologia_lock:
+        _topologia.setdefault(nodo.nombre, {})[(host, port)] = estado
+
+
+def _candidatos(nodo, preferred_host=None):
+    """(host, puerto) a probar, primero lo que la topología cacheada da como primario."""
+    standby_host = nodo.standby_host or DB_STANDBY_HOST
+    if preferred_host:
+        # Si se especifica un host preferido, probar ese con ambos puertos
+        candidatos = [(preferred_host, nodo.port), (preferred_host, 5433)]
+    else:
+        candidatos = [(nodo.current_host, nodo.current_port), (standby_host, 5432), (standby_host, 5433)]
+    candidatos = list(dict.fromkeys(candidatos))
+    with _topologia_lock:
+        conocida = dict(_topologia.get(nodo.nombre, {}))
+    prioridad = {"primario": 0, None: 1, "solo_lectura": 2, "caido": 3}
+    return sorted(candidatos, key=lambda c: prioridad[conocida.get(c)])
+
+
+def _intentar_conexion(nodo, host, port, decidido, escritura=True):
+    """Conecta y, si `escritura`, comprueba que sea escribible; devuelve la conexión o None."""
+    try:
+        conn = psycopg2.connect(
+            host=host,
+            port=port,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASS,
+            connect_timeout=DB_CONNECT_TIMEOUT
+        )
+    except Exception as e:
+        _anotar_topologia(nodo, host, port, "caido")
+        if not decidido.is_set():
+            print(f"[DB] Fallo conexión a {host}:{port}: {e}")
+        raise
+    if decidido.is_set():
+        # Ya ganó otro candidato: esta conexión sobra
+        conn.close()
+        return None
+    if is_connection_read_only(conn):
+        _anotar_topologia(nodo, host, port, "solo_lectura")
+        if not escritura:
+            return conn
+        print(f"[DB] {host}:{port} es read-only, buscando alternativa...")
+        conn.close()
+        return None
+    _anotar_topologia(nodo, host, port, "primario")
+    return conn
+
+
+def _cerrar_perdedor(futuro):
+    if futuro.exception() is None and futuro.result() is not None:
+        futuro.result().close()
+
+
+def connect_db_with_failover(preferred_host=None, nodo=None, escritura=True):
     """
     Conecta a PostgreSQL con soporte para failover automático.
-    Intenta conectar al host preferido, si falla intenta el alternativo.
-    También prueba diferentes puertos (5432 y 5433).
-    Verifica que la conexión sea de escritura (no read-only).
+    Lanza en paralelo la conexión a todos los candidatos (host actual y
+    standby, puertos 5432 y 5433), escalonando según la topología cacheada,
+    y se queda con el primero que sea de escritura (no read-only). Las
+    conexiones que terminen después se cierran.
     
     Args:
         preferred_host: Host preferido para conectar (None = usar el actual)
+        nodo: NodoShard al que conectar (None = nodo único configurado por DB_HOST)
+        escritura: False = vale cualquier candidato, también una réplica; no
+            cambia el host actual del nodo (modo degradado)
     
     Returns:
         Tupla (conexión, host_usado)
     """
     global current_db_host, current_db_port, last_failover_time
-    
-    # Lista de (host, puerto) para probar
-    hosts_to_try = []
-    
-    if preferred_host:
-        # Si se especifica un host preferido, probar ese primero con ambos puertos
-        hosts_to_try.append((preferred_host, DB_PORT))
-        hosts_to_try.append((preferred_host, 5433))
-    else:
-        # Probar host actual primero, luego alternativo
-        hosts_to_try.append((current_db_host, current_db_port))
-        hosts_to_try.append((DB_STANDBY_HOST, 5432))
-        hosts_to_try.append((DB_STANDBY_HOST, 5433))
-    
+
+    if nodo is None:
+        nodo = NODO_POR_DEFECTO
+    candidatos = _candidatos(nodo, preferred_host)
+    print(f"[DB] Conectando a {', '.join(f'{h}:{p}' for h, p in candidatos)} (shard {nodo.nombre})")
+
+    decidido = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(candidatos), thread_name_prefix=f"db-{nodo.nombre}")
+    pendientes = {}
+    ganador = None
     last_error = None
-    for host, port in hosts_to_try:
-        try:
-            print(f"[DB] Intentando conectar a {host}:{port}")
-            conn = psycopg2.connect(
-                host=host,
-                port=port,
-                database=DB_NAME,
-                user=DB_USER,
-                password=DB_PASS,
-                connect_timeout=5
-            )
-            
-            # Verificar que no sea read-only
-            if not is_connection_read_only(conn):
-                print(f"[DB] Conectado exitosamente a {host}:{port}")
-                current_db_host = host
-                current_db_port = port
-                last_failover_time = datetime.now()
-                return conn, host
-            else:
-                print(f"[DB] {host}:{port} es read-only, buscando alternativa...")
-                conn.close()
-        except Exception as e:
-            last_error = e
-            print(f"[DB] Fallo conexión a {host}:{port}: {e}")
+    try:
+        # El favorito sale primero; el resto, si no ha ganado ya, tras el escalonado
+        primero = candidatos[0]
+        pendientes[pool.submit(_intentar_conexion, nodo, *primero, decidido, escritura)] = primero
+        restantes = candidatos[1:]
+        espera = DB_CARRERA_ESCALONADO_MS / 1000.0
+        while pendientes or restantes:
+            hechos, _ = wait(list(pendientes), timeout=espera if restantes else None,
+                             return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                host, port = pendientes.pop(futuro)
+                try:
+                    conn = futuro.result()
+                except Exception as e:
+                    last_error = e
+                    conn = None
+                if conn is not None and ganador is None:
+                    ganador = (conn, host, port)
+                    decidido.set()
+                elif conn is not None:
+                    conn.close()
+            if ganador is not None:
+                break
+            if restantes and (not hechos or not pendientes):
+                # Sin respuesta en el escalonado (o el favorito ya falló): lanzar el resto
+                for candidato in restantes:
+                    pendientes[pool.submit(_intentar_conexion, nodo, *candidato, decidido, escritura)] = candidato
+                restantes = []
+    finally:
+        decidido.set()
+        # No se espera a los perdedores: su conexión se cierra cuando terminen
+        for futuro in pendientes:
+            futuro.add_done_callback(_cerrar_perdedor)
+        pool.shutdown(wait=False)
+
+    if ganador is not None:
+        conn, host, port = ganador
+        if not escritura:
+            print(f"[DB] Conectado para lectura a {host}:{port} (shard {nodo.nombre})")
+            return conn, host
+        print(f"[DB] Conectado exitosamente a {host}:{port}")
+        nodo.current_host = host
+        nodo.current_port = port
+        current_db_host = host
+        current_db_port = port
+        last_failover_time = datetime.now()
+        return conn, host
     
     # Si llegamos aquí, ninguna conexión funcionó
-    print(f"[DB] ERROR: No se pudo conectar a ningún servidor")
+    print(f"[DB] ERROR: No se pudo conectar a ningún servidor (shard {nodo.nombre})")
     raise Exception(f"No se pudo conectar a la base de datos: {last_error}")
 
 
-def connect_db():
+def connect_db(nodo=None):
     """Conecta a la base de datos con soporte de failover."""
-    conn, _ = connect_db_with_failover()
+    conn, _ = connect_db_with_failover(nodo=nodo)
     return conn
 
 
-def reconnect_db_if_needed(conn):
+def connect_db_lectura(nodo=None):
+    """Conexión de solo consulta al primero que responda, primario o réplica (autocommit)."""
+    conn, _ = connect_db_with_failover(nodo=nodo, escritura=False)
+    # Sin transacción abierta entre consultas: en un hot standby frenaría el replay
+    conn.rollback()
+    conn.autocommit = True
+    return conn
+
+
+def reconnect_db_if_needed(conn, nodo=None):
     """
     Verifica si la conexión está activa, si no, intenta reconectar.
     
@@ -117,10 +276,169 @@ def reconnect_db_if_needed(conn):
             pass
         
         # Intentar reconectar con failover
-        new_conn, _ = connect_db_with_failover()
+        new_conn, _ = connect_db_with_failover(nodo=nodo)
         return new_conn
 
 
+class SinPrimario(Exception):
+    """El shard está en modo degradado: no hay primario escribible ahora mismo."""
+
+
+class PoolShards:
+    """
+    Una conexión por shard, abierta bajo demanda la primera vez que llega
+    una petición para un ISBN de ese shard. El esquema se verifica una vez
+    por nodo.
+
+    Si no se puede conectar al primario, el shard entra en modo degradado:
+    `conexion()` lanza SinPrimario al instante, sin volver a esperar a la
+    BD, y un hilo reintenta el primario cada GA_DEGRADADO_REINTENTO_MS. La
+    conexión que consiga se entrega en la siguiente llamada a `conexion()`,
+    que es cuando el shard sale del modo degradado. Las lecturas usan
+    mientras tanto `conexion_lectura()`.
+    """
+    def __init__(self, mapa: ShardMapRecargable, sondear: bool = True, degradado: bool = GA_MODO_DEGRADADO):
+        self.mapa = mapa
+        self.conexiones = {}  # nombre_shard -> conexión
+        # Sin sondeo la conexión se da por buena hasta que falle o llegue un
+        # anuncio de failover (ver GA_FAILOVER_SUB)
+        self.sondear = sondear
+        self.modo_degradado = degradado
+        self.degradados = {}   # nombre_shard -> instante (monotonic) en que entró
+        self.lecturas = {}     # nombre_shard -> conexión de solo consulta
+        self._recuperadas = {}  # nombre_shard -> conexión al primario lista para usar
+        self._lock = threading.Lock()
+
+    def ubicar(self, isbn):
+        """Devuelve (nodo, rango) dueño del ISBN según la versión vigente del mapa."""
+        return self.mapa.actual().ubicar(isbn)
+
+    def conexion(self, nodo):
+        if nodo.nombre in self.degradados:
+            with self._lock:
+                conn = self._recuperadas.pop(nodo.nombre, None)
+            if conn is None:
+                raise SinPrimario(f"Shard {nodo.nombre} sin primario (modo solo lectura)")
+            try:
+                self._preparar(conn, nodo)
+            except Exception:
+                # Volvió a caer entre el reintento y ahora: seguir degradado
+                conn.close()
+                self.reintentar(nodo)
+                self.degradar(nodo)
+                raise
+            self._salir_degradado(nodo)
+        conn = self.conexiones.get(nodo.nombre)
+        try:
+            if conn is None:
+                conn = connect_db(nodo)
+                self._preparar(conn, nodo)
+            elif self.sondear or conn.closed:
+                conn = reconnect_db_if_needed(conn, nodo)
+        except Exception:
+            self.conexiones.pop(nodo.nombre, None)
+            self.degradar(nodo)
+            raise
+        self.conexiones[nodo.nombre] = conn
+        return conn
+
+    def _preparar(self, conn, nodo):
+        ensure_schema(conn)
+        ensure_schema_journal(conn)
+        if contadores.activos():
+            contadores.ensure_schema_contadores(conn)
+        self.conexiones[nodo.nombre] = conn
+        print(f"[GestorAlmacenamiento] Shard {nodo.nombre} listo ({nodo.current_host}:{nodo.current_port})")
+
+    def conexion_lectura(self, nodo):
+        """Conexión para consultas en modo degradado: la del primario si la hay, si no una réplica."""
+        conn = self.conexiones.get(nodo.nombre)
+        if conn is not None and not conn.closed:
+            return conn
+        conn = self.lecturas.get(nodo.nombre)
+        if conn is None or conn.closed:
+            conn = connect_db_lectura(nodo)
+            self.lecturas[nodo.nombre] = conn
+        return conn
+
+    def descartar_lectura(self, nodo):
+        conn = self.lecturas.pop(nodo.nombre, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def degradar(self, nodo):
+        """Pasa el shard a modo degradado y arranca el reintento del primario en segundo plano."""
+        if not self.modo_degradado or nodo.nombre in self.degradados:
+            return
+        self.degradados[nodo.nombre] = time.monotonic()
+        print(f"[GestorAlmacenamiento] Shard {nodo.nombre} en modo degradado: solo lectura hasta que vuelva un primario")
+        threading.Thread(target=self._vigilar_primario, args=(nodo,),
+                         name=f"degradado-{nodo.nombre}", daemon=True).start()
+
+    def reintentar(self, nodo):
+        """Olvida el modo degradado para que la próxima conexión vaya directa al primario (p.ej. tras un anuncio)."""
+        with self._lock:
+            self.degradados.pop(nodo.nombre, None)
+            conn = self._recuperadas.pop(nodo.nombre, None)
+        if conn is not None:
+            conn.close()
+
+    def _salir_degradado(self, nodo):
+        with self._lock:
+            desde = self.degradados.pop(nodo.nombre, None)
+        if desde is not None:
+            print(f"[GestorAlmacenamiento] Shard {nodo.nombre} sale del modo degradado "
+                  f"tras {time.monotonic() - desde:.1f} s ({nodo.current_host}:{nodo.current_port})")
+        self.descartar_lectura(nodo)
+
+    def _vigilar_primario(self, nodo):
+        desde = self.degradados.get(nodo.nombre)
+        while desde is not None and self.degradados.get(nodo.nombre) == desde:
+            time.sleep(GA_DEGRADADO_REINTENTO_MS / 1000.0)
+            if self.degradados.get(nodo.nombre) != desde:
+                return
+            try:
+                conn = connect_db(nodo)
+            except Exception:
+                continue
+            with self._lock:
+                if self.degradados.get(nodo.nombre) == desde:
+                    self._recuperadas[nodo.nombre] = conn
+                    return
+            # Ya salió del modo degradado por otro camino (anuncio de failover)
+            conn.close()
+            return
+
+    def estado(self):
+        ahora = time.monotonic()
+        return {nombre: round(ahora - desde, 1) for nombre, desde in list(self.degradados.items())}
+
+    def descartar(self, nodo):
+        """Cierra la conexión del shard para forzar reconexión en la próxima petición."""
+        conn = self.conexiones.pop(nodo.nombre, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def cerrar(self):
+        self.degradados.clear()
+        with self._lock:
+            pendientes = list(self._recuperadas.values())
+            self._recuperadas.clear()
+        for conn in list(self.conexiones.values()) + list(self.lecturas.values()) + pendientes:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.conexiones.clear()
+        self.lecturas.clear()
+
+
 def ensure_schema(conn):                        
     with conn.cursor() as cur:
         cur.execute("""
@@ -160,20 +478,22 @@ def actualizar_renovacion(conn, isbn, usuario, nueva_fecha=None):
     """
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Verificar préstamo existente
+            # Verificar préstamo existente (los errores hacen rollback para soltar el bloqueo)
             cur.execute(
-                "SELECT renovaciones, estado, fecha_devolucion FROM prestamos WHERE isbn=%s AND usuario=%s;",
+                "SELECT renovaciones, estado, fecha_devolucion FROM prestamos WHERE isbn=%s AND usuario=%s FOR UPDATE;",
                 (isbn, usuario)
             )
             prestamo = cur.fetchone()
             
             if not prestamo:
+                conn.rollback()
                 return {
                     "error": "PrestamoNoEncontrado",
                     "detalle": f"No existe un préstamo para el usuario {usuario} del libro {isbn}"
                 }
             
             if prestamo["estado"] != "ACTIVO":
+                conn.rollback()
                 return {
                     "error": "PrestamoNoActivo",
                     "detalle": f"El préstamo no está activo (estado: {prestamo['estado']})"
@@ -181,6 +501,7 @@ def actualizar_renovacion(conn, isbn, usuario, nueva_fecha=None):
             
             # Validar límite de renovaciones
             if prestamo["renovaciones"] >= 2:
+                conn.rollback()
                 return {
                     "error": "LimiteRenovaciones",
                     "detalle": f"Se alcanzó el límite de 2 renovaciones (actual: {prestamo['renovaciones']})"
@@ -216,6 +537,8 @@ def actualizar_renovacion(conn, isbn, usuario, nueva_fecha=None):
         
     except Exception as e:
         conn.rollback()
+        if es_conflicto_reintentable(e):
+            raise
         return {
             "error": "ErrorProcesamiento",
             "detalle": f"Error al procesar renovación: {str(e)}"
@@ -223,6 +546,77 @@ def actualizar_renovacion(conn, isbn, usuario, nueva_fecha=None):
 
 
 
+SQL_RENOVACION_LOTE = """
+    WITH lote (pos, isbn, usuario, nueva_fecha) AS (VALUES %s),
+    renovados AS (
+        UPDATE prestamos p
+           SET fecha_devolucion = COALESCE(l.nueva_fecha, p.fecha_devolucion + INTERVAL '7 days'),
+               renovaciones = p.renovaciones + 1
+          FROM lote l
+         WHERE p.isbn = l.isbn AND p.usuario = l.usuario
+           AND p.estado = 'ACTIVO' AND p.renovaciones < 2
+        RETURNING p.isbn, p.usuario, p.fecha_devolucion, p.renovaciones
+    )
+    SELECT l.pos, l.isbn, l.usuario,
+           r.fecha_devolucion, r.renovaciones,
+           a.estado AS estado_previo, a.renovaciones AS renovaciones_previas
+      FROM lote l
+      LEFT JOIN renovados r ON r.isbn = l.isbn AND r.usuario = l.usuario
+      LEFT JOIN prestamos a ON a.isbn = l.isbn AND a.usuario = l.usuario
+     ORDER BY l.pos;
+"""
+
+
+def actualizar_renovacion_lote(conn, items, nueva_fecha=None):
+    """
+    Renueva un lote de préstamos [(isbn, usuario), ...] en una sola transacción.
+    Cada ronda es un único UPDATE ... FROM (VALUES ...); si un par se repite en
+    el lote, las repeticiones van en rondas siguientes para que cuenten como
+    renovaciones sucesivas. Devuelve una respuesta por elemento, en orden.
+    """
+    resultados = [None] * len(items)
+    pendientes = list(enumerate(items))
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            while pendientes:
+                ronda, resto, vistos = [], [], set()
+                for pos, (isbn, usuario) in pendientes:
+                    if (isbn, usuario) in vistos:
+                        resto.append((pos, (isbn, usuario)))
+                    else:
+                        vistos.add((isbn, usuario))
+                        ronda.append((pos, isbn, usuario, nueva_fecha))
+                filas = execute_values(cur, SQL_RENOVACION_LOTE, ronda,
+                                       template="(%s, %s, %s, %s::timestamp)",
+                                       page_size=len(ronda), fetch=True)
+                for fila in filas:
+                    isbn, usuario = fila["isbn"], fila["usuario"]
+                    if fila["renovaciones"] is not None:
+                        resultados[fila["pos"]] = _resp_renovacion_ok(
+                            isbn, usuario, fila["fecha_devolucion"], fila["renovaciones"])
+                        continue
+                    previo = None if fila["estado_previo"] is None else {
+                        "estado": fila["estado_previo"], "renovaciones": fila["renovaciones_previas"]}
+                    resultados[fila["pos"]] = _error_renovacion(previo, isbn, usuario) or {
+                        # Otra transacción lo cambió entre la lectura y el UPDATE
+                        "error": "ErrorProcesamiento",
+                        "detalle": "El préstamo cambió durante la renovación. Por favor reintente la operación."
+                    }
+                pendientes = resto
+
+        conn.commit()
+        return _resp_lote(resultados)
+
+    except Exception as e:
+        conn.rollback()
+        if es_conflicto_reintentable(e):
+            raise
+        return {
+            "error": "ErrorProcesamiento",
+            "detalle": f"Error al procesar lote de renovaciones: {str(e)}"
+        }
+
+
 def consultar_libro(conn, isbn):
     # Consulta si un libro existe y retorna sus datos
     try:
@@ -231,6 +625,10 @@ def consultar_libro(conn, isbn):
             libro = cur.fetchone()
             
             if libro:
+                if contadores.activos():
+                    # El stock está repartido en slots: devolver el total exacto
+                    libro["ejemplares"] = contadores.total_ejemplares(conn, isbn)
+                    conn.commit()
                 return {"status": "ok", "datos": libro}
             else:
                 return {"error": "LibroNoEncontrado", "detalle": f"El libro {isbn} no existe"}
@@ -238,9 +636,36 @@ def consultar_libro(conn, isbn):
         return {"error": "ErrorConsulta", "detalle": str(e)}
 
 
-def aplicar_devolucion(conn, isbn, usuario):    
+def aplicar_devolucion(conn, isbn, usuario, id_journal=None):    
     try:
         with conn.cursor() as cur:
+            if id_journal:
+                # Mismo id en el primer intento y al reproducirla del journal: aplicarla una sola vez
+                cur.execute("""
+                    INSERT INTO journal_aplicado (id, isbn) VALUES (%s, %s)
+                    ON CONFLICT (id) DO NOTHING;
+                """, (id_journal, isbn))
+                if cur.rowcount == 0:
+                    conn.rollback()
+                    return {"status": "ok", "detalle": "devolucion ya aplicada"}
+
+            # Incrementar ejemplares del libro. Va antes que prestamos para tomar
+            # los bloqueos en el mismo orden que procesar_prestamo (libros -> prestamos)
+            if contadores.activos():
+                cur.execute("""
+                    INSERT INTO libros(isbn, ejemplares)
+                    VALUES (%s, 0)
+                    ON CONFLICT (isbn) DO NOTHING;
+                """, (isbn,))
+                contadores.devolver_ejemplar(conn, isbn)
+            else:
+                cur.execute("""
+                    INSERT INTO libros(isbn, ejemplares)
+                    VALUES (%s, 1)
+                    ON CONFLICT (isbn)
+                    DO UPDATE SET ejemplares = libros.ejemplares + 1;
+                """, (isbn,))
+
             # Marcar préstamo como DEVUELTO; si no existe, se cre como DEVUELTO
             cur.execute("""
                 UPDATE prestamos
@@ -254,18 +679,12 @@ def aplicar_devolucion(conn, isbn, usuario):
                     ON CONFLICT (isbn, usuario) DO NOTHING;
                 """, (isbn, usuario))
 
-            # Incrementar ejemplares del libro 
-            cur.execute("""
-                INSERT INTO libros(isbn, ejemplares)
-                VALUES (%s, 1)
-                ON CONFLICT (isbn)
-                DO UPDATE SET ejemplares = libros.ejemplares + 1;
-            """, (isbn,))
-
         conn.commit()
         return {"status": "ok", "detalle": "devolucion completada"}
     except Exception as e:
         conn.rollback()
+        if es_conflicto_reintentable(e):
+            raise
         return {"error": str(e)}
 
 
@@ -282,20 +701,26 @@ def procesar_prestamo(conn, isbn, usuario):
     """
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Verificar que el libro existe y tiene ejemplares disponibles
+            # Verificar que el libro existe y tiene ejemplares disponibles.
+            # FOR UPDATE evita que dos préstamos concurrentes lean el mismo stock
+            # (con contadores fragmentados el stock se bloquea por slot, no aquí)
             cur.execute(
-                "SELECT ejemplares FROM libros WHERE isbn=%s;",
+                "SELECT ejemplares FROM libros WHERE isbn=%s;" if contadores.activos()
+                else "SELECT ejemplares FROM libros WHERE isbn=%s FOR UPDATE;",
                 (isbn,)
             )
             libro = cur.fetchone()
             
             if not libro:
+                conn.rollback()
                 return {
                     "error": "LibroNoEncontrado",
                     "detalle": f"El libro con ISBN {isbn} no existe en el sistema"
                 }
             
-            if libro["ejemplares"] <= 0:
+            # Con contadores fragmentados el stock se descuenta más abajo
+            if not contadores.activos() and libro["ejemplares"] <= 0:
+                conn.rollback()
                 return {
                     "error": "SinEjemplaresDisponibles",
                     "detalle": f"No hay ejemplares disponibles del libro {isbn}"
@@ -303,12 +728,13 @@ def procesar_prestamo(conn, isbn, usuario):
             
             # Verificar que el usuario no tenga ya un préstamo activo de este libro
             cur.execute(
-                "SELECT estado FROM prestamos WHERE isbn=%s AND usuario=%s;",
+                "SELECT estado FROM prestamos WHERE isbn=%s AND usuario=%s FOR UPDATE;",
                 (isbn, usuario)
             )
             prestamo_existente = cur.fetchone()
             
             if prestamo_existente and prestamo_existente["estado"] == "ACTIVO":
+                conn.rollback()
                 return {
                     "error": "PrestamoActivo",
                     "detalle": f"El usuario {usuario} ya tiene un préstamo activo del libro {isbn}"
@@ -329,11 +755,19 @@ def procesar_prestamo(conn, isbn, usuario):
             """, (isbn, usuario, fecha_devolucion, fecha_devolucion))
             
             # Decrementar ejemplares disponibles
-            cur.execute("""
-                UPDATE libros 
-                SET ejemplares = ejemplares - 1
-                WHERE isbn=%s;
-            """, (isbn,))
+            if contadores.activos():
+                if not contadores.tomar_ejemplar(conn, isbn):
+                    conn.rollback()
+                    return {
+                        "error": "SinEjemplaresDisponibles",
+                        "detalle": f"No hay ejemplares disponibles del libro {isbn}"
+                    }
+            else:
+                cur.execute("""
+                    UPDATE libros 
+                    SET ejemplares = ejemplares - 1
+                    WHERE isbn=%s;
+                """, (isbn,))
         
         conn.commit()
         
@@ -351,105 +785,402 @@ def procesar_prestamo(conn, isbn, usuario):
         
     except Exception as e:
         conn.rollback()
+        if es_conflicto_reintentable(e):
+            raise
         return {
             "error": "ErrorProcesamiento",
             "detalle": f"Error al procesar préstamo: {str(e)}"
         }
 
 
-# ZMQ REP Server 
-def main():
-    # ZMQ
-    context = zmq.Context()
-    socket_rep = context.socket(zmq.REP)
-    socket_rep.bind("tcp://*:5570")
-
-    print("[GestorAlmacenamiento] Escuchando en 5570 (REP) - Postgres con failover automático")  
-
-    # Conexión y esquema
-    conn = connect_db()
-    print(f"[GestorAlmacenamiento] Conectado a PostgreSQL ({current_db_host})")
-    ensure_schema(conn)
-    print("[GestorAlmacenamiento] Esquema de base de datos verificado")
-    print("[GestorAlmacenamiento] Listo para recibir peticiones...")
+class PostgresAlmacenamiento(Almacenamiento):
+    """
+    Backend PostgreSQL: enruta cada acción al shard dueño del ISBN, reconecta
+    con failover, rechaza escrituras sobre rangos en migración y guarda en el
+    journal local las devoluciones que llegan sin base de datos.
+    """
+    nombre = "postgres"
 
-    while True:
-        try:
-            req = socket_rep.recv_json()
-            
-            # Verificar y reconectar si es necesario ANTES de cada operación
+    def __init__(self):
+        self.mapa = ShardMapRecargable(SHARD_MAP_FILE, MAPA_POR_DEFECTO, intervalo=SHARD_MAP_RECARGA)
+        self.pool = PoolShards(self.mapa, sondear=not GA_FAILOVER_SUB)
+        # Conflictos de concurrencia reintentados / no resueltos dentro del plazo, por acción
+        self.reintentos = defaultdict(int)
+        self.reintentos_agotados = defaultdict(int)
+        self.lecturas_degradadas = defaultdict(int)
+        for nodo in self.mapa.actual().nodos.values():
             try:
-                conn = reconnect_db_if_needed(conn)
+                self.pool.conexion(nodo)
             except Exception as e:
-                print(f"[DB] Error al verificar/reconectar: {e}")
-                socket_rep.send_json({
-                    "status": "error",
-                    "error": "ErrorConexionDB",
-                    "detalle": f"No se pudo conectar a la base de datos: {str(e)}"
-                })
-                continue
+                # Se reintenta en la primera petición; mientras tanto las devoluciones van al journal
+                print(f"[GestorAlmacenamiento] Shard {nodo.nombre} no disponible al arrancar: {e}")
+        print(f"[GestorAlmacenamiento] Conectado a PostgreSQL ({len(self.pool.conexiones)} shard(s))")
+        print("[GestorAlmacenamiento] Esquema de base de datos verificado")
 
-            # Acepta "action" o "accion"
-            action = req.get("action") or req.get("accion")  
-
-            if action == "validar_renovacion":
-                isbn = req.get("isbn"); usuario = req.get("usuario")
-                resp = validar_renovacion(conn, isbn, usuario)
-
-            elif action == "actualizar_renovacion":
-                isbn = req.get("isbn"); usuario = req.get("usuario")
-                nueva_fecha = req.get("nueva_fecha") or datetime.now().isoformat()
-                resp = actualizar_renovacion(conn, isbn, usuario, nueva_fecha)
-
-            elif action == "aplicar_devolucion":
-                isbn = req.get("isbn"); usuario = req.get("usuario")
-                if not isbn or not usuario:
-                    resp = {"error": "ParametrosInvalidos"}
-                else:
-                    resp = aplicar_devolucion(conn, isbn, usuario)
-
-            elif action == "procesar_prestamo":
-                isbn = req.get("isbn"); usuario = req.get("usuario")
-                if not isbn or not usuario:
-                    resp = {"error": "ParametrosInvalidos", "detalle": "ISBN y usuario son requeridos"}
-                else:
-                    resp = procesar_prestamo(conn, isbn, usuario)
-
-            elif action == "consultar_libro":
-                isbn = req.get("isbn")
-                if not isbn:
-                    resp = {"error": "ParametrosInvalidos"}
-                else:
-                    resp = consultar_libro(conn, isbn)
+        self.journal = JournalLocal()
+        self._proxima_purga = time.monotonic()
+        if self.journal.hay_pendientes():
+            self.mantenimiento()
 
-            else:
-                resp = {"error": "accion_desconocida"}
+        if contadores.activos():
+            self.rebalanceador = contadores.RebalanceadorContadores(
+                lambda: self.mapa.actual().nodos.values(), connect_db
+            )
+            self.rebalanceador.start()
+            print(f"[GestorAlmacenamiento] Contadores fragmentados activos ({contadores.CONTADORES_SLOTS} slots por ISBN)")
+
+    def _ejecutar(self, action, isbn, usuario, fn, *args, id_journal=None):
+        nodo, rango = self.pool.ubicar(isbn)
+        if rango.estado == ESTADO_MIGRANDO and action in ACCIONES_ESCRITURA:
+            return self._error_migracion(rango)
+
+        # Verificar y reconectar si es necesario ANTES de cada operación
+        try:
+            with traza.subspan("db.conexion", shard=nodo.nombre):
+                conn = self.pool.conexion(nodo)
+        except Exception as e:
+            if not isinstance(e, SinPrimario):
+                print(f"[DB] Error al verificar/reconectar: {e}")
+            if action in ACCIONES_JOURNAL:
+                return self._aceptar_en_journal(action, isbn, usuario, id_journal)
+            if nodo.nombre in self.pool.degradados:
+                if action in ACCIONES_ESCRITURA:
+                    return self._error_solo_lectura(nodo)
+                return self._ejecutar_lectura(nodo, action, fn, *args)
+            return {
+                "status": "error",
+                "error": "ErrorConexionDB",
+                "detalle": f"No se pudo conectar a la base de datos: {str(e)}"
+            }
 
-            socket_rep.send_json(resp)
+        # Hay primario escribible: aplicar antes lo que quedó pendiente
+        if self.hay_mantenimiento():
+            self.mantenimiento()
 
+        try:
+            with traza.subspan("db.transaccion", shard=nodo.nombre, host=nodo.current_host):
+                return self._con_reintentos(action, fn, conn, *args)
         except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
             # Error de conexión - intentar reconectar
             print(f"[DB] Error de conexión a la base de datos: {e}")
+            self.pool.descartar(nodo)
+            if action in ACCIONES_JOURNAL:
+                # Puede que el COMMIT llegara a aplicarse: se reproduce con el mismo
+                # id y journal_aplicado descarta la repetición si fue así
+                return self._aceptar_en_journal(action, isbn, usuario, id_journal)
             try:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-                conn = connect_db()
-                print(f"[DB] Reconexión exitosa a {current_db_host}")
+                self.pool.conexion(nodo)
+                print(f"[DB] Reconexión exitosa a {nodo.current_host} (shard {nodo.nombre})")
                 # Reenviar mensaje de error para que el cliente reintente
-                socket_rep.send_json({
+                return {
                     "status": "error",
                     "error": "ErrorConexionDB",
                     "detalle": "Se perdió la conexión a la base de datos, se reconectó. Por favor reintente la operación."
-                })
+                }
             except Exception as reconnect_error:
                 print(f"[DB] Fallo la reconexión: {reconnect_error}")
-                socket_rep.send_json({
+                if nodo.nombre in self.pool.degradados and action not in ACCIONES_ESCRITURA:
+                    return self._ejecutar_lectura(nodo, action, fn, *args)
+                return {
                     "status": "error",
                     "error": "ErrorConexionDB",
                     "detalle": f"No se pudo reconectar a la base de datos: {str(reconnect_error)}"
-                })
+                }
+
+    @staticmethod
+    def _error_migracion(rango):
+        return {
+            "status": "error",
+            "error": "ShardEnMigracion",
+            "detalle": f"El rango {rango.inicio}-{rango.fin} se está migrando. Por favor reintente la operación."
+        }
+
+    @staticmethod
+    def _error_solo_lectura(nodo):
+        return {
+            "status": "error",
+            "error": "ModoSoloLectura",
+            "detalle": f"El shard {nodo.nombre} no tiene primario: solo se atienden consultas. Por favor reintente la operación."
+        }
+
+    def _ejecutar_lectura(self, nodo, action, fn, *args):
+        """Consulta en modo degradado sobre la réplica (o el primario si ya volvió)."""
+        try:
+            with traza.subspan("db.lectura_replica", shard=nodo.nombre):
+                conn = self.pool.conexion_lectura(nodo)
+                resp = fn(conn, *args)
+        except Exception as e:
+            self.pool.descartar_lectura(nodo)
+            return {
+                "status": "error",
+                "error": "ErrorConexionDB",
+                "detalle": f"Sin primario ni réplica disponibles: {str(e)}"
+            }
+        if conn.closed:
+            self.pool.descartar_lectura(nodo)
+        self.lecturas_degradadas[action] += 1
+        if isinstance(resp, dict):
+            # Puede ir algo por detrás del primario (lag de la réplica)
+            resp["solo_lectura"] = True
+        return resp
+
+    def _con_reintentos(self, action, fn, conn, *args):
+        """
+        Ejecuta la transacción y la repite si PostgreSQL la abortó por
+        serialización (40001) o deadlock (40P01), con backoff exponencial con
+        jitter completo, mientras quede plazo para responder al actor.
+        """
+        limite = time.monotonic() + GA_PLAZO_REINTENTOS_MS / 1000.0
+        intento = 0
+        while True:
+            try:
+                return fn(conn, *args)
+            except psycopg2.Error as e:
+                if not es_conflicto_reintentable(e):
+                    raise
+                espera = random.uniform(0, min(GA_REINTENTO_MAX_MS, GA_REINTENTO_BASE_MS * (2 ** intento))) / 1000.0
+                if time.monotonic() + espera >= limite:
+                    self.reintentos_agotados[action] += 1
+                    print(f"[DB] {action}: conflicto de concurrencia tras {intento} reintento(s): {e.pgcode}")
+                    return {
+                        "error": "ErrorProcesamiento",
+                        "detalle": f"Conflicto de concurrencia tras {intento} reintento(s): {str(e).strip()}"
+                    }
+                intento += 1
+                self.reintentos[action] += 1
+                traza.actual().anotar(reintentos=intento)
+                time.sleep(espera)
+
+    def estadisticas(self):
+        return {
+            "reintentos": dict(self.reintentos),
+            "reintentos_agotados": dict(self.reintentos_agotados),
+            "modo_degradado": self.pool.estado(),
+            "lecturas_degradadas": dict(self.lecturas_degradadas),
+        }
+
+    def version_mapa(self):
+        # actual() relee el archivo si cambió: con el GA atendiendo de uno en uno,
+        # al responder ya no queda ninguna petición en curso con el mapa anterior
+        return self.mapa.actual().version
+
+    def cambiar_primaria(self, anuncio):
+        """
+        Apunta al nuevo primario los shards cuyo par primario/standby lo
+        incluye y abre ya la conexión, sin esperar a que falle una petición.
+        Los anuncios se repiten periódicamente, así que si no cambia nada no hace nada.
+        """
+        primaria = anuncio.get("primaria") or {}
+        host, port = primaria.get("host"), primaria.get("port")
+        if not host or not port:
+            return
+        for nodo in self.mapa.actual().nodos.values():
+            if host not in (nodo.host, nodo.standby_host or DB_STANDBY_HOST):
+                continue
+            if (nodo.current_host, nodo.current_port) == (host, int(port)):
+                continue
+            print(f"[DB] Anuncio de failover (época {anuncio.get('epoca')}): shard {nodo.nombre} "
+                  f"pasa de {nodo.current_host}:{nodo.current_port} a {host}:{port}")
+            self.pool.reintentar(nodo)
+            self.pool.descartar(nodo)
+            nodo.current_host, nodo.current_port = host, int(port)
+            try:
+                self.pool.conexion(nodo)
+            except Exception as e:
+                # Se reintenta con la próxima petición
+                print(f"[DB] No se pudo conectar aún al nuevo primario {host}:{port}: {e}")
+
+    def uso_pool(self):
+        conexiones = list(self.pool.conexiones.values())
+        return {
+            "shards": len(self.mapa.actual().nodos),
+            "abiertas": len(conexiones),
+            "en_transaccion": sum(
+                1 for c in conexiones
+                if not c.closed and c.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            ),
+            "degradados": self.pool.estado(),
+        }
+
+    def _aceptar_en_journal(self, action, isbn, usuario, id_journal=None):
+        """Registra la escritura en el journal local y la confirma como pendiente."""
+        id_journal = self.journal.anotar(action, {"isbn": isbn, "usuario": usuario}, id_journal)
+        print(f"[Journal] {action} aceptada como pendiente ({id_journal})")
+        return {
+            "status": "pendiente",
+            "detalle": "Base de datos no disponible: la operación se aplicará cuando vuelva",
+            "datos": {"id_journal": id_journal}
+        }
+
+    def validar_renovacion(self, isbn, usuario):
+        return self._ejecutar("validar_renovacion", isbn, usuario, validar_renovacion, isbn, usuario)
+
+    def actualizar_renovacion(self, isbn, usuario, nueva_fecha=None):
+        return self._ejecutar("actualizar_renovacion", isbn, usuario,
+                              actualizar_renovacion, isbn, usuario, nueva_fecha)
+
+    def actualizar_renovacion_lote(self, items, nueva_fecha=None):
+        """Parte el lote por shard: una transacción (un UPDATE por ronda) en cada uno."""
+        resultados = [None] * len(items)
+        grupos = defaultdict(list)
+        for pos, (isbn, usuario) in enumerate(items):
+            nodo, rango = self.pool.ubicar(isbn)
+            if rango.estado == ESTADO_MIGRANDO:
+                resultados[pos] = self._error_migracion(rango)
+            else:
+                grupos[nodo.nombre].append(pos)
+
+        for posiciones in grupos.values():
+            parte = [items[pos] for pos in posiciones]
+            resp = self._ejecutar("actualizar_renovacion_lote", parte[0][0], None,
+                                  actualizar_renovacion_lote, parte, nueva_fecha)
+            por_item = (resp.get("datos") or {}).get("resultados") if resp.get("status") == "ok" else None
+            for k, pos in enumerate(posiciones):
+                # Si falló el shard entero (conexión, migración...) cada elemento lleva ese error
+                resultados[pos] = por_item[k] if por_item else resp
+        return _resp_lote(resultados)
+
+    def consultar_libro(self, isbn):
+        return self._ejecutar("consultar_libro", isbn, None, consultar_libro, isbn)
+
+    def aplicar_devolucion(self, isbn, usuario):
+        # El id se fija antes del primer intento para poder reproducirla sin duplicarla
+        id_journal = nuevo_id()
+        return self._ejecutar("aplicar_devolucion", isbn, usuario, aplicar_devolucion, isbn, usuario, id_journal,
+                              id_journal=id_journal)
+
+    def procesar_prestamo(self, isbn, usuario):
+        return self._ejecutar("procesar_prestamo", isbn, usuario, procesar_prestamo, isbn, usuario)
+
+    def hay_mantenimiento(self):
+        return self.journal.hay_pendientes() or time.monotonic() >= self._proxima_purga
+
+    def mantenimiento(self):
+        """Aplica en orden las entradas pendientes del journal; se detiene en el primer shard sin BD."""
+        def aplicar(entrada):
+            if entrada.get("accion") != "aplicar_devolucion" or not entrada.get("isbn") or not entrada.get("usuario"):
+                return "rechazada"
+            nodo, rango = self.pool.ubicar(entrada["isbn"])
+            if rango.estado == ESTADO_MIGRANDO:
+                # Como _ejecutar con las escrituras: esperar a que termine la migración
+                return "reintentar"
+            try:
+                conn = self.pool.conexion(nodo)
+                resp = aplicar_devolucion(conn, entrada["isbn"], entrada["usuario"], id_journal=entrada["id"])
+            except Exception as e:
+                if es_conflicto_reintentable(e):
+                    # Conflicto con una transacción concurrente: la conexión sigue sana
+                    return "reintentar"
+                if not isinstance(e, SinPrimario):
+                    print(f"[Journal] Base de datos aún no disponible: {e}")
+                self.pool.descartar(nodo)
+                return "reintentar"
+            if resp.get("status") == "ok":
+                return "ok"
+            if conn.closed:
+                self.pool.descartar(nodo)
+                return "reintentar"
+            print(f"[Journal] Entrada {entrada['id']} rechazada: {resp}")
+            return "rechazada"
+
+        n = self.journal.reproducir(aplicar)
+        if n:
+            print(f"[Journal] {n} operación(es) pendiente(s) aplicada(s)")
+        if time.monotonic() >= self._proxima_purga and not self.journal.hay_pendientes():
+            self._purgar_aplicados()
+
+    def _purgar_aplicados(self):
+        """Cada devolución deja su id en journal_aplicado: borrar los que ya no se pueden reproducir."""
+        self._proxima_purga = time.monotonic() + 3600
+        for nodo in self.mapa.actual().nodos.values():
+            try:
+                borrados = purgar_aplicados(self.pool.conexion(nodo))
+            except Exception as e:
+                if not isinstance(e, SinPrimario):
+                    print(f"[Journal] No se pudo purgar journal_aplicado en {nodo.nombre}: {e}")
+                    self.pool.descartar(nodo)
+                continue
+            if borrados:
+                print(f"[Journal] {borrados} id(s) aplicados purgados en {nodo.nombre}")
+
+    def cerrar(self):
+        self.journal.cerrar()
+        self.pool.cerrar()
+
+
+def crear_almacenamiento(backend=None) -> Almacenamiento:
+    """Instancia el backend indicado por GA_BACKEND (postgres, sqlite o memoria)."""
+    backend = (backend or GA_BACKEND).lower()
+    if backend == "postgres":
+        return PostgresAlmacenamiento()
+    if backend == "sqlite":
+        print(f"[GestorAlmacenamiento] Backend SQLite en {GA_SQLITE_PATH}")
+        return SQLiteAlmacenamiento(GA_SQLITE_PATH)
+    if backend == "memoria":
+        print("[GestorAlmacenamiento] Backend en memoria (los datos no persisten)")
+        return MemoriaAlmacenamiento()
+    raise ValueError(f"GA_BACKEND desconocido: {backend}")
+
+
+# ZMQ REP Server 
+def servir(context: zmq.Context, endpoint: str = "tcp://*:5570",
+           detener: Optional[threading.Event] = None) -> None:
+    """Atiende peticiones en `endpoint` hasta KeyboardInterrupt o hasta que se active `detener`."""
+    socket_rep = context.socket(zmq.REP)
+    socket_rep.linger = 0
+    socket_rep.bind(endpoint)
+
+    print(f"[GestorAlmacenamiento] Escuchando en {endpoint} (REP) - backend {GA_BACKEND}")
+
+    almacenamiento = crear_almacenamiento()
+    despachador = Despachador(almacenamiento)
+    salud = None
+    if GA_SALUD_ADDR:
+        salud = HealthResponder(GA_SALUD_ADDR, context=context)
+        salud.registrar("backend", lambda: GA_BACKEND)
+        salud.registrar("carga", despachador.carga.a_dict)
+        salud.registrar("pool", almacenamiento.uso_pool)
+        salud.start()
+    poller = zmq.Poller()
+    poller.register(socket_rep, zmq.POLLIN)
+    socket_failover = None
+    if GA_FAILOVER_SUB:
+        socket_failover = context.socket(zmq.SUB)
+        socket_failover.linger = 0
+        for endpoint_monitor in GA_FAILOVER_SUB:
+            socket_failover.connect(endpoint_monitor)
+        socket_failover.setsockopt_string(zmq.SUBSCRIBE, "primaria")
+        poller.register(socket_failover, zmq.POLLIN)
+    print("[GestorAlmacenamiento] Listo para recibir peticiones...")
+
+    ultima_actividad = time.monotonic()
+    while detener is None or not detener.is_set():
+        try:
+            if almacenamiento.hay_mantenimiento():
+                espera = GA_JOURNAL_REINTENTO_MS
+            elif detener is not None or socket_failover is not None:
+                espera = 500
+            else:
+                espera = None
+            eventos = dict(poller.poll(espera))
+            if socket_failover is not None and socket_failover in eventos:
+                _, _, cuerpo = socket_failover.recv_string().partition(" ")
+                almacenamiento.cambiar_primaria(json.loads(cuerpo))
+            if socket_rep not in eventos:
+                if almacenamiento.hay_mantenimiento() and \
+                        (time.monotonic() - ultima_actividad) * 1000 >= GA_JOURNAL_REINTENTO_MS:
+                    # Sin peticiones: aprovechar para el trabajo de fondo (p.ej. vaciar el journal)
+                    almacenamiento.mantenimiento()
+                    ultima_actividad = time.monotonic()
+                continue
+
+            ultima_actividad = time.monotonic()
+            req = socket_rep.recv_json()
+            accion = req.get("action") or req.get("accion")
+            with traza.iniciar("ga", f"ga.{accion}", traza.de_mensaje(req), backend=GA_BACKEND):
+                respuesta = despachador.despachar(req)
+            socket_rep.send_json(respuesta)
+
         except KeyboardInterrupt:
             break
         except Exception as e:
@@ -465,10 +1196,16 @@ def main():
             except Exception:
                 pass
 
-    try:
-        conn.close()
-    except Exception:
-        pass
+    if salud is not None:
+        salud.stop()
+    if socket_failover is not None:
+        socket_failover.close(0)
+    socket_rep.close(0)
+    almacenamiento.cerrar()
+
+
+def main():
+    servir(zmq.Context())
 
 
 if __name__ == "__main__":
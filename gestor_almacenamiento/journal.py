@@ -0,0 +1,179 @@
+"""
+Journal local de escrituras pendientes (store-and-forward).
+
+Mientras no hay un primario escribible el GA acepta las devoluciones en un
+archivo append-only (una línea JSON por entrada, con fsync antes de
+responder) y las reproduce en orden cuando vuelve la base de datos.
+
+Cada entrada lleva un id único que se inserta en la tabla journal_aplicado
+dentro de la misma transacción que la devolución, así que reproducir dos
+veces la misma entrada (p.ej. si el GA cae entre el commit y el avance del
+checkpoint) no suma el ejemplar dos veces. El id se genera antes del primer
+intento contra la base de datos: si la conexión cae con el COMMIT en vuelo
+no se sabe si se aplicó, y al reproducirla journal_aplicado lo resuelve.
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+GA_JOURNAL_PATH = os.getenv("GA_JOURNAL_PATH", "journal/devoluciones.jsonl")
+# Horas que se conservan los ids aplicados (cubre de sobra un corte de la BD)
+GA_JOURNAL_RETENCION_H = float(os.getenv("GA_JOURNAL_RETENCION_H", "168"))
+
+
+def nuevo_id() -> str:
+    return uuid.uuid4().hex
+
+
+def ensure_schema_journal(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS journal_aplicado (
+          id TEXT PRIMARY KEY,
+          aplicado TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        -- El isbn permite mover los ids junto con su rango de slots (rebalancear_shards.py)
+        ALTER TABLE journal_aplicado ADD COLUMN IF NOT EXISTS isbn TEXT;
+        CREATE INDEX IF NOT EXISTS idx_journal_aplicado_fecha ON journal_aplicado(aplicado);
+        CREATE INDEX IF NOT EXISTS idx_journal_aplicado_isbn ON journal_aplicado(isbn);
+        """)
+    conn.commit()
+
+
+def purgar_aplicados(conn, horas: float = GA_JOURNAL_RETENCION_H) -> int:
+    """Borra los ids aplicados hace más de `horas`. Devuelve cuántos borró."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM journal_aplicado WHERE aplicado < NOW() - %s * INTERVAL '1 hour';", (horas,))
+        borrados = cur.rowcount
+    conn.commit()
+    return borrados
+
+
+def _fsync_dir(path: str) -> None:
+    # Sin esto un archivo recién creado podría perderse tras un corte de luz
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JournalLocal:
+    """
+    Archivo append-only + checkpoint (<path>.offset) con el byte hasta el que
+    ya se reprodujo. Las entradas que la base de datos rechaza por un motivo
+    distinto a la conexión se apartan en <path>.rechazadas.
+    """
+    def __init__(self, path: str = GA_JOURNAL_PATH):
+        self.path = path
+        self.path_offset = f"{path}.offset"
+        self.path_rechazadas = f"{path}.rechazadas"
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        nuevo = not os.path.exists(path)
+        self._f = open(path, "ab")
+        if nuevo:
+            _fsync_dir(path)
+        self._offset = self._leer_offset()
+        if self._offset > self._f.tell():
+            self._offset = 0
+
+    def _leer_offset(self) -> int:
+        try:
+            with open(self.path_offset, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _escribir_offset(self, offset: int) -> None:
+        tmp = f"{self.path_offset}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path_offset)
+        self._offset = offset
+
+    def anotar(self, accion: str, datos: Dict, id_journal: Optional[str] = None) -> str:
+        """
+        Añade una entrada y la fuerza a disco. Devuelve su id. Si la operación
+        ya se intentó contra la base de datos se pasa el id de ese intento.
+        """
+        entrada = {
+            "id": id_journal or nuevo_id(),
+            "accion": accion,
+            "fecha": datetime.now().isoformat(),
+            **datos,
+        }
+        linea = (json.dumps(entrada, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._f.write(linea)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+        return entrada["id"]
+
+    def hay_pendientes(self) -> bool:
+        with self._lock:
+            return self._f.tell() > self._offset
+
+    def _pendientes(self) -> Iterator[Tuple[dict, int]]:
+        """(entrada, offset_siguiente) desde el checkpoint; ignora una última línea a medias."""
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            while True:
+                linea = f.readline()
+                if not linea.endswith(b"\n"):
+                    return
+                fin = f.tell()
+                try:
+                    yield json.loads(linea), fin
+                except ValueError:
+                    print(f"[Journal] Línea corrupta en offset {fin - len(linea)}, se omite")
+                    self._escribir_offset(fin)
+
+    def reproducir(self, aplicar: Callable[[dict], str]) -> int:
+        """
+        Reproduce en orden las entradas pendientes. `aplicar` devuelve
+        "ok" (aplicada), "rechazada" (no se reintentará) o "reintentar"
+        (la base de datos sigue sin estar disponible: se detiene aquí).
+        Devuelve el número de entradas aplicadas.
+        """
+        aplicadas = 0
+        with self._lock:
+            for entrada, fin in self._pendientes():
+                resultado = aplicar(entrada)
+                if resultado == "reintentar":
+                    break
+                if resultado == "rechazada":
+                    with open(self.path_rechazadas, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                else:
+                    aplicadas += 1
+                self._escribir_offset(fin)
+            self._compactar_si_vacio()
+        return aplicadas
+
+    def _compactar_si_vacio(self) -> None:
+        # Todo reproducido: truncar para que el archivo no crezca sin límite.
+        # El checkpoint va a 0 antes de truncar: si el GA cae en medio se
+        # reproduce todo otra vez, y journal_aplicado descarta los repetidos.
+        if self._f.tell() == self._offset and self._offset > 0:
+            self._escribir_offset(0)
+            self._f.truncate(0)
+            self._f.seek(0)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._f.close()
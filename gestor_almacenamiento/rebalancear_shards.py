@@ -0,0 +1,305 @@
+"""
+Migra un rango de slots de ISBN de un shard a otro sin detener los GA.
+
+Si los nodos usan contadores fragmentados (contadores.py) también se copian
+las filas de libros_ejemplares. Los ids de journal_aplicado del rango van con
+él, para que una devolución del journal reproducida después de la migración
+siga aplicándose una sola vez.
+
+Uso:
+    python rebalancear_shards.py --mapa shards.json --slots 0-255 --hacia s1 \
+        --ga tcp://ga1:5570,tcp://ga2:5570
+
+Pasos:
+  1. Copia en caliente las filas de libros/prestamos del rango al destino
+     (los GA siguen leyendo y escribiendo en el origen).
+  2. Marca el rango como "migrando" y espera a que todos los GA confirmen que
+     cargaron esa versión del mapa: desde ahí rechazan escrituras sobre él con
+     ShardEnMigracion (el cliente reintenta), las lecturas siguen en el origen.
+  3. Copia el delta final, que ya no puede cambiar.
+  4. Publica el mapa con el nuevo dueño del rango y espera la confirmación
+     de todos los GA.
+  5. Borra las filas del rango en el origen.
+
+Los ISBN del rango se recorren en lotes de --lote con un cursor de servidor,
+así que la memoria no depende del tamaño del rango.
+
+El archivo del mapa debe ser el mismo (volumen compartido) para todos los GA;
+cada GA lo relee cuando cambia su mtime (SHARD_MAP_RECARGA segundos).
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+import zmq
+from psycopg2.extras import execute_values
+
+from shards import ShardMap, RangoSlots, slot_de, ESTADO_ACTIVO, ESTADO_MIGRANDO
+from gestor_a import DB_NAME, DB_USER, DB_PASS, ensure_schema
+from contadores import ensure_schema_contadores
+from journal import ensure_schema_journal
+
+
+def conectar(nodo):
+    return psycopg2.connect(
+        host=nodo.host,
+        port=nodo.port,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS,
+        connect_timeout=5
+    )
+
+
+def partir_rangos(mapa: ShardMap, inicio: int, fin: int, hacia: str) -> ShardMap:
+    """Devuelve un mapa nuevo donde [inicio, fin] es un rango propio marcado como migrando."""
+    nuevos = []
+    origenes = set()
+    for r in mapa.rangos:
+        if r.fin < inicio or r.inicio > fin:
+            nuevos.append(RangoSlots(r.inicio, r.fin, r.shard, r.estado))
+            continue
+        origenes.add(r.shard)
+        if r.inicio < inicio:
+            nuevos.append(RangoSlots(r.inicio, inicio - 1, r.shard, r.estado))
+        if r.fin > fin:
+            nuevos.append(RangoSlots(fin + 1, r.fin, r.shard, r.estado))
+    if len(origenes) != 1:
+        raise SystemExit(f"[Rebalanceo] El rango {inicio}-{fin} debe pertenecer a un único shard (encontrados: {sorted(origenes)})")
+    origen = origenes.pop()
+    if origen == hacia:
+        raise SystemExit(f"[Rebalanceo] El rango {inicio}-{fin} ya pertenece a {hacia}")
+    nuevos.append(RangoSlots(inicio, fin, origen, ESTADO_MIGRANDO))
+    return ShardMap(mapa.nodos, nuevos, mapa.num_slots, mapa.version + 1)
+
+
+def lotes_del_rango(conn, inicio: int, fin: int, num_slots: int, lote: int):
+    """
+    Recorre los ISBN del origen con un cursor de servidor (memoria constante)
+    y los entrega en listas de `lote`. `conn` debe ser una conexión solo para
+    esto: un commit en ella cerraría el cursor.
+    """
+    bloque = []
+    with conn.cursor(name="rebalanceo_isbns") as cur:
+        cur.itersize = 5000
+        cur.execute("SELECT isbn FROM libros UNION SELECT DISTINCT isbn FROM prestamos;")
+        for (isbn,) in cur:
+            if inicio <= slot_de(isbn, num_slots) <= fin:
+                bloque.append(isbn)
+                if len(bloque) >= lote:
+                    yield bloque
+                    bloque = []
+    conn.commit()
+    if bloque:
+        yield bloque
+
+
+def tiene_contadores(conn) -> bool:
+    """True si el nodo usa contadores fragmentados (tabla libros_ejemplares)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('libros_ejemplares') IS NOT NULL;")
+        existe = cur.fetchone()[0]
+    conn.commit()
+    return existe
+
+
+def copiar(origen, destino, lotes, con_contadores: bool = False):
+    """Copia (upsert) libros y préstamos de cada lote de ISBN. Devuelve (ISBN, filas) copiados."""
+    n_isbns = copiadas = 0
+    for bloque in lotes:
+        with origen.cursor() as cur:
+            cur.execute("SELECT isbn, ejemplares FROM libros WHERE isbn = ANY(%s);", (bloque,))
+            libros = cur.fetchall()
+            cur.execute("""
+                SELECT isbn, usuario, estado, fecha_devolucion, renovaciones
+                  FROM prestamos WHERE isbn = ANY(%s);
+            """, (bloque,))
+            prestamos = cur.fetchall()
+            slots = []
+            if con_contadores:
+                cur.execute("SELECT isbn, slot, ejemplares FROM libros_ejemplares WHERE isbn = ANY(%s);", (bloque,))
+                slots = cur.fetchall()
+            cur.execute("SELECT id, isbn, aplicado FROM journal_aplicado WHERE isbn = ANY(%s);", (bloque,))
+            aplicados = cur.fetchall()
+        origen.commit()
+        with destino.cursor() as cur:
+            if libros:
+                execute_values(cur, """
+                    INSERT INTO libros (isbn, ejemplares) VALUES %s
+                    ON CONFLICT (isbn) DO UPDATE SET ejemplares = EXCLUDED.ejemplares;
+                """, libros)
+            if prestamos:
+                execute_values(cur, """
+                    INSERT INTO prestamos (isbn, usuario, estado, fecha_devolucion, renovaciones) VALUES %s
+                    ON CONFLICT (isbn, usuario) DO UPDATE
+                       SET estado = EXCLUDED.estado,
+                           fecha_devolucion = EXCLUDED.fecha_devolucion,
+                           renovaciones = EXCLUDED.renovaciones;
+                """, prestamos)
+            if slots:
+                execute_values(cur, """
+                    INSERT INTO libros_ejemplares (isbn, slot, ejemplares) VALUES %s
+                    ON CONFLICT (isbn, slot) DO UPDATE SET ejemplares = EXCLUDED.ejemplares;
+                """, slots)
+            if aplicados:
+                execute_values(cur, """
+                    INSERT INTO journal_aplicado (id, isbn, aplicado) VALUES %s
+                    ON CONFLICT (id) DO NOTHING;
+                """, aplicados)
+        destino.commit()
+        n_isbns += len(bloque)
+        copiadas += len(libros) + len(prestamos) + len(slots) + len(aplicados)
+    return n_isbns, copiadas
+
+
+def copiar_aplicados_sin_isbn(origen, destino) -> int:
+    """Ids anteriores a la columna isbn: no se sabe de qué rango son, se copian todos."""
+    with origen.cursor() as cur:
+        cur.execute("SELECT id, isbn, aplicado FROM journal_aplicado WHERE isbn IS NULL;")
+        filas = cur.fetchall()
+    origen.commit()
+    if filas:
+        with destino.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO journal_aplicado (id, isbn, aplicado) VALUES %s
+                ON CONFLICT (id) DO NOTHING;
+            """, filas)
+        destino.commit()
+    return len(filas)
+
+
+def borrar(conn, lotes, con_contadores: bool = False) -> int:
+    n_isbns = 0
+    for bloque in lotes:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM journal_aplicado WHERE isbn = ANY(%s);", (bloque,))
+            if con_contadores:
+                cur.execute("DELETE FROM libros_ejemplares WHERE isbn = ANY(%s);", (bloque,))
+            # prestamos primero por la FK hacia libros (init.sql)
+            cur.execute("DELETE FROM prestamos WHERE isbn = ANY(%s);", (bloque,))
+            cur.execute("DELETE FROM libros WHERE isbn = ANY(%s);", (bloque,))
+        conn.commit()
+        n_isbns += len(bloque)
+    return n_isbns
+
+
+def version_de_ga(context, endpoint: str, timeout_ms: int):
+    """Versión del mapa que usa el GA en `endpoint`, o None si no responde a tiempo."""
+    socket = context.socket(zmq.REQ)
+    socket.linger = 0
+    socket.rcvtimeo = socket.sndtimeo = timeout_ms
+    try:
+        socket.connect(endpoint)
+        socket.send_json({"action": "version_mapa"})
+        resp = socket.recv_json()
+    except zmq.Again:
+        return None
+    finally:
+        socket.close()
+    return (resp.get("datos") or {}).get("version")
+
+
+def esperar_version(context, endpoints, version: int, timeout: float, sondeo: float = 0.2):
+    """
+    Espera a que todos los GA de `endpoints` usen la versión `version` del
+    mapa (o una posterior). Devuelve los que no la confirmaron antes de
+    `timeout` segundos (lista vacía si todos lo hicieron).
+    """
+    limite = time.monotonic() + timeout
+    pendientes = list(endpoints)
+    while True:
+        restante_ms = max(1, int((limite - time.monotonic()) * 1000))
+        pendientes = [e for e in pendientes
+                      if (version_de_ga(context, e, min(1000, restante_ms)) or -1) < version]
+        if not pendientes or time.monotonic() >= limite:
+            return pendientes
+        time.sleep(sondeo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra un rango de slots de ISBN entre shards")
+    parser.add_argument("--mapa", required=True, help="Ruta del archivo de mapa de shards (JSON)")
+    parser.add_argument("--slots", required=True, help="Rango de slots a mover, p.ej. 0-255")
+    parser.add_argument("--hacia", required=True, help="Shard destino")
+    parser.add_argument("--lote", type=int, default=500, help="ISBN por lote de copia")
+    parser.add_argument("--ga", default=os.getenv("GA_ENDPOINTS", ""),
+                        help="Endpoints REP de todos los GA, separados por comas (por defecto GA_ENDPOINTS)")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="Segundos máximos para que todos los GA confirmen cada versión del mapa")
+    args = parser.parse_args()
+    endpoints = [e.strip() for e in args.ga.split(",") if e.strip()]
+    if not endpoints:
+        raise SystemExit("[Rebalanceo] Indique con --ga (o GA_ENDPOINTS) todos los GA que usan el mapa")
+
+    inicio, fin = (int(x) for x in args.slots.split("-", 1))
+    mapa = ShardMap.desde_archivo(args.mapa)
+    if args.hacia not in mapa.nodos:
+        raise SystemExit(f"[Rebalanceo] Shard destino desconocido: {args.hacia}")
+    if not (0 <= inicio <= fin < mapa.num_slots):
+        raise SystemExit(f"[Rebalanceo] Rango fuera de [0, {mapa.num_slots - 1}]")
+
+    migrando = partir_rangos(mapa, inicio, fin, args.hacia)
+    origen_nombre = next(r.shard for r in migrando.rangos if r.estado == ESTADO_MIGRANDO)
+    origen = conectar(mapa.nodos[origen_nombre])
+    lector = conectar(mapa.nodos[origen_nombre])
+    destino = conectar(mapa.nodos[args.hacia])
+    ensure_schema(destino)
+    ensure_schema_journal(origen)
+    ensure_schema_journal(destino)
+    con_contadores = tiene_contadores(origen)
+    if con_contadores:
+        ensure_schema_contadores(destino)
+    context = zmq.Context()
+
+    print(f"[Rebalanceo] Slots {inicio}-{fin}: {origen_nombre} -> {args.hacia}")
+
+    # 1. Copia en caliente
+    lotes = lotes_del_rango(lector, inicio, fin, mapa.num_slots, args.lote)
+    n_isbns, n = copiar(origen, destino, lotes, con_contadores)
+    n += copiar_aplicados_sin_isbn(origen, destino)
+    print(f"[Rebalanceo] Copia inicial: {n_isbns} ISBN, {n} filas")
+
+    # 2. Congelar escrituras del rango
+    migrando.guardar(args.mapa)
+    print(f"[Rebalanceo] Rango marcado como migrando (versión {migrando.version}); "
+          f"esperando confirmación de {len(endpoints)} GA")
+    sin_confirmar = esperar_version(context, endpoints, migrando.version, args.timeout)
+    if sin_confirmar:
+        # Alguno podría seguir escribiendo en el origen: volver al mapa anterior
+        ShardMap(mapa.nodos, mapa.rangos, mapa.num_slots, migrando.version + 1).guardar(args.mapa)
+        raise SystemExit(f"[Rebalanceo] Sin confirmación de {sin_confirmar}: migración cancelada, "
+                         f"mapa restaurado (el destino puede conservar copias sin dueño)")
+
+    # 3. Delta final (incluye ISBN creados durante la copia inicial)
+    lotes = lotes_del_rango(lector, inicio, fin, mapa.num_slots, args.lote)
+    n_isbns, n = copiar(origen, destino, lotes, con_contadores)
+    print(f"[Rebalanceo] Delta final: {n_isbns} ISBN, {n} filas")
+
+    # 4. Cambiar de dueño
+    rangos = [
+        RangoSlots(r.inicio, r.fin, args.hacia if r.estado == ESTADO_MIGRANDO else r.shard,
+                   ESTADO_ACTIVO if r.estado == ESTADO_MIGRANDO else r.estado)
+        for r in migrando.rangos
+    ]
+    final = ShardMap(mapa.nodos, rangos, mapa.num_slots, migrando.version + 1)
+    final.guardar(args.mapa)
+    print(f"[Rebalanceo] Mapa publicado (versión {final.version}); esperando confirmación de {len(endpoints)} GA")
+    sin_confirmar = esperar_version(context, endpoints, final.version, args.timeout)
+    if sin_confirmar:
+        # Alguno podría seguir leyendo del origen: no borrar hasta que lo cargue
+        raise SystemExit(f"[Rebalanceo] Sin confirmación de {sin_confirmar}: el origen {origen_nombre} "
+                         f"conserva las filas del rango {inicio}-{fin}; bórrelas cuando todos usen la versión {final.version}")
+
+    # 5. Limpiar el origen
+    n_isbns = borrar(origen, lotes_del_rango(lector, inicio, fin, mapa.num_slots, args.lote), con_contadores)
+    print(f"[Rebalanceo] {n_isbns} ISBN eliminados de {origen_nombre}")
+
+    lector.close()
+    origen.close()
+    destino.close()
+    context.term()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Mapa de shards por hash de ISBN para el gestor de almacenamiento.
+
+Cada ISBN se asigna a uno de NUM_SLOTS slots fijos (crc32(isbn) % NUM_SLOTS)
+y cada rango contiguo de slots pertenece a un nodo PostgreSQL. Mover un rango
+de un nodo a otro (ver rebalancear_shards.py) no cambia el slot de ningún ISBN,
+solo el dueño del rango.
+
+Formato del archivo (JSON):
+
+    {
+      "version": 1,
+      "num_slots": 1024,
+      "nodos": {
+        "s0": {"host": "postgres_s0", "port": 5432, "standby_host": "postgres_s0_replica"},
+        "s1": {"host": "postgres_s1", "port": 5432}
+      },
+      "rangos": [
+        {"inicio": 0,   "fin": 511,  "shard": "s0"},
+        {"inicio": 512, "fin": 1023, "shard": "s1"}
+      ]
+    }
+
+Un rango con "estado": "migrando" sigue sirviendo lecturas desde su dueño
+actual, pero rechaza escrituras hasta que termine el rebalanceo.
+"""
+import json
+import os
+import time
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+NUM_SLOTS = 1024
+
+ESTADO_ACTIVO = "activo"
+ESTADO_MIGRANDO = "migrando"
+
+
+def slot_de(isbn: str, num_slots: int = NUM_SLOTS) -> int:
+    """Slot estable de un ISBN (no usar hash(): está aleatorizado por proceso)."""
+    return zlib.crc32(str(isbn).encode("utf-8")) % num_slots
+
+
+@dataclass
+class NodoShard:
+    nombre: str
+    host: str
+    port: int = 5432
+    standby_host: Optional[str] = None
+    # Estado de conexión (se actualiza tras un failover)
+    current_host: str = field(default="", compare=False)
+    current_port: int = field(default=0, compare=False)
+
+    def __post_init__(self):
+        self.port = int(self.port)
+        if not self.current_host:
+            self.current_host = self.host
+        if not self.current_port:
+            self.current_port = self.port
+
+    def a_dict(self) -> dict:
+        d = {"host": self.host, "port": self.port}
+        if self.standby_host:
+            d["standby_host"] = self.standby_host
+        return d
+
+
+@dataclass
+class RangoSlots:
+    inicio: int
+    fin: int  # inclusivo
+    shard: str
+    estado: str = ESTADO_ACTIVO
+
+    def contiene(self, slot: int) -> bool:
+        return self.inicio <= slot <= self.fin
+
+    def a_dict(self) -> dict:
+        d = {"inicio": self.inicio, "fin": self.fin, "shard": self.shard}
+        if self.estado != ESTADO_ACTIVO:
+            d["estado"] = self.estado
+        return d
+
+
+class ShardMap:
+    def __init__(self, nodos: Dict[str, NodoShard], rangos: List[RangoSlots],
+                 num_slots: int = NUM_SLOTS, version: int = 1):
+        self.nodos = nodos
+        self.rangos = sorted(rangos, key=lambda r: r.inicio)
+        self.num_slots = num_slots
+        self.version = version
+        self.validar()
+        # Tabla slot -> rango para resolver en O(1)
+        self._por_slot: List[RangoSlots] = [None] * num_slots
+        for r in self.rangos:
+            for s in range(r.inicio, r.fin + 1):
+                self._por_slot[s] = r
+
+    def validar(self) -> None:
+        """Los rangos deben cubrir [0, num_slots) sin huecos ni solapes."""
+        esperado = 0
+        for r in self.rangos:
+            if r.shard not in self.nodos:
+                raise ValueError(f"Rango {r.inicio}-{r.fin} apunta a shard desconocido '{r.shard}'")
+            if r.inicio != esperado or r.fin < r.inicio:
+                raise ValueError(f"Rangos inválidos: se esperaba inicio {esperado}, llegó {r.inicio}-{r.fin}")
+            esperado = r.fin + 1
+        if esperado != self.num_slots:
+            raise ValueError(f"Los rangos cubren hasta {esperado - 1}, se esperaba {self.num_slots - 1}")
+
+    def ubicar(self, isbn: str) -> Tuple[NodoShard, RangoSlots]:
+        rango = self._por_slot[slot_de(isbn, self.num_slots)]
+        return self.nodos[rango.shard], rango
+
+    def nodo_para(self, isbn: str) -> NodoShard:
+        return self.ubicar(isbn)[0]
+
+    def a_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "num_slots": self.num_slots,
+            "nodos": {n: nodo.a_dict() for n, nodo in self.nodos.items()},
+            "rangos": [r.a_dict() for r in self.rangos],
+        }
+
+    @classmethod
+    def desde_dict(cls, d: dict) -> "ShardMap":
+        nodos = {
+            nombre: NodoShard(nombre=nombre, host=cfg["host"], port=cfg.get("port", 5432),
+                              standby_host=cfg.get("standby_host"))
+            for nombre, cfg in d["nodos"].items()
+        }
+        rangos = [
+            RangoSlots(inicio=int(r["inicio"]), fin=int(r["fin"]), shard=r["shard"],
+                       estado=r.get("estado", ESTADO_ACTIVO))
+            for r in d["rangos"]
+        ]
+        return cls(nodos, rangos, num_slots=int(d.get("num_slots", NUM_SLOTS)),
+                   version=int(d.get("version", 1)))
+
+    @classmethod
+    def desde_archivo(cls, path: str) -> "ShardMap":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.desde_dict(json.load(f))
+
+    @classmethod
+    def por_defecto(cls, host: str, port: int, standby_host: Optional[str] = None) -> "ShardMap":
+        """Un único shard que cubre todos los slots (comportamiento sin sharding)."""
+        nodo = NodoShard(nombre="default", host=host, port=port, standby_host=standby_host)
+        return cls({"default": nodo}, [RangoSlots(0, NUM_SLOTS - 1, "default")])
+
+    def guardar(self, path: str) -> None:
+        """Escritura atómica: los GA que recargan nunca ven un archivo a medias."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.a_dict(), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+class ShardMapRecargable:
+    """
+    Envuelve un ShardMap leído de archivo y lo recarga cuando cambia su mtime.
+    Conserva el estado de conexión (current_host/current_port) de los nodos
+    que siguen existiendo en la nueva versión.
+    """
+    def __init__(self, path: Optional[str], por_defecto: ShardMap, intervalo: float = 1.0):
+        self.path = path
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._ultima_revision = 0.0
+        self._mapa = por_defecto
+        if path:
+            self._recargar(forzar=True)
+
+    def actual(self) -> ShardMap:
+        if self.path and time.monotonic() - self._ultima_revision >= self.intervalo:
+            self._recargar()
+        return self._mapa
+
+    def _recargar(self, forzar: bool = False) -> None:
+        with self._lock:
+            self._ultima_revision = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError as e:
+                if forzar:
+                    raise
+                print(f"[Shards] No se pudo leer {self.path}: {e}")
+                return
+            if not forzar and mtime == self._mtime:
+                return
+            try:
+                nuevo = ShardMap.desde_archivo(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                if forzar:
+                    raise
+                # Archivo a medias o mal editado: seguir con el mapa anterior. El mtime
+                # se recuerda para no repetir el aviso; al corregirlo cambia y se relee
+                self._mtime = mtime
+                print(f"[Shards] Mapa inválido en {self.path}, se mantiene la versión {self._mapa.version}: {e}")
+                return
+            for nombre, nodo in nuevo.nodos.items():
+                anterior = self._mapa.nodos.get(nombre)
+                if anterior and anterior == nodo:
+                    nodo.current_host = anterior.current_host
+                    nodo.current_port = anterior.current_port
+            self._mapa = nuevo
+            self._mtime = mtime
+            print(f"[Shards] Mapa cargado (versión {nuevo.version}, {len(nuevo.nodos)} nodos)")
@@ -1,11 +1,73 @@
+import os
+import zlib
 import zmq
 import json
-from typing import Dict, Any
+import uuid
+from typing import Callable, Dict, Any, List, Optional
 from types import SimpleNamespace
 from datetime import datetime, timedelta
 
 from common.messaging.respuesta import Respuesta
 from common.resilience.circuitBreaker import CircuitBreaker
+from common.health.monitor import HealthMonitor
+from common.health.responder import HealthResponder
+from common.metrics.carga import CargaReciente
+from common.tracing import traza
+
+
+# Operaciones que se pueden pedir con "asincrono": true (se publican y los actores las procesan)
+OPERACIONES_ASINCRONAS = {"prestamo", "renovacion", "devolucion"}
+
+# Operaciones que cambian el estado de un préstamo: tras ellas se publica "invalidar"
+# para que los actores olviden lo que tenían en caché de ese (usuario, isbn)
+OPERACIONES_INVALIDAN = {"prestamo", "devolucion"}
+ESTADO_TRAS_OPERACION = {
+    "prestamo": {"estado": "ACTIVO", "renovaciones": 0},
+    "devolucion": {"estado": "DEVUELTO", "renovaciones": None},
+}
+TOPICO_INVALIDAR = "invalidar"
+
+
+def _lista_env(nombre: str, defecto: str) -> List[str]:
+    return [e.strip() for e in os.getenv(nombre, defecto).split(",") if e.strip()]
+
+
+# Réplicas de cada actor. Un usuario va siempre a la misma réplica (hash del
+# usuario), así la caché de validaciones de esa réplica le sirve en cada petición.
+REPLICAS_ACTORES = {
+    "prestamo": _lista_env("ACTOR_PRESTAMO_ADDRS", "tcp://actor_prestamo:5560"),
+    "renovacion": _lista_env("ACTOR_RENOVACION_ADDRS", "tcp://actor_renovacion:5561"),
+    "devolucion": _lista_env("ACTOR_DEVOLUCION_ADDRS", "tcp://actor_devolucion:5562"),
+}
+
+
+# Endpoints de health (HealthResponder, ACTOR_SALUD_ADDR en el actor) de cada
+# réplica, en el mismo orden que las réplicas. Vacío = no se vigila ese actor.
+SALUD_ACTORES = {
+    "prestamo": _lista_env("ACTOR_PRESTAMO_SALUD_ADDRS", ""),
+    "renovacion": _lista_env("ACTOR_RENOVACION_SALUD_ADDRS", ""),
+    "devolucion": _lista_env("ACTOR_DEVOLUCION_SALUD_ADDRS", ""),
+}
+
+
+# HealthResponder con la carga del GC (p.ej. tcp://*:5557); vacío = sin health-check
+GC_SALUD_ADDR = os.getenv("GC_SALUD_ADDR", "")
+
+
+def replica_para(operacion: str, usuario, replicas_actores: Optional[Dict[str, List[str]]] = None,
+                 disponible: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Réplica del actor que atiende a este usuario (crc32 estable entre reinicios).
+    Si esa réplica no está disponible se usa la siguiente del anillo que lo esté.
+    """
+    replicas = (replicas_actores or REPLICAS_ACTORES)[operacion]
+    inicio = zlib.crc32(str(usuario or "").encode("utf-8")) % len(replicas)
+    if disponible is not None:
+        for i in range(len(replicas)):
+            replica = replicas[(inicio + i) % len(replicas)]
+            if disponible(replica):
+                return replica
+    return replicas[inicio]
 
 
 class ZMQPublisher:
@@ -44,12 +106,52 @@ class MessageRouter:
 
 
 class GestorCarga:
-    def __init__(self, context: zmq.Context):
+    def __init__(self, context: zmq.Context, rep_endpoint: str = "tcp://*:5555",
+                 pub_endpoint: str = "tcp://*:5556",
+                 replicas_actores: Optional[Dict[str, List[str]]] = None,
+                 ga_endpoint: str = "tcp://gestor_almacenamiento:5570"):
         self.context = context
-        self.publisher = ZMQPublisher(context, "tcp://*:5556")
-        self.replier = ZMQReplier(context, "tcp://*:5555")
+        self.publisher = ZMQPublisher(context, pub_endpoint)
+        self.replier = ZMQReplier(context, rep_endpoint)
+        self.replicas_actores = replicas_actores or REPLICAS_ACTORES
+        self.ga_endpoint = ga_endpoint
+        self.salud = self._vigilar_replicas(context)
+        self.carga = CargaReciente()
+        self.responder_salud = None
+        if GC_SALUD_ADDR:
+            self.responder_salud = HealthResponder(GC_SALUD_ADDR, context=context)
+            self.responder_salud.registrar("carga", self.carga.a_dict)
+            if self.salud is not None:
+                self.responder_salud.registrar("sospecha_replicas", self.salud.sospecha)
+            self.responder_salud.start()
         self.router = MessageRouter()
         self.actores: Dict[str, Any] = {}
+        self.origen = uuid.uuid4().hex[:8]
+        self.secuencias: Dict[str, int] = {}
+
+    def _vigilar_replicas(self, context: zmq.Context) -> Optional[HealthMonitor]:
+        """Arranca el HealthMonitor si hay endpoints de health configurados para las réplicas."""
+        monitor = None
+        for operacion, endpoints in SALUD_ACTORES.items():
+            replicas = self.replicas_actores.get(operacion, [])
+            if not endpoints:
+                continue
+            if len(endpoints) != len(replicas):
+                print(f"[Gestor] {operacion}: {len(endpoints)} endpoints de health para "
+                      f"{len(replicas)} réplicas, no se vigilan")
+                continue
+            if monitor is None:
+                monitor = HealthMonitor(context=context)
+                monitor.on_change(lambda n, s: print(f"[Gestor] Réplica {n}: {s}"))
+            for replica, endpoint in zip(replicas, endpoints):
+                monitor.add_target(replica, endpoint)
+        if monitor is not None:
+            monitor.start()
+        return monitor
+
+    def _replica(self, operacion: str, usuario) -> str:
+        disponible = self.salud.disponible if self.salud is not None else None
+        return replica_para(operacion, usuario, self.replicas_actores, disponible)
 
     def recibir_peticion(self) -> SimpleNamespace:
         _, msg = self.replier.receive()
@@ -68,8 +170,52 @@ class GestorCarga:
         pet = SimpleNamespace(id=pid, payload=payload, raw=msg)
         return pet
 
-    def publicar_evento(self, topic: str, mensaje: Dict[str, Any]) -> None:
+    def publicar_evento(self, topic: str, mensaje: Dict[str, Any]) -> int:
+        """
+        Publica un evento con número de secuencia por tópico. "origen" cambia en
+        cada arranque del GC, así los suscriptores distinguen un reinicio de un hueco.
+        """
+        self.secuencias[topic] = self.secuencias.get(topic, 0) + 1
+        mensaje = dict(mensaje, origen=f"{self.origen}:{topic}", seq=self.secuencias[topic])
         self.publisher.publish(topic, json.dumps(mensaje))
+        return mensaje["seq"]
+
+    def invalidar_cache(self, operacion: str, isbn, usuario, aplicada: bool = False) -> None:
+        """
+        Avisa a los actores de que el préstamo (usuario, isbn) cambió. Si la
+        operación ya se aplicó se envía el estado resultante para que lo
+        guarden; si no, que la operación está pendiente: lo que respondiera el
+        GA antes de aplicarla no debe cachearse (ver cache.py).
+        """
+        if operacion not in OPERACIONES_INVALIDAN or not usuario:
+            return
+        evento = {"operacion": operacion, "isbn": isbn, "usuario": usuario}
+        if aplicada:
+            evento["prestamo"] = ESTADO_TRAS_OPERACION[operacion]
+        else:
+            evento["pendiente"] = True
+        self.publicar_evento(TOPICO_INVALIDAR, evento)
+
+    def encolar_operacion(self, peticion: SimpleNamespace) -> Respuesta:
+        """Modo asíncrono: publica la operación para los actores y confirma sin esperar el resultado."""
+        operacion = peticion.payload.get("operacion")
+        # El actor que consuma el evento continúa la traza como hijo de "gc.publicar";
+        # "asincrono" indica al analizador que ese trabajo no es parte de la respuesta
+        with traza.subspan("gc.publicar", operacion=operacion, asincrono=True) as span:
+            seq = self.publicar_evento(operacion, traza.con_cabeceras({
+                "id": peticion.id,
+                "isbn": peticion.payload.get("isbn"),
+                "usuario": peticion.payload.get("usuario"),
+            }, span))
+        # Todavía no se aplicó: los actores dejan de cachear ese préstamo un TTL
+        self.invalidar_cache(operacion, peticion.payload.get("isbn"), peticion.payload.get("usuario"))
+        return Respuesta(
+            topico=operacion,
+            contenido="respuesta",
+            exito=True,
+            mensaje="Operación aceptada; el resultado se publica en resultado." + operacion,
+            datos={"seq": seq}
+        )
 
     def _consultar_almacenamiento(self, peticion: dict) -> dict:
         """Realiza una petición síncrona al gestor de almacenamiento"""
@@ -77,7 +223,7 @@ class GestorCarga:
             req = self.context.socket(zmq.REQ)
             req.RCVTIMEO = 5000
             req.SNDTIMEO = 5000
-            req.connect("tcp://gestor_almacenamiento:5570")
+            req.connect(self.ga_endpoint)
             req.send_json(peticion)
             response = req.recv_json()
             req.close()
@@ -86,6 +232,13 @@ class GestorCarga:
             print(f"[Gestor] Error al consultar almacenamiento: {e}")
             return {"error": "ErrorComunicacion", "detalle": str(e)}
 
+    @staticmethod
+    def _pedir_actor(req: zmq.Socket, operacion: str, isbn, usuario) -> Dict[str, Any]:
+        """Ida y vuelta con el actor; con trazas, como span "gc.actor" de la petición en curso."""
+        with traza.subspan("gc.actor", operacion=operacion) as span:
+            req.send_json(traza.con_cabeceras({"isbn": isbn, "usuario": usuario}, span))
+            return req.recv_json()
+
     def enrutar_prestamo(self, peticion: SimpleNamespace) -> Respuesta:
         operacion = peticion.payload.get("operacion", "desconocida")
         isbn = peticion.payload.get("isbn")
@@ -99,10 +252,9 @@ class GestorCarga:
                 req.setsockopt(zmq.RCVTIMEO, 5000)
                 req.setsockopt(zmq.SNDTIMEO, 5000)
                 req.setsockopt(zmq.LINGER, 0)
-                req.connect("tcp://actor_prestamo:5560")
+                req.connect(self._replica("prestamo", usuario))
                 
-                req.send_json({"isbn": isbn, "usuario": usuario})
-                response = req.recv_json()
+                response = self._pedir_actor(req, operacion, isbn, usuario)
                 
                 print(f"[Gestor] Respuesta del actor: {response}")
                 
@@ -152,10 +304,9 @@ class GestorCarga:
                 req.setsockopt(zmq.RCVTIMEO, 5000)
                 req.setsockopt(zmq.SNDTIMEO, 5000)
                 req.setsockopt(zmq.LINGER, 0)
-                req.connect("tcp://actor_renovacion:5561")
+                req.connect(self._replica("renovacion", usuario))
                 
-                req.send_json({"isbn": isbn, "usuario": usuario})
-                response = req.recv_json()
+                response = self._pedir_actor(req, operacion, isbn, usuario)
                 
                 print(f"[Gestor] Respuesta del actor: {response}")
                 
@@ -205,10 +356,9 @@ class GestorCarga:
                 req.setsockopt(zmq.RCVTIMEO, 5000)
                 req.setsockopt(zmq.SNDTIMEO, 5000)
                 req.setsockopt(zmq.LINGER, 0)
-                req.connect("tcp://actor_devolucion:5562")
+                req.connect(self._replica("devolucion", usuario))
                 
-                req.send_json({"isbn": isbn, "usuario": usuario})
-                response = req.recv_json()
+                response = self._pedir_actor(req, operacion, isbn, usuario)
                 
                 print(f"[Gestor] Respuesta del actor: {response}")
                 
@@ -274,6 +424,44 @@ class GestorCarga:
         print("[Gestor] Respuesta enviada")
 
 
+    def atender(self, peticion: SimpleNamespace) -> Respuesta:
+        """Enruta una petición ya recibida (síncrona o encolada) y devuelve la respuesta."""
+        if peticion.raw.get("asincrono") and peticion.payload.get("operacion") in OPERACIONES_ASINCRONAS:
+            return self.encolar_operacion(peticion)
+        respuesta = self.enrutar_prestamo(peticion)
+        if respuesta.exito:
+            self.invalidar_cache(peticion.payload.get("operacion"),
+                                 peticion.payload.get("isbn"), peticion.payload.get("usuario"),
+                                 aplicada=True)
+        return respuesta
+
+    def servir(self) -> None:
+        """Bucle principal: recibir, enrutar y responder hasta KeyboardInterrupt."""
+        while True:
+            peticion = self.recibir_peticion()#siempre se estan recibiendo peticiones
+            print(f"[Gestor] Recibida petición: {peticion.payload}")
+
+            # Raíz de la traza, salvo que el cliente mande sus propias cabeceras
+            span = traza.iniciar("gc", "gc.peticion", traza.de_mensaje(peticion.raw), raiz=True,
+                                 operacion=peticion.payload.get("operacion"), id=peticion.id)
+            with span:
+                # enrutar según tipo
+                print(f"[Gestor] Enrutando operación: {peticion.payload.get('operacion')}")
+                inicio = self.carga.empezar()
+                try:
+                    respuesta = self.atender(peticion)
+                finally:
+                    self.carga.terminar(inicio)
+                print(f"[Gestor] Respuesta generada: exito={respuesta.exito}, mensaje={respuesta.mensaje}")
+                span.anotar(exito=respuesta.exito)
+                if span.traza:
+                    # El cliente recibe el id de la traza para buscarla después
+                    respuesta.headers["traza"] = span.traza
+
+                # responder al cliente
+                self.responder_cliente(respuesta)
+
+
 def main():
     context = zmq.Context()
     gestor = GestorCarga(context)
@@ -281,18 +469,7 @@ def main():
     print("Gestor listo en puertos 5555 (REQ/REP) y 5556 (PUB/SUB)")
 
     try:
-        while True:
-            peticion = gestor.recibir_peticion()#siempre se estan recibiendo peticiones
-            print(f"[Gestor] Recibida petición: {peticion.payload}")
-
-            # enrutar según tipo
-            print(f"[Gestor] Enrutando operación: {peticion.payload.get('operacion')}")
-            respuesta = gestor.enrutar_prestamo(peticion)
-            print(f"[Gestor] Respuesta generada: exito={respuesta.exito}, mensaje={respuesta.mensaje}")
-
-            # responder al cliente
-            gestor.responder_cliente(respuesta)
-
+        gestor.servir()
     except KeyboardInterrupt:
         print("Interrumpido")
     finally:
@@ -1,77 +1,381 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+"""
+Análisis de resultados de carga: percentiles, throughput y errores por
+operación, por ejecución y entre ejecuciones, con comparación contra una
+línea base.
+
+Entradas (en --dir, por defecto test_results):
+- CSV de Locust (`results_<N>users_<fecha>_stats.csv` y su `_stats_history.csv`).
+- JSON de carga_abierta.py / reproducir.py (`--salida`), con --json.
+
+Los `_stats_history.csv` se recorren fila a fila (no se cargan enteros), así
+que sirve para pruebas largas. Del historial sale la estabilidad de la
+prueba: desviación del throughput por segundo y el peor p99 de un intervalo.
+
+Con --guardar-baseline se guardan las métricas medias de cada escenario; con
+--baseline se compara la ejecución más reciente de cada escenario contra esa
+línea base y el proceso termina con código 1 si la latencia sube o el
+throughput baja más de los umbrales.
+
+Uso:
+    python analizar_resultados.py                                   # informe + gráficos
+    python analizar_resultados.py --guardar-baseline baseline.json
+    python analizar_resultados.py --baseline baseline.json --umbral-latencia 15
+"""
+import argparse
+import csv
+import json
+import math
+import re
+import sys
+from collections import defaultdict
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
 # Directorio donde están los resultados CSV
 OUT_DIR = Path("test_results")
 
-# Buscar todos los archivos CSV con estadísticas
-archivos = list(OUT_DIR.glob("results_*users_*_stats.csv"))
+PERCENTILES = ("p50", "p90", "p99", "p99.9")
+COLUMNAS_LOCUST = {"p50": "50%", "p90": "90%", "p99": "99%", "p99.9": "99.9%"}
+METRICAS = PERCENTILES + ("media_ms", "max_ms", "rps", "tasa_error")
+NOMBRE_LOCUST = re.compile(r"results_(?P<usuarios>\d+)users_(?P<fecha>\d{8}_\d{6})_stats$")
 
-if not archivos:
-    raise SystemExit(f"No se encontraron archivos CSV en {OUT_DIR}. Ejecuta primero las pruebas de Locust.")
 
-print(f"Archivos encontrados: {len(archivos)}")
-for a in archivos:
-    print(f"  - {a.name}")
+def _num(valor) -> Optional[float]:
+    try:
+        v = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(v) else v
 
-rows = []
 
-for archivo in archivos:
-    df = pd.read_csv(archivo)
-    # Filtrar fila con métricas agregadas
-    total = df[df["Name"] == "Aggregated"]
-    if total.empty:
-        continue
-    # Extraer número de usuarios desde el nombre del archivo
-    nombre = archivo.stem
-    try:
-        usuarios = int(nombre.split("_")[1].replace("users", ""))
-    except Exception:
-        usuarios = None
-    
-    # Guardar estadísticas relevantes
-    rows.append({
-        "Usuarios": usuarios,
-        "Tiempo promedio (ms)": float(total["Average Response Time"].iloc[0]),
-        "Desv. Std (ms)": None,  # Esta columna no está presente
-        "Solicitudes procesadas": int(total["Request Count"].iloc[0]),
-        "Requests/s": float(total["Requests/s"].iloc[0]),
-    })
-
-
-# Validación
-if not rows:
-    raise SystemExit("No hubo filas 'Aggregated' en los CSV. Revisa que Locust haya terminado correctamente.")
-
-
-# Crear dataframe final y guardarlo como CSV
-df_final = pd.DataFrame(rows).sort_values("Usuarios")
-df_final.to_csv(OUT_DIR / "resumen_total.csv", index=False)
-print(df_final)
-
-
-# Gráfico 1: Tiempo promedio vs Usuarios
-plt.figure()
-plt.plot(df_final["Usuarios"], df_final["Tiempo promedio (ms)"], marker="o")
-plt.title("Tiempo de respuesta promedio vs Nº de usuarios")
-plt.xlabel("Usuarios (procesos solicitantes)")
-plt.ylabel("Tiempo promedio (ms)")
-plt.grid(True)
-plt.savefig(OUT_DIR / "grafico_tiempo_respuesta.png", bbox_inches="tight")
-
-
-# Gráfico 2: Solicitudes procesadas vs Usuarios
-plt.figure()
-plt.plot(df_final["Usuarios"], df_final["Solicitudes procesadas"], marker="s")
-plt.title("Solicitudes procesadas vs Nº de usuarios (2 min)")
-plt.xlabel("Usuarios (procesos solicitantes)")
-plt.ylabel("Solicitudes procesadas")
-plt.grid(True)
-plt.savefig(OUT_DIR / "grafico_solicitudes.png", bbox_inches="tight")
-
-
-print(f"\n Archivos en {OUT_DIR}:")
-print(" - resumen_total.csv")
-print(" - grafico_tiempo_respuesta.png")
-print(" - grafico_solicitudes.png")
\ No newline at end of file
+class Acumulador:
+    """Media y desviación en una pasada (Welford), sin guardar las muestras."""
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self._m2 = 0.0
+        self.maximo: Optional[float] = None
+
+    def agregar(self, x: Optional[float]) -> None:
+        if x is None:
+            return
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self._m2 += delta * (x - self.media)
+        self.maximo = x if self.maximo is None else max(self.maximo, x)
+
+    @property
+    def desviacion(self) -> Optional[float]:
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else None
+
+
+# === Lectura de ejecuciones ===
+def leer_locust(stats: Path) -> Optional[Dict]:
+    """Una ejecución de Locust: métricas por operación del _stats.csv más la estabilidad del historial."""
+    m = NOMBRE_LOCUST.match(stats.stem)
+    if not m:
+        return None
+    operaciones = {}
+    with stats.open(newline="", encoding="utf-8") as f:
+        for fila in csv.DictReader(f):
+            nombre = "TOTAL" if fila["Name"] == "Aggregated" else fila["Name"]
+            n = int(_num(fila["Request Count"]) or 0)
+            fallos = int(_num(fila["Failure Count"]) or 0)
+            operaciones[nombre] = {
+                "n": n,
+                "fallos": fallos,
+                "tasa_error": fallos / n if n else 0.0,
+                "rps": _num(fila["Requests/s"]),
+                "media_ms": _num(fila["Average Response Time"]),
+                "max_ms": _num(fila["Max Response Time"]),
+                **{p: _num(fila.get(col)) for p, col in COLUMNAS_LOCUST.items()},
+            }
+    if "TOTAL" not in operaciones:
+        return None
+
+    historial = stats.with_name(stats.stem + "_history.csv")
+    if historial.exists():
+        for nombre, est in leer_historial(historial).items():
+            if nombre in operaciones:
+                operaciones[nombre].update(est)
+    return {
+        "ejecucion": stats.stem[: -len("_stats")],
+        "escenario": f"{int(m.group('usuarios'))}users",
+        "usuarios": int(m.group("usuarios")),
+        "fecha": m.group("fecha"),
+        "operaciones": operaciones,
+    }
+
+
+def leer_historial(path: Path) -> Dict[str, Dict]:
+    """Recorre el _stats_history.csv fila a fila: desviación del rps y peor p99 por intervalo."""
+    rps: Dict[str, Acumulador] = defaultdict(Acumulador)
+    p99: Dict[str, Acumulador] = defaultdict(Acumulador)
+    with path.open(newline="", encoding="utf-8") as f:
+        for fila in csv.DictReader(f):
+            if not _num(fila.get("User Count")):
+                continue  # arranque, aún sin usuarios
+            nombre = "TOTAL" if fila["Name"] == "Aggregated" else fila["Name"]
+            rps[nombre].agregar(_num(fila.get("Requests/s")))
+            p99[nombre].agregar(_num(fila.get("99%")))
+    return {
+        nombre: {
+            "rps_desviacion": rps[nombre].desviacion,
+            "p99_peor_intervalo": p99[nombre].maximo,
+        }
+        for nombre in rps
+    }
+
+
+def leer_json(path: Path) -> Optional[Dict]:
+    """Una ejecución de carga_abierta.py o reproducir.py (JSON de --salida)."""
+    with path.open(encoding="utf-8") as f:
+        datos = json.load(f)
+    resumen = datos.get("resumen")
+    if not resumen:
+        return None
+    operaciones = {}
+    for nombre, r in list(resumen.get("operaciones", {}).items()) + [("TOTAL", resumen.get("total", {}))]:
+        lat = r.get("latencia_us", {})
+        ms = lambda v: v / 1000.0 if v is not None else None
+        respondidas = r.get("ok", 0) + r.get("rechazadas", 0)
+        perdidas = r.get("timeouts", 0) + r.get("no_enviadas", 0)
+        operaciones[nombre] = {
+            "n": respondidas + perdidas,
+            "fallos": perdidas,
+            "tasa_error": r.get("tasa_error", 0.0),
+            "rps": r.get("throughput_rps"),
+            "media_ms": ms(lat.get("media")),
+            "max_ms": ms(lat.get("max")),
+            **{p: ms(lat.get(p)) for p in PERCENTILES},
+        }
+    return {
+        "ejecucion": path.stem,
+        "escenario": path.stem,
+        "usuarios": None,
+        "fecha": f"{path.stat().st_mtime:.0f}",
+        "operaciones": operaciones,
+    }
+
+
+def cargar_ejecuciones(directorio: Path, patron: str, jsons: Iterable[str]) -> List[Dict]:
+    ejecuciones = []
+    for stats in sorted(directorio.glob(patron)):
+        if stats.name.endswith("_stats.csv"):
+            ejecucion = leer_locust(stats)
+            if ejecucion:
+                ejecuciones.append(ejecucion)
+    for nombre in jsons:
+        ejecucion = leer_json(Path(nombre))
+        if ejecucion:
+            ejecuciones.append(ejecucion)
+    return ejecuciones
+
+
+# === Agregación entre ejecuciones ===
+def agregar_escenarios(ejecuciones: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+    """
+    Por escenario y operación, media y desviación de cada métrica entre
+    ejecuciones. Los percentiles de distintas ejecuciones no se pueden
+    fusionar con exactitud desde el CSV de Locust: se promedian.
+    """
+    acc: Dict[str, Dict[str, Dict[str, Acumulador]]] = defaultdict(lambda: defaultdict(lambda: defaultdict(Acumulador)))
+    for ej in ejecuciones:
+        for op, metricas in ej["operaciones"].items():
+            for m in METRICAS:
+                acc[ej["escenario"]][op][m].agregar(metricas.get(m))
+    escenarios = {}
+    for escenario, ops in acc.items():
+        escenarios[escenario] = {}
+        for op, metricas in ops.items():
+            escenarios[escenario][op] = {
+                "ejecuciones": max((a.n for a in metricas.values()), default=0),
+                **{m: _redondear(a.media) if a.n else None for m, a in metricas.items()},
+                **{f"{m}_desviacion": _redondear(a.desviacion) for m, a in metricas.items()},
+            }
+    return escenarios
+
+
+def ultimas_por_escenario(ejecuciones: List[Dict]) -> Dict[str, Dict]:
+    ultimas = {}
+    for ej in ejecuciones:
+        if ej["escenario"] not in ultimas or ej["fecha"] > ultimas[ej["escenario"]]["fecha"]:
+            ultimas[ej["escenario"]] = ej
+    return ultimas
+
+
+def _redondear(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(v, 4)
+
+
+# === Comparación con la línea base ===
+def comparar(ultimas: Dict[str, Dict], baseline: Dict[str, Dict[str, Dict]], umbral_latencia: float,
+             umbral_throughput: float, umbral_error: float, metrica_latencia: str) -> List[str]:
+    """Devuelve la lista de regresiones (vacía si no hay)."""
+    regresiones = []
+    for escenario, ej in sorted(ultimas.items()):
+        base_ops = baseline.get(escenario)
+        if not base_ops:
+            print(f"  {escenario}: sin línea base, se omite")
+            continue
+        for op, actual in sorted(ej["operaciones"].items()):
+            base = base_ops.get(op)
+            if not base:
+                continue
+            lat_a, lat_b = actual.get(metrica_latencia), base.get(metrica_latencia)
+            if lat_a is not None and lat_b:
+                cambio = (lat_a - lat_b) / lat_b * 100
+                estado = "REGRESIÓN" if cambio > umbral_latencia else "ok"
+                print(f"  {escenario:<14} {op:<12} {metrica_latencia:>6}: {lat_b:9.2f} -> {lat_a:9.2f} ms "
+                      f"({cambio:+6.1f}%) {estado}")
+                if cambio > umbral_latencia:
+                    regresiones.append(f"{escenario}/{op}: {metrica_latencia} +{cambio:.1f}% (> {umbral_latencia}%)")
+            rps_a, rps_b = actual.get("rps"), base.get("rps")
+            if rps_a is not None and rps_b:
+                cambio = (rps_a - rps_b) / rps_b * 100
+                estado = "REGRESIÓN" if -cambio > umbral_throughput else "ok"
+                print(f"  {escenario:<14} {op:<12} {'rps':>6}: {rps_b:9.2f} -> {rps_a:9.2f}    "
+                      f"({cambio:+6.1f}%) {estado}")
+                if -cambio > umbral_throughput:
+                    regresiones.append(f"{escenario}/{op}: throughput {cambio:.1f}% (< -{umbral_throughput}%)")
+            err_a, err_b = actual.get("tasa_error") or 0.0, base.get("tasa_error") or 0.0
+            if err_a - err_b > umbral_error:
+                regresiones.append(f"{escenario}/{op}: tasa de error {err_b:.2%} -> {err_a:.2%}")
+    return regresiones
+
+
+# === Salida ===
+def _fmt(v, decimales=1) -> str:
+    return "-" if v is None else f"{v:.{decimales}f}"
+
+
+def imprimir_ejecuciones(ejecuciones: List[Dict]) -> None:
+    print("\n=== Por ejecución (latencias en ms) ===")
+    cabecera = (f"{'ejecucion':<34} {'operacion':<12} {'n':>7} {'err%':>6} {'rps':>8} "
+                f"{'p50':>7} {'p90':>7} {'p99':>7} {'p99.9':>7} {'rps σ':>7} {'p99 peor':>8}")
+    print(cabecera)
+    print("-" * len(cabecera))
+    for ej in sorted(ejecuciones, key=lambda e: (e["escenario"], e["fecha"])):
+        for op, m in sorted(ej["operaciones"].items(), key=lambda x: (x[0] == "TOTAL", x[0])):
+            print(f"{ej['ejecucion']:<34} {op:<12} {m['n']:>7} {m['tasa_error'] * 100:>6.2f} {_fmt(m['rps'], 2):>8} "
+                  f"{_fmt(m['p50']):>7} {_fmt(m['p90']):>7} {_fmt(m['p99']):>7} {_fmt(m['p99.9']):>7} "
+                  f"{_fmt(m.get('rps_desviacion'), 2):>7} {_fmt(m.get('p99_peor_intervalo')):>8}")
+
+
+def imprimir_escenarios(escenarios: Dict[str, Dict[str, Dict]]) -> None:
+    print("\n=== Entre ejecuciones: media ± desviación (latencias en ms) ===")
+    cabecera = f"{'escenario':<14} {'operacion':<12} {'runs':>4} {'rps':>14} {'p50':>12} {'p99':>12} {'p99.9':>12} {'err%':>6}"
+    print(cabecera)
+    print("-" * len(cabecera))
+    for escenario in sorted(escenarios, key=_orden_escenario):
+        for op, m in sorted(escenarios[escenario].items(), key=lambda x: (x[0] == "TOTAL", x[0])):
+            pm = lambda k, d=1: f"{_fmt(m[k], d)}±{_fmt(m[k + '_desviacion'], d)}"
+            print(f"{escenario:<14} {op:<12} {m['ejecuciones']:>4} {pm('rps', 2):>14} {pm('p50'):>12} "
+                  f"{pm('p99'):>12} {pm('p99.9'):>12} {(m['tasa_error'] or 0) * 100:>6.2f}")
+
+
+def _orden_escenario(escenario: str):
+    m = re.match(r"(\d+)users$", escenario)
+    return (0, int(m.group(1)), "") if m else (1, 0, escenario)
+
+
+def guardar_resumen(escenarios: Dict[str, Dict[str, Dict]], path: Path) -> None:
+    columnas = ["Escenario", "Operacion", "Ejecuciones"] + [c for m in METRICAS for c in (m, f"{m}_desviacion")]
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(columnas)
+        for escenario in sorted(escenarios, key=_orden_escenario):
+            for op, m in sorted(escenarios[escenario].items()):
+                w.writerow([escenario, op, m["ejecuciones"]] + [m.get(c) for c in columnas[3:]])
+
+
+def graficar(escenarios: Dict[str, Dict[str, Dict]], directorio: Path) -> List[str]:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    puntos = sorted((_orden_escenario(e)[1], ops["TOTAL"]) for e, ops in escenarios.items()
+                    if _orden_escenario(e)[0] == 0 and "TOTAL" in ops)
+    if not puntos:
+        return []
+    usuarios = [u for u, _ in puntos]
+
+    # Gráfico 1: percentiles de latencia vs usuarios
+    plt.figure()
+    for p in PERCENTILES:
+        plt.errorbar(usuarios, [m[p] for _, m in puntos], yerr=[m[f"{p}_desviacion"] or 0 for _, m in puntos],
+                     marker="o", capsize=3, label=p)
+    plt.title("Tiempo de respuesta por percentil vs Nº de usuarios")
+    plt.xlabel("Usuarios (procesos solicitantes)")
+    plt.ylabel("Tiempo de respuesta (ms)")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(directorio / "grafico_tiempo_respuesta.png", bbox_inches="tight")
+
+    # Gráfico 2: throughput vs usuarios
+    plt.figure()
+    plt.errorbar(usuarios, [m["rps"] for _, m in puntos], yerr=[m["rps_desviacion"] or 0 for _, m in puntos],
+                 marker="s", capsize=3)
+    plt.title("Throughput vs Nº de usuarios")
+    plt.xlabel("Usuarios (procesos solicitantes)")
+    plt.ylabel("Solicitudes por segundo")
+    plt.grid(True)
+    plt.savefig(directorio / "grafico_solicitudes.png", bbox_inches="tight")
+    return ["grafico_tiempo_respuesta.png", "grafico_solicitudes.png"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentiles, throughput y regresiones de las pruebas de carga")
+    parser.add_argument("--dir", type=Path, default=OUT_DIR, help="carpeta con los CSV de Locust")
+    parser.add_argument("--patron", default="results_*users_*_stats.csv", help="CSV de Locust a incluir")
+    parser.add_argument("--json", nargs="*", default=[], help="resultados de carga_abierta.py / reproducir.py")
+    parser.add_argument("--guardar-baseline", type=Path, help="guarda las medias por escenario como línea base")
+    parser.add_argument("--baseline", type=Path, help="compara la última ejecución de cada escenario con esta línea base")
+    parser.add_argument("--metrica-latencia", default="p99", choices=PERCENTILES + ("media_ms",))
+    parser.add_argument("--umbral-latencia", type=float, default=10.0, help="%% de subida de latencia tolerado")
+    parser.add_argument("--umbral-throughput", type=float, default=10.0, help="%% de bajada de throughput tolerado")
+    parser.add_argument("--umbral-error", type=float, default=0.01, help="subida absoluta de la tasa de error tolerada")
+    parser.add_argument("--sin-graficos", action="store_true")
+    args = parser.parse_args()
+
+    ejecuciones = cargar_ejecuciones(args.dir, args.patron, args.json)
+    if not ejecuciones:
+        raise SystemExit(f"No se encontraron resultados en {args.dir}. Ejecuta primero las pruebas de Locust.")
+    print(f"Ejecuciones encontradas: {len(ejecuciones)}")
+
+    escenarios = agregar_escenarios(ejecuciones)
+    imprimir_ejecuciones(ejecuciones)
+    imprimir_escenarios(escenarios)
+
+    args.dir.mkdir(parents=True, exist_ok=True)
+    generados = ["resumen_total.csv"]
+    guardar_resumen(escenarios, args.dir / "resumen_total.csv")
+    if not args.sin_graficos:
+        generados += graficar(escenarios, args.dir)
+    print(f"\n Archivos en {args.dir}:")
+    for nombre in generados:
+        print(f" - {nombre}")
+
+    if args.guardar_baseline:
+        with args.guardar_baseline.open("w", encoding="utf-8") as f:
+            json.dump(escenarios, f, indent=2)
+        print(f"\nLínea base guardada en {args.guardar_baseline}")
+
+    if args.baseline:
+        with args.baseline.open(encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n=== Comparación con {args.baseline} ===")
+        regresiones = comparar(ultimas_por_escenario(ejecuciones), baseline, args.umbral_latencia,
+                               args.umbral_throughput, args.umbral_error, args.metrica_latencia)
+        if regresiones:
+            print("\nRegresiones:")
+            for r in regresiones:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("\nSin regresiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Generador de carga de lazo abierto para el protocolo del GC.
+
+A diferencia de locustfile.py (lazo cerrado: cada usuario espera la
+respuesta y un rato antes de la siguiente petición), aquí las peticiones
+salen a una tasa fija, pase lo que pase con las respuestas. La petición i
+está programada para t0 + i/tasa, y su latencia se mide desde ese instante
+y no desde que realmente salió. Así, si el sistema se atasca, las peticiones
+que "deberían" haber salido durante el atasco cuentan todo su tiempo de
+espera (corrección de la omisión coordinada). El tiempo desde el envío real
+se guarda aparte como `servicio_us`.
+
+Las peticiones van por varios DEALER persistentes contra el REP del GC, sin
+esperar respuesta (pipelining). El REP contesta en orden por conexión, así
+que cada DEALER empareja sus respuestas con una cola FIFO de envíos. Si la
+más antigua supera el timeout, todas las pendientes de ese socket se dan por
+perdidas y el socket se rehace.
+
+Uso (desde proceso_solicitante, con PYTHONPATH=.. fuera de Docker):
+    python carga_abierta.py --tasa 500 --duracion 60 \
+        --mezcla consulta=5,renovacion=3,prestamo=1,devolucion=1
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import zmq
+
+from common.metrics.histograma import Histograma
+from solicitudes import OPERACIONES, leer_solicitudes
+
+GESTOR_CARGA_ADDR = os.getenv("GESTOR_CARGA_ADDR", "tcp://gestor_carga:5555")
+MEZCLA_POR_DEFECTO = "consulta=5,renovacion=3,prestamo=1,devolucion=1"
+
+
+def parsear_mezcla(texto: str) -> Dict[str, float]:
+    """"consulta=5,prestamo=1" -> {"consulta": 5.0, "prestamo": 1.0}."""
+    mezcla = {}
+    for parte in texto.split(","):
+        if not parte.strip():
+            continue
+        op, _, peso = parte.partition("=")
+        op = op.strip()
+        if op not in OPERACIONES:
+            raise ValueError(f"Operación desconocida en la mezcla: {op!r} (válidas: {', '.join(OPERACIONES)})")
+        mezcla[op] = float(peso or 1)
+    if not mezcla or sum(mezcla.values()) <= 0:
+        raise ValueError("La mezcla no tiene ninguna operación con peso > 0")
+    return mezcla
+
+
+class ConexionDealer:
+    """DEALER persistente con la cola de peticiones enviadas y aún sin respuesta."""
+
+    def __init__(self, context: zmq.Context, endpoint: str):
+        self.context = context
+        self.endpoint = endpoint
+        self.socket: Optional[zmq.Socket] = None
+        self.pendientes: deque = deque()  # (programado, enviado, operacion)
+        self.abrir()
+
+    def abrir(self) -> None:
+        s = self.context.socket(zmq.DEALER)
+        s.linger = 0
+        s.sndhwm = 0
+        s.rcvhwm = 0
+        s.connect(self.endpoint)
+        self.socket = s
+
+    def rehacer(self) -> None:
+        self.socket.close(0)
+        self.pendientes.clear()
+        self.abrir()
+
+
+class Resultados:
+    def __init__(self):
+        self.latencia: Dict[str, Histograma] = {}
+        self.servicio: Dict[str, Histograma] = {}
+        self.contadores: Dict[str, Dict[str, int]] = {}
+
+    def _op(self, op: str):
+        if op not in self.latencia:
+            self.latencia[op] = Histograma()
+            self.servicio[op] = Histograma()
+            self.contadores[op] = {"ok": 0, "rechazadas": 0, "timeouts": 0, "no_enviadas": 0}
+        return self.latencia[op], self.servicio[op], self.contadores[op]
+
+    def respuesta(self, op: str, latencia_us: float, servicio_us: float, exito: bool) -> None:
+        lat, serv, cont = self._op(op)
+        lat.registrar(latencia_us)
+        serv.registrar(servicio_us)
+        # Una respuesta de negocio negativa (sin ejemplares...) sigue siendo una respuesta
+        cont["ok" if exito else "rechazadas"] += 1
+
+    def perdida(self, op: str, latencia_us: float, motivo: str) -> None:
+        lat, _, cont = self._op(op)
+        # Cuenta en la latencia como mínimo lo que se esperó: descartarla escondería el atasco
+        lat.registrar(latencia_us)
+        cont[motivo] += 1
+
+    def a_dict(self) -> Dict:
+        return {
+            op: {
+                "contadores": dict(self.contadores[op]),
+                "latencia": self.latencia[op].a_dict(),
+                "servicio": self.servicio[op].a_dict(),
+            }
+            for op in self.latencia
+        }
+
+
+class GeneradorAbierto:
+    """Envía peticiones al GC a `tasa` por segundo, repartidas en `conexiones` DEALER."""
+
+    def __init__(self, endpoint: str, tasa: float, mezcla: Dict[str, float], datos: Optional[List[Dict]] = None,
+                 conexiones: int = 4, timeout_ms: int = 10000, max_en_vuelo: int = 100000,
+                 semilla: Optional[int] = None, libros: int = 1000, usuarios: int = 1000, prefijo_id: str = "ca"):
+        self.endpoint = endpoint
+        self.tasa = tasa
+        self.n_conexiones = max(1, conexiones)
+        self.timeout = timeout_ms / 1000.0
+        self.max_en_vuelo = max_en_vuelo
+        self.rng = random.Random(semilla)
+        self.ops = list(mezcla)
+        self.pesos = list(itertools.accumulate(mezcla[op] for op in self.ops))
+        self.datos = itertools.cycle(datos) if datos else None
+        self.libros = libros
+        self.usuarios = usuarios
+        self.prefijo_id = prefijo_id
+
+    def _peticion(self, i: int) -> Dict:
+        op = self.rng.choices(self.ops, cum_weights=self.pesos)[0]
+        if self.datos is not None:
+            fila = next(self.datos)
+            isbn, usuario = fila["isbn"], fila["usuario"]
+        else:
+            isbn = f"Libro{self.rng.randint(1, self.libros)}"
+            usuario = f"usuario{self.rng.randint(1, self.usuarios)}"
+        return {"operacion": op, "isbn": isbn, "usuario": usuario, "id": f"{self.prefijo_id}-{i}"}
+
+    def ejecutar(self, duracion_s: float, calentamiento_s: float = 0.0) -> Dict:
+        context = zmq.Context()
+        conexiones = [ConexionDealer(context, self.endpoint) for _ in range(self.n_conexiones)]
+        resultados = Resultados()
+        intervalo = 1.0 / self.tasa
+        t0 = time.perf_counter() + 0.2   # margen para que conecten los sockets
+        medir_desde = t0 + calentamiento_s
+        fin_envio = medir_desde + duracion_s
+        i = 0
+        en_vuelo = 0
+        enviadas = 0
+        retraso_max = 0.0
+        poller = None
+
+        def medir(programado: float) -> bool:
+            return programado >= medir_desde
+
+        try:
+            while True:
+                ahora = time.perf_counter()
+
+                # Enviar todo lo que ya tocaba, aunque llegue tarde: la latencia cuenta desde `programado`
+                while True:
+                    programado = t0 + i * intervalo
+                    if programado > ahora or programado >= fin_envio:
+                        break
+                    peticion = self._peticion(i)
+                    op = peticion["operacion"]
+                    conn = conexiones[i % self.n_conexiones]
+                    i += 1
+                    if en_vuelo >= self.max_en_vuelo:
+                        if medir(programado):
+                            resultados.perdida(op, (ahora - programado) * 1e6, "no_enviadas")
+                        continue
+                    conn.socket.send_multipart([b"", json.dumps(peticion).encode("utf-8")])
+                    enviado = time.perf_counter()
+                    conn.pendientes.append((programado, enviado, op))
+                    en_vuelo += 1
+                    if medir(programado):
+                        enviadas += 1
+                        retraso_max = max(retraso_max, enviado - programado)
+
+                termino_envio = t0 + i * intervalo >= fin_envio
+                if termino_envio and en_vuelo == 0:
+                    break
+                if termino_envio and ahora > fin_envio + self.timeout:
+                    break
+
+                # Dormir hasta la próxima petición programada o hasta que llegue una respuesta
+                if poller is None:
+                    poller = zmq.Poller()
+                    for conn in conexiones:
+                        poller.register(conn.socket, zmq.POLLIN)
+                espera = 0.1 if termino_envio else max(0.0, t0 + i * intervalo - time.perf_counter())
+                eventos = dict(poller.poll(espera * 1000))
+
+                ahora = time.perf_counter()
+                for conn in conexiones:
+                    if conn.socket in eventos:
+                        while True:
+                            try:
+                                partes = conn.socket.recv_multipart(zmq.NOBLOCK)
+                            except zmq.Again:
+                                break
+                            if not conn.pendientes:
+                                continue  # respuesta tardía de algo ya dado por perdido
+                            programado, enviado, op = conn.pendientes.popleft()
+                            en_vuelo -= 1
+                            recibido = time.perf_counter()
+                            if not medir(programado):
+                                continue
+                            try:
+                                exito = bool(json.loads(partes[-1]).get("exito"))
+                            except ValueError:
+                                exito = False
+                            resultados.respuesta(op, (recibido - programado) * 1e6, (recibido - enviado) * 1e6, exito)
+                    if conn.pendientes and ahora - conn.pendientes[0][1] > self.timeout:
+                        # FIFO roto a partir de aquí: todo lo pendiente de este socket se pierde
+                        for programado, _, op in conn.pendientes:
+                            if medir(programado):
+                                resultados.perdida(op, (ahora - programado) * 1e6, "timeouts")
+                        en_vuelo -= len(conn.pendientes)
+                        print(f"[CargaAbierta] Timeout en una conexión: {len(conn.pendientes)} peticiones perdidas, "
+                              f"se rehace el socket", file=sys.stderr)
+                        conn.rehacer()
+                        poller = None
+
+            # Lo que quede sin respuesta al cortar cuenta como timeout
+            ahora = time.perf_counter()
+            for conn in conexiones:
+                for programado, _, op in conn.pendientes:
+                    if medir(programado):
+                        resultados.perdida(op, (ahora - programado) * 1e6, "timeouts")
+        finally:
+            for conn in conexiones:
+                conn.socket.close(0)
+            context.term()
+
+        return {
+            "tasa_objetivo": self.tasa,
+            "duracion_s": duracion_s,
+            "enviadas": enviadas,
+            "retraso_max_envio_ms": round(retraso_max * 1000, 3),
+            "operaciones": resultados.a_dict(),
+        }
+
+
+def fusionar(parciales: List[Dict]) -> Dict:
+    """Junta los resultados de varios procesos generadores (histogramas sumados)."""
+    total = {
+        "tasa_objetivo": sum(p["tasa_objetivo"] for p in parciales),
+        "duracion_s": max(p["duracion_s"] for p in parciales),
+        "enviadas": sum(p["enviadas"] for p in parciales),
+        "retraso_max_envio_ms": max(p["retraso_max_envio_ms"] for p in parciales),
+        "operaciones": {},
+    }
+    for parcial in parciales:
+        for op, datos in parcial["operaciones"].items():
+            acumulado = total["operaciones"].setdefault(op, {
+                "contadores": {}, "latencia": Histograma().a_dict(), "servicio": Histograma().a_dict()})
+            for k, n in datos["contadores"].items():
+                acumulado["contadores"][k] = acumulado["contadores"].get(k, 0) + n
+            for clave in ("latencia", "servicio"):
+                h = Histograma.desde_dict(acumulado[clave])
+                h.fusionar(Histograma.desde_dict(datos[clave]))
+                acumulado[clave] = h.a_dict()
+    return total
+
+
+def resumir(resultado: Dict) -> Dict:
+    """Añade percentiles, throughput y tasa de error por operación y en total."""
+    duracion = resultado["duracion_s"]
+    resumen = {k: v for k, v in resultado.items() if k != "operaciones"}
+    resumen["operaciones"] = {}
+    lat_total, serv_total, cont_total = Histograma(), Histograma(), {}
+    for op, datos in sorted(resultado["operaciones"].items()):
+        lat = Histograma.desde_dict(datos["latencia"])
+        serv = Histograma.desde_dict(datos["servicio"])
+        lat_total.fusionar(lat)
+        serv_total.fusionar(serv)
+        for k, n in datos["contadores"].items():
+            cont_total[k] = cont_total.get(k, 0) + n
+        resumen["operaciones"][op] = _resumen_op(datos["contadores"], lat, serv, duracion)
+    resumen["total"] = _resumen_op(cont_total, lat_total, serv_total, duracion)
+    return resumen
+
+
+def _resumen_op(contadores: Dict[str, int], lat: Histograma, serv: Histograma, duracion: float) -> Dict:
+    respondidas = contadores.get("ok", 0) + contadores.get("rechazadas", 0)
+    perdidas = contadores.get("timeouts", 0) + contadores.get("no_enviadas", 0)
+    return {
+        **contadores,
+        "throughput_rps": round(respondidas / duracion, 2) if duracion else None,
+        "tasa_error": round(perdidas / (respondidas + perdidas), 4) if respondidas + perdidas else 0.0,
+        "latencia_us": lat.resumen(),
+        "servicio_us": serv.resumen(),
+    }
+
+
+def imprimir(resumen: Dict, cabecera: Optional[str] = None) -> None:
+    if cabecera is None:
+        cabecera = (f"Tasa objetivo: {resumen['tasa_objetivo']:g} req/s durante {resumen['duracion_s']:g} s "
+                    f"({resumen['enviadas']} enviadas, retraso máximo de envío {resumen['retraso_max_envio_ms']} ms)")
+        if resumen["retraso_max_envio_ms"] > 10:
+            cabecera += "\n  AVISO: el generador no siguió el ritmo; usa más --procesos o baja la tasa"
+    print(f"\n{cabecera}")
+    columnas = f"{'operacion':<12} {'ok':>8} {'rech':>6} {'t/o':>6} {'rps':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'p99.9':>9} {'max':>9}"
+    print(columnas)
+    print("-" * len(columnas))
+    filas = list(resumen["operaciones"].items()) + [("TOTAL", resumen["total"])]
+    for op, r in filas:
+        lat = r["latencia_us"]
+        ms = lambda v: f"{v / 1000:.1f}" if v is not None else "-"
+        print(f"{op:<12} {r.get('ok', 0):>8} {r.get('rechazadas', 0):>6} "
+              f"{r.get('timeouts', 0) + r.get('no_enviadas', 0):>6} {r['throughput_rps'] or 0:>9.1f} "
+              f"{ms(lat['p50']):>9} {ms(lat['p90']):>9} {ms(lat['p99']):>9} {ms(lat['p99.9']):>9} {ms(lat['max']):>9}")
+    print("(latencias en ms, medidas desde el instante programado)")
+
+
+def _proceso(config: Dict) -> Dict:
+    generador = GeneradorAbierto(**config["generador"])
+    return generador.ejecutar(config["duracion"], config["calentamiento"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga de lazo abierto contra el GC con histogramas de latencia")
+    parser.add_argument("--endpoint", default=GESTOR_CARGA_ADDR, help="REP del GC (GESTOR_CARGA_ADDR)")
+    parser.add_argument("--tasa", type=float, required=True, help="peticiones por segundo (total)")
+    parser.add_argument("--duracion", type=float, default=60, help="segundos de medición")
+    parser.add_argument("--calentamiento", type=float, default=5, help="segundos iniciales que no se miden")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO, help="pesos por operación, p.ej. consulta=5,prestamo=1")
+    parser.add_argument("--conexiones", type=int, default=4, help="sockets DEALER por proceso")
+    parser.add_argument("--procesos", type=int, default=1, help="procesos generadores (la tasa se reparte)")
+    parser.add_argument("--timeout-ms", type=int, default=10000)
+    parser.add_argument("--max-en-vuelo", type=int, default=100000,
+                        help="peticiones sin respuesta por proceso a partir de las cuales se dejan de enviar")
+    parser.add_argument("--datos", help="fichero de solicitudes (RENO/PRES/DEVO/CONS isbn usuario) del que tomar ISBN y usuario")
+    parser.add_argument("--libros", type=int, default=1000, help="ISBN sintéticos Libro1..N si no hay --datos")
+    parser.add_argument("--usuarios", type=int, default=1000, help="usuarios sintéticos usuario1..N si no hay --datos")
+    parser.add_argument("--semilla", type=int)
+    parser.add_argument("--salida", help="guarda el resultado (resumen + histogramas) en este JSON")
+    args = parser.parse_args()
+
+    mezcla = parsear_mezcla(args.mezcla)
+    datos = list(leer_solicitudes(args.datos)) if args.datos else None
+    procesos = max(1, args.procesos)
+    configs = []
+    for n in range(procesos):
+        configs.append({
+            "duracion": args.duracion,
+            "calentamiento": args.calentamiento,
+            "generador": {
+                "endpoint": args.endpoint,
+                "tasa": args.tasa / procesos,
+                "mezcla": mezcla,
+                "datos": datos,
+                "conexiones": args.conexiones,
+                "timeout_ms": args.timeout_ms,
+                "max_en_vuelo": args.max_en_vuelo,
+                "semilla": None if args.semilla is None else args.semilla + n,
+                "libros": args.libros,
+                "usuarios": args.usuarios,
+                "prefijo_id": f"ca{os.getpid()}-{n}",
+            },
+        })
+
+    print(f"[CargaAbierta] {args.tasa:g} req/s contra {args.endpoint} "
+          f"({procesos} proceso(s) x {args.conexiones} conexiones), mezcla {mezcla}")
+    if procesos == 1:
+        resultado = _proceso(configs[0])
+    else:
+        with multiprocessing.Pool(procesos) as pool:
+            resultado = fusionar(pool.map(_proceso, configs))
+
+    resumen = resumir(resultado)
+    imprimir(resumen)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"resumen": resumen, "histogramas": resultado["operaciones"],
+                       "mezcla": mezcla, "endpoint": args.endpoint}, f, indent=2)
+        print(f"[CargaAbierta] Resultado guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,147 @@
-from locust import User, task, between, events
-import zmq
+"""
+Usuarios Locust contra el GC, uno por operación: préstamo, renovación,
+devolución y consulta. El peso de cada clase se configura por entorno
+(LOCUST_PESO_<OPERACION>), y con `locust ... RenovacionUser` se puede
+lanzar una sola.
+
+Cada usuario mantiene un único socket REQ durante toda la prueba. Si una
+respuesta no llega en LOCUST_TIMEOUT_MS, el socket queda bloqueado en
+estado REQ, así que se cierra y se abre otro. Los datos de las peticiones se
+cargan una sola vez por proceso (o por worker en modo distribuido), no en
+cada `on_start`.
+
+Se usa zmq.green: con el zmq normal, un recv bloqueante detiene todos los
+greenlets del worker, y los usuarios acaban turnándose en vez de ir en paralelo.
+"""
+import itertools
 import json
-from pathlib import Path
-import time
+import os
 import sys
+import time
+from pathlib import Path
+
+import zmq.green as zmq
+from locust import User, between, events, task
+
+from solicitudes import OPERACIONES, leer_solicitudes
 
 # === Configuración inicial ===
 ROOT = Path(__file__).resolve().parent
-SOLICITUDES = ROOT / "solicitudes.txt"
-
-# Leemos las líneas del archivo una sola vez
-def cargar_renovaciones():
-    renovaciones = []
-    with SOLICITUDES.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            parts = line.split()
-            if len(parts) >= 3 and parts[0].upper() == "RENO":
-                renovaciones.append({"isbn": parts[1], "usuario": parts[2]})
-    return renovaciones
-
-
-# === Clase Locust ===
-class RenovacionUser(User):
-    wait_time = between(0.5, 2)  # intervalo entre solicitudes
+SOLICITUDES = Path(os.getenv("LOCUST_SOLICITUDES", ROOT / "solicitudes.txt"))
+GESTOR_CARGA_ADDR = os.getenv("GESTOR_CARGA_ADDR", "tcp://gestor_carga:5555")
+TIMEOUT_MS = int(os.getenv("LOCUST_TIMEOUT_MS", "10000"))
+ESPERA_MIN = float(os.getenv("LOCUST_ESPERA_MIN", "0.5"))
+ESPERA_MAX = float(os.getenv("LOCUST_ESPERA_MAX", "2"))
+
+
+def _peso(operacion, defecto):
+    return int(os.getenv(f"LOCUST_PESO_{operacion.upper()}", str(defecto)))
+
+
+# Datos por operación, cargados una vez por proceso. Las operaciones sin
+# líneas propias en el fichero usan los pares (isbn, usuario) del resto.
+_datos = None
+
+
+def datos_de(operacion):
+    global _datos
+    if _datos is None:
+        por_op = {op: [] for op in OPERACIONES}
+        for s in leer_solicitudes(SOLICITUDES):
+            por_op[s["operacion"]].append({"isbn": s["isbn"], "usuario": s["usuario"]})
+        todos = [d for lista in por_op.values() for d in lista]
+        if not todos:
+            raise RuntimeError(f"{SOLICITUDES} no tiene solicitudes válidas")
+        _datos = {op: (lista or todos) for op, lista in por_op.items()}
+        print(f"[LOCUST] Solicitudes cargadas de {SOLICITUDES}: "
+              f"{ {op: len(l) for op, l in por_op.items()} }", file=sys.stderr)
+    return _datos[operacion]
+
+
+# === Clases Locust ===
+class UsuarioGC(User):
+    """Base: un socket REQ persistente y una petición `operacion` por tarea."""
+    abstract = True
+    wait_time = between(ESPERA_MIN, ESPERA_MAX)  # intervalo entre solicitudes
+    operacion = None
 
     def on_start(self):
         """Se ejecuta al iniciar cada usuario Locust"""
-        self.context = zmq.Context()
-        self.renovaciones = cargar_renovaciones()
-        self.indice = 0
-        print(f"[LOCUST] Usuario iniciado. Renovaciones cargadas: {len(self.renovaciones)}", file=sys.stderr)
+        self.context = zmq.Context.instance()
+        self.socket = None
+        self._abrir()
+        # Cada usuario empieza en un punto distinto para no pedir todos lo mismo a la vez
+        datos = datos_de(self.operacion)
+        self.datos = itertools.islice(itertools.cycle(datos), id(self) % len(datos), None)
+
+    def _abrir(self):
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.setsockopt(zmq.RCVTIMEO, TIMEOUT_MS)
+        self.socket.setsockopt(zmq.SNDTIMEO, TIMEOUT_MS)
+        self.socket.connect(GESTOR_CARGA_ADDR)
+
+    def _reabrir(self):
+        # Un REQ sin respuesta no admite otro send: hay que cambiar de socket
+        self.socket.close(0)
+        self._abrir()
 
     @task
-    def enviar_renovacion(self):
-        """Envía una renovación y mide tiempo de respuesta"""
-        # Crear nuevo socket para cada request (patrón ZMQ REQ/REP)
-        socket_req = self.context.socket(zmq.REQ)
-        socket_req.setsockopt(zmq.RCVTIMEO, 10000)  # timeout 10 segundos
-        socket_req.setsockopt(zmq.SNDTIMEO, 10000)
-        
+    def enviar(self):
+        """Envía una petición y reporta a Locust el tiempo de respuesta"""
+        data = next(self.datos)
+        pet = {
+            "operacion": self.operacion,
+            "isbn": data["isbn"],
+            "usuario": data["usuario"],
+            "id": f"{data['isbn']}_{data['usuario']}_{time.time()}"
+        }
+        start_time = time.perf_counter()
         try:
-            socket_req.connect("tcp://gestor_carga:5555")
-            
-            # Obtener datos rotando por el array
-            data = self.renovaciones[self.indice % len(self.renovaciones)]
-            self.indice += 1
-
-            pet = {
-                "operacion": "renovacion",
-                "isbn": data["isbn"],
-                "usuario": data["usuario"],
-                "id": f"{data['isbn']}_{data['usuario']}_{time.time()}"
-            }
-
-            start_time = time.time()
-            
-            # Enviar petición
-            socket_req.send_json(pet)
-            
-            # Recibir respuesta
-            resp = socket_req.recv_json()
-            total_time = (time.time() - start_time) * 1000  # ms
-
-            # Reportar éxito a Locust
-            events.request.fire(
-                request_type="ZMQ",
-                name="renovacion",
-                response_time=total_time,
-                response_length=len(json.dumps(resp)),
-                exception=None,
-            )
-            
+            self.socket.send_json(pet)
+            resp = self.socket.recv_json()
         except zmq.error.Again:
-            total_time = (time.time() - start_time) * 1000
-            print("[LOCUST] Timeout esperando respuesta", file=sys.stderr)
-            events.request.fire(
-                request_type="ZMQ",
-                name="renovacion",
-                response_time=total_time,
-                response_length=0,
-                exception=Exception("Timeout"),
-            )
+            print("[LOCUST] Timeout esperando respuesta, se reabre el socket", file=sys.stderr)
+            self._reabrir()
+            self._reportar(start_time, 0, Exception("Timeout"))
         except Exception as e:
-            total_time = (time.time() - start_time) * 1000
             print(f"[LOCUST] Error: {e}", file=sys.stderr)
-            events.request.fire(
-                request_type="ZMQ",
-                name="renovacion",
-                response_time=total_time,
-                response_length=0,
-                exception=e,
-            )
-        finally:
-            socket_req.close()
+            self._reabrir()
+            self._reportar(start_time, 0, e)
+        else:
+            self._reportar(start_time, len(json.dumps(resp)), None)
+
+    def _reportar(self, start_time, longitud, excepcion):
+        events.request.fire(
+            request_type="ZMQ",
+            name=self.operacion,
+            response_time=(time.perf_counter() - start_time) * 1000,  # ms
+            response_length=longitud,
+            exception=excepcion,
+            context={},
+        )
 
     def on_stop(self):
-        """Cierra el contexto ZMQ"""
-        self.context.term()
+        """Cierra el socket del usuario (el contexto es compartido)"""
+        if self.socket is not None:
+            self.socket.close(0)
+
+
+class PrestamoUser(UsuarioGC):
+    operacion = "prestamo"
+    weight = _peso("prestamo", 1)
+
+
+class RenovacionUser(UsuarioGC):
+    operacion = "renovacion"
+    weight = _peso("renovacion", 3)
+
+
+class DevolucionUser(UsuarioGC):
+    operacion = "devolucion"
+    weight = _peso("devolucion", 1)
+
+
+class ConsultaUser(UsuarioGC):
+    operacion = "consulta"
+    weight = _peso("consulta", 5)
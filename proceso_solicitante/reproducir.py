@@ -0,0 +1,233 @@
+"""
+Reproducción de trazas de peticiones contra el GC.
+
+Lee la traza en streaming (texto tipo solicitudes.txt o JSONL, también .gz),
+así que la memoria no depende del tamaño del fichero. Hay dos modos:
+
+- `--velocidad X`: respeta los tiempos originales divididos por X (X=5 es
+  el mismo tráfico en una quinta parte del tiempo). Las líneas sin instante
+  van separadas `--intervalo-ms` de la anterior. La latencia se mide desde
+  el instante programado, como en carga_abierta.py.
+- `--max`: tan rápido como se pueda, con `--concurrencia` peticiones en
+  vuelo como máximo.
+
+El orden por usuario se respeta en los dos modos: la siguiente petición de un
+usuario no sale hasta que llega la respuesta de la anterior (una devolución
+nunca adelanta a su préstamo). Con `--copias N` cada petición se repite para
+N usuarios distintos (usuario~1, usuario~2...), que multiplica el volumen sin
+cambiar la forma del tráfico.
+
+Uso (desde proceso_solicitante, con PYTHONPATH=.. fuera de Docker):
+    python reproducir.py trafico.jsonl.gz --velocidad 5 --copias 2
+    python reproducir.py solicitudes.txt --max --concurrencia 64
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Iterator, Optional
+
+import zmq
+
+from carga_abierta import GESTOR_CARGA_ADDR, ConexionDealer, Resultados, imprimir, resumir
+from solicitudes import leer_traza
+
+
+def con_copias(eventos: Iterable[Dict], copias: int) -> Iterator[Dict]:
+    for ev in eventos:
+        yield ev
+        for k in range(1, copias):
+            yield {**ev, "usuario": f"{ev['usuario']}~{k}"}
+
+
+class Reproductor:
+    """
+    Envía los eventos de una traza por `conexiones` DEALER. Cada usuario va
+    siempre por la misma conexión y con una sola petición en vuelo a la vez.
+    """
+
+    def __init__(self, endpoint: str, conexiones: int = 8, velocidad: Optional[float] = 1.0,
+                 concurrencia: int = 64, intervalo_ms: float = 100.0, timeout_ms: int = 10000,
+                 max_esperando: int = 10000):
+        self.endpoint = endpoint
+        self.n_conexiones = max(1, conexiones)
+        self.velocidad = velocidad            # None = lo más rápido posible
+        self.concurrencia = max(1, concurrencia)
+        self.intervalo = intervalo_ms / 1000.0
+        self.timeout = timeout_ms / 1000.0
+        # Peticiones leídas y retenidas por el orden de su usuario; al llegar
+        # aquí se deja de leer la traza hasta que se liberen
+        self.max_esperando = max_esperando
+
+    def ejecutar(self, eventos: Iterable[Dict]) -> Dict:
+        context = zmq.Context()
+        conexiones = [ConexionDealer(context, self.endpoint) for _ in range(self.n_conexiones)]
+        poller = zmq.Poller()
+        for conn in conexiones:
+            poller.register(conn.socket, zmq.POLLIN)
+        resultados = Resultados()
+        esperando: Dict[str, deque] = defaultdict(deque)  # usuario -> [(programado, evento)]
+        ocupados = set()                                   # usuarios con una petición en vuelo
+        estado = {"en_vuelo": 0, "esperando": 0, "enviadas": 0, "retraso_max": 0.0, "n": 0}
+
+        fuente = iter(eventos)
+        siguiente = next(fuente, None)
+        t0 = time.perf_counter() + 0.2   # margen para que conecten los sockets
+        t_traza = {"inicio": None, "ultimo": None}
+
+        def programado_de(ev: Dict) -> Optional[float]:
+            if self.velocidad is None:
+                return None
+            t = ev.get("t")
+            if t is None:
+                t = (t_traza["ultimo"] + self.intervalo) if t_traza["ultimo"] is not None else 0.0
+            if t_traza["inicio"] is None:
+                t_traza["inicio"] = t
+            t_traza["ultimo"] = t
+            return t0 + (t - t_traza["inicio"]) / self.velocidad
+
+        def enviar(programado: float, ev: Dict, retenida: bool = False) -> None:
+            usuario = ev["usuario"]
+            conn = conexiones[hash(usuario) % self.n_conexiones]
+            estado["n"] += 1
+            peticion = {"operacion": ev["operacion"], "isbn": ev["isbn"], "usuario": usuario,
+                        "id": f"replay-{estado['n']}"}
+            conn.socket.send_multipart([b"", json.dumps(peticion).encode("utf-8")])
+            enviado = time.perf_counter()
+            conn.pendientes.append((programado, enviado, ev["operacion"], usuario))
+            ocupados.add(usuario)
+            estado["en_vuelo"] += 1
+            estado["enviadas"] += 1
+            if not retenida:
+                # Lo que esperó por el orden de su usuario no es retraso del reproductor
+                estado["retraso_max"] = max(estado["retraso_max"], enviado - programado)
+
+        def liberar(usuario: str) -> None:
+            ocupados.discard(usuario)
+            cola = esperando.get(usuario)
+            if cola:
+                programado, ev = cola.popleft()
+                estado["esperando"] -= 1
+                if not cola:
+                    del esperando[usuario]
+                enviar(programado, ev, retenida=True)
+
+        programado_siguiente = programado_de(siguiente) if siguiente is not None else None
+        try:
+            while True:
+                ahora = time.perf_counter()
+                # Admitir los eventos que ya tocan
+                while siguiente is not None and estado["esperando"] < self.max_esperando:
+                    if self.velocidad is None:
+                        if estado["en_vuelo"] + estado["esperando"] >= self.concurrencia:
+                            break
+                        programado_siguiente = ahora   # sin tiempos: cuenta desde que entra
+                    elif programado_siguiente > ahora:
+                        break
+                    if siguiente["usuario"] in ocupados:
+                        esperando[siguiente["usuario"]].append((programado_siguiente, siguiente))
+                        estado["esperando"] += 1
+                    else:
+                        enviar(programado_siguiente, siguiente)
+                    siguiente = next(fuente, None)
+                    programado_siguiente = programado_de(siguiente) if siguiente is not None else None
+
+                if siguiente is None and estado["en_vuelo"] == 0 and estado["esperando"] == 0:
+                    break
+
+                if siguiente is None or estado["esperando"] >= self.max_esperando or self.velocidad is None:
+                    espera = 0.1
+                else:
+                    espera = max(0.0, programado_siguiente - time.perf_counter())
+                eventos_zmq = dict(poller.poll(espera * 1000))
+
+                ahora = time.perf_counter()
+                for conn in conexiones:
+                    if conn.socket in eventos_zmq:
+                        while True:
+                            try:
+                                partes = conn.socket.recv_multipart(zmq.NOBLOCK)
+                            except zmq.Again:
+                                break
+                            if not conn.pendientes:
+                                continue
+                            programado, enviado, op, usuario = conn.pendientes.popleft()
+                            estado["en_vuelo"] -= 1
+                            recibido = time.perf_counter()
+                            try:
+                                exito = bool(json.loads(partes[-1]).get("exito"))
+                            except ValueError:
+                                exito = False
+                            resultados.respuesta(op, (recibido - programado) * 1e6, (recibido - enviado) * 1e6, exito)
+                            liberar(usuario)
+                    if conn.pendientes and ahora - conn.pendientes[0][1] > self.timeout:
+                        perdidas = list(conn.pendientes)
+                        print(f"[Reproductor] Timeout en una conexión: {len(perdidas)} peticiones perdidas, "
+                              f"se rehace el socket", file=sys.stderr)
+                        poller.unregister(conn.socket)
+                        conn.rehacer()
+                        poller.register(conn.socket, zmq.POLLIN)
+                        estado["en_vuelo"] -= len(perdidas)
+                        for programado, _, op, usuario in perdidas:
+                            resultados.perdida(op, (ahora - programado) * 1e6, "timeouts")
+                            liberar(usuario)
+        finally:
+            for conn in conexiones:
+                conn.socket.close(0)
+            context.term()
+
+        duracion = max(time.perf_counter() - t0, 1e-9)
+        return {
+            "tasa_objetivo": self.velocidad,
+            "duracion_s": round(duracion, 3),
+            "enviadas": estado["enviadas"],
+            "retraso_max_envio_ms": round(estado["retraso_max"] * 1000, 3),
+            "operaciones": resultados.a_dict(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una traza de peticiones contra el GC")
+    parser.add_argument("traza", help="fichero de texto (RENO|PRES|DEVO|CONS isbn usuario) o JSONL, opcionalmente .gz")
+    parser.add_argument("--formato", choices=("texto", "jsonl"), help="por defecto se deduce de la extensión")
+    parser.add_argument("--endpoint", default=GESTOR_CARGA_ADDR, help="REP del GC (GESTOR_CARGA_ADDR)")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--velocidad", type=float, default=1.0, help="factor sobre los tiempos originales")
+    modo.add_argument("--max", action="store_true", help="lo más rápido posible, limitado por --concurrencia")
+    parser.add_argument("--concurrencia", type=int, default=64, help="peticiones en vuelo como máximo con --max")
+    parser.add_argument("--conexiones", type=int, default=8, help="sockets DEALER")
+    parser.add_argument("--intervalo-ms", type=float, default=100,
+                        help="separación de las líneas sin instante (texto) con --velocidad")
+    parser.add_argument("--copias", type=int, default=1, help="repite cada petición para N usuarios distintos")
+    parser.add_argument("--timeout-ms", type=int, default=10000)
+    parser.add_argument("--salida", help="guarda el resultado (resumen + histogramas) en este JSON")
+    args = parser.parse_args()
+
+    if args.velocidad is not None and args.velocidad <= 0:
+        parser.error("--velocidad debe ser > 0")
+    reproductor = Reproductor(
+        args.endpoint,
+        conexiones=args.conexiones,
+        velocidad=None if args.max else args.velocidad,
+        concurrencia=args.concurrencia,
+        intervalo_ms=args.intervalo_ms,
+        timeout_ms=args.timeout_ms,
+    )
+    modo_txt = f"--max, concurrencia {args.concurrencia}" if args.max else f"velocidad x{args.velocidad:g}"
+    print(f"[Reproductor] {args.traza} contra {args.endpoint} ({modo_txt}, {args.copias} copia(s))")
+    resultado = reproductor.ejecutar(con_copias(leer_traza(args.traza, args.formato), max(1, args.copias)))
+
+    resumen = resumir(resultado)
+    imprimir(resumen, f"Reproducidas {resumen['enviadas']} peticiones en {resumen['duracion_s']:g} s "
+                      f"({resumen['enviadas'] / resumen['duracion_s']:.1f} req/s, retraso máximo del "
+                      f"reproductor {resumen['retraso_max_envio_ms']} ms)")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"resumen": resumen, "histogramas": resultado["operaciones"],
+                       "traza": args.traza, "endpoint": args.endpoint}, f, indent=2)
+        print(f"[Reproductor] Resultado guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
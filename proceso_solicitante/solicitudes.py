@@ -0,0 +1,122 @@
+"""
+Lectura de ficheros de solicitudes (solicitudes.txt, devoluciones.txt) y
+de trazas JSONL.
+
+Texto: una petición por línea, "<OP> <isbn> [usuario]", donde OP es PRES,
+RENO, DEVO o CONS; las líneas vacías y las que empiezan por # se ignoran.
+JSONL: un objeto por línea con la operación, el ISBN, el usuario y,
+opcionalmente, el instante de la petición (ver `leer_traza`).
+
+Todo se lee línea a línea (también .gz), así que sirve igual para ficheros
+de millones de líneas.
+"""
+import gzip
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+PREFIJOS = {
+    "PRES": "prestamo",
+    "RENO": "renovacion",
+    "DEVO": "devolucion",
+    "CONS": "consulta",
+}
+OPERACIONES = tuple(PREFIJOS.values())
+USUARIO_POR_DEFECTO = "usuario_demo"
+
+
+# Nombres de campo aceptados en las trazas JSONL, en orden de preferencia
+CAMPOS_OPERACION = ("operacion", "tipoOperacion", "topico", "op")
+CAMPOS_USUARIO = ("usuario", "idUsuario", "user")
+CAMPOS_INSTANTE = ("t", "ts", "timestamp", "fecha", "fechaOperacion", "date")
+
+
+def _abrir(path: Union[str, Path]):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+def leer_solicitudes(path: Union[str, Path]) -> Iterator[Dict[str, str]]:
+    """Genera {"operacion", "isbn", "usuario"} por cada línea válida del fichero."""
+    with _abrir(path) as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+            operacion = PREFIJOS.get(parts[0].upper())
+            if operacion is None or len(parts) < 2:
+                continue
+            # Formato antiguo sin usuario
+            usuario = parts[2] if len(parts) >= 3 else USUARIO_POR_DEFECTO
+            yield {"operacion": operacion, "isbn": parts[1], "usuario": usuario}
+
+
+def _instante(valor) -> Optional[float]:
+    """Epoch en segundos a partir de un número (s o ms) o de una fecha ISO 8601."""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, (int, float)):
+        return valor / 1000.0 if valor > 1e11 else float(valor)
+    try:
+        return float(valor)
+    except ValueError:
+        return datetime.fromisoformat(str(valor).replace("Z", "+00:00")).timestamp()
+
+
+def _primero(obj: Dict, campos):
+    for campo in campos:
+        if obj.get(campo) not in (None, ""):
+            return obj[campo]
+    return None
+
+
+def leer_jsonl(path: Union[str, Path]) -> Iterator[Dict]:
+    """
+    Genera {"operacion", "isbn", "usuario", "t"} por cada línea JSON con una
+    operación conocida; "t" es el instante de la petición en epoch (o None).
+    Las líneas que no se pueden interpretar se saltan.
+    """
+    with _abrir(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(obj, dict):
+                continue
+            operacion = str(_primero(obj, CAMPOS_OPERACION) or "").lower()
+            operacion = PREFIJOS.get(operacion.upper(), operacion)
+            if operacion not in OPERACIONES or not obj.get("isbn"):
+                continue
+            try:
+                t = _instante(_primero(obj, CAMPOS_INSTANTE))
+            except ValueError:
+                t = None
+            yield {
+                "operacion": operacion,
+                "isbn": str(obj["isbn"]),
+                "usuario": str(_primero(obj, CAMPOS_USUARIO) or USUARIO_POR_DEFECTO),
+                "t": t,
+            }
+
+
+def leer_traza(path: Union[str, Path], formato: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Lee una traza en el formato indicado ("jsonl" o "texto"); sin formato se
+    deduce de la extensión (.jsonl/.json, también comprimidos con .gz). Las
+    líneas de texto no llevan instante: "t" es None.
+    """
+    if formato is None:
+        nombre = Path(path).name
+        if nombre.endswith(".gz"):
+            nombre = nombre[:-3]
+        formato = "jsonl" if nombre.endswith((".jsonl", ".json")) else "texto"
+    if formato == "jsonl":
+        return leer_jsonl(path)
+    return ({**s, "t": None} for s in leer_solicitudes(path))
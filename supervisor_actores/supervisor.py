@@ -0,0 +1,507 @@
+"""
+Supervisor / autoescalador de un actor en la máquina local.
+
+Ocupa los puertos públicos del actor (ROUTER de peticiones síncronas y PUB de
+resultados) y reparte el trabajo entre N procesos hijos del actor, que
+arranca en modo supervisado (ver common/actors/base.py):
+
+  GC --REQ--> ROUTER :puerto --> ROUTER 127.0.0.1 <--REQ-- workers de cada hijo
+  GC --PUB--> SUB (seq)      --> ROUTER 127.0.0.1 <--DEALER-- cada hijo
+  hijos --PUB--> XSUB 127.0.0.1 --> XPUB :puerto_resultados --> suscriptores
+
+Las peticiones van al worker que lleva más tiempo libre (LRU: cada worker
+avisa con LISTO) y los eventos a los hijos por turno, siempre por identidad,
+así que el supervisor sabe qué tiene cada hijo. Los sockets internos se
+enlazan a un puerto libre que elige el sistema, y cada hijo informa del
+puerto de su HealthResponder al darse de alta.
+
+Cada SUP_INTERVALO_S mide la carga por worker: peticiones en curso en el
+broker (media por la ley de Little) más los eventos en la cola de cada hijo,
+que pregunta a su HealthResponder. Si supera SUP_UMBRAL_ALTO (o el p90 de
+latencia supera SUP_LATENCIA_MAX_MS) durante SUP_INTERVALOS_SUBIR intervalos
+seguidos arranca un hijo más; si queda por debajo de SUP_UMBRAL_BAJO durante
+SUP_INTERVALOS_BAJAR intervalos retira el más nuevo: deja de enviarle trabajo,
+espera (hasta SUP_DRENAJE_S) a que responda lo que tiene en curso y vacíe su
+cola de eventos, y solo entonces le envía SIGINT. Tras cada cambio espera
+SUP_ENFRIAMIENTO_S antes de volver a decidir, y nunca sale de [--min, --max].
+
+Uso:
+    python supervisor.py --actor renovacion --min 1 --max 4
+"""
+import argparse
+import json
+import os
+import itertools
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import zmq
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from common.metrics.histograma import Histograma  # noqa: E402
+
+# actor -> (script, topic, puerto ROUTER, puerto PUB de resultados)
+ACTORES = {
+    "prestamo": ("actor_prestamo/prestamo.py", "prestamo", 5560, 5563),
+    "renovacion": ("actor_renovacion/renovacion.py", "renovacion", 5561, 5564),
+    "devolucion": ("actor_devolucion/devolucion.py", "devolucion", 5562, 5565),
+}
+
+GESTOR_CARGA_PUB_ADDR = os.getenv("GESTOR_CARGA_PUB_ADDR", "tcp://gestor_carga:5556")
+SUP_INTERVALO_S = float(os.getenv("SUP_INTERVALO_S", "1"))
+SUP_UMBRAL_ALTO = float(os.getenv("SUP_UMBRAL_ALTO", "0.8"))
+SUP_UMBRAL_BAJO = float(os.getenv("SUP_UMBRAL_BAJO", "0.2"))
+SUP_LATENCIA_MAX_MS = float(os.getenv("SUP_LATENCIA_MAX_MS", "0"))  # 0 = no se mira la latencia
+SUP_INTERVALOS_SUBIR = int(os.getenv("SUP_INTERVALOS_SUBIR", "3"))
+SUP_INTERVALOS_BAJAR = int(os.getenv("SUP_INTERVALOS_BAJAR", "10"))
+SUP_ENFRIAMIENTO_S = float(os.getenv("SUP_ENFRIAMIENTO_S", "15"))
+SUP_SALUD_TIMEOUT_MS = int(os.getenv("SUP_SALUD_TIMEOUT_MS", "300"))
+SUP_DRENAJE_S = float(os.getenv("SUP_DRENAJE_S", "10"))
+ACTOR_WORKERS = int(os.getenv("ACTOR_WORKERS", "4"))
+ACTOR_COLA_EVENTOS = int(os.getenv("ACTOR_COLA_EVENTOS", "10000"))
+LISTO = b"LISTO"  # mismo valor que common/actors/base.py
+LOCAL = "tcp://127.0.0.1:*"  # puerto libre elegido al enlazar
+
+
+def _enlazar(socket: zmq.Socket, endpoint: str) -> str:
+    """Enlaza y devuelve el endpoint real (con el puerto si era comodín)."""
+    socket.bind(endpoint)
+    return socket.getsockopt_string(zmq.LAST_ENDPOINT)
+
+
+class Hijo:
+    """Proceso del actor arrancado por el supervisor."""
+
+    def __init__(self, id: str, script: str, env: Dict[str, str]):
+        self.id = id
+        # El hijo enlaza su HealthResponder en un puerto libre y lo comunica al darse de alta
+        self.salud_endpoint: Optional[str] = None
+        env = dict(env, ACTOR_HIJO_ID=id, ACTOR_SALUD_ADDR=LOCAL)
+        self.proceso = subprocess.Popen([sys.executable, "-u", script], env=env, cwd=os.path.dirname(script))
+        self.inicio = time.monotonic()
+        self.estado: Dict[str, Any] = {}
+
+    @property
+    def pid(self) -> int:
+        return self.proceso.pid
+
+    def vivo(self) -> bool:
+        return self.proceso.poll() is None
+
+    def consultar(self, context: zmq.Context) -> Optional[Dict[str, Any]]:
+        """Pregunta la carga al HealthResponder del hijo; None si no contesta a tiempo."""
+        if self.salud_endpoint is None:
+            return None
+        req = context.socket(zmq.REQ)
+        req.linger = 0
+        req.RCVTIMEO = SUP_SALUD_TIMEOUT_MS
+        req.connect(self.salud_endpoint)
+        try:
+            req.send_json({"accion": "salud"})
+            self.estado = req.recv_json()
+            return self.estado
+        except zmq.Again:
+            return None
+        finally:
+            req.close(0)
+
+    def retirar(self, timeout: float = 5.0) -> None:
+        """SIGINT para que el actor termine lo que tenga en curso y cierre sus sockets."""
+        if not self.vivo():
+            return
+        if os.name == "nt":
+            self.proceso.terminate()
+        else:
+            self.proceso.send_signal(signal.SIGINT)
+        try:
+            self.proceso.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+            self.proceso.wait()
+
+
+class Supervisor:
+    def __init__(self, actor: str, minimo: int, maximo: int, context: Optional[zmq.Context] = None):
+        if actor not in ACTORES:
+            raise ValueError(f"Actor desconocido: {actor} (válidos: {', '.join(ACTORES)})")
+        script, self.topic, puerto, puerto_resultados = ACTORES[actor]
+        self.actor = actor
+        self.nombre = f"Supervisor {actor}"
+        self.script = os.path.join(RAIZ, script)
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.context = context or zmq.Context.instance()
+        self.frontend_endpoint = f"tcp://*:{puerto}"
+        self.resultados_endpoint = f"tcp://*:{puerto_resultados}"
+        # Endpoints internos: se conocen al enlazar (_abrir_sockets)
+        self.backend_endpoint = self.eventos_endpoint = self.xsub_endpoint = None
+        self._sockets: Dict[str, zmq.Socket] = {}
+
+        self.hijos: List[Hijo] = []
+        self._ids = itertools.count(1)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Métricas del broker, que el hilo de control lee y reinicia cada intervalo
+        self._pendientes: Dict[tuple, deque] = {}
+        self._en_curso = 0
+        self._ocupado = 0.0  # segundos de petición completados en el intervalo
+        self._latencias = Histograma()
+        self._ultimo_seq: Dict[str, int] = {}
+        self.eventos_perdidos = 0
+        self.escalados = {"subidas": 0, "bajadas": 0}
+        # Reparto por hijo (protegido por _lock): workers libres en orden LRU,
+        # peticiones en curso y eventos enviados a cada hijo, hijos dados de alta
+        # para eventos y los que se están retirando (ya no reciben trabajo)
+        self._libres: deque = deque()
+        self._en_curso_hijo: Dict[str, int] = {}
+        self._eventos_enviados: Dict[str, int] = {}
+        self._alta: List[str] = []
+        self._turno = 0
+        self._retirando: set = set()
+        self._eventos_sin_hijo: deque = deque()
+        self.eventos_descartados = 0
+        self._en_espera: deque = deque()  # peticiones leídas cuyo worker libre resultó no valer
+
+    # Procesos hijos
+    def _env_hijo(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.pop("ACTOR_RESULTADOS_ADDR", None)
+        env.update({
+            "PYTHONPATH": os.pathsep.join(p for p in (RAIZ, env.get("PYTHONPATH")) if p),
+            "ACTOR_BACKEND_ADDR": self.backend_endpoint,
+            "ACTOR_EVENTOS_ADDR": self.eventos_endpoint,
+            "ACTOR_RESULTADOS_CONNECT": self.xsub_endpoint,
+            "GESTOR_CARGA_PUB_ADDR": GESTOR_CARGA_PUB_ADDR,
+        })
+        return env
+
+    def arrancar_hijo(self) -> Hijo:
+        hijo = Hijo(f"h{next(self._ids)}", self.script, self._env_hijo())
+        self.hijos.append(hijo)
+        print(f"[{self.nombre}] Hijo {hijo.id} arrancado pid={hijo.pid} ({len(self.hijos)} en total)")
+        return hijo
+
+    def retirar_hijo(self, drenar: bool = True) -> None:
+        # El más nuevo primero: los antiguos tienen la caché más caliente
+        hijo = self.hijos.pop()
+        print(f"[{self.nombre}] Retirando hijo {hijo.id} pid={hijo.pid} ({len(self.hijos)} quedan)")
+        with self._lock:
+            self._retirando.add(hijo.id)
+        if drenar and hijo.vivo():
+            self._drenar(hijo, SUP_DRENAJE_S)
+        hijo.retirar()
+        with self._lock:
+            self._retirando.discard(hijo.id)
+            self._olvidar(hijo.id)
+
+    def _drenar(self, hijo: Hijo, timeout: float) -> bool:
+        """
+        Espera a que el hijo, que ya no recibe trabajo nuevo, responda las
+        peticiones en curso y procese todos los eventos que se le enviaron.
+        """
+        limite = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                en_curso = self._en_curso_hijo.get(hijo.id, 0)
+                enviados = self._eventos_enviados.get(hijo.id, 0)
+            estado = hijo.consultar(self.context) or {}
+            recibidos = estado.get("eventos", {}).get("recibidos", 0)
+            cola = estado.get("cola_eventos", 0)
+            if estado and en_curso == 0 and recibidos >= enviados and cola == 0 and estado.get("en_curso", 0) == 0:
+                return True
+            if time.monotonic() >= limite or not hijo.vivo():
+                print(f"[{self.nombre}] Hijo {hijo.id} sin drenar tras {timeout}s: {en_curso} petición(es) "
+                      f"en curso, {max(0, enviados - recibidos) + cola} evento(s) sin procesar")
+                return False
+            time.sleep(0.05)
+
+    def _olvidar(self, hijo_id: str) -> None:
+        """Quita el estado de reparto de un hijo que ya no está (con _lock)."""
+        prefijo = f"{hijo_id}/".encode()
+        self._libres = deque(w for w in self._libres if not w.startswith(prefijo))
+        self._en_curso_hijo.pop(hijo_id, None)
+        self._eventos_enviados.pop(hijo_id, None)
+        if hijo_id in self._alta:
+            self._alta.remove(hijo_id)
+
+    @staticmethod
+    def _hijo_de(worker: bytes) -> str:
+        return worker.split(b"/", 1)[0].decode()
+
+    # Broker (hilo principal)
+    def _abrir_sockets(self) -> None:
+        """Enlaza todos los sockets antes de arrancar hijos, que necesitan los endpoints internos."""
+        def socket(tipo):
+            s = self.context.socket(tipo)
+            s.linger = 0
+            return s
+
+        frontend = socket(zmq.ROUTER)
+        frontend.bind(self.frontend_endpoint)
+        backend = socket(zmq.ROUTER)
+        backend.router_mandatory = 1   # un worker de un hijo muerto da error en vez de perder la petición
+        self.backend_endpoint = _enlazar(backend, LOCAL)
+
+        sub = socket(zmq.SUB)
+        sub.connect(GESTOR_CARGA_PUB_ADDR)
+        sub.setsockopt_string(zmq.SUBSCRIBE, self.topic)
+        eventos = socket(zmq.ROUTER)
+        eventos.router_mandatory = 1
+        self.eventos_endpoint = _enlazar(eventos, LOCAL)
+
+        xsub = socket(zmq.XSUB)
+        self.xsub_endpoint = _enlazar(xsub, LOCAL)
+        xpub = socket(zmq.XPUB)
+        xpub.bind(self.resultados_endpoint)
+        self._sockets = {"frontend": frontend, "backend": backend, "sub": sub, "eventos": eventos,
+                         "xsub": xsub, "xpub": xpub}
+
+    def _broker(self) -> None:
+        frontend, backend, sub, eventos, xsub, xpub = (
+            self._sockets[n] for n in ("frontend", "backend", "sub", "eventos", "xsub", "xpub"))
+        poller = zmq.Poller()
+        for s in (backend, sub, eventos, xsub, xpub):
+            poller.register(s, zmq.POLLIN)
+        leyendo_frontend = False
+
+        try:
+            while not self._stop.is_set():
+                # Solo se aceptan peticiones mientras haya un worker libre
+                with self._lock:
+                    hay_libres = bool(self._libres)
+                if hay_libres != leyendo_frontend:
+                    if hay_libres:
+                        poller.register(frontend, zmq.POLLIN)
+                    else:
+                        poller.unregister(frontend)
+                    leyendo_frontend = hay_libres
+                events = dict(poller.poll(500))
+                if frontend in events:
+                    frames = frontend.recv_multipart()
+                    with self._lock:
+                        self._pendientes.setdefault(tuple(frames[:-1]), deque()).append(time.perf_counter())
+                        self._en_curso += 1
+                    if not self._enviar_a_worker(backend, frames):
+                        self._en_espera.append(frames)
+                if backend in events:
+                    worker, _, *frames = backend.recv_multipart()
+                    self._worker_libre(worker, respondio=frames != [LISTO])
+                    if frames != [LISTO]:
+                        self._completada(tuple(frames[:-1]))
+                        frontend.send_multipart(frames)
+                    while self._en_espera and self._enviar_a_worker(backend, self._en_espera[0]):
+                        self._en_espera.popleft()
+                if eventos in events:
+                    self._alta_hijo(*eventos.recv_multipart())
+                    self._reenviar_eventos(eventos)
+                if sub in events:
+                    raw = sub.recv_string()
+                    parts = raw.split(" ", 1)
+                    if len(parts) == 2:
+                        try:
+                            msg = json.loads(parts[1])
+                        except ValueError:
+                            print(f"[{self.nombre}] Evento no es JSON: {parts[1][:100]}")
+                            continue
+                        self._revisar_secuencia(msg)
+                        self._eventos_sin_hijo.append(msg)
+                        self._reenviar_eventos(eventos)
+                if xsub in events:
+                    xpub.send_multipart(xsub.recv_multipart())
+                if xpub in events:
+                    xsub.send_multipart(xpub.recv_multipart())
+        finally:
+            for s in self._sockets.values():
+                s.close(0)
+
+    def _enviar_a_worker(self, backend: zmq.Socket, frames: List[bytes]) -> bool:
+        """Entrega la petición al worker libre más antiguo de un hijo que no se esté retirando."""
+        while True:
+            with self._lock:
+                if not self._libres:
+                    return False
+                worker = self._libres.popleft()
+                hijo_id = self._hijo_de(worker)
+                if hijo_id in self._retirando:
+                    continue
+            try:
+                backend.send_multipart([worker, b"", *frames])
+            except zmq.ZMQError:
+                continue   # el hijo murió: probar con el siguiente
+            with self._lock:
+                self._en_curso_hijo[hijo_id] = self._en_curso_hijo.get(hijo_id, 0) + 1
+            return True
+
+    def _worker_libre(self, worker: bytes, respondio: bool) -> None:
+        hijo_id = self._hijo_de(worker)
+        with self._lock:
+            if respondio:
+                self._en_curso_hijo[hijo_id] = max(0, self._en_curso_hijo.get(hijo_id, 0) - 1)
+            if hijo_id not in self._retirando:
+                self._libres.append(worker)
+
+    def _alta_hijo(self, identidad: bytes, cuerpo: bytes) -> None:
+        """Primer mensaje de un hijo por el canal de eventos: endpoint de su HealthResponder."""
+        hijo_id = identidad.decode()
+        try:
+            alta = json.loads(cuerpo)
+        except ValueError:
+            return
+        for hijo in self.hijos:
+            if hijo.id == hijo_id:
+                hijo.salud_endpoint = alta.get("salud")
+        with self._lock:
+            if hijo_id not in self._alta:
+                self._alta.append(hijo_id)
+        print(f"[{self.nombre}] Hijo {hijo_id} listo (salud en {alta.get('salud')})")
+
+    def _reenviar_eventos(self, eventos: zmq.Socket) -> None:
+        """Reparte por turno los eventos pendientes entre los hijos dados de alta y no retirándose."""
+        while self._eventos_sin_hijo:
+            msg = self._eventos_sin_hijo[0]
+            with self._lock:
+                candidatos = [h for h in self._alta if h not in self._retirando]
+            enviado = False
+            for i in range(len(candidatos)):
+                hijo_id = candidatos[(self._turno + i) % len(candidatos)]
+                try:
+                    eventos.send_multipart([hijo_id.encode(), json.dumps(msg).encode("utf-8")], zmq.NOBLOCK)
+                except zmq.ZMQError:
+                    continue   # desconectado o con la cola llena
+                with self._lock:
+                    self._eventos_enviados[hijo_id] = self._eventos_enviados.get(hijo_id, 0) + 1
+                self._turno = (self._turno + i + 1) % len(candidatos)
+                enviado = True
+                break
+            if not enviado:
+                # Ningún hijo disponible: se guardan hasta que alguno se dé de alta (acotado)
+                while len(self._eventos_sin_hijo) > ACTOR_COLA_EVENTOS:
+                    self._eventos_sin_hijo.popleft()
+                    self.eventos_descartados += 1
+                return
+            self._eventos_sin_hijo.popleft()
+
+    def _completada(self, envoltorio: tuple) -> None:
+        with self._lock:
+            inicios = self._pendientes.get(envoltorio)
+            if not inicios:
+                return
+            duracion = time.perf_counter() - inicios.popleft()
+            if not inicios:
+                del self._pendientes[envoltorio]
+            self._en_curso -= 1
+            self._ocupado += duracion
+            self._latencias.registrar(int(duracion * 1_000_000))
+
+    def _revisar_secuencia(self, msg: Dict[str, Any]) -> None:
+        """Los hijos solo ven parte de los eventos, así que los huecos se miran aquí."""
+        origen, seq = msg.get("origen"), msg.get("seq")
+        if origen is None or not isinstance(seq, int):
+            return
+        ultimo = self._ultimo_seq.get(origen)
+        if ultimo is not None and seq > ultimo + 1:
+            self.eventos_perdidos += seq - ultimo - 1
+            print(f"[{self.nombre}] Hueco en eventos de {origen}: {seq - ultimo - 1} perdido(s)")
+        if ultimo is None or seq > ultimo:
+            self._ultimo_seq[origen] = seq
+
+    # Control (hilo aparte)
+    def medir(self, intervalo: float) -> Dict[str, Any]:
+        with self._lock:
+            en_curso = self._en_curso
+            ocupado, self._ocupado = self._ocupado, 0.0
+            latencias = self._latencias.resumen()
+            self._latencias.reiniciar()
+        cola = 0
+        for hijo in self.hijos:
+            estado = hijo.consultar(self.context)
+            if estado is not None:
+                cola += estado.get("cola_eventos", 0)
+        workers = max(1, len(self.hijos) * ACTOR_WORKERS)
+        # Little: concurrencia media = tiempo ocupado / intervalo; el valor
+        # instantáneo cubre peticiones largas que aún no han terminado
+        concurrencia = max(en_curso, ocupado / intervalo)
+        return {
+            "hijos": len(self.hijos),
+            "en_curso": en_curso,
+            "cola_eventos": cola,
+            "carga": (concurrencia + cola) / workers,
+            "latencia_us": latencias,
+        }
+
+    def _controlar(self) -> None:
+        altos = bajos = 0
+        ultimo_cambio = time.monotonic()
+        while not self._stop.wait(SUP_INTERVALO_S):
+            # Hijos caídos: se reemplazan sin esperar a la política
+            for hijo in [h for h in self.hijos if not h.vivo()]:
+                print(f"[{self.nombre}] Hijo {hijo.id} pid={hijo.pid} terminó (código {hijo.proceso.returncode})")
+                self.hijos.remove(hijo)
+                with self._lock:
+                    self._olvidar(hijo.id)
+            while len(self.hijos) < self.minimo:
+                self.arrancar_hijo()
+
+            m = self.medir(SUP_INTERVALO_S)
+            p90 = m["latencia_us"].get("p90")
+            lento = SUP_LATENCIA_MAX_MS > 0 and p90 is not None and p90 > SUP_LATENCIA_MAX_MS * 1000
+            if m["carga"] >= SUP_UMBRAL_ALTO or lento:
+                altos, bajos = altos + 1, 0
+            elif m["carga"] <= SUP_UMBRAL_BAJO:
+                altos, bajos = 0, bajos + 1
+            else:
+                altos = bajos = 0
+
+            if time.monotonic() - ultimo_cambio < SUP_ENFRIAMIENTO_S:
+                continue
+            if altos >= SUP_INTERVALOS_SUBIR and len(self.hijos) < self.maximo:
+                print(f"[{self.nombre}] Subiendo: carga={m['carga']:.2f} p90={p90}us cola={m['cola_eventos']}")
+                self.arrancar_hijo()
+                self.escalados["subidas"] += 1
+            elif bajos >= SUP_INTERVALOS_BAJAR and len(self.hijos) > self.minimo:
+                print(f"[{self.nombre}] Bajando: carga={m['carga']:.2f} p90={p90}us")
+                self.retirar_hijo()
+                self.escalados["bajadas"] += 1
+            else:
+                continue
+            altos = bajos = 0
+            ultimo_cambio = time.monotonic()
+
+    def run(self) -> None:
+        self._abrir_sockets()
+        for _ in range(self.minimo):
+            self.arrancar_hijo()
+        control = threading.Thread(target=self._controlar, name="supervisor-control", daemon=True)
+        control.start()
+        print(f"[{self.nombre}] ROUTER en {self.frontend_endpoint}, resultados en {self.resultados_endpoint}, "
+              f"hijos entre {self.minimo} y {self.maximo}")
+        try:
+            self._broker()
+        except KeyboardInterrupt:
+            print(f"[{self.nombre}] Interrumpido")
+        finally:
+            self._stop.set()
+            control.join(timeout=SUP_INTERVALO_S + SUP_DRENAJE_S + 1)
+            # El broker ya no atiende: no hay a quién responder, se paran sin drenar
+            while self.hijos:
+                self.retirar_hijo(drenar=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervisor/autoescalador local de un actor")
+    parser.add_argument("--actor", required=True, choices=sorted(ACTORES))
+    parser.add_argument("--min", type=int, default=int(os.getenv("SUP_MIN", "1")), dest="minimo")
+    parser.add_argument("--max", type=int, default=int(os.getenv("SUP_MAX", "4")), dest="maximo")
+    args = parser.parse_args()
+    Supervisor(args.actor, args.minimo, args.maximo).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Pruebas unitarias de la lógica pura (sin red ni base de datos).
+
+Uso (desde la raíz del repo):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cada servicio importa sus módulos hermanos sin paquete, como en todo_en_uno.py
+for carpeta in ("", "gestor_almacenamiento", "gestor_carga",
+                "actor_prestamo", "actor_renovacion", "actor_devolucion"):
+    sys.path.insert(0, os.path.join(RAIZ, carpeta))
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+import zmq
+
+from common.actors.base import Actor
+
+
+class _ActorLento(Actor):
+    topic = "prueba"
+    nombre = "ActorPrueba"
+
+    def __init__(self, espera_evento=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.espera_evento = espera_evento
+        self.vistos = []
+
+    def handle(self, msg):
+        time.sleep(msg.get("espera", self.espera_evento))
+        self.vistos.append(msg.get("n"))
+        return {"exito": True, "n": msg.get("n")}
+
+
+@pytest.fixture
+def context():
+    ctx = zmq.Context()
+    yield ctx
+    ctx.term()
+
+
+def _pedir(context, endpoint, msg, resultados):
+    req = context.socket(zmq.REQ)
+    req.linger = 0
+    req.connect(endpoint)
+    inicio = time.monotonic()
+    req.send_json(msg)
+    resultados[msg["n"]] = (req.recv_json(), time.monotonic() - inicio)
+    req.close()
+
+
+def test_peticion_lenta_no_retrasa_a_las_demas(context):
+    endpoint = "inproc://actor-lru"
+    actor = _ActorLento(workers=2, workers_eventos=1, context=context, bind_endpoint=endpoint,
+                        pub_endpoint="inproc://sin-pub", ga_endpoints=["inproc://sin-ga"])
+    hilo = threading.Thread(target=actor.run, daemon=True)
+    hilo.start()
+    time.sleep(0.2)
+    resultados = {}
+    try:
+        lenta = threading.Thread(target=_pedir, args=(context, endpoint, {"n": 0, "espera": 1.0}, resultados))
+        lenta.start()
+        time.sleep(0.1)
+        # Con reparto por turno alguna de estas iría al worker ocupado y esperaría 1 s
+        for n in range(1, 5):
+            _pedir(context, endpoint, {"n": n, "espera": 0.0}, resultados)
+        lenta.join()
+    finally:
+        actor.stop()
+        hilo.join(timeout=5)
+    assert [resultados[n][0]["n"] for n in range(5)] == list(range(5))
+    assert max(resultados[n][1] for n in range(1, 5)) < 0.5
+
+
+def _con_workers_de_eventos(actor, context, eventos):
+    resultados_ep = "inproc://resultados-prueba"
+    resultados = context.socket(zmq.PULL)
+    resultados.linger = 0
+    resultados.bind(resultados_ep)
+    for n in range(eventos):
+        actor._cola_eventos.put({"n": n})
+    for n in range(actor.workers_eventos):
+        t = threading.Thread(target=actor._worker_eventos, args=(n, resultados_ep), daemon=True)
+        t.start()
+        actor._hilos_eventos.append(t)
+    actor._stop.set()
+    return resultados
+
+
+def test_al_parar_se_vacia_la_cola_de_eventos(context):
+    actor = _ActorLento(espera_evento=0.01, workers=1, workers_eventos=2, context=context,
+                        pub_endpoint="inproc://sin-pub", ga_endpoints=["inproc://sin-ga"])
+    resultados = _con_workers_de_eventos(actor, context, 20)
+    try:
+        assert actor._drenar_eventos(resultados, None, timeout=5) == 0
+    finally:
+        resultados.close()
+    assert sorted(actor.vistos) == list(range(20))
+    assert actor.contadores_eventos["procesados"] == 20
+    assert actor.contadores_eventos["descartados"] == 0
+
+
+def test_eventos_sin_procesar_al_agotar_el_plazo_se_cuentan(context):
+    actor = _ActorLento(espera_evento=0.1, workers=1, workers_eventos=1, context=context,
+                        pub_endpoint="inproc://sin-pub", ga_endpoints=["inproc://sin-ga"])
+    resultados = _con_workers_de_eventos(actor, context, 20)
+    try:
+        restantes = actor._drenar_eventos(resultados, None, timeout=0.25)
+    finally:
+        resultados.close()
+    for t in actor._hilos_eventos:
+        t.join(timeout=1)
+    assert 0 < restantes < 20
+    assert actor.contadores_eventos["descartados"] == restantes
+    assert len(actor.vistos) + restantes == 20
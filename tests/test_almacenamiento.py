@@ -0,0 +1,131 @@
+"""Los backends embebidos responden lo mismo (estado, códigos de error y datos) a cada acción."""
+import pytest
+
+from acciones import Despachador
+from almacenamiento import MAX_RENOVACIONES, MemoriaAlmacenamiento, SQLiteAlmacenamiento
+
+ISBN = "978-0134685991"
+AGOTADO = "978-0000000001"
+INEXISTENTE = "978-9999999999"
+LIBROS = {ISBN: 5, AGOTADO: 0}
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def ga(request, tmp_path):
+    if request.param == "memoria":
+        almacenamiento = MemoriaAlmacenamiento(LIBROS)
+    else:
+        almacenamiento = SQLiteAlmacenamiento(str(tmp_path / "ga.sqlite3"), LIBROS)
+    yield Despachador(almacenamiento)
+    almacenamiento.cerrar()
+
+
+def _pedir(ga, accion, isbn=ISBN, usuario="u1", **extra):
+    return ga.despachar({"action": accion, "isbn": isbn, "usuario": usuario, **extra})
+
+
+def _codigo(resp):
+    return resp.get("error") or resp.get("status")
+
+
+def _normalizar(resp):
+    """Quita lo que depende del reloj (fechas) para comparar backends."""
+    if isinstance(resp, dict):
+        return {k: _normalizar(v) for k, v in resp.items() if "fecha" not in k}
+    if isinstance(resp, list):
+        return [_normalizar(v) for v in resp]
+    return resp
+
+
+def test_consultar_libro(ga):
+    assert _pedir(ga, "consultar_libro")["datos"]["ejemplares"] == 5
+    assert _codigo(_pedir(ga, "consultar_libro", isbn=INEXISTENTE)) == "LibroNoEncontrado"
+
+
+def test_prestamo_descuenta_un_ejemplar(ga):
+    resp = _pedir(ga, "procesar_prestamo")
+    assert _codigo(resp) == "ok"
+    assert resp["datos"]["dias_prestamo"] == 14
+    assert _pedir(ga, "consultar_libro")["datos"]["ejemplares"] == 4
+
+
+@pytest.mark.parametrize("isbn, codigo", [(INEXISTENTE, "LibroNoEncontrado"),
+                                          (AGOTADO, "SinEjemplaresDisponibles")])
+def test_prestamo_de_libro_no_disponible(ga, isbn, codigo):
+    assert _codigo(_pedir(ga, "procesar_prestamo", isbn=isbn)) == codigo
+
+
+def test_prestamo_repetido(ga):
+    _pedir(ga, "procesar_prestamo")
+    assert _codigo(_pedir(ga, "procesar_prestamo")) == "PrestamoActivo"
+    assert _pedir(ga, "consultar_libro")["datos"]["ejemplares"] == 4
+
+
+def test_renovaciones_hasta_el_limite(ga):
+    _pedir(ga, "procesar_prestamo")
+    for n in range(1, MAX_RENOVACIONES + 1):
+        resp = _pedir(ga, "actualizar_renovacion")
+        assert _codigo(resp) == "ok"
+        assert resp["datos"]["renovaciones"] == n
+    assert _codigo(_pedir(ga, "actualizar_renovacion")) == "LimiteRenovaciones"
+    assert _pedir(ga, "validar_renovacion") == {"renovaciones": MAX_RENOVACIONES}
+
+
+def test_renovar_sin_prestamo(ga):
+    assert _codigo(_pedir(ga, "actualizar_renovacion")) == "PrestamoNoEncontrado"
+    assert _pedir(ga, "validar_renovacion") == {"renovaciones": 0}
+
+
+def test_devolucion_y_renovacion_de_prestamo_devuelto(ga):
+    _pedir(ga, "procesar_prestamo")
+    assert _codigo(_pedir(ga, "aplicar_devolucion")) == "ok"
+    assert _pedir(ga, "consultar_libro")["datos"]["ejemplares"] == 5
+    assert _codigo(_pedir(ga, "actualizar_renovacion")) == "PrestamoNoActivo"
+    # Tras devolver se puede volver a pedir, con las renovaciones a cero
+    assert _codigo(_pedir(ga, "procesar_prestamo")) == "ok"
+    assert _pedir(ga, "actualizar_renovacion")["datos"]["renovaciones"] == 1
+
+
+def test_devolucion_sin_prestamo_suma_ejemplar(ga):
+    assert _codigo(_pedir(ga, "aplicar_devolucion", isbn=AGOTADO)) == "ok"
+    assert _pedir(ga, "consultar_libro", isbn=AGOTADO)["datos"]["ejemplares"] == 1
+
+
+def test_lote_de_renovaciones(ga):
+    _pedir(ga, "procesar_prestamo", usuario="u1")
+    _pedir(ga, "procesar_prestamo", usuario="u2")
+    _pedir(ga, "aplicar_devolucion", usuario="u2")
+    items = [{"isbn": ISBN, "usuario": u} for u in ("u1", "u2", "u3", "u1", "u1")]
+    resp = ga.despachar({"action": "actualizar_renovacion_lote", "items": items})
+
+    assert _codigo(resp) == "ok"
+    resultados = resp["datos"]["resultados"]
+    assert [_codigo(r) for r in resultados] == [
+        "ok", "PrestamoNoActivo", "PrestamoNoEncontrado", "ok", "LimiteRenovaciones"]
+    assert [r["datos"]["renovaciones"] for r in resultados if _codigo(r) == "ok"] == [1, 2]
+
+
+def test_parametros_invalidos(ga):
+    assert _codigo(ga.despachar({"action": "procesar_prestamo", "isbn": ISBN})) == "ParametrosInvalidos"
+    assert _codigo(ga.despachar({"action": "actualizar_renovacion_lote", "items": [{"isbn": ISBN}]})) \
+        == "ParametrosInvalidos"
+    assert ga.despachar({"action": "no_existe"}) == {"error": "accion_desconocida"}
+
+
+def test_mismas_respuestas_en_todos_los_backends(tmp_path):
+    guion = [
+        ("consultar_libro", ISBN, "u1"), ("consultar_libro", INEXISTENTE, "u1"),
+        ("procesar_prestamo", ISBN, "u1"), ("procesar_prestamo", ISBN, "u1"),
+        ("procesar_prestamo", AGOTADO, "u1"), ("procesar_prestamo", INEXISTENTE, "u1"),
+        ("actualizar_renovacion", ISBN, "u1"), ("actualizar_renovacion", ISBN, "u1"),
+        ("actualizar_renovacion", ISBN, "u1"), ("actualizar_renovacion", ISBN, "u2"),
+        ("validar_renovacion", ISBN, "u1"), ("aplicar_devolucion", ISBN, "u1"),
+        ("actualizar_renovacion", ISBN, "u1"), ("consultar_libro", ISBN, "u1"),
+    ]
+    respuestas = {}
+    for backend in (MemoriaAlmacenamiento(LIBROS), SQLiteAlmacenamiento(str(tmp_path / "ga.sqlite3"), LIBROS)):
+        ga = Despachador(backend)
+        respuestas[backend.nombre] = [_normalizar(_pedir(ga, accion, isbn, usuario))
+                                      for accion, isbn, usuario in guion]
+        backend.cerrar()
+    assert respuestas["memoria"] == respuestas["sqlite"]
@@ -0,0 +1,137 @@
+import pytest
+
+from common.actors import cache as modulo_cache
+from common.actors.base import Actor
+from common.actors.cache import NO_EXISTE, CacheUsuarios
+
+
+class _Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    r = _Reloj()
+    monkeypatch.setattr(modulo_cache.time, "monotonic", r)
+    return r
+
+
+def test_guarda_y_obtiene():
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    c.guardar("u1", "isbn1", "ACTIVO", 1)
+    assert c.obtener("u1", "isbn1") == {"estado": "ACTIVO", "renovaciones": 1}
+    assert c.obtener("u1", "otro") is None
+    assert (c.aciertos, c.fallos) == (1, 1)
+
+
+def test_desactivada_no_guarda():
+    c = CacheUsuarios(ttl=0, max_usuarios=10)
+    c.guardar("u1", "isbn1", "ACTIVO")
+    assert not c.activa
+    assert c.obtener("u1", "isbn1") is None
+
+
+def test_lru_expulsa_al_usuario_menos_usado():
+    c = CacheUsuarios(ttl=30, max_usuarios=2)
+    c.guardar("u1", "a", "ACTIVO")
+    c.guardar("u2", "a", "ACTIVO")
+    assert c.obtener("u1", "a")       # u1 pasa a ser el más reciente
+    c.guardar("u3", "a", "ACTIVO")
+
+    assert c.obtener("u2", "a") is None
+    assert c.obtener("u1", "a") and c.obtener("u3", "a")
+    assert c.estadisticas()["usuarios"] == 2
+
+
+def test_ttl_caduca_las_entradas(reloj):
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    c.guardar("u1", "a", NO_EXISTE)
+    reloj.ahora += 29.9
+    assert c.obtener("u1", "a") == {"estado": NO_EXISTE, "renovaciones": None}
+    reloj.ahora += 0.2
+    assert c.obtener("u1", "a") is None
+
+
+def test_evento_con_estado_lo_guarda():
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    c.guardar("u1", "a", NO_EXISTE)
+    c.aplicar_evento({"usuario": "u1", "isbn": "a", "prestamo": {"estado": "ACTIVO", "renovaciones": 0}})
+    assert c.obtener("u1", "a") == {"estado": "ACTIVO", "renovaciones": 0}
+
+
+def test_evento_sin_estado_invalida():
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    c.guardar("u1", "a", "ACTIVO")
+    c.guardar("u1", "b", "ACTIVO")
+    c.aplicar_evento({"usuario": "u1", "isbn": "a"})
+    assert c.obtener("u1", "a") is None
+    assert c.obtener("u1", "b")
+
+    c.aplicar_evento({"usuario": "u1"})   # sin isbn: todo el usuario
+    assert c.obtener("u1", "b") is None
+    assert c.invalidaciones == 2
+
+
+def test_operacion_pendiente_no_se_cachea_hasta_un_ttl(reloj):
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    c.guardar("u1", "a", "DEVUELTO")
+    c.aplicar_evento({"usuario": "u1", "isbn": "a", "pendiente": True})
+    assert c.obtener("u1", "a") is None
+
+    # El GA aún no vio el préstamo asíncrono: su respuesta no se guarda
+    c.guardar("u1", "a", NO_EXISTE)
+    assert c.obtener("u1", "a") is None
+    c.guardar("u1", "b", NO_EXISTE)     # otros libros no se ven afectados
+    assert c.obtener("u1", "b")
+    assert c.estadisticas()["omitidas"] == 1
+
+    reloj.ahora += 30.1
+    c.guardar("u1", "a", "ACTIVO", 0)
+    assert c.obtener("u1", "a") == {"estado": "ACTIVO", "renovaciones": 0}
+
+
+def test_marcas_pendientes_vencidas_se_purgan(reloj):
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    for n in range(5):
+        c.marcar_pendiente(f"u{n}", "a")
+    reloj.ahora += 31
+    c.marcar_pendiente("u9", "a")
+    assert c.estadisticas()["pendientes"] == 1
+
+
+def test_limpiar_vacia_y_no_guarda_durante_un_ttl(reloj):
+    c = CacheUsuarios(ttl=30, max_usuarios=10)
+    c.guardar("u1", "a", "ACTIVO")
+    c.limpiar()
+    assert c.obtener("u1", "a") is None
+
+    c.guardar("u2", "a", NO_EXISTE)
+    assert c.obtener("u2", "a") is None
+    reloj.ahora += 30.1
+    c.guardar("u2", "a", NO_EXISTE)
+    assert c.obtener("u2", "a")
+
+
+class _ActorPrueba(Actor):
+    topic = "prueba"
+
+    def handle(self, msg):
+        return {}
+
+
+def test_hueco_en_invalidaciones_vacia_la_cache():
+    actor = _ActorPrueba(pub_endpoint="inproc://sin-uso", ga_endpoints=["inproc://sin-uso"])
+    actor.cache = CacheUsuarios(ttl=30, max_usuarios=10)
+
+    actor._aplicar_invalidacion({"origen": "gc:invalidar", "seq": 1, "usuario": "u0", "isbn": "a"})
+    actor.cache.guardar("u1", "a", "ACTIVO")
+    actor._aplicar_invalidacion({"origen": "gc:invalidar", "seq": 2, "usuario": "u0", "isbn": "a"})
+    assert actor.cache.obtener("u1", "a")
+
+    actor._aplicar_invalidacion({"origen": "gc:invalidar", "seq": 5, "usuario": "u0", "isbn": "a"})
+    assert actor.contadores_eventos["perdidos"] == 2
+    assert actor.cache.obtener("u1", "a") is None
@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+import contadores
+
+ISBN = "978-0134685991"
+
+
+class _BaseFalsa:
+    """
+    Lo justo de PostgreSQL para contadores.py: libros y libros_ejemplares.
+    Los cambios se aplican al momento (no hay transacciones ni bloqueos).
+    """
+
+    def __init__(self, libros):
+        self.libros = dict(libros)
+        self.slots = {}                 # (isbn, slot) -> ejemplares
+        self.azar = random.Random(7)    # ORDER BY random()
+
+    def cursor(self, *args, **kwargs):
+        return _CursorFalso(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def de(self, isbn):
+        return {slot: n for (i, slot), n in sorted(self.slots.items()) if i == isbn}
+
+
+class _CursorFalso:
+    def __init__(self, db):
+        self.db = db
+        self._filas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+    def fetchall(self):
+        return list(self._filas)
+
+    def execute(self, sql, params=()):
+        db, sql = self.db, " ".join(sql.split())
+        self._filas = []
+        if sql.startswith("SELECT ejemplares FROM libros WHERE isbn=%s FOR UPDATE"):
+            isbn, = params
+            self._filas = [(db.libros[isbn],)] if isbn in db.libros else []
+        elif sql.startswith("SELECT slot FROM libros_ejemplares WHERE isbn=%s ORDER BY slot"):
+            self._filas = [(slot,) for slot in db.de(params[0])]
+        elif sql.startswith("SELECT slot, ejemplares FROM libros_ejemplares"):
+            self._filas = list(db.de(params[0]).items())
+        elif sql.startswith("INSERT INTO libros_ejemplares"):
+            isbn, slot, n = params
+            db.slots[(isbn, slot)] = db.slots.get((isbn, slot), 0) + n
+        elif sql.startswith("UPDATE libros SET ejemplares = 0"):
+            db.libros[params[0]] = 0
+        elif sql.startswith("UPDATE libros_ejemplares SET ejemplares = ejemplares + %s"):
+            delta, isbn = params
+            candidatos = [s for s, n in db.de(isbn).items() if n > 0 or "ejemplares > 0" not in sql]
+            if candidatos:
+                slot = db.azar.choice(candidatos)
+                db.slots[(isbn, slot)] += delta
+                self._filas = [(slot,)]
+        elif sql.startswith("UPDATE libros_ejemplares SET ejemplares=%s"):
+            n, isbn, slot = params
+            db.slots[(isbn, slot)] = n
+        elif sql.startswith("SELECT l.ejemplares + COALESCE"):
+            isbn, = params
+            if isbn in db.libros:
+                self._filas = [(db.libros[isbn] + sum(db.de(isbn).values()),)]
+        elif sql.startswith("SELECT isbn FROM libros_ejemplares GROUP BY isbn"):
+            limite, = params
+            for isbn in sorted({i for i, _ in db.slots}):
+                valores = list(db.de(isbn).values())
+                if min(valores) == 0 and sum(valores) >= len(valores):
+                    self._filas.append((isbn,))
+            self._filas = self._filas[:limite]
+        else:
+            raise AssertionError(f"SQL no contemplado: {sql}")
+
+
+@pytest.fixture(autouse=True)
+def slots(monkeypatch):
+    monkeypatch.setattr(contadores, "CONTADORES_SLOTS", 4)
+
+
+def test_primer_prestamo_siembra_los_slots():
+    db = _BaseFalsa({ISBN: 10})
+    assert contadores.tomar_ejemplar(db, ISBN)
+    assert db.libros[ISBN] == 0
+    assert sorted(db.de(ISBN)) == [0, 1, 2, 3]
+    assert sum(db.de(ISBN).values()) == 9
+    assert contadores.total_ejemplares(db, ISBN) == 9
+
+
+def test_tomar_hasta_agotar():
+    db = _BaseFalsa({ISBN: 5})
+    assert all(contadores.tomar_ejemplar(db, ISBN) for _ in range(5))
+    assert not contadores.tomar_ejemplar(db, ISBN)
+    assert db.de(ISBN) == {0: 0, 1: 0, 2: 0, 3: 0}
+    assert contadores.total_ejemplares(db, ISBN) == 0
+
+
+def test_tomar_libro_inexistente():
+    db = _BaseFalsa({})
+    assert not contadores.tomar_ejemplar(db, ISBN)
+    assert db.slots == {}
+
+
+def test_stock_que_llega_a_libros_despues_de_sembrar_se_presta():
+    db = _BaseFalsa({ISBN: 2})
+    assert contadores.tomar_ejemplar(db, ISBN) and contadores.tomar_ejemplar(db, ISBN)
+    db.libros[ISBN] = 3                      # p.ej. carga de datos con los slots ya creados
+    assert contadores.total_ejemplares(db, ISBN) == 3
+
+    assert all(contadores.tomar_ejemplar(db, ISBN) for _ in range(3))
+    assert not contadores.tomar_ejemplar(db, ISBN)
+    assert db.libros[ISBN] == 0
+
+
+def test_devolver_suma_a_un_slot():
+    db = _BaseFalsa({ISBN: 0})
+    contadores.devolver_ejemplar(db, ISBN)   # sin slots: siembra y suma
+    assert sum(db.de(ISBN).values()) == 1
+    contadores.devolver_ejemplar(db, ISBN)
+    assert contadores.total_ejemplares(db, ISBN) == 2
+    assert contadores.tomar_ejemplar(db, ISBN)
+
+
+def test_devolver_sin_libro_falla():
+    db = _BaseFalsa({})
+    with pytest.raises(RuntimeError, match="No hay slots"):
+        contadores.devolver_ejemplar(db, ISBN)
+
+
+def test_rebalancear_reparte_cuando_hay_slots_vacios():
+    db = _BaseFalsa({ISBN: 0, "otro": 0, "escaso": 0})
+    db.slots.update({(ISBN, 0): 8, (ISBN, 1): 0, (ISBN, 2): 0, (ISBN, 3): 1})
+    db.slots.update({("otro", s): 2 for s in range(4)})                      # sin vacíos
+    db.slots.update({("escaso", 0): 3, ("escaso", 1): 0, ("escaso", 2): 0, ("escaso", 3): 0})  # 3 < 4 slots
+
+    assert contadores.rebalancear(db) == 1
+    assert db.de(ISBN) == {0: 3, 1: 2, 2: 2, 3: 2}
+    assert db.de("otro") == {s: 2 for s in range(4)}
+    assert db.de("escaso") == {0: 3, 1: 0, 2: 0, 3: 0}
+
+
+def test_rebalancear_respeta_el_limite():
+    db = _BaseFalsa({})
+    for isbn in ("a", "b", "c"):
+        db.libros[isbn] = 0
+        db.slots.update({(isbn, 0): 4, (isbn, 1): 0})
+    assert contadores.rebalancear(db, limite=2) == 2
+    assert db.de("c") == {0: 4, 1: 0}
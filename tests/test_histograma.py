@@ -0,0 +1,119 @@
+import json
+import math
+import random
+
+import pytest
+
+from common.metrics.histograma import Histograma, _indice, _limite_superior
+
+VALORES = list(range(0, 5000)) + [2 ** k + d for k in range(7, 40) for d in (-1, 0, 1)]
+
+
+def _exacto(ordenados, p):
+    """Misma definición que Histograma.percentil: el menor valor con al menos el p% por debajo."""
+    return ordenados[max(1, math.ceil(len(ordenados) * p / 100.0)) - 1]
+
+
+def _distribuciones():
+    rnd = random.Random(1234)
+    return {
+        "uniforme": [rnd.randint(1, 100_000) for _ in range(20_000)],
+        "exponencial": [int(rnd.expovariate(1 / 2_000)) + 1 for _ in range(20_000)],
+        "lognormal": [int(rnd.lognormvariate(8, 1.5)) + 1 for _ in range(20_000)],
+        "bimodal": [rnd.choice((rnd.randint(50, 150), rnd.randint(40_000, 60_000))) for _ in range(20_000)],
+    }
+
+
+def test_bucket_contiene_al_valor():
+    for v in VALORES:
+        i = _indice(v)
+        assert _limite_superior(i) >= v
+        assert i == 0 or _limite_superior(i - 1) < v
+
+
+def test_buckets_contiguos_y_crecientes():
+    for i in range(0, 128 + 64 * 30):
+        siguiente = _limite_superior(i) + 1
+        assert _indice(siguiente) == i + 1
+
+
+def test_lineal_por_debajo_de_128():
+    assert [_indice(v) for v in range(128)] == list(range(128))
+    assert all(_limite_superior(i) == i for i in range(128))
+
+
+def test_ancho_relativo_del_bucket_menor_que_1_64():
+    for v in VALORES:
+        if v >= 128:
+            i = _indice(v)
+            inferior = _limite_superior(i - 1) + 1
+            assert (_limite_superior(i) - inferior + 1) / inferior <= 1 / 64
+
+
+@pytest.mark.parametrize("nombre", list(_distribuciones()))
+def test_percentiles_contra_los_exactos(nombre):
+    valores = _distribuciones()[nombre]
+    h = Histograma()
+    for v in valores:
+        h.registrar(v)
+    ordenados = sorted(valores)
+    for p in (1, 10, 25, 50, 75, 90, 99, 99.9, 100):
+        exacto, estimado = _exacto(ordenados, p), h.percentil(p)
+        # Se devuelve el límite superior del bucket: nunca por debajo del valor exacto
+        assert exacto <= estimado
+        assert (estimado - exacto) / exacto < 1 / 64, (p, exacto, estimado)
+
+
+def test_percentil_vacio_y_extremos():
+    h = Histograma()
+    assert h.percentil(50) is None
+    assert h.resumen()["n"] == 0 and h.resumen()["media"] is None
+    for v in (10, 20, 30_000):
+        h.registrar(v)
+    assert h.percentil(0) == 10
+    assert h.percentil(100) == 30_000          # acotado por el máximo, no por el bucket
+    assert h.resumen() == {"n": 3, "min": 10, "media": 10010.0, "max": 30_000,
+                           "p50": 20, "p90": 30_000, "p99": 30_000, "p99.9": 30_000}
+
+
+def test_registrar_varias_veces_y_negativos():
+    h = Histograma()
+    h.registrar(500, veces=3)
+    h.registrar(-5)
+    assert (h.total, h.suma, h.minimo, h.maximo) == (4, 1500, 0, 500)
+
+
+def test_fusionar_equivale_a_registrar_todo():
+    valores = _distribuciones()["lognormal"]
+    todo, a, b = Histograma(), Histograma(), Histograma()
+    for n, v in enumerate(valores):
+        todo.registrar(v)
+        (a if n % 3 else b).registrar(v)
+    a.fusionar(b)
+    a.fusionar(Histograma())                   # fusionar uno vacío no cambia nada
+    assert a.a_dict() == todo.a_dict()
+    assert a.resumen() == todo.resumen()
+
+
+def test_fusionar_en_un_vacio():
+    h, otro = Histograma(), Histograma()
+    otro.registrar(7)
+    h.fusionar(otro)
+    assert (h.total, h.minimo, h.maximo) == (1, 7, 7)
+
+
+def test_ida_y_vuelta_por_dict_y_json():
+    h = Histograma()
+    for v in _distribuciones()["exponencial"]:
+        h.registrar(v)
+    copia = Histograma.desde_dict(json.loads(json.dumps(h.a_dict())))
+    assert copia.a_dict() == h.a_dict()
+    assert copia.resumen() == h.resumen()
+    assert Histograma.desde_dict({}).resumen()["n"] == 0
+
+
+def test_reiniciar():
+    h = Histograma()
+    h.registrar(3)
+    h.reiniciar()
+    assert h.a_dict() == {"buckets": {}, "total": 0, "suma": 0, "min": None, "max": None}
@@ -0,0 +1,227 @@
+import json
+import os
+
+import psycopg2
+import pytest
+
+import gestor_a
+from journal import JournalLocal
+from shards import ESTADO_ACTIVO, ESTADO_MIGRANDO, NodoShard, RangoSlots
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = JournalLocal(str(tmp_path / "journal" / "devoluciones.jsonl"))
+    yield j
+    j.cerrar()
+
+
+def _lineas(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f]
+
+
+def test_anotar_fuerza_a_disco_antes_de_volver(journal, monkeypatch):
+    sincronizados = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (sincronizados.append(fd), fsync(fd)))
+
+    id_journal = journal.anotar("aplicar_devolucion", {"isbn": "1", "usuario": "u1"})
+
+    assert journal._f.fileno() in sincronizados
+    entrada, = _lineas(journal.path)
+    assert entrada["id"] == id_journal
+    assert (entrada["accion"], entrada["isbn"], entrada["usuario"]) == ("aplicar_devolucion", "1", "u1")
+    assert journal.hay_pendientes()
+
+
+def test_reproduce_en_orden(journal):
+    ids = [journal.anotar("aplicar_devolucion", {"isbn": str(n), "usuario": "u"}) for n in range(5)]
+    vistos = []
+
+    assert journal.reproducir(lambda e: vistos.append(e["id"]) or "ok") == 5
+    assert vistos == ids
+    assert not journal.hay_pendientes()
+    # Todo reproducido: el archivo se compacta
+    assert os.path.getsize(journal.path) == 0
+
+
+def test_checkpoint_tras_reproduccion_parcial(journal):
+    ids = [journal.anotar("aplicar_devolucion", {"isbn": str(n), "usuario": "u"}) for n in range(4)]
+    vistos = []
+
+    def aplicar(entrada):
+        if len(vistos) == 2:
+            return "reintentar"
+        vistos.append(entrada["id"])
+        return "ok"
+
+    assert journal.reproducir(aplicar) == 2
+    assert journal.hay_pendientes()
+    journal.cerrar()
+
+    # Tras reiniciar se sigue desde el checkpoint, sin repetir las aplicadas
+    reabierto = JournalLocal(journal.path)
+    try:
+        resto = []
+        assert reabierto.reproducir(lambda e: resto.append(e["id"]) or "ok") == 2
+        assert vistos + resto == ids
+    finally:
+        reabierto.cerrar()
+
+
+def test_rechazadas_se_apartan_y_no_detienen(journal):
+    journal.anotar("aplicar_devolucion", {"isbn": "1", "usuario": "u"})
+    journal.anotar("aplicar_devolucion", {"isbn": "2", "usuario": "u"})
+
+    assert journal.reproducir(lambda e: "rechazada" if e["isbn"] == "1" else "ok") == 1
+    assert [e["isbn"] for e in _lineas(journal.path_rechazadas)] == ["1"]
+    assert not journal.hay_pendientes()
+
+
+def test_ignora_linea_a_medias(journal):
+    journal.anotar("aplicar_devolucion", {"isbn": "1", "usuario": "u"})
+    journal._f.write(b'{"id": "cortada"')
+    journal._f.flush()
+    vistos = []
+
+    assert journal.reproducir(lambda e: vistos.append(e["isbn"]) or "ok") == 1
+    assert vistos == ["1"]
+
+
+class _ConexionFalsa:
+    """Lo justo de psycopg2 para aplicar_devolucion: journal_aplicado, libros y préstamos, con commit/rollback."""
+
+    def __init__(self):
+        self.aplicados = set()
+        self.ejemplares = 0
+        self.closed = False
+        self._cambios = []
+
+    def cursor(self, *args, **kwargs):
+        return _CursorFalso(self)
+
+    def commit(self):
+        for cambio in self._cambios:
+            cambio()
+        self._cambios = []
+
+    def rollback(self):
+        self._cambios = []
+
+
+class _CursorFalso:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        conn = self.conn
+        if "journal_aplicado" in sql:
+            id_journal = params[0]
+            self.rowcount = 0 if id_journal in conn.aplicados else 1
+            conn._cambios.append(lambda: conn.aplicados.add(id_journal))
+        elif "INSERT INTO libros" in sql:
+            conn._cambios.append(lambda: setattr(conn, "ejemplares", conn.ejemplares + 1))
+            self.rowcount = 1
+        else:
+            self.rowcount = 1
+
+
+def test_reproducir_dos_veces_no_suma_dos_veces(journal):
+    """El GA cae entre el commit y el checkpoint: journal_aplicado descarta la repetición."""
+    journal.anotar("aplicar_devolucion", {"isbn": "1", "usuario": "u"})
+    conn = _ConexionFalsa()
+    aplicar = lambda e: gestor_a.aplicar_devolucion(conn, e["isbn"], e["usuario"], id_journal=e["id"])["status"]
+
+    entrada, _ = next(journal._pendientes())
+    assert aplicar(entrada) == "ok"          # commit hecho, checkpoint sin avanzar
+    assert journal.reproducir(aplicar) == 1  # se reproduce otra vez desde el checkpoint
+    assert conn.ejemplares == 1
+
+
+class _PoolFalso:
+    def __init__(self, estado):
+        self.nodo = NodoShard(nombre="s0", host="h")
+        self.rango = RangoSlots(0, 1023, "s0", estado=estado)
+        self.conexiones_pedidas = 0
+
+    def ubicar(self, isbn):
+        return self.nodo, self.rango
+
+    def conexion(self, nodo):
+        self.conexiones_pedidas += 1
+        raise gestor_a.SinPrimario("sin primario")
+
+    def descartar(self, nodo):
+        pass
+
+
+def test_mantenimiento_no_escribe_en_rango_en_migracion(journal):
+    journal.anotar("aplicar_devolucion", {"isbn": "1", "usuario": "u"})
+    almacenamiento = object.__new__(gestor_a.PostgresAlmacenamiento)
+    almacenamiento.journal = journal
+    almacenamiento.pool = _PoolFalso(ESTADO_MIGRANDO)
+    almacenamiento._proxima_purga = float("inf")
+
+    almacenamiento.mantenimiento()
+
+    assert almacenamiento.pool.conexiones_pedidas == 0
+    assert journal.hay_pendientes()
+
+
+class _ConexionQueCaeTrasCommit(_ConexionFalsa):
+    """El COMMIT se aplica en el servidor pero la conexión cae antes de recibir la confirmación."""
+
+    def __init__(self):
+        super().__init__()
+        self.caer = True
+
+    def commit(self):
+        super().commit()
+        if self.caer:
+            self.caer = False
+            self.closed = True
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def rollback(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        super().rollback()
+
+
+class _PoolConUnaConexion(_PoolFalso):
+    def __init__(self, conn):
+        super().__init__(ESTADO_ACTIVO)
+        self.conn = conn
+
+    def conexion(self, nodo):
+        self.conexiones_pedidas += 1
+        self.conn.closed = False     # reconexión
+        return self.conn
+
+
+def test_commit_confirmado_y_conexion_caida_no_suma_dos_veces(journal):
+    conn = _ConexionQueCaeTrasCommit()
+    almacenamiento = object.__new__(gestor_a.PostgresAlmacenamiento)
+    almacenamiento.journal = journal
+    almacenamiento.pool = _PoolConUnaConexion(conn)
+    almacenamiento._proxima_purga = float("inf")
+
+    resp = almacenamiento.aplicar_devolucion("1", "u")
+
+    # Sin saber si el COMMIT llegó, se acepta como pendiente con el id del intento
+    assert resp["status"] == "pendiente"
+    assert conn.ejemplares == 1 and conn.aplicados == {resp["datos"]["id_journal"]}
+    entrada, = _lineas(journal.path)
+    assert entrada["id"] == resp["datos"]["id_journal"]
+
+    almacenamiento.mantenimiento()
+    assert not journal.hay_pendientes()
+    assert conn.ejemplares == 1
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+from common.actors.lotes import Coalescedor
+
+
+class _GA:
+    """enviar_lote de prueba: apunta cada lote y puede quedarse bloqueado hasta que se suelte."""
+
+    def __init__(self):
+        self.lotes = []
+        self.soltar = threading.Event()
+        self.soltar.set()
+        self.dentro = threading.Event()
+
+    def __call__(self, items):
+        self.lotes.append(list(items))
+        self.dentro.set()
+        self.soltar.wait(5)
+        return [f"ok-{item}" for item in items]
+
+
+def _lanzar(coalescedor, items):
+    resultados = {}
+
+    def worker(item):
+        resultados[item] = coalescedor.enviar(item)
+
+    hilos = [threading.Thread(target=worker, args=(item,)) for item in items]
+    for h in hilos:
+        h.start()
+    return hilos, resultados
+
+
+def _esperar_pendientes(coalescedor, n):
+    limite = time.monotonic() + 5
+    while len(coalescedor._pendientes) < n and time.monotonic() < limite:
+        time.sleep(0.001)
+    assert len(coalescedor._pendientes) == n
+
+
+def test_sin_lote_en_vuelo_envia_enseguida():
+    ga = _GA()
+    c = Coalescedor(ga, ventana_ms=0, maximo=100)
+    t0 = time.monotonic()
+    assert c.enviar("a") == "ok-a"
+    assert time.monotonic() - t0 < 0.5
+    assert ga.lotes == [["a"]]
+    assert (c.lotes, c.elementos) == (1, 1)
+
+
+def test_acumula_mientras_hay_un_lote_en_vuelo():
+    ga = _GA()
+    ga.soltar.clear()
+    c = Coalescedor(ga, ventana_ms=0, maximo=100)
+    primero, _ = _lanzar(c, ["a"])
+    assert ga.dentro.wait(5)
+
+    resto, _ = _lanzar(c, ["b", "c", "d"])
+    _esperar_pendientes(c, 3)
+    ga.soltar.set()
+    for h in primero + resto:
+        h.join(5)
+
+    assert ga.lotes[0] == ["a"]
+    assert sorted(ga.lotes[1]) == ["b", "c", "d"]
+    assert len(ga.lotes) == 2
+
+
+def test_cada_hilo_recibe_su_resultado():
+    ga = _GA()
+    ga.soltar.clear()
+    c = Coalescedor(ga, ventana_ms=0, maximo=100)
+    items = [f"i{n}" for n in range(20)]
+    hilos, resultados = _lanzar(c, items[:1])
+    assert ga.dentro.wait(5)
+    mas, resultados_mas = _lanzar(c, items[1:])
+    _esperar_pendientes(c, 19)
+    ga.soltar.set()
+    for h in hilos + mas:
+        h.join(5)
+
+    resultados.update(resultados_mas)
+    assert resultados == {item: f"ok-{item}" for item in items}
+    assert c.elementos == 20
+
+
+def test_respeta_el_tamano_maximo():
+    ga = _GA()
+    ga.soltar.clear()
+    c = Coalescedor(ga, ventana_ms=0, maximo=3)
+    hilos, _ = _lanzar(c, ["x"])
+    assert ga.dentro.wait(5)
+    items = [f"i{n}" for n in range(7)]
+    mas, resultados_mas = _lanzar(c, items)
+    _esperar_pendientes(c, 7)
+    ga.soltar.set()
+    for h in hilos + mas:
+        h.join(5)
+
+    assert all(len(lote) <= 3 for lote in ga.lotes)
+    assert sorted(sum(ga.lotes, [])) == sorted(["x"] + items)
+    assert resultados_mas == {item: f"ok-{item}" for item in items}
+
+
+def test_ventana_espera_a_que_se_sumen_otros():
+    ga = _GA()
+    c = Coalescedor(ga, ventana_ms=300, maximo=100)
+    hilos, _ = _lanzar(c, ["a"])
+    _esperar_pendientes(c, 1)
+    mas, _ = _lanzar(c, ["b", "c"])
+    for h in hilos + mas:
+        h.join(5)
+
+    assert len(ga.lotes) == 1
+    assert sorted(ga.lotes[0]) == ["a", "b", "c"]
+
+
+def test_ventana_termina_al_llenar_el_lote():
+    ga = _GA()
+    c = Coalescedor(ga, ventana_ms=10000, maximo=2)
+    t0 = time.monotonic()
+    hilos, resultados = _lanzar(c, ["a", "b"])
+    for h in hilos:
+        h.join(5)
+    assert time.monotonic() - t0 < 5
+    assert resultados == {"a": "ok-a", "b": "ok-b"}
+    assert len(ga.lotes) == 1 and sorted(ga.lotes[0]) == ["a", "b"]
+
+
+def test_error_del_envio_llega_a_todos():
+    def falla(items):
+        raise ConnectionError("GA caído")
+
+    c = Coalescedor(falla, ventana_ms=0, maximo=100)
+    with pytest.raises(ConnectionError, match="GA caído"):
+        c.enviar("a")
+    # El siguiente envío no se queda bloqueado por el lote fallido
+    c.enviar_lote = lambda items: [f"ok-{i}" for i in items]
+    assert c.enviar("b") == "ok-b"
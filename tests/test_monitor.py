@@ -0,0 +1,114 @@
+import math
+
+import pytest
+
+from common.health.monitor import DetectorPhi, HealthMonitor
+
+
+def _phi_esperado(y):
+    e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+    return -math.log10(e / (1.0 + e))
+
+
+def _regular(detector, inicio=0.0, n=20, intervalo=0.1):
+    t = inicio
+    for _ in range(n):
+        detector.latido(t)
+        t += intervalo
+    return t - intervalo   # instante del último latido
+
+
+def test_sin_latidos_phi_es_cero():
+    assert DetectorPhi().phi(1000.0) == 0.0
+
+
+def test_phi_crece_con_el_silencio():
+    d = DetectorPhi(ventana=100, desviacion_min_ms=20, intervalo_esperado_ms=100)
+    ultimo = _regular(d)
+    valores = [d.phi(ultimo + s) for s in (0.0, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5)]
+    assert valores == sorted(valores)
+    assert valores[0] < 0.1
+    # Justo en el intervalo medio la probabilidad de que llegue más tarde es 1/2
+    assert valores[2] == pytest.approx(math.log10(2), abs=1e-3)
+    assert valores[-1] > 8
+
+
+def test_desviacion_minima_con_latidos_perfectos():
+    # Intervalos idénticos: la desviación real es 0 y se usa la mínima
+    d = DetectorPhi(ventana=100, desviacion_min_ms=20, intervalo_esperado_ms=100)
+    ultimo = _regular(d)
+    assert d.phi(ultimo + 0.1 + 0.02) == pytest.approx(_phi_esperado(1.0), rel=1e-6)
+    assert d.phi(ultimo + 0.1 + 0.04) == pytest.approx(_phi_esperado(2.0), rel=1e-6)
+
+    # Con una mínima mayor la misma espera levanta menos sospecha
+    holgado = DetectorPhi(ventana=100, desviacion_min_ms=100, intervalo_esperado_ms=100)
+    ultimo = _regular(holgado)
+    assert holgado.phi(ultimo + 0.14) == pytest.approx(_phi_esperado(0.4), rel=1e-6)
+    assert holgado.phi(ultimo + 0.14) < d.phi(ultimo + 0.14)
+
+
+def test_desviacion_real_si_supera_la_minima():
+    d = DetectorPhi(ventana=4, desviacion_min_ms=1, intervalo_esperado_ms=100)
+    t = 0.0
+    for intervalo in (None, 0.05, 0.15, 0.05, 0.15):
+        t += intervalo or 0.0
+        d.latido(t)
+    # Ventana de 4: 0.05, 0.15, 0.05, 0.15 -> media 0.1, desviación 0.05
+    assert list(d.intervalos) == pytest.approx([0.05, 0.15, 0.05, 0.15])
+    assert d.phi(t + 0.15) == pytest.approx(_phi_esperado(1.0), rel=1e-6)
+
+
+def test_intervalo_esperado_hasta_tener_historia():
+    d = DetectorPhi(ventana=100, desviacion_min_ms=20, intervalo_esperado_ms=500)
+    d.latido(10.0)
+    assert d.phi(10.5) == pytest.approx(math.log10(2), abs=1e-3)
+
+
+class _Registro:
+    def __init__(self):
+        self.cambios = []
+
+    def __call__(self, nombre, estado):
+        self.cambios.append((nombre, estado))
+
+
+@pytest.fixture
+def monitor():
+    m = HealthMonitor(intervalo_ms=100, timeout_ms=700, umbral_phi=8)
+    m.add_target("actor", "inproc://sin-uso")
+    registro = _Registro()
+    m.on_change(registro)
+    return m, m._objetivos["actor"], registro
+
+
+def test_transiciones_up_down_up(monitor):
+    m, objetivo, registro = monitor
+    t = 0.0
+    for _ in range(20):
+        m._respuesta(objetivo, b'{"en_curso": 1}', t)
+        m._revisar(objetivo, t + 0.05)
+        t += 0.1
+    assert registro.cambios == [("actor", "UP")]
+    assert m.disponible("actor") and m.estado("actor") == {"en_curso": 1}
+
+    # Silencio: sigue UP mientras phi no llega al umbral
+    ultimo = t - 0.1
+    m._revisar(objetivo, ultimo + 0.15)
+    assert m.status["actor"] == "UP"
+    m._revisar(objetivo, ultimo + 0.3)
+    assert m.status["actor"] == "DOWN"
+    assert not m.disponible("actor")
+
+    # La siguiente respuesta lo vuelve a dar por UP
+    m._respuesta(objetivo, b"no es json", ultimo + 1.0)
+    assert registro.cambios == [("actor", "UP"), ("actor", "DOWN"), ("actor", "UP")]
+    assert m.estado("actor") == {}
+
+
+def test_sin_respuesta_nunca_cae_por_timeout(monitor):
+    m, objetivo, registro = monitor
+    objetivo.alta = 100.0
+    m._revisar(objetivo, 100.5)
+    assert m.status["actor"] == "UNKNOWN" and m.disponible("actor")
+    m._revisar(objetivo, 100.7)
+    assert registro.cambios == [("actor", "DOWN")]
@@ -0,0 +1,211 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+import zmq
+
+from rebalancear_shards import esperar_version, partir_rangos
+from shards import (ESTADO_ACTIVO, ESTADO_MIGRANDO, NUM_SLOTS, NodoShard, RangoSlots, ShardMap,
+                    ShardMapRecargable, slot_de)
+
+
+def _mapa(*rangos, version=1):
+    nodos = {nombre: NodoShard(nombre=nombre, host=f"pg_{nombre}") for nombre in ("s0", "s1", "s2")}
+    return ShardMap(nodos, [RangoSlots(*r) for r in rangos], version=version)
+
+
+def test_slot_estable_y_conocido():
+    # crc32 % 1024: si cambia, los ISBN ya guardados quedarían en el shard equivocado
+    assert slot_de("978-0134685991") == 227
+    assert slot_de("978-0262033848") == 630
+    assert slot_de("978-0134685991", 16) == 3
+    assert all(0 <= slot_de(str(n)) < NUM_SLOTS for n in range(1000))
+
+
+def test_slot_no_depende_del_proceso():
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    codigo = "from shards import slot_de; print(slot_de('978-0134685991'))"
+    for semilla in ("1", "2"):
+        salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True,
+                                cwd=os.path.join(raiz, "gestor_almacenamiento"),
+                                env=dict(os.environ, PYTHONHASHSEED=semilla))
+        assert salida.stdout.strip() == "227"
+
+
+def test_ubicar_resuelve_el_rango_del_slot():
+    mapa = _mapa((0, 511, "s0"), (512, 1023, "s1"))
+    nodo, rango = mapa.ubicar("978-0134685991")      # slot 227
+    assert (nodo.nombre, rango.inicio, rango.fin) == ("s0", 0, 511)
+    assert mapa.nodo_para("978-0262033848").nombre == "s1"   # slot 630
+
+
+@pytest.mark.parametrize("rangos, mensaje", [
+    ([(0, 500, "s0"), (502, 1023, "s1")], "se esperaba inicio 501"),      # hueco
+    ([(0, 600, "s0"), (500, 1023, "s1")], "se esperaba inicio 601"),      # solape
+    ([(0, 511, "s0"), (512, 1000, "s1")], "cubren hasta 1000"),           # no llega al final
+    ([(1, 1023, "s0")], "se esperaba inicio 0"),                          # no empieza en 0
+    ([(0, 1023, "s9")], "shard desconocido"),
+    ([(0, 10, "s0"), (11, 5, "s1"), (6, 1023, "s0")], "Rangos inválidos"),  # fin < inicio
+])
+def test_validar_rechaza_mapas_incorrectos(rangos, mensaje):
+    with pytest.raises(ValueError, match=mensaje):
+        _mapa(*rangos)
+
+
+def test_ida_y_vuelta_por_dict():
+    mapa = _mapa((0, 99, "s0"), (100, 1023, "s1", ESTADO_MIGRANDO), version=7)
+    copia = ShardMap.desde_dict(mapa.a_dict())
+    assert copia.a_dict() == mapa.a_dict()
+    assert copia.rangos[1].estado == ESTADO_MIGRANDO
+    assert "estado" not in mapa.a_dict()["rangos"][0]
+
+
+def test_partir_rangos_aisla_el_rango_como_migrando():
+    mapa = _mapa((0, 511, "s0"), (512, 1023, "s1"))
+    nuevo = partir_rangos(mapa, 100, 199, "s1")
+
+    assert [(r.inicio, r.fin, r.shard, r.estado) for r in nuevo.rangos] == [
+        (0, 99, "s0", ESTADO_ACTIVO),
+        (100, 199, "s0", ESTADO_MIGRANDO),
+        (200, 511, "s0", ESTADO_ACTIVO),
+        (512, 1023, "s1", ESTADO_ACTIVO),
+    ]
+    assert nuevo.version == mapa.version + 1
+    # Los slots no cambian: solo el estado del rango que los contiene
+    for isbn in ("978-0134685991", "978-0262033848"):
+        assert nuevo.nodo_para(isbn).nombre == mapa.nodo_para(isbn).nombre
+
+
+def test_partir_rangos_en_un_borde():
+    mapa = _mapa((0, 511, "s0"), (512, 1023, "s1"))
+    nuevo = partir_rangos(mapa, 512, 1023, "s2")
+    assert [(r.inicio, r.fin, r.shard, r.estado) for r in nuevo.rangos] == [
+        (0, 511, "s0", ESTADO_ACTIVO),
+        (512, 1023, "s1", ESTADO_MIGRANDO),
+    ]
+
+
+def test_partir_rangos_de_varios_shards_falla():
+    mapa = _mapa((0, 511, "s0"), (512, 1023, "s1"))
+    with pytest.raises(SystemExit, match="único shard"):
+        partir_rangos(mapa, 500, 600, "s2")
+
+
+def test_partir_rangos_hacia_el_mismo_shard_falla():
+    mapa = _mapa((0, 511, "s0"), (512, 1023, "s1"))
+    with pytest.raises(SystemExit, match="ya pertenece a s0"):
+        partir_rangos(mapa, 0, 10, "s0")
+
+
+def test_recarga_cuando_cambia_el_mtime(tmp_path):
+    path = str(tmp_path / "shards.json")
+    _mapa((0, 1023, "s0")).guardar(path)
+    recargable = ShardMapRecargable(path, ShardMap.por_defecto("pg", 5432), intervalo=0)
+    nodo = recargable.actual().nodos["s0"]
+    nodo.current_host = "pg_s0_replica"         # tras un failover
+
+    _mapa((0, 511, "s0"), (512, 1023, "s1"), version=2).guardar(path)
+    os.utime(path, (1, 1))                       # mtime distinto aunque el FS tenga poca resolución
+    mapa = recargable.actual()
+
+    assert mapa.version == 2
+    assert mapa.nodo_para("978-0262033848").nombre == "s1"
+    # Los nodos que no cambian conservan su estado de conexión
+    assert mapa.nodos["s0"].current_host == "pg_s0_replica"
+    assert mapa.nodos["s1"].current_host == "pg_s1"
+
+
+def test_sin_cambio_de_mtime_no_recarga(tmp_path):
+    path = str(tmp_path / "shards.json")
+    _mapa((0, 1023, "s0")).guardar(path)
+    os.utime(path, (1, 1))
+    recargable = ShardMapRecargable(path, ShardMap.por_defecto("pg", 5432), intervalo=0)
+    antes = recargable.actual()
+
+    _mapa((0, 511, "s0"), (512, 1023, "s1"), version=2).guardar(path)
+    os.utime(path, (1, 1))
+    assert recargable.actual() is antes
+
+
+class _GAFalso:
+    """REP que responde a version_mapa con la versión indicada, como el bucle de servir()."""
+
+    def __init__(self, context, version):
+        self.version = version
+        self.socket = context.socket(zmq.REP)
+        self.socket.linger = 0
+        self.endpoint = f"tcp://127.0.0.1:{self.socket.bind_to_random_port('tcp://127.0.0.1')}"
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._servir, daemon=True)
+        self._hilo.start()
+
+    def _servir(self):
+        while not self._detener.is_set():
+            if self.socket.poll(50):
+                self.socket.recv_json()
+                self.socket.send_json({"status": "ok", "datos": {"version": self.version}})
+
+    def cerrar(self):
+        self._detener.set()
+        self._hilo.join()
+        self.socket.close()
+
+
+@pytest.fixture
+def context():
+    ctx = zmq.Context()
+    yield ctx
+    ctx.term()
+
+
+def test_esperar_version_hasta_que_todos_confirman(context):
+    gas = [_GAFalso(context, 3), _GAFalso(context, 2)]
+    try:
+        threading.Timer(0.3, setattr, (gas[1], "version", 3)).start()   # el segundo recarga más tarde
+        assert esperar_version(context, [g.endpoint for g in gas], 3, timeout=5, sondeo=0.05) == []
+    finally:
+        for g in gas:
+            g.cerrar()
+
+
+def test_esperar_version_devuelve_los_que_no_confirman(context):
+    al_dia, atrasado = _GAFalso(context, 4), _GAFalso(context, 3)
+    caido = "tcp://127.0.0.1:1"
+    try:
+        pendientes = esperar_version(context, [al_dia.endpoint, atrasado.endpoint, caido], 4,
+                                     timeout=0.3, sondeo=0.05)
+        assert pendientes == [atrasado.endpoint, caido]
+    finally:
+        al_dia.cerrar()
+        atrasado.cerrar()
+
+
+@pytest.mark.parametrize("contenido", [
+    '{"nodos": {"s0": {"host": "pg_s0"}}, "rangos": [',                               # JSON a medias
+    '{"nodos": {"s0": {"host": "pg_s0"}}}',                                           # falta "rangos"
+    '{"nodos": {"s0": {"host": "pg_s0"}}, "rangos": [{"inicio": 0, "fin": 99, "shard": "s0"}]}',  # no cubre
+])
+def test_mapa_invalido_mantiene_el_anterior(tmp_path, contenido):
+    path = str(tmp_path / "shards.json")
+    _mapa((0, 1023, "s0")).guardar(path)
+    recargable = ShardMapRecargable(path, ShardMap.por_defecto("pg", 5432), intervalo=0)
+    antes = recargable.actual()
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.utime(path, (1, 1))
+    assert recargable.actual() is antes
+
+    # Al corregir el archivo se carga sin reiniciar
+    _mapa((0, 511, "s0"), (512, 1023, "s1"), version=2).guardar(path)
+    os.utime(path, (2, 2))
+    assert recargable.actual().version == 2
+
+
+def test_mapa_invalido_al_arrancar_falla(tmp_path):
+    path = tmp_path / "shards.json"
+    path.write_text("{", encoding="utf-8")
+    with pytest.raises(ValueError):
+        ShardMapRecargable(str(path), ShardMap.por_defecto("pg", 5432))
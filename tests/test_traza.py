@@ -0,0 +1,21 @@
+import glob
+import os
+import socket
+
+from common.tracing.traza import EscritorTrazas
+
+
+def test_nombre_del_fichero_incluye_host_y_pid(tmp_path, monkeypatch):
+    monkeypatch.setattr(socket, "gethostname", lambda: "ga-1")
+    monkeypatch.setattr(os, "getpid", lambda: 1)
+    escritor = EscritorTrazas(str(tmp_path))
+    try:
+        assert os.path.basename(escritor.path) == "trazas-ga-1-1.jsonl"
+    finally:
+        escritor.cerrar()
+    # Dos contenedores con PID 1 en el mismo volumen no comparten fichero
+    monkeypatch.setattr(socket, "gethostname", lambda: "actor-1")
+    otro = EscritorTrazas(str(tmp_path))
+    otro.cerrar()
+    # El analizador los sigue encontrando con su patrón
+    assert len(glob.glob(os.path.join(str(tmp_path), "trazas-*.jsonl*"))) == 2
@@ -0,0 +1,81 @@
+"""
+Modo "todo en uno": GC, los tres actores y el GA en un solo proceso.
+
+Para instalaciones de un solo equipo (y para perfilar): los saltos internos
+GC -> actor, GC -PUB-> actor y actor -> GA van por inproc:// sobre un único
+zmq.Context, con los mismos mensajes que en el despliegue distribuido. Solo
+quedan en TCP la entrada de los clientes (5555), el PUB del GC (5556, para
+suscriptores externos) y los PUB de resultados de los actores (5563-5565).
+
+Uso (el GA lee su configuración de siempre, p.ej. GA_BACKEND=sqlite):
+    python todo_en_uno/todo_en_uno.py
+"""
+import os
+import sys
+import threading
+
+import zmq
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cada servicio importa sus módulos hermanos sin paquete (p.ej. "from acciones import ...")
+for carpeta in ("", "gestor_almacenamiento", "gestor_carga",
+                "actor_prestamo", "actor_renovacion", "actor_devolucion"):
+    sys.path.insert(0, os.path.join(RAIZ, carpeta))
+
+import gestor_a  # noqa: E402
+from devolucion import Devolucion  # noqa: E402
+from gestor import GestorCarga  # noqa: E402
+from prestamo import ActorPrestamo  # noqa: E402
+from renovacion import ActorRenovacion  # noqa: E402
+
+GA_ENDPOINT = "inproc://gestor-almacenamiento"
+GC_PUB_ENDPOINT = "inproc://gestor-carga-pub"
+ACTORES = {
+    "prestamo": (ActorPrestamo, "inproc://actor-prestamo"),
+    "renovacion": (ActorRenovacion, "inproc://actor-renovacion"),
+    "devolucion": (Devolucion, "inproc://actor-devolucion"),
+}
+
+GC_REP_ADDR = os.getenv("GC_REP_ADDR", "tcp://*:5555")
+GC_PUB_ADDR = os.getenv("GC_PUB_ADDR", "tcp://*:5556")
+
+
+def main():
+    context = zmq.Context()
+    detener = threading.Event()
+
+    ga = threading.Thread(target=gestor_a.servir, args=(context, GA_ENDPOINT, detener),
+                          name="gestor-almacenamiento", daemon=True)
+    ga.start()
+
+    gestor = GestorCarga(context, rep_endpoint=GC_REP_ADDR, pub_endpoint=GC_PUB_ENDPOINT,
+                         replicas_actores={op: [ep] for op, (_, ep) in ACTORES.items()},
+                         ga_endpoint=GA_ENDPOINT)
+    if GC_PUB_ADDR:
+        gestor.publisher.socket.bind(GC_PUB_ADDR)
+
+    actores = []
+    for clase, endpoint in ACTORES.values():
+        actor = clase(context=context, bind_endpoint=endpoint, pub_endpoint=GC_PUB_ENDPOINT,
+                      ga_endpoints=[GA_ENDPOINT])
+        hilo = threading.Thread(target=actor.run, name=actor.nombre, daemon=True)
+        hilo.start()
+        actores.append((actor, hilo))
+
+    print(f"[TodoEnUno] GC en {GC_REP_ADDR}, actores y GA por inproc://")
+
+    try:
+        gestor.servir()
+    except KeyboardInterrupt:
+        print("[TodoEnUno] Interrumpido")
+    finally:
+        detener.set()
+        for actor, hilo in actores:
+            actor.stop()
+            hilo.join(timeout=2.0)
+        ga.join(timeout=2.0)
+        context.destroy(linger=0)
+
+
+if __name__ == "__main__":
+    main()